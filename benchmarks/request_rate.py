@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Measure how many requests per second the API serves.
+
+This starts the application in-process on an ephemeral port, creates
+a number of people and events through the HTTP API, and then reads
+them back as fast as possible from a fixed number of concurrent
+clients.  The client shares the IOLoop with the server so the numbers
+are only meaningful relative to each other, e.g., before and after a
+change::
+
+    python benchmarks/request_rate.py --requests 5000
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from tornado import gen
+from tornado import httpclient
+from tornado import httpserver
+from tornado import ioloop
+
+from familytree import main
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--people', type=int, default=100,
+                        help='number of people to create')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='number of reads per resource type')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='number of concurrent clients')
+    return parser.parse_args()
+
+
+@gen.coroutine
+def populate(client, base_url, people):
+    person_urls, event_urls = [], []
+    for index in range(people):
+        response = yield client.fetch(
+            base_url + '/person', method='POST',
+            headers={'Content-Type': 'application/json'},
+            body=json.dumps({'display_name': 'person {0}'.format(index)}))
+        person_urls.append(json.loads(response.body.decode('utf-8'))['self'])
+    for index in range(0, people - 1, 2):
+        response = yield client.fetch(
+            base_url + '/event', method='POST',
+            headers={'Content-Type': 'application/json'},
+            body=json.dumps({'people': person_urls[index:index + 2]}))
+        event_urls.append(json.loads(response.body.decode('utf-8'))['self'])
+    raise gen.Return((person_urls, event_urls))
+
+
+@gen.coroutine
+def measure(client, urls, requests, concurrency):
+    remaining = [requests]
+
+    @gen.coroutine
+    def worker(offset):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            yield client.fetch(urls[(remaining[0] + offset) % len(urls)])
+
+    start = time.time()
+    yield [worker(offset) for offset in range(concurrency)]
+    raise gen.Return(requests / (time.time() - start))
+
+
+@gen.coroutine
+def run(arguments, base_url):
+    client = httpclient.AsyncHTTPClient(max_clients=arguments.concurrency)
+    person_urls, event_urls = yield populate(
+        client, base_url, arguments.people)
+    for name, urls in (('GET /person/<id>', person_urls),
+                       ('GET /event/<id>', event_urls)):
+        rate = yield measure(client, urls, arguments.requests,
+                             arguments.concurrency)
+        print('{0:20s} {1:10.1f} req/s'.format(name, rate))
+
+
+def main_():
+    arguments = parse_arguments()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(0)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    server = httpserver.HTTPServer(main.Application())
+    server.add_sockets([sock])
+    base_url = 'http://127.0.0.1:{0}'.format(sock.getsockname()[1])
+    ioloop.IOLoop.instance().run_sync(lambda: run(arguments, base_url))
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,369 @@
+"""Run many API operations in a single request.
+
+A batch is an ordered list of operations that is sent to the
+``/batch`` resource.  Each operation names the HTTP method and URL
+that it would otherwise have been sent to along with the body::
+
+    {"operations": [
+        {"id": "mother", "method": "POST", "url": "/person",
+         "body": {"display_name": "Mother"}},
+        {"id": "child", "method": "POST", "url": "/person",
+         "body": {"display_name": "Child"}},
+        {"method": "POST", "url": "/event",
+         "body": {"people": [{"$ref": "mother"}, {"$ref": "child"}]}}
+    ]}
+
+An operation can refer to the resource that an earlier operation
+returned with a ``{"$ref": name}`` object anywhere in its `url` or
+`body`.  The name is either the `id` of the earlier operation or its
+zero-based position in the list and the reference is replaced by the
+``self`` link of the earlier result.
+
+Every write is buffered in a single
+:class:`~familytree.storage.Transaction` that is committed after the
+last operation succeeds.  If an operation fails, nothing is written.
+
+"""
+import uuid
+
+from tornado import gen
+from tornado import httputil
+from tornado.util import bytes_type, unicode_type
+from tornado.web import HTTPError
+
+from . import event
+from . import handlers
+from . import http
+from . import person
+from . import storage
+
+
+_STRING_TYPES = (unicode_type, bytes_type)
+
+
+def get_handlers(url_stem):
+    return [
+        (url_stem, BatchHandler),
+    ]
+
+
+class BatchHandler(handlers.BaseHandler):
+
+    """Root resource that runs a batch of operations.
+
+    .. attribute:: max_operations
+
+       the most operations that a single batch may contain
+
+    .. attribute:: max_attempts
+
+       how many times a batch is run when the people that it links
+       keep changing before it is reported as a conflict
+
+    """
+
+    max_operations = 100
+    max_attempts = 5
+
+    @gen.coroutine
+    def post(self):
+        """Run a batch of operations in one transaction.
+
+        :jsonparameter list operations: the operations to run in
+            order.  Each operation is an object with the following
+            members.
+        :jsonparameter str operations[].method: the HTTP method of
+            the operation.  ``GET``, ``POST`` and ``DELETE`` are
+            supported.
+        :jsonparameter str operations[].url: the URL or path of the
+            resource that the operation targets
+        :jsonparameter object operations[].body: the representation
+            to send with a ``POST``
+        :jsonparameter str operations[].id: an optional name that
+            later operations can refer to
+        :jsonparameter str operations[].if_match: an optional entity
+            tag that a deleted resource has to match
+
+        The response contains a ``results`` list with an object for
+        each operation that includes its ``status``, the
+        representation as ``body`` if there is one, and its ``id``.
+        A failed operation includes an ``error`` message and the
+        operations that follow it are reported as *424 Failed
+        Dependency*.  ``committed`` is :data:`true` if the writes
+        were saved.
+
+        :status 200: every operation succeeded and was committed
+        :status 400: the batch is malformed or an operation failed
+            with this status.  The same is true for the other 4xx
+            statuses.
+        :status 409: the people that the batch links to or unlinks
+            from events kept changing while it was being committed
+        :status 413: the batch contains more than
+            :attr:`max_operations` operations
+        :status 415: the enclosed media-type is not recognized
+
+        """
+        body = self.request_body
+        operations = body.get('operations') if isinstance(body, dict) else None
+        if not isinstance(operations, list):
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='operations must be a list')
+        if len(operations) > self.max_operations:
+            raise HTTPError(http.REQUEST_ENTITY_TOO_LARGE)
+
+        for _ in range(self.max_attempts):
+            batch = Batch(self)
+            status = yield storage.get_executor().submit(batch.run,
+                                                         operations)
+            if status != http.CONFLICT:
+                break
+        self.send_representation({
+            'committed': status == http.OK,
+            'results': batch.results,
+        })
+        self.set_status(status)
+
+
+class Batch(object):
+
+    """Runs the operations of a single batch.
+
+    :param familytree.handlers.BaseHandler handler: the handler that
+        received the batch.  It is used to build representations
+        and resolve URLs.
+
+    Reads see the writes of earlier operations in the same batch.
+    People are saved with the version that they were read at so that
+    the commit fails instead of losing the event links of a concurrent
+    request.  :meth:`run` returns a 409 status when that happens and
+    the batch can be run again.  :meth:`run` blocks on the storage
+    layer so it should be called from the storage executor.
+
+    """
+
+    def __init__(self, handler):
+        super(Batch, self).__init__()
+        self.handler = handler
+        self.transaction = storage.Transaction()
+        self.results = []
+        self._names = {}
+        self._versions = {}
+        self._if_match = set()
+        self._operations = {
+            (person.CreatePersonHandler, 'POST'): self.create_person,
+            (person.PersonHandler, 'GET'): self.get_person,
+            (person.PersonHandler, 'DELETE'): self.delete_person,
+            (event.CreateEventHandler, 'POST'): self.create_event,
+            (event.EventHandler, 'GET'): self.get_event,
+            (event.EventHandler, 'DELETE'): self.delete_event,
+        }
+
+    def run(self, operations):
+        """Run `operations` and commit their writes.
+
+        :returns: the HTTP status of the batch
+
+        """
+        for index, operation in enumerate(operations):
+            result = {}
+            if isinstance(operation, dict) and 'id' in operation:
+                result['id'] = operation['id']
+                if isinstance(operation['id'], _STRING_TYPES):
+                    self._names[operation['id']] = index
+            self.results.append(result)
+            try:
+                status, body = self.execute(operation)
+            except HTTPError as error:
+                result['status'] = error.status_code
+                result['error'] = (error.reason or
+                                   httputil.responses[error.status_code])
+                self.transaction = storage.Transaction()
+                for skipped in operations[index + 1:]:
+                    result = {'status': http.FAILED_DEPENDENCY}
+                    if isinstance(skipped, dict) and 'id' in skipped:
+                        result['id'] = skipped['id']
+                    self.results.append(result)
+                return error.status_code
+            result['status'] = status
+            if body is not None:
+                result['body'] = body
+
+        try:
+            self.transaction.commit()
+        except storage.InstanceNotFound:
+            return http.NOT_FOUND
+        except storage.VersionConflict as error:
+            key = (error.model_class, error.instance_id)
+            if key in self._versions and key not in self._if_match:
+                return http.CONFLICT
+            return http.PRECONDITION_FAILED
+        return http.OK
+
+    def execute(self, operation):
+        """Run a single operation.
+
+        :returns: a ``(status, representation)`` tuple
+        :raises HTTPError: if the operation fails
+
+        """
+        if not isinstance(operation, dict):
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='operation must be an object')
+        method = operation.get('method', 'GET')
+        url = self.resolve(operation.get('url'))
+        if not isinstance(method, _STRING_TYPES):
+            raise HTTPError(http.BAD_REQUEST, reason='invalid method')
+        if not isinstance(url, _STRING_TYPES):
+            raise HTTPError(http.BAD_REQUEST, reason='invalid url')
+
+        target = self.handler.application.resolve_path(
+            http.urlsplit(url).path)
+        if target is None:
+            raise HTTPError(http.NOT_FOUND)
+        handler_class, args = target
+        try:
+            operation_method = self._operations[
+                (handler_class, method.upper())]
+        except KeyError:
+            raise HTTPError(http.METHOD_NOT_ALLOWED)
+
+        kwargs = {}
+        if method.upper() == 'POST':
+            kwargs['body'] = self.resolve(operation.get('body'))
+            if not isinstance(kwargs['body'], dict):
+                raise HTTPError(http.BAD_REQUEST,
+                                reason='body must be an object')
+        elif method.upper() == 'DELETE':
+            kwargs['expected_version'] = handlers.parse_if_match(
+                operation.get('if_match'))
+        return operation_method(*args, **kwargs)
+
+    def resolve(self, value):
+        """Replace the ``{"$ref": name}`` objects in `value`."""
+        if isinstance(value, dict):
+            if list(value) == ['$ref']:
+                return self._get_reference(value['$ref'])
+            return dict((key, self.resolve(element))
+                        for key, element in value.items())
+        if isinstance(value, list):
+            return [self.resolve(element) for element in value]
+        return value
+
+    def get_items(self, item_type, item_ids):
+        """Return instances that include the writes of this batch.
+
+        :raises HTTPError: with a 404 status if any of the items
+            do not exist
+
+        Each call returns new instances so they can be modified
+        without affecting the transaction until they are saved.
+
+        """
+        instances, wanted = {}, []
+        for item_id in item_ids:
+            key = (item_type, item_id)
+            if key in self.transaction.changes:
+                record = self.transaction.changes[key]
+                if record is None:
+                    raise HTTPError(http.NOT_FOUND)
+                instances[item_id] = item_type.from_dictionary(record)
+            else:
+                wanted.append(item_id)
+        if wanted:
+            try:
+                found = storage.get_versioned_items(item_type, wanted)
+            except storage.InstancesNotFound:
+                raise HTTPError(http.NOT_FOUND)
+            for item_id, (instance, version) in zip(wanted, found):
+                instances[item_id] = instance
+                self._versions[(item_type, item_id)] = version
+        return [instances[item_id] for item_id in item_ids]
+
+    def create_person(self, body):
+        try:
+            a_person = person.Person.from_dictionary(body)
+            a_person.validate()
+        except (AssertionError, KeyError):
+            raise HTTPError(http.BAD_REQUEST)
+        except ValueError as error:
+            raise HTTPError(http.BAD_REQUEST, reason=str(error))
+        a_person.id = uuid.uuid4().hex
+        self.transaction.save_item(a_person, a_person.id)
+        return http.CREATED, self._represent_person(a_person)
+
+    def get_person(self, person_id):
+        a_person, = self.get_items(person.Person, [person_id])
+        return http.OK, self._represent_person(a_person)
+
+    def delete_person(self, person_id, expected_version=None):
+        self.get_items(person.Person, [person_id])
+        if expected_version is not None:
+            self._if_match.add((person.Person, person_id))
+        self.transaction.delete_item(person.Person, person_id,
+                                     expected_version=expected_version)
+        return http.NO_CONTENT, None
+
+    def create_event(self, body):
+        if not isinstance(body.get('people', []), list):
+            raise HTTPError(http.BAD_REQUEST, reason='people must be a list')
+        an_event = event.Event.from_dictionary(body)
+        an_event.id = uuid.uuid4().hex
+        event_url = self.handler.get_url_for(event.EventHandler, an_event.id)
+        people = self.get_items(person.Person, _ids_from_urls(an_event.people))
+        self.transaction.save_item(an_event, an_event.id)
+        for a_person in people:
+            a_person.add_event(event_url)
+            self._save_person(a_person)
+        return http.CREATED, self._represent_event(an_event)
+
+    def get_event(self, event_id):
+        an_event, = self.get_items(event.Event, [event_id])
+        return http.OK, self._represent_event(an_event)
+
+    def delete_event(self, event_id, expected_version=None):
+        an_event, = self.get_items(event.Event, [event_id])
+        people = self.get_items(person.Person, _ids_from_urls(an_event.people))
+        for a_person in people:
+            a_person.discard_event(event_id)
+            self._save_person(a_person)
+        if expected_version is not None:
+            self._if_match.add((event.Event, event_id))
+        self.transaction.delete_item(event.Event, event_id,
+                                     expected_version=expected_version)
+        return http.NO_CONTENT, None
+
+    def _save_person(self, a_person):
+        self.transaction.save_item(
+            a_person, a_person.id,
+            expected_version=self._versions.get((person.Person, a_person.id)))
+
+    def _get_reference(self, name):
+        index = name
+        if isinstance(name, _STRING_TYPES):
+            index = self._names.get(name)
+        if (not isinstance(index, int) or isinstance(index, bool) or
+                not 0 <= index < len(self.results) - 1):
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='unknown reference {0!r}'.format(name))
+        url = self.results[index].get('body', {}).get('self')
+        if url is None:
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='{0!r} has no URL'.format(name))
+        return url
+
+    def _represent_person(self, a_person):
+        return self.handler.get_representation(
+            a_person, model_handler=person.PersonHandler,
+            actions=person.get_applicable_actions(a_person))
+
+    def _represent_event(self, an_event):
+        return self.handler.get_representation(
+            an_event, model_handler=event.EventHandler,
+            actions=event.get_applicable_actions(an_event))
+
+
+def _ids_from_urls(urls):
+    if not all(isinstance(url, _STRING_TYPES) for url in urls):
+        raise HTTPError(http.BAD_REQUEST, reason='people must be URLs')
+    return [url.rsplit('/', 1)[-1] for url in urls]
+
@@ -0,0 +1,435 @@
+"""Load and dump the whole store.
+
+Records are exchanged as newline-delimited JSON (`NDJSON`_) with one
+record per line.  Each record is an object with a single member that
+names the type of the record and holds its stored representation::
+
+    {"person": {"id": "1a2b", "display_name": "Mother", "events": []}}
+    {"person": {"display_name": "Child"}}
+    {"event": {"id": "3c4d", "people": ["http://example.com/person/1a2b"]}}
+
+An export produces these records for everything in the store and an
+import loads them.  A record without an ``id`` is assigned a new one
+when it is imported.  Records are written as they are so the links
+between people and events are not reconciled.  This makes an import
+suitable for restoring an export.
+
+The ``family-tree-export`` command writes an export without going
+through the HTTP API::
+
+    family-tree-export -c /etc/family-tree.yaml -o backup.ndjson
+
+.. _NDJSON: http://ndjson.org/
+
+"""
+import argparse
+import re
+import sys
+import uuid
+
+from tornado import gen
+from tornado import web
+from tornado.util import bytes_type, unicode_type
+import helper.config
+import werkzeug.http
+
+from . import codec
+from . import event
+from . import handlers
+from . import http
+from . import person
+from . import storage
+
+
+MODELS = {
+    'event': event.Event,
+    'person': person.Person,
+}
+"""Record type names and the model classes that they are loaded as."""
+
+MEDIA_TYPES = frozenset(['application/x-ndjson', 'application/ndjson'])
+
+_IDENTIFIER = re.compile(r'^[a-f0-9]+$')
+_STRING_TYPES = (unicode_type, bytes_type)
+
+
+def get_handlers(url_stem):
+    return [
+        (url_stem + '/import', ImportHandler),
+        (url_stem + '/export', ExportHandler),
+    ]
+
+
+def export_chunks(group_size=100, as_array=False):
+    """Encode every stored record.
+
+    :param int group_size: the number of records that are read and
+        encoded together
+    :param bool as_array: produce a JSON array of the records
+        instead of NDJSON
+    :returns: an iterator of byte strings that hold one group of
+        records each
+
+    The record types are exported in the order of their names and
+    the records of each type in key order (see
+    :func:`~familytree.storage.scan_items`).  Advancing the iterator
+    blocks on the storage layer.
+
+    """
+    json_codec = codec.JSONCodec()
+    separator = b',\n' if as_array else b'\n'
+    written = False
+    if as_array:
+        yield b'['
+    for name in sorted(MODELS):
+        for group in storage.scan_items(MODELS[name], group_size):
+            if not group:
+                continue
+            chunk = separator.join(json_codec.encode({name: record})
+                                   for _, record in group)
+            if not as_array:
+                chunk += separator
+            elif written:
+                chunk = separator + chunk
+            written = True
+            yield chunk
+    if as_array:
+        yield b']\n'
+
+
+def export_main(argv=None):
+    """Write an export to standard output or a file.
+
+    This is the ``family-tree-export`` command.  The storage backend
+    is selected by the ``storage`` member of the ``Application``
+    section of the configuration file.  Output is flushed after each
+    group of records.
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Export every person and event as NDJSON.')
+    parser.add_argument('-c', '--config', dest='config',
+                        help='configuration file that selects the storage '
+                        'backend')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='file to write instead of standard output')
+    parser.add_argument('--json', dest='as_array', action='store_true',
+                        help='write a JSON array instead of NDJSON')
+    parser.add_argument('--group-size', dest='group_size', type=int,
+                        default=100, help='records to read at a time')
+    arguments = parser.parse_args(argv)
+
+    if arguments.config:
+        config = helper.config.Config(arguments.config)
+        storage.configure(config.application.get('storage'))
+    if arguments.output:
+        output = open(arguments.output, 'wb')
+    else:
+        output = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+        for chunk in export_chunks(arguments.group_size,
+                                   as_array=arguments.as_array):
+            output.write(chunk)
+            output.flush()
+    finally:
+        if arguments.output:
+            output.close()
+        storage.shutdown()
+
+
+class Importer(object):
+
+    """Parses NDJSON records and saves them in groups.
+
+    :param int group_size: the number of records that are saved
+        with each call to :func:`~familytree.storage.save_items`
+    :param int max_line_length: the longest line in bytes that is
+        parsed.  Longer lines are reported as errors.
+    :param int max_errors: the most errors that are kept for
+        :meth:`get_summary`.  Every error is counted.
+
+    Data is passed to :meth:`feed` in chunks of any size.  Only the
+    incomplete line at the end of a chunk and the records that have
+    not been saved yet are kept between calls, so memory use does
+    not depend on the size of the import.  :meth:`feed` and
+    :meth:`close` block on the storage layer so they should be run
+    on the storage executor.
+
+    """
+
+    def __init__(self, group_size=100, max_line_length=1024 * 1024,
+                 max_errors=100):
+        super(Importer, self).__init__()
+        self.group_size = group_size
+        self.max_line_length = max_line_length
+        self.max_errors = max_errors
+        self.lines = 0
+        self.imported = dict((name, 0) for name in MODELS)
+        self.failed = 0
+        self.errors = []
+        self._codec = codec.JSONCodec()
+        self._partial = b''
+        self._discarding = False
+        self._pending = []
+
+    def feed(self, data):
+        """Parse the complete lines in `data` and save full groups."""
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if self._discarding:
+                self._discarding = False
+                self.lines += 1
+                self._add_error('line is too long')
+            else:
+                self._parse_line(line)
+        if len(self._partial) > self.max_line_length:
+            self._partial = b''
+            self._discarding = True
+
+    def close(self):
+        """Parse the last line and save the records that remain."""
+        if self._partial or self._discarding:
+            self.feed(b'\n')
+        self._flush()
+
+    def get_summary(self):
+        """Return the counts and errors of the import as a dictionary."""
+        return {
+            'lines': self.lines,
+            'imported': dict(self.imported),
+            'failed': self.failed,
+            'errors': list(self.errors),
+        }
+
+    def _parse_line(self, line):
+        self.lines += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = self._codec.decode(line)
+            if not isinstance(record, dict) or len(record) != 1:
+                raise ValueError('record must be an object with one member')
+            (name, data), = record.items()
+            if name not in MODELS:
+                raise ValueError('unknown record type {0!r}'.format(name))
+            if not isinstance(data, dict):
+                raise ValueError('{0} must be an object'.format(name))
+            if not isinstance(data.get('id', ''), _STRING_TYPES):
+                raise ValueError('id must be a string')
+            if not isinstance(data.get('people', []), list):
+                raise ValueError('people must be a list')
+            if not isinstance(data.get('events', []), list):
+                raise ValueError('events must be a list')
+            instance = MODELS[name].from_dictionary(data)
+            if isinstance(instance, person.Person):
+                instance.validate()
+        except (AssertionError, KeyError, TypeError, ValueError) as error:
+            self._add_error(str(error) or error.__class__.__name__)
+            return
+
+        if instance.id is None:
+            instance.id = uuid.uuid4().hex
+        elif not _IDENTIFIER.match(instance.id):
+            self._add_error('malformed id {0!r}'.format(instance.id))
+            return
+        self._pending.append((name, instance))
+        if len(self._pending) >= self.group_size:
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            storage.save_items((instance, instance.id)
+                               for _, instance in pending)
+            for name, _ in pending:
+                self.imported[name] += 1
+
+    def _add_error(self, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': self.lines, 'error': message})
+
+
+class ImportHandler(handlers.BaseHandler):
+
+    """Root resource that loads records in bulk.
+
+    .. attribute:: group_size
+
+       the number of records that are written together
+
+    .. attribute:: chunk_size
+
+       the number of bytes that are parsed at a time
+
+    .. attribute:: max_body_size
+
+       the largest body in bytes that is imported when the body is
+       read as a whole
+
+    :class:`familytree.server.HTTPServer` streams the body to an
+    :class:`Importer` as it is read (see :meth:`get_body_consumer`).
+    The next chunk is read once the previous one has been saved so
+    memory use does not depend on the size of the import and there is
+    no limit.  Other HTTP servers read the whole body before the
+    handler is called.  It is then parsed :attr:`chunk_size` bytes at
+    a time and limited to :attr:`max_body_size`.
+
+    """
+
+    group_size = 100
+    chunk_size = 64 * 1024
+    max_body_size = 64 * 1024 * 1024
+
+    def __init__(self, *args, **kwargs):
+        super(ImportHandler, self).__init__(*args, **kwargs)
+        self.importer = None
+
+    @classmethod
+    def get_body_consumer(cls, request):
+        """Return the callable that streams `request` into an importer.
+
+        :param tornado.httpserver.HTTPRequest request: the request
+            whose body has not been read yet
+        :returns: a callable that feeds each chunk of the body to a
+            new :class:`Importer` on the storage executor, or
+            :data:`None` if the request is not an import
+
+        """
+        if (request.method != 'POST' or
+                _get_content_type(request) not in MEDIA_TYPES):
+            return None
+        return _BodyImporter(Importer(cls.group_size))
+
+    def prepare(self):
+        super(ImportHandler, self).prepare()
+        if _get_content_type(self.request) not in MEDIA_TYPES:
+            raise web.HTTPError(http.UNSUPPORTED_MEDIA_TYPE)
+        consumer = getattr(self.request, 'body_consumer', None)
+        if isinstance(consumer, _BodyImporter):
+            self.importer = consumer.importer
+            return
+        if len(self.request.body) > self.max_body_size:
+            raise web.HTTPError(http.REQUEST_ENTITY_TOO_LARGE)
+        self.importer = Importer(self.group_size)
+
+    @gen.coroutine
+    def post(self):
+        """Load people and events from newline-delimited JSON.
+
+        :requestheader Content-Type: ``application/x-ndjson``
+
+        Each line of the body is a record as described above.  A line
+        that cannot be loaded is reported in the response and does
+        not stop the import.
+
+        The response contains the number of ``lines`` that were read,
+        the number of records that were ``imported`` of each type,
+        the number of lines that ``failed``, and a list of ``errors``
+        that each include the ``line`` number and an ``error``
+        message.  Only the first 100 errors are listed.
+
+        :status 200: the import finished
+        :status 413: the body was read as a whole and is larger than
+            :attr:`max_body_size`
+        :status 415: the enclosed media-type is not NDJSON
+
+        """
+        executor = storage.get_executor()
+        body = self.request.body or b''
+        for offset in range(0, len(body), self.chunk_size):
+            yield executor.submit(self.importer.feed,
+                                  body[offset:offset + self.chunk_size])
+        yield executor.submit(self.importer.close)
+        self.send_representation(self.importer.get_summary())
+
+
+class _BodyImporter(object):
+
+    """Feeds the chunks of a streamed request body to `importer`."""
+
+    def __init__(self, importer):
+        super(_BodyImporter, self).__init__()
+        self.importer = importer
+
+    def __call__(self, data):
+        return storage.get_executor().submit(self.importer.feed, data)
+
+
+def _get_content_type(request):
+    content_type, _ = werkzeug.http.parse_options_header(
+        request.headers.get('Content-Type', 'application/octet-stream'))
+    return content_type
+
+
+class ExportHandler(handlers.BaseHandler):
+
+    """Root resource that dumps every record.
+
+    .. attribute:: group_size
+
+       the number of records that are read and sent together
+
+    The response is sent with chunked transfer encoding.  The handler
+    waits for each chunk to be written to the client before it reads
+    the next group so a slow client does not cause the export to be
+    buffered in memory, and other requests are served in between.
+
+    """
+
+    group_size = 100
+    response_media_type = 'application/x-ndjson'
+    codecs = dict.fromkeys(['application/x-ndjson', 'application/json'],
+                           codec.JSONCodec())
+
+    def __init__(self, *args, **kwargs):
+        super(ExportHandler, self).__init__(*args, **kwargs)
+        self._disconnected = False
+        self._flush_callback = None
+
+    @gen.coroutine
+    def get(self):
+        """Dump people and events.
+
+        :requestheader Accept: ``application/x-ndjson`` for one
+            record per line or ``application/json`` for a JSON array
+            of the records
+
+        The records are described under :ref:`Importing Records
+        <importing_records>` and can be imported into another store.
+
+        :status 200: the response contains every record
+
+        """
+        media_type = self.get_response_media_type()
+        self.set_header('Content-Type', media_type)
+        chunks = export_chunks(self.group_size,
+                               as_array=media_type == 'application/json')
+        executor = storage.get_executor()
+        while not self._disconnected:
+            chunk = yield executor.submit(next, chunks, None)
+            if chunk is None:
+                break
+            self.write(chunk)
+            yield gen.Task(self._flush)
+
+    def on_connection_close(self):
+        super(ExportHandler, self).on_connection_close()
+        self._disconnected = True
+        callback, self._flush_callback = self._flush_callback, None
+        if callback is not None:
+            callback()
+
+    def _flush(self, callback):
+        if self._disconnected:
+            callback()
+            return
+        self._flush_callback = callback
+        self.flush(callback=self._on_flushed)
+
+    def _on_flushed(self):
+        callback, self._flush_callback = self._flush_callback, None
+        if callback is not None:
+            callback()
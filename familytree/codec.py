@@ -0,0 +1,329 @@
+"""Encoding and decoding of message bodies.
+
+A *codec* translates between the dictionaries that the model classes
+work with and the bytes that are sent over the wire for a single
+media type.  Every codec has the same shape:
+
+.. attribute:: media_type
+
+   the media type that the codec handles, without parameters
+
+.. method:: encode(value)
+
+   return the body for `value` as a byte string
+
+.. method:: decode(data, charset)
+
+   return the value of the `data` byte string, which was sent
+   with the `charset` media type parameter
+
+:class:`~familytree.handlers.BaseHandler` selects a codec from its
+:attr:`~familytree.handlers.BaseHandler.codecs` mapping.
+
+Two codecs are available: :class:`JSONCodec` for
+``application/json`` and :class:`MessagePackCodec` for the compact
+binary ``application/msgpack`` encoding.  The handlers only offer
+MessagePack when :func:`has_native_msgpack` is true since the pure
+Python encoders are slower than JSON.
+
+"""
+import json
+import struct
+
+from tornado.util import bytes_type, unicode_type
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+def has_native_msgpack():
+    """Is the C extension of the :mod:`msgpack` package installed?
+
+    :mod:`msgpack` silently falls back to a pure Python implementation
+    when its extension cannot be loaded, for example on PyPy.
+
+    """
+    return (msgpack is not None and
+            msgpack.Packer.__module__ != 'msgpack.fallback')
+
+
+class JSONCodec(object):
+
+    """Encode and decode ``application/json`` bodies.
+
+    :param str implementation: the name of the JSON library to use.
+        This defaults to the fastest one that is installed, trying
+        ``orjson`` and ``ujson`` before falling back to the standard
+        library :mod:`json` module.
+
+    All of the implementations accept the same values and report
+    malformed documents with a :exc:`ValueError` so the choice is
+    invisible to the handlers.  The output differs only in white
+    space.
+
+    """
+
+    media_type = 'application/json'
+
+    def __init__(self, implementation=None):
+        super(JSONCodec, self).__init__()
+        if implementation is None:
+            if orjson is not None:
+                implementation = 'orjson'
+            elif ujson is not None:
+                implementation = 'ujson'
+            else:
+                implementation = 'json'
+        self.implementation = implementation
+        self._encode, self._decode = {
+            'orjson': (_orjson_encode, _orjson_decode),
+            'ujson': (_ujson_encode, _ujson_decode),
+            'json': (_json_encode, _json_decode),
+        }[implementation]
+
+    def encode(self, value):
+        return self._encode(value)
+
+    def decode(self, data, charset='utf-8'):
+        return self._decode(data, charset)
+
+
+def _json_encode(value):
+    return json.dumps(value).encode('utf-8')
+
+
+def _json_decode(data, charset):
+    return json.loads(data.decode(charset))
+
+
+def _orjson_encode(value):
+    return orjson.dumps(value)
+
+
+def _orjson_decode(data, charset):
+    if charset.lower().replace('-', '') != 'utf8':
+        data = data.decode(charset)
+    return orjson.loads(data)
+
+
+def _ujson_encode(value):
+    return ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+
+
+def _ujson_decode(data, charset):
+    return ujson.loads(data.decode(charset))
+
+
+class MessagePackCodec(object):
+
+    """Encode and decode ``application/msgpack`` bodies.
+
+    :param str implementation: ``'msgpack'`` to use the
+        :mod:`msgpack` extension or ``'python'`` to use the encoder
+        in this module.  This defaults to the extension when it is
+        installed.
+
+    `MessagePack <http://msgpack.org/>`_ is a binary encoding of the
+    same values that JSON represents.  Strings are always encoded as
+    UTF-8 so the `charset` parameter of :meth:`decode` is ignored.
+    Extension types, map keys that are not hashable, and containers
+    that are nested more than 512 levels deep are not supported and
+    are reported as a malformed document with :exc:`ValueError`.
+
+    """
+
+    media_type = 'application/msgpack'
+
+    def __init__(self, implementation=None):
+        super(MessagePackCodec, self).__init__()
+        if implementation is None:
+            implementation = 'python' if msgpack is None else 'msgpack'
+        self.implementation = implementation
+        self._encode, self._decode = {
+            'msgpack': (_msgpack_encode, _msgpack_decode),
+            'python': (_pack, _unpack),
+        }[implementation]
+
+    def encode(self, value):
+        return self._encode(value)
+
+    def decode(self, data, charset=None):
+        return self._decode(data)
+
+
+def _msgpack_encode(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_decode(data):
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except TypeError as error:
+        raise ValueError('malformed MessagePack document: {0}'.format(error))
+
+
+# MessagePack type prefixes, see https://github.com/msgpack/msgpack
+_NIL, _FALSE, _TRUE = 0xc0, 0xc2, 0xc3
+_BIN = (0xc4, 0xc5, 0xc6)
+_STR = (0xd9, 0xda, 0xdb)
+_ARRAY = (0xdc, 0xdd)
+_MAP = (0xde, 0xdf)
+_LENGTHS = {
+    0xc4: '>B', 0xc5: '>H', 0xc6: '>I',
+    0xd9: '>B', 0xda: '>H', 0xdb: '>I',
+    0xdc: '>H', 0xdd: '>I', 0xde: '>H', 0xdf: '>I',
+}
+_SCALARS = {
+    0xca: '>f', 0xcb: '>d',
+    0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q',
+}
+_MAX_DEPTH = 512
+
+
+def _pack(value):
+    chunks = []
+    _pack_into(value, chunks)
+    return b''.join(chunks)
+
+
+def _pack_header(fixed, prefixes, size, chunks):
+    if fixed is not None and size < (32 if fixed == 0xa0 else 16):
+        chunks.append(struct.pack('>B', fixed | size))
+    elif prefixes[0] in (0xc4, 0xd9) and size < 0x100:
+        chunks.append(struct.pack('>BB', prefixes[0], size))
+    elif size < 0x10000:
+        chunks.append(struct.pack('>BH', prefixes[-2], size))
+    else:
+        chunks.append(struct.pack('>BI', prefixes[-1], size))
+
+
+def _pack_into(value, chunks):
+    if value is None:
+        chunks.append(struct.pack('>B', _NIL))
+    elif value is True or value is False:
+        chunks.append(struct.pack('>B', _TRUE if value else _FALSE))
+    elif isinstance(value, float):
+        chunks.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, (int, type(2 ** 64))):
+        if 0 <= value < 0x80 or -32 <= value < 0:
+            chunks.append(struct.pack('>b' if value < 0 else '>B', value))
+        elif value >= 0:
+            for prefix, limit in ((0xcc, 0x100), (0xcd, 0x10000),
+                                  (0xce, 0x100000000),
+                                  (0xcf, 0x10000000000000000)):
+                if value < limit:
+                    chunks.append(
+                        struct.pack('>B' + _SCALARS[prefix][1], prefix,
+                                    value))
+                    break
+            else:
+                raise TypeError('{0} is too large to pack'.format(value))
+        else:
+            for prefix, limit in ((0xd0, 0x80), (0xd1, 0x8000),
+                                  (0xd2, 0x80000000),
+                                  (0xd3, 0x8000000000000000)):
+                if value >= -limit:
+                    chunks.append(
+                        struct.pack('>B' + _SCALARS[prefix][1], prefix,
+                                    value))
+                    break
+            else:
+                raise TypeError('{0} is too small to pack'.format(value))
+    elif isinstance(value, (unicode_type, str)):
+        # a native string on Python 2 is packed as text, just like
+        # the msgpack extension does without use_bin_type
+        if isinstance(value, unicode_type):
+            value = value.encode('utf-8')
+        _pack_header(0xa0, _STR, len(value), chunks)
+        chunks.append(value)
+    elif isinstance(value, (bytes_type, bytearray)):
+        _pack_header(None, _BIN, len(value), chunks)
+        chunks.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        _pack_header(0x90, _ARRAY, len(value), chunks)
+        for element in value:
+            _pack_into(element, chunks)
+    elif isinstance(value, dict):
+        _pack_header(0x80, _MAP, len(value), chunks)
+        for key, element in value.items():
+            _pack_into(key, chunks)
+            _pack_into(element, chunks)
+    else:
+        raise TypeError('{0!r} cannot be packed'.format(value))
+
+
+def _unpack(data):
+    data = bytes(data)
+    try:
+        value, offset = _unpack_from(data, bytearray(data), 0, 0)
+    except (IndexError, TypeError, struct.error, UnicodeDecodeError) as error:
+        # TypeError is raised for a map key that cannot be hashed
+        raise ValueError('malformed MessagePack document: {0}'.format(error))
+    if offset != len(data):
+        raise ValueError('extra data after MessagePack document')
+    return value
+
+
+def _unpack_from(data, octets, offset, depth):
+    prefix = octets[offset]
+    offset += 1
+    if prefix < 0x80:
+        return prefix, offset
+    if prefix >= 0xe0:
+        return prefix - 0x100, offset
+    if prefix == _NIL:
+        return None, offset
+    if prefix in (_FALSE, _TRUE):
+        return prefix == _TRUE, offset
+    if prefix in _SCALARS:
+        fmt = _SCALARS[prefix]
+        return (struct.unpack_from(fmt, data, offset)[0],
+                offset + struct.calcsize(fmt))
+
+    if prefix in _LENGTHS:
+        fmt = _LENGTHS[prefix]
+        size = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+    elif prefix & 0xe0 == 0xa0:
+        size, prefix = prefix & 0x1f, _STR[0]
+    elif prefix & 0xf0 == 0x90:
+        size, prefix = prefix & 0x0f, _ARRAY[0]
+    elif prefix & 0xf0 == 0x80:
+        size, prefix = prefix & 0x0f, _MAP[0]
+    else:
+        raise ValueError('unsupported MessagePack type 0x{0:02x}'.format(
+            prefix))
+
+    if prefix in _STR or prefix in _BIN:
+        end = offset + size
+        if end > len(data):
+            raise ValueError('truncated MessagePack document')
+        chunk = data[offset:end]
+        return (chunk.decode('utf-8') if prefix in _STR else chunk), end
+    depth += 1
+    if depth > _MAX_DEPTH:
+        raise ValueError('MessagePack document is nested too deeply')
+    if prefix in _ARRAY:
+        elements = []
+        for _ in range(size):
+            element, offset = _unpack_from(data, octets, offset, depth)
+            elements.append(element)
+        return elements, offset
+    mapping = {}
+    for _ in range(size):
+        key, offset = _unpack_from(data, octets, offset, depth)
+        mapping[key], offset = _unpack_from(data, octets, offset, depth)
+    return mapping, offset
@@ -0,0 +1,129 @@
+"""Resources for looking inside a running process.
+
+``/debug/profiles`` lists the request profiles that were collected
+by :mod:`familytree.profiling` and ``/debug/profiles/<id>`` returns
+one of them.  Both respond with *404 Not Found* unless profiling is
+enabled and the request sends the profiling token, if one is
+configured, in the ``X-Profile`` header or the ``profile`` query
+parameter.  Requests to these resources are never profiled.
+
+"""
+import marshal
+
+from tornado import web
+
+from . import handlers
+from . import http
+from . import profiling
+
+try:
+    from cStringIO import StringIO
+except ImportError:  # pragma: no cover
+    from io import StringIO
+
+
+PSTATS_MEDIA_TYPE = 'application/octet-stream'
+
+
+def get_handlers(url_stem):
+    return [
+        (url_stem + '/profiles', ProfilesHandler),
+        web.url(url_stem + '/profiles/([a-f0-9]+)', ProfileHandler,
+                name='profile'),
+    ]
+
+
+class _ProfilingHandler(handlers.BaseHandler):
+
+    profiled = False
+
+    def prepare(self):
+        if not profiling.is_authorized(self):
+            raise web.HTTPError(http.NOT_FOUND)
+        super(_ProfilingHandler, self).prepare()
+
+
+class ProfilesHandler(_ProfilingHandler):
+
+    """Root resource that lists the stored profiles."""
+
+    def get(self):
+        """Retrieve the descriptions of the stored profiles.
+
+        The response contains a ``profiles`` list with the newest
+        profile first.  Each entry includes the ``id`` of the
+        profile, the ``handler``, ``method``, ``path`` and
+        ``status`` of the profiled request, its ``duration`` in
+        milliseconds, the ``created`` time in seconds since the epoch,
+        and a ``self`` link to the profile.
+
+        :status 200: the response contains the list
+        :status 404: profiling is not enabled or the token is missing
+
+        """
+        profiles = []
+        for description in profiling.list_profiles():
+            description = dict(description)
+            description['self'] = self.get_url_for('profile',
+                                                   description['id'])
+            profiles.append(description)
+        self.send_representation({'profiles': profiles})
+
+
+class ProfileHandler(_ProfilingHandler):
+
+    """Resource that returns one profile.
+
+    .. attribute:: default_limit
+
+       the number of functions that the text report lists unless the
+       ``limit`` query parameter asks for another number
+
+    """
+
+    default_limit = 50
+    response_media_type = 'text/plain'
+    # the body is written directly, the codecs are only negotiated
+    codecs = dict.fromkeys(['text/plain', PSTATS_MEDIA_TYPE])
+
+    def get(self, profile_id):
+        """Retrieve a profile.
+
+        :requestheader Accept: ``text/plain`` for a report of the
+            functions that took the most time or
+            ``application/octet-stream`` for a file that
+            :class:`pstats.Stats` loads
+        :query sort: the :meth:`pstats.Stats.sort_stats` key to order
+            the report by.  The default is ``cumulative``.
+        :query limit: the number of functions in the report
+
+        :status 200: the response contains the profile
+        :status 400: the sort key or limit is not valid
+        :status 404: the profile does not exist, profiling is not
+            enabled, or the token is missing
+
+        """
+        try:
+            stats = profiling.get_profile(profile_id)
+        except KeyError:
+            raise web.HTTPError(http.NOT_FOUND)
+
+        media_type = self.get_response_media_type()
+        if media_type == PSTATS_MEDIA_TYPE:
+            self.set_header('Content-Type', media_type)
+            self.write(marshal.dumps(stats.stats))
+            return
+
+        sort = self.get_query_argument('sort', 'cumulative')
+        try:
+            limit = int(self.get_query_argument('limit',
+                                                self.default_limit))
+            stats.sort_stats(sort)
+        except (KeyError, ValueError):
+            raise web.HTTPError(http.BAD_REQUEST,
+                                reason='invalid sort key or limit')
+        stats.stream = StringIO()
+        stats.print_stats(limit)
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.write(stats.stream.getvalue())
+
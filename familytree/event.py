@@ -1,6 +1,8 @@
 import uuid
 
+from tornado import gen
 from tornado import web
+from tornado.util import bytes_type, unicode_type
 
 from . import handlers
 from . import http
@@ -8,6 +10,10 @@ from . import person
 from . import storage
 
 
+_STRING_TYPES = (unicode_type, bytes_type)
+_MAX_ATTEMPTS = 5
+
+
 def get_handlers(url_stem):
     return [
         (url_stem, CreateEventHandler),
@@ -16,10 +22,10 @@ def get_handlers(url_stem):
 
 
 def get_applicable_actions(event):
-    return [
-        {'name': 'delete-event', 'method': 'DELETE',
-         'handler': EventHandler, 'args': (event.id,)},
-    ]
+    return _action_card.bind(event.id)
+
+
+_MEMBERS = frozenset(['id', 'people'])
 
 
 class Event(object):
@@ -28,35 +34,85 @@ class Event(object):
 
     .. attribute:: people
 
-       a list of links to :class:`~person.Person` representations
+       a tuple of links to :class:`~person.Person` representations
 
     This class implements the :class:`~storage.ModelInstance` methods
     so `Event` instances can be stored using the :mod:`~.storage` module.
+    Events are indexed by the people that were involved in them and
+    by their identifiers so that they can be listed in a stable order.
 
     """
 
+    storage_indexes = (
+        storage.HashIndex('people'),
+        storage.SortedIndex('id'),
+    )
+
     def __init__(self):
         self.id = None
-        self.people = []
+        self.people = ()
 
-    def as_dictionary(self):
-        return {
-            'id': self.id,
-            'people': self.people,
-        }
+    def as_dictionary(self, fields=None):
+        if fields is None:
+            return {
+                'id': self.id,
+                'people': self.people,
+            }
+        return dict((name, getattr(self, name)) for name in fields
+                    if name in _MEMBERS)
 
     @classmethod
     def from_dictionary(cls, data):
         event = Event()
         event.id = data.get('id')
-        event.people.extend(a_person for a_person in data.get('people', []))
+        event.people = tuple(data.get('people', ()))
         return event
 
 
 class CreateEventHandler(handlers.BaseHandler):
 
-    """Root resource that creates a new event."""
+    """Root resource that lists events and creates a new event."""
+
+    @gen.coroutine
+    def get(self):
+        """List events in order of their identifiers.
+
+        :query int limit: the most events to return
+        :query str cursor: the position to continue listing from.
+            Use the ``next`` link of the previous page instead of
+            building it.
+        :query embed: ``people`` to embed the people of each event
+        :query int depth: how many levels of links to embed
+        :query fields: comma-separated members to include in each
+            representation.  The ``self`` link is always included.
+        :requestheader Accept: the requested representation type
+        :responseheader Link: the ``next`` link if there are more
+            events
+
+        The response is an object with an ``items`` list that holds
+        the event representations.  Each page costs the same no
+        matter how far into the collection it is.
 
+        :status 200: the response contains a page of events
+        :status 400: the ``limit`` or ``cursor`` is malformed
+
+        """
+        limit = self.get_page_limit()
+        after = self.get_page_cursor()
+        events, last_entry = yield storage.query_page_async(
+            Event, 'id', limit, after=after)
+        fields = self.get_requested_fields()
+        items = [self.get_representation(
+            event, model_handler=EventHandler,
+            actions=get_applicable_actions(event), fields=fields)
+            for event in events]
+        if self.wants_embedded():
+            embedded = yield self.get_embedded(Event, events)
+            for item, item_embedded in zip(items, embedded):
+                item['embedded'] = item_embedded
+        self.send_page(items, limit, last_entry)
+
+    @gen.coroutine
     def post(self):
         """Create a new event.
 
@@ -68,20 +124,29 @@ class CreateEventHandler(handlers.BaseHandler):
             created event resource
         :status 201: a new event was created
         :status 400: something is wrong with the included
-            representation
+            representation, e.g., ``people`` is not a list of URLs
+        :status 404: one of the ``people`` does not exist
+        :status 409: the people kept changing while the event was
+            being saved
         :status 415: the enclosed media-type is not recognized
 
         """
         event = self.deserialize_model_instance(Event)
+        people = self.request_body.get('people', [])
+        if (not isinstance(people, list) or
+                not all(isinstance(url, _STRING_TYPES) for url in people)):
+            raise web.HTTPError(http.BAD_REQUEST,
+                                reason='people must be a list of URLs')
         event.id = uuid.uuid4().hex
-        storage.save_item(event, event.id)
 
         event_url = self.get_url_for(EventHandler, event.id)
-        for person_url in event.people:
-            person_id = person_url.split('/')[-1]
-            a_person = storage.get_item(person.Person, person_id)
-            a_person.add_event(event_url)
-            storage.save_item(a_person, a_person.id)
+        try:
+            yield _commit_with_people(
+                [url.rsplit('/', 1)[-1] for url in people],
+                lambda transaction: transaction.save_item(event, event.id),
+                lambda a_person: a_person.add_event(event_url))
+        except storage.InstanceNotFound:
+            raise web.HTTPError(http.NOT_FOUND, reason='people must exist')
         self.serialize_model_instance(
             event,
             actions=get_applicable_actions(event),
@@ -94,46 +159,211 @@ class EventHandler(handlers.BaseHandler):
 
     """Manipulate a specific Event."""
 
+    @gen.coroutine
     def get(self, event_id):
         """Retrieve a Event by unique identifier.
 
         :param event_id: the unique identifier assigned to an event
+        :query embed: ``people`` to include the representations of
+            the people involved in the ``embedded`` member
+        :query int depth: how many levels of links to embed
+        :query fields: comma-separated members to include in the
+            representation.  The ``self`` link is always included.
         :requestheader Accept: the requested representation type
+        :requestheader If-None-Match: entity tags that the client has
+        :responseheader Etag: the version of the event.  When related
+            resources are embedded, it is a hash of the response.
 
         :status 200: the response contains a representation of the
             requested Event
+        :status 304: the client already has the current version
         :status 404: `event_id` refers to a non-existent event
 
         """
+        embedding = self.wants_embedded()
+        if not embedding and self.send_cached_response((Event, event_id)):
+            return
         try:
-            event = storage.get_item(Event, event_id)
+            event, version = yield storage.get_versioned_item_async(
+                Event, event_id)
         except storage.InstanceNotFound:
             raise web.HTTPError(http.NOT_FOUND)
 
+        embedded = None
+        if embedding:
+            embedded, = yield self.get_embedded(Event, [event])
+            version = None
+        elif self.check_not_modified(version):
+            return
         self.serialize_model_instance(
             event,
             actions=get_applicable_actions(event),
             model_handler=EventHandler,
+            version=version,
+            embedded=embedded,
         )
         self.set_status(http.OK)
 
+    @gen.coroutine
+    def patch(self, event_id):
+        """Change some members of an Event.
+
+        :param event_id: the unique identifier assigned to an event
+        :requestheader Content-Type: ``application/merge-patch+json``
+            or ``application/json-patch+json``
+        :requestheader If-Match: the version that the patch was
+            made from
+        :requestheader Prefer: ``return=minimal`` to omit the
+            representation from the response
+        :responseheader Etag: the new version of the event
+
+        The patch is applied to the representation that is stored.
+        People that are added to or removed from ``people`` have the
+        link to this event added or removed in the same write.  For
+        example, this JSON Patch adds one person::
+
+            [{"op": "add", "path": "/people/-",
+              "value": "http://example.com/person/1234"}]
+
+        :status 200: the event was changed and the response contains
+            its new representation
+        :status 204: the event was changed
+        :status 400: the patch is malformed, changes the ``id``, or
+            links to a person that does not exist
+        :status 404: `event_id` refers to a non-existent event
+        :status 409: the patch does not apply to the event or the
+            people kept changing while it was being saved
+        :status 412: the event is not at a version in ``If-Match``
+        :status 415: the enclosed media-type is not a patch format
+        :status 428: the request does not include ``If-Match``
+
+        """
+        expected_version = self.require_expected_version()
+        try:
+            event, version = yield storage.get_versioned_item_async(
+                Event, event_id)
+        except storage.InstanceNotFound:
+            raise web.HTTPError(http.NOT_FOUND)
+        if version not in expected_version:
+            raise web.HTTPError(http.PRECONDITION_FAILED)
+
+        changes = self.apply_patch(event.as_dictionary())
+        people = changes.get('people', [])
+        if (not isinstance(people, list) or
+                not all(isinstance(url, _STRING_TYPES) for url in people)):
+            raise web.HTTPError(http.BAD_REQUEST,
+                                reason='people must be a list of URLs')
+        old_ids = set(url.rsplit('/', 1)[-1] for url in event.people)
+        new_ids = set(url.rsplit('/', 1)[-1] for url in people)
+        changed_ids = sorted(old_ids ^ new_ids)
+
+        event = Event.from_dictionary(changes)
+        event_url = self.get_url_for(EventHandler, event_id)
+
+        def update_person(a_person):
+            if a_person.id in new_ids:
+                a_person.add_event(event_url)
+            else:
+                a_person.discard_event(event_id)
+
+        try:
+            version = yield _commit_with_people(
+                changed_ids,
+                lambda transaction: transaction.save_item(
+                    event, event_id, expected_version=version),
+                update_person)
+        except storage.InstanceNotFound as error:
+            if error.model_class is person.Person:
+                raise web.HTTPError(http.BAD_REQUEST,
+                                    reason='people must exist')
+            raise web.HTTPError(http.NOT_FOUND)
+        except storage.VersionConflict:
+            raise web.HTTPError(http.PRECONDITION_FAILED)
+
+        if self.prefers_minimal_response():
+            self.set_version(version)
+            self.set_status(http.NO_CONTENT)
+            return
+        self.serialize_model_instance(
+            event,
+            actions=get_applicable_actions(event),
+            model_handler=EventHandler,
+            version=version,
+        )
+        self.set_status(http.OK)
+
+    @gen.coroutine
     def delete(self, event_id):
         """Delete a Event by unique identifier.
 
         :param event_id: the unique identifier assigned to an event
+        :requestheader If-Match: only delete the event if it is at
+            one of these versions
 
         :status 204: the requested event has been deleted
         :status 404: `event_id` refers to a non-existent event
+        :status 409: the people kept changing while the event was
+            being deleted
+        :status 412: the event is not at a version in ``If-Match``
 
         """
+        expected_version = self.get_expected_version()
         try:
-            the_event = storage.get_item(Event, event_id)
-            for url in the_event.people:
-                path, person_id = url.rsplit('/', 1)
-                a_person = storage.get_item(person.Person, person_id)
-                a_person.remove_event(self.request.full_url())
-                storage.save_item(a_person, a_person.id)
-            storage.delete_item(Event, event_id)
-            self.set_status(http.NO_CONTENT)
+            the_event = yield storage.get_item_async(Event, event_id)
+            yield _commit_with_people(
+                [url.rsplit('/', 1)[1] for url in the_event.people],
+                lambda transaction: transaction.delete_item(
+                    Event, event_id, expected_version=expected_version),
+                lambda a_person: a_person.discard_event(event_id))
         except storage.InstanceNotFound:
             raise web.HTTPError(http.NOT_FOUND)
+        except storage.VersionConflict:
+            raise web.HTTPError(http.PRECONDITION_FAILED)
+        self.set_status(http.NO_CONTENT)
+
+
+@gen.coroutine
+def _commit_with_people(person_ids, stage, update_person):
+    """Commit a transaction that also changes some people.
+
+    :param list person_ids: the identifiers of the people to change
+    :param stage: called with a new :class:`~familytree.storage.Transaction`
+        to buffer the writes other than the people.  Its return value
+        is the result of the coroutine.
+    :param update_person: called with each person to change it
+        before it is saved
+    :raises HTTPError: with a 409 status if the people keep changing
+
+    The people are saved with the version that they were read at so
+    that a link that another request adds to or removes from one of
+    them in the meantime is not lost.  When that happens, the people
+    are read again and the transaction is retried.
+
+    """
+    for _ in range(_MAX_ATTEMPTS):
+        people = yield storage.get_versioned_items_async(person.Person,
+                                                         person_ids)
+        transaction = storage.Transaction()
+        result = stage(transaction)
+        for a_person, version in people:
+            update_person(a_person)
+            transaction.save_item(a_person, a_person.id,
+                                  expected_version=version)
+        try:
+            yield transaction.commit_async()
+        except (storage.InstanceNotFound, storage.VersionConflict) as error:
+            if error.model_class is not person.Person:
+                raise
+            continue
+        raise gen.Return(result)
+    raise web.HTTPError(http.CONFLICT,
+                        reason='people changed while saving the event')
+
+
+_action_card = handlers.ActionCard(
+    ('delete-event', 'DELETE', EventHandler),
+    ('update-event', 'PATCH', EventHandler),
+)
+handlers.register_model(Event, EventHandler, get_applicable_actions)
+handlers.register_relation(Event, 'people', person.Person)
+handlers.register_relation(person.Person, 'events', Event)
@@ -1,20 +1,546 @@
+import base64
+import collections
 import json
+import threading
+import time
 
+from tornado import escape
+from tornado import gen
+from tornado import stack_context
+from tornado.util import unicode_type
 from tornado.web import RequestHandler, HTTPError
+import werkzeug.datastructures
 import werkzeug.http
 
+from . import codec
 from . import http
+from . import metrics
+from . import patch
+from . import profiling
+from . import storage
+from . import timing
+
+
+CachedResponse = collections.namedtuple(
+    'CachedResponse', ['body', 'headers', 'version'])
+
+_response_cache = None
+_default_page_size = 20
+_max_page_size = 100
+_max_embed_depth = 2
+_models = {}
+_relations = {}
+
+
+class ResponseCache(object):
+
+    """Least-recently-used cache of rendered response bodies.
+
+    :param int max_bytes: the most body bytes to retain
+
+    Entries are keyed by ``(resource_key, scheme, host, media_type,
+    fields)`` where ``resource_key`` is the ``(model_class, item_id)``
+    pair that the storage layer uses and ``fields`` is the sparse
+    fieldset, if any.  The scheme and host are part of the key
+    because the links in a representation are absolute.  Each
+    value is a :class:`CachedResponse`.
+
+    :meth:`invalidate` is registered as a storage write listener so
+    every rendering of an item is discarded when the item is written.
+    The same *generation* protocol as
+    :class:`~familytree.storage.cache.InstanceCache` keeps a response
+    that was rendered from a record read before a write out of the
+    cache.  Each process has its own cache so it only sees writes made
+    by that process.
+
+    """
+
+    def __init__(self, max_bytes):
+        super(ResponseCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached response for `key` or :data:`None`."""
+        with self._lock:
+            try:
+                response = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = response
+            self.hits += 1
+            return response
+
+    def put(self, key, response, generation):
+        """Cache `response` unless the cache changed since `generation`."""
+        size = len(response.body)
+        with self._lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            self._discard(key)
+            self._entries[key] = response
+            self._variants.setdefault(key[0], set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, resource_keys):
+        """Remove every rendering of `resource_keys`."""
+        with self._lock:
+            self.generation += 1
+            for resource_key in resource_keys:
+                for key in list(self._variants.get(resource_key, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._variants.clear()
+            self.size = 0
+
+    def _discard(self, key):
+        response = self._entries.pop(key, None)
+        if response is not None:
+            self.size -= len(response.body)
+            variants = self._variants[key[0]]
+            variants.discard(key)
+            if not variants:
+                del self._variants[key[0]]
+
+
+def configure_response_cache(max_bytes):
+    """Replace the response cache.
+
+    :param int max_bytes: the most body bytes to cache.  Zero
+        disables the cache.
+    :returns: the new :class:`ResponseCache` or :data:`None`
+
+    """
+    global _response_cache
+
+    if _response_cache is not None:
+        storage.remove_write_listener(_response_cache.invalidate)
+    _response_cache = None
+    if max_bytes > 0:
+        _response_cache = ResponseCache(max_bytes)
+        storage.add_write_listener(_response_cache.invalidate)
+    return _response_cache
+
+
+def get_response_cache():
+    """Return the active response cache or :data:`None`."""
+    return _response_cache
+
+
+def configure_paging(default_page_size, max_page_size):
+    """Set the page sizes of the collection resources.
+
+    :param int default_page_size: the number of items in a page when
+        the client does not send a ``limit``
+    :param int max_page_size: the largest ``limit`` that is honored
+
+    """
+    global _default_page_size, _max_page_size
+
+    if not 0 < default_page_size <= max_page_size:
+        raise ValueError('page sizes must satisfy 0 < {0} <= {1}'.format(
+            default_page_size, max_page_size))
+    _default_page_size = default_page_size
+    _max_page_size = max_page_size
+
+
+def encode_cursor(entry):
+    """Return an opaque cursor for a ``(key, item_id)`` index entry."""
+    data = json.dumps(list(entry), separators=(',', ':'))
+    return base64.urlsafe_b64encode(
+        data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the ``(key, item_id)`` entry encoded in `cursor`.
+
+    :raises ValueError: if `cursor` was not produced by
+        :func:`encode_cursor`
+
+    Both the key and the identifier have to be strings since the
+    sorted indexes only hold string keys.
+
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        entry = json.loads(
+            base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, ValueError):
+        raise ValueError('malformed cursor')
+    if (not isinstance(entry, list) or len(entry) != 2 or
+            not all(isinstance(value, unicode_type) for value in entry)):
+        raise ValueError('malformed cursor')
+    return tuple(entry)
+
+
+def configure_embedding(max_depth):
+    """Set how deep related resources can be embedded.
+
+    :param int max_depth: the largest ``depth`` that is honored
+
+    """
+    global _max_embed_depth
+
+    if max_depth < 1:
+        raise ValueError('max_depth must be positive')
+    _max_embed_depth = max_depth
+
+
+def register_model(model_class, model_handler, get_actions):
+    """Describe how instances of `model_class` are represented.
+
+    :param type model_class: the model class
+    :param model_handler: the handler that owns the instances
+    :param get_actions: callable that returns the bound
+        :class:`ActionCard` of an instance
+
+    Registered models can be embedded in other representations.
+
+    """
+    _models[model_class] = (model_handler, get_actions)
+
+
+def register_relation(model_class, name, target_class):
+    """Declare that a member of `model_class` links to other instances.
+
+    :param type model_class: the model class that has the links
+    :param str name: the member of the representation that holds
+        the list of links and the value of the ``embed`` argument
+        that embeds them
+    :param type target_class: the registered model class of the
+        linked instances
+
+    """
+    _relations[(model_class, name)] = target_class
+
+
+def parse_if_match(header):
+    """Return the versions that an ``If-Match`` value allows.
+
+    :param str header: the header value or :data:`None`
+    :returns: a :class:`frozenset` of the acceptable versions or
+        :data:`None` if any version is acceptable
+
+    """
+    if header is None:
+        return None
+    etags = werkzeug.http.parse_etags(header)
+    if etags.star_tag:
+        return None
+    return frozenset(etags.as_set())
+
+
+class ActionCard(object):
+
+    """The actions that apply to instances of a model class.
+
+    :param actions: ``(name, method, handler)`` tuples that describe
+        each action
+
+    A card is built once per model class and then bound to the
+    arguments of a specific instance with :meth:`bind`.  Rendering a
+    bound card only fills in the URLs.  Iterating over a bound card
+    yields the action dictionaries that
+    :meth:`BaseHandler.serialize_model_instance` also accepts.
+
+    """
+
+    def __init__(self, *actions):
+        super(ActionCard, self).__init__()
+        self.actions = tuple(actions)
+        self.args = ()
+
+    def __iter__(self):
+        for name, method, handler in self.actions:
+            yield {'name': name, 'method': method, 'handler': handler,
+                   'args': self.args}
+
+    def bind(self, *args):
+        """Return a copy of this card that links to `args`."""
+        card = ActionCard()
+        card.actions = self.actions
+        card.args = args
+        return card
+
+    def render(self, get_url_for):
+        """Return the ``actions`` member of a representation.
+
+        :param get_url_for: callable that returns the URL for a
+            handler and positional arguments
+
+        """
+        return dict((name, {'method': method,
+                            'url': get_url_for(handler, *self.args)})
+                    for name, method, handler in self.actions)
 
 
 class BaseHandler(RequestHandler):
+
+    """Common behavior of the API handlers.
+
+    .. attribute:: codecs
+
+       mapping of media type to the :mod:`~familytree.codec` that
+       encodes and decodes bodies of that type.  Use
+       :meth:`register_codec` to add one.  ``application/msgpack``
+       is registered when :func:`~familytree.codec.has_native_msgpack`
+       is true.
+
+    .. attribute:: patch_formats
+
+       mapping of the media types that a ``PATCH`` request can be
+       sent in to the :mod:`~familytree.patch` function that applies
+       it
+
+    .. attribute:: response_media_type
+
+       the media type that is sent when the client does not prefer
+       another one
+
+    Request bodies are decoded based on their ``Content-Type`` and
+    response bodies are encoded in the type that
+    :meth:`get_response_media_type` negotiates from the ``Accept``
+    header.
+
+    Every finished request is recorded in the :mod:`~familytree.metrics`
+    of the process along with the sizes of its request and response
+    bodies.  The :attr:`timer` of the request is current while the
+    handler runs and its phases are written to the access log (see
+    :mod:`familytree.timing`) when the request finishes.  A request
+    that asks for a profile is profiled as described in
+    :mod:`familytree.profiling`.
+
+    .. attribute:: timer
+
+       the :class:`~familytree.timing.RequestTimer` of the request
+
+    .. attribute:: profiled
+
+       set this to :data:`False` in handlers whose requests should
+       not be profiled even if they ask for it
+
+    """
+
+    profiled = True
     supported_media_types = set(['application/json'])
+    response_media_type = 'application/json'
+    codecs = {
+        'application/json': codec.JSONCodec(),
+    }
+    patch_formats = {
+        'application/merge-patch+json': patch.apply_merge_patch,
+        'application/json-patch+json': patch.apply_json_patch,
+    }
+
+    @classmethod
+    def register_codec(cls, a_codec):
+        """Accept and send bodies of ``a_codec.media_type``.
+
+        The codec is registered for `cls` and its subclasses.
+
+        """
+        cls.codecs = dict(cls.codecs)
+        cls.codecs[a_codec.media_type] = a_codec
+        cls.supported_media_types = (cls.supported_media_types |
+                                     set([a_codec.media_type]))
 
     def __init__(self, *args, **kwargs):
         super(BaseHandler, self).__init__(*args, **kwargs)
         self._request_body = None
+        self._cache_key = None
+        self._cache_generation = None
+        self._url_prefix = None
+        self._response_media_type = None
+        self._response_bytes = 0
+        self.timer = timing.RequestTimer()
+        self._profile = None
+
+    def prepare(self):
+        super(BaseHandler, self).prepare()
+        if self.request.method != 'DELETE':
+            self.get_response_media_type()
+
+    def _execute(self, *args, **kwargs):
+        # the timer and the profile are made current again for every
+        # callback that runs on behalf of this request, including
+        # coroutine steps
+        if self.profiled:
+            self._profile = profiling.start(self)
+        with stack_context.StackContext(self.timer.activate):
+            if self._profile is None:
+                return super(BaseHandler, self)._execute(*args, **kwargs)
+            self.set_header(profiling.HEADER, self.get_url_for(
+                'profile', self._profile.id) or self._profile.id)
+            with stack_context.StackContext(self._profile.activate):
+                return super(BaseHandler, self)._execute(*args, **kwargs)
+
+    def write(self, chunk):
+        super(BaseHandler, self).write(chunk)
+        if isinstance(chunk, dict):
+            chunk = escape.json_encode(chunk)
+        self._response_bytes += len(escape.utf8(chunk))
+
+    def on_finish(self):
+        super(BaseHandler, self).on_finish()
+        if self._profile is not None:
+            self._profile.finish(self)
+        metrics.record_request(self.__class__.__name__, self.request.method,
+                               self.get_status(), self.request.request_time(),
+                               len(self.request.body or b''),
+                               self._response_bytes)
+        timing.log_request(self)
 
     def get_url_for(self, handler, *args):
-        return self.application.get_url_for(self.request, handler, *args)
+        """Return the absolute URL of `handler` for this request.
+
+        The scheme and host prefix is computed on the first call and
+        reused for every other link in the response.
+
+        """
+        start = time.time()
+        path = self.application.reverse_path(handler, *args)
+        if path is not None:
+            if self._url_prefix is None:
+                self._url_prefix = self.application.get_url_prefix(
+                    self.request)
+            path = self._url_prefix + path
+        self.timer.add('links', time.time() - start)
+        return path
+
+    def get_response_media_type(self):
+        """Return the media type to encode the response body in.
+
+        :raises HTTPError: with a 406 status if the ``Accept`` header
+            does not allow any of the types in :attr:`codecs`
+
+        :attr:`response_media_type` wins when the client does not
+        send an ``Accept`` header or accepts several types equally.
+        :meth:`prepare` calls this for every request that sends a
+        representation so that an unacceptable request fails before
+        the handler changes anything.
+
+        """
+        if self._response_media_type is None:
+            header = self.request.headers.get('Accept')
+            if not header:
+                self._response_media_type = self.response_media_type
+            else:
+                accept = werkzeug.http.parse_accept_header(
+                    header, werkzeug.datastructures.MIMEAccept)
+                available = [self.response_media_type]
+                available.extend(sorted(
+                    media_type for media_type in self.codecs
+                    if media_type != self.response_media_type))
+                media_type = accept.best_match(available)
+                if media_type is None:
+                    raise HTTPError(http.NOT_ACCEPTABLE)
+                self._response_media_type = media_type
+        return self._response_media_type
+
+    def set_version(self, version):
+        """Send `version` as the entity tag of the response."""
+        self.set_header('Etag', werkzeug.http.quote_etag(version))
+
+    def check_not_modified(self, version):
+        """Short-circuit the response if the client has `version`.
+
+        :param str version: the version of the requested resource
+        :returns: :data:`True` if the response status was set to
+            304 and nothing else should be written
+
+        This sets the ``Etag`` header and compares `version` with
+        the ``If-None-Match`` request header.  Call it as soon as the
+        version is known so that a matching request does not pay for
+        building and encoding the representation.
+
+        """
+        self.set_version(version)
+        header = self.request.headers.get('If-None-Match')
+        if header is None:
+            return False
+        etags = werkzeug.http.parse_etags(header)
+        if etags.star_tag or etags.contains_weak(version):
+            self.set_status(http.NOT_MODIFIED)
+            return True
+        return False
+
+    def get_expected_version(self):
+        """Return the versions that the ``If-Match`` header allows.
+
+        :returns: a :class:`frozenset` of the acceptable versions or
+            :data:`None` if any version is acceptable
+
+        The result is suitable for the `expected_version` parameter
+        of the storage functions.  Weak entity tags never match.
+
+        """
+        return parse_if_match(self.request.headers.get('If-Match'))
+
+    def require_expected_version(self):
+        """Return the versions that the required ``If-Match`` allows.
+
+        :raises HTTPError: with a 428 status if the request does not
+            include a ``If-Match`` header that names a version
+
+        Use this instead of :meth:`get_expected_version` when the
+        client has to prove that it saw the current version, e.g.,
+        before applying a patch to it.
+
+        """
+        expected_version = self.get_expected_version()
+        if not expected_version:
+            raise HTTPError(http.PRECONDITION_REQUIRED,
+                            reason='Precondition Required')
+        return expected_version
+
+    def send_cached_response(self, resource_key):
+        """Send a previously rendered representation if there is one.
+
+        :param tuple resource_key: the ``(model_class, item_id)`` pair
+            that identifies the requested item
+        :returns: :data:`True` if the response was sent from the
+            cache and nothing else should be written
+
+        When this returns :data:`False`, the representation that is
+        sent by the next call to :meth:`serialize_model_instance` is
+        added to the response cache.
+
+        """
+        cache = _response_cache
+        if cache is None:
+            return False
+        key = (resource_key, self.request.protocol, self.request.host,
+               self.get_response_media_type(), self.get_requested_fields())
+        response = cache.get(key)
+        if response is None:
+            self._cache_key = key
+            self._cache_generation = cache.generation
+            return False
+
+        for name, value in response.headers:
+            self.set_header(name, value)
+        if response.version is not None:
+            if self.check_not_modified(response.version):
+                return True
+        self.write(response.body)
+        self.set_status(http.OK)
+        return True
 
     def require_request_body(self):
         if self.request.headers.get('Content-Length', '0') == '0':
@@ -22,6 +548,65 @@ class BaseHandler(RequestHandler):
         if not self.request.body:
             raise HTTPError(http.BAD_REQUEST)
 
+    def apply_patch(self, representation, read_only=('id',)):
+        """Return `representation` changed by the patch in the body.
+
+        :param dict representation: the current representation as
+            returned by the model's ``as_dictionary`` method
+        :param read_only: names of the members that the patch may
+            not change
+        :returns: the patched representation
+        :raises HTTPError: if the patch cannot be applied
+
+        The format of the patch is selected by the ``Content-Type``
+        header from :attr:`patch_formats`.
+
+        - 400: if the patch is malformed, does not result in an
+          object, or changes a `read_only` member
+        - 409: if the patch does not apply to `representation`
+        - 415: if the content type is not a patch format
+
+        """
+        self.require_request_body()
+        content_type, content_options = werkzeug.http.parse_options_header(
+            self.request.headers.get('Content-Type',
+                                     'application/octet-stream'))
+        try:
+            apply = self.patch_formats[content_type]
+        except KeyError:
+            raise HTTPError(http.UNSUPPORTED_MEDIA_TYPE)
+        try:
+            with self.timer.measure('parse'):
+                patch_document = self.codecs['application/json'].decode(
+                    self.request.body,
+                    content_options.get('charset', 'utf-8'))
+            document = patch.to_document(representation)
+            patched = apply(document, patch_document)
+        except patch.PatchConflict as error:
+            raise HTTPError(http.CONFLICT, log_message=str(error))
+        except ValueError as error:
+            raise HTTPError(http.BAD_REQUEST, log_message=str(error))
+
+        if not isinstance(patched, dict):
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='patch must result in an object')
+        for name in read_only:
+            if patched.get(name) != document.get(name):
+                raise HTTPError(http.BAD_REQUEST,
+                                reason='{0} cannot be changed'.format(name))
+        return patched
+
+    def prefers_minimal_response(self):
+        """Did the client send ``Prefer: return=minimal``?
+
+        A client that already knows the new state of a resource uses
+        this preference to ask for an empty response.
+
+        """
+        header = self.request.headers.get('Prefer') or ''
+        return any(preference.strip() == 'return=minimal'
+                   for preference in header.split(','))
+
     def deserialize_model_instance(self, model_class):
         """Parse the body into an instance of ``model_class``.
 
@@ -36,22 +621,32 @@ class BaseHandler(RequestHandler):
         appropriate :class:`HTTPError` is raised.
 
         """
-        return model_class.from_dictionary(self.request_body)
+        body = self.request_body
+        if not isinstance(body, dict):
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='body must be an object')
+        return model_class.from_dictionary(body)
 
     def serialize_model_instance(self, model_instance, **kwds):
         """Send a *model* instance as the response.
 
         :param model_instance: instance of a *model* class that
             implements an ``as_dictionary`` method.
-        :keyword actions: a list of actions represented as dictionary
-            instances.
+        :keyword actions: a bound :class:`ActionCard` or a list of
+            actions represented as dictionary instances.
         :keyword RequestHandler model_handler: the Tornado handler that
             *owns* the model instance.  If present, this parameter is
             used to create the *self* link.
+        :keyword str version: the stored version of the model
+            instance.  If present, it is sent as the ``Etag`` header.
+        :keyword dict embedded: related representations returned by
+            :meth:`get_embedded`.  If present, they are included as
+            the ``embedded`` member and the response is not cached.
 
-        The actions available for this model instance are passed as
-        dictionary instances in the unnamed arguments list.  Each
-        instance is a dictionary containing the following members:
+        The actions available for this model instance are usually
+        passed as a bound :class:`ActionCard`.  They can also be
+        passed as a list of dictionaries containing the following
+        members:
 
         - name: the well-known action name
         - method: the HTTP method to invoke for the action
@@ -62,22 +657,251 @@ class BaseHandler(RequestHandler):
 
         """
         model_handler = kwds.get('model_handler')
-        model_representation = model_instance.as_dictionary()
+        if kwds.get('version') is not None:
+            self.set_version(kwds['version'])
+        model_representation = self.get_representation(
+            model_instance, model_handler=model_handler,
+            actions=kwds.get('actions'), fields=self.get_requested_fields())
+        headers = [('Content-Type', self.get_response_media_type()),
+                   ('Vary', 'Accept')]
+        if model_handler is not None:
+            headers.append(('Location', model_representation['self']))
+            self.set_header(*headers[-1])
+        if kwds.get('embedded') is not None:
+            model_representation['embedded'] = kwds['embedded']
+            self._cache_key = None
+
+        body = self.send_representation(model_representation)
+
+        if self._cache_key is not None and _response_cache is not None:
+            _response_cache.put(
+                self._cache_key,
+                CachedResponse(body, headers, kwds.get('version')),
+                self._cache_generation)
 
+    def get_representation(self, model_instance, model_handler=None,
+                           actions=None, fields=None):
+        """Return the representation of a *model* instance.
+
+        :param model_instance: instance of a *model* class that
+            implements an ``as_dictionary`` method.
+        :param RequestHandler model_handler: the handler that *owns*
+            the model instance.  If present, it is used to create the
+            *self* link.
+        :param actions: a bound :class:`ActionCard` or a list of
+            action dictionaries as described in
+            :meth:`serialize_model_instance`
+        :param fields: if specified, the set of members to include
+            as returned by :meth:`get_requested_fields`.  The model
+            instance is asked for these members only.  The ``self``
+            link is always included and the action card is included
+            if ``actions`` is in the set.
+        :rtype: dict
+
+        """
+        if fields is None:
+            model_representation = model_instance.as_dictionary()
+        else:
+            model_representation = model_instance.as_dictionary(
+                fields=fields | frozenset(['id']))
+            if 'actions' not in fields:
+                actions = None
         if model_handler is not None:
-            url = self.get_url_for(model_handler, model_representation['id'])
-            model_representation['self'] = url
-            self.set_header('Location', url)
+            model_representation['self'] = self.get_url_for(
+                model_handler, model_representation['id'])
+        if fields is not None and 'id' not in fields:
+            del model_representation['id']
+
+        if isinstance(actions, ActionCard):
+            model_representation['actions'] = actions.render(
+                self.get_url_for)
+        elif actions:
+            model_representation['actions'] = dict(
+                (action['name'], {
+                    'method': action['method'],
+                    'url': self.get_url_for(action['handler'],
+                                            *action['args']),
+                })
+                for action in actions)
+        return model_representation
+
+    def get_page_limit(self):
+        """Return the page size that the ``limit`` argument asks for.
+
+        :raises HTTPError: with a 400 status if ``limit`` is not a
+            positive integer
+
+        The result is capped at the configured maximum page size (see
+        :func:`configure_paging`).
+
+        """
+        limit = self.get_argument('limit', None)
+        if limit is None:
+            return _default_page_size
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='limit must be a positive integer')
+        return min(limit, _max_page_size)
+
+    def get_page_cursor(self):
+        """Return the index entry that the ``cursor`` argument names.
+
+        :returns: the ``(key, item_id)`` entry that the requested
+            page follows or :data:`None` for the first page
+        :raises HTTPError: with a 400 status if the cursor is
+            malformed
+
+        """
+        cursor = self.get_argument('cursor', None)
+        if cursor is None:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise HTTPError(http.BAD_REQUEST, reason='malformed cursor')
+
+    def get_requested_fields(self):
+        """Return the members that the ``fields`` argument asks for.
+
+        :returns: a :class:`frozenset` of member names or
+            :data:`None` if the full representation is wanted
+
+        The names are given in one or more comma-separated ``fields``
+        arguments.  Names that a representation does not have are
+        ignored.
+
+        """
+        arguments = self.get_arguments('fields')
+        if not arguments:
+            return None
+        return frozenset(name for argument in arguments
+                         for name in argument.split(',') if name)
+
+    def wants_embedded(self):
+        """Did the client ask for related resources to be embedded?"""
+        return bool(self.get_arguments('embed'))
+
+    @gen.coroutine
+    def get_embedded(self, model_class, instances):
+        """Retrieve the related resources that the client asked for.
 
-        for action in kwds.get('actions', []):
-            action_card = model_representation.setdefault('actions', {})
-            action_card[action['name']] = {
-                'method': action['method'],
-                'url': self.get_url_for(action['handler'], *action['args']),
-            }
+        :param type model_class: the class of `instances`
+        :param list instances: the model instances that are sent
+        :returns: a :class:`list` with an ``embedded`` dictionary for
+            each instance.  Each one maps a relation name to the list
+            of representations of the linked instances that exist.
+        :raises HTTPError: with a 400 status if the ``embed`` or
+            ``depth`` arguments are malformed
 
-        self.set_header('Content-Type', 'application/json')
-        self.write(json.dumps(model_representation))
+        The relations are named by one or more comma-separated
+        ``embed`` arguments.  A ``depth`` greater than one embeds the
+        same relations in the embedded representations, up to the
+        configured maximum depth (see :func:`configure_embedding`).
+        Each level costs one storage read per related model class no
+        matter how many instances are involved.
+
+        """
+        names = []
+        for argument in self.get_arguments('embed'):
+            names.extend(name for name in argument.split(',') if name)
+        for name in names:
+            if not any(key[1] == name for key in _relations):
+                raise HTTPError(http.BAD_REQUEST,
+                                reason='cannot embed {0}'.format(name))
+        try:
+            depth = int(self.get_argument('depth', 1))
+        except ValueError:
+            depth = 0
+        if depth < 1:
+            raise HTTPError(http.BAD_REQUEST,
+                            reason='depth must be a positive integer')
+        depth = min(depth, _max_embed_depth)
+
+        results = [{} for _ in instances]
+        level = [(model_class, instance, embedded)
+                 for instance, embedded in zip(instances, results)]
+        while level and depth > 0:
+            depth -= 1
+            wanted = collections.OrderedDict()
+            for item_class, instance, _ in level:
+                for name, target_class, item_ids in _links(
+                        item_class, instance, names):
+                    wanted.setdefault(target_class, []).extend(item_ids)
+
+            found = {}
+            for target_class, item_ids in wanted.items():
+                items = yield storage.get_items_async(
+                    target_class, list(collections.OrderedDict.fromkeys(
+                        item_ids)), ignore_missing=True)
+                model_handler, get_actions = _models[target_class]
+                for item in items:
+                    representation = self.get_representation(
+                        item, model_handler=model_handler,
+                        actions=get_actions(item))
+                    if depth > 0:
+                        representation['embedded'] = {}
+                    found[(target_class, item.id)] = (item, representation)
+
+            next_level = []
+            for item_class, instance, embedded in level:
+                for name, target_class, item_ids in _links(
+                        item_class, instance, names):
+                    embedded[name] = [
+                        found[(target_class, item_id)][1]
+                        for item_id in item_ids
+                        if (target_class, item_id) in found]
+            if depth > 0:
+                next_level = [
+                    (target_class, item, representation['embedded'])
+                    for (target_class, _), (item, representation)
+                    in found.items()]
+            level = next_level
+        raise gen.Return(results)
+
+    def send_page(self, items, limit, last_entry):
+        """Send one page of a collection.
+
+        :param list items: the representations in the page
+        :param int limit: the page size
+        :param tuple last_entry: the index entry that the next page
+            follows or :data:`None` if this is the last page
+
+        The page is sent as an object with the ``items``, a ``self``
+        link and, unless this is the last page, a ``next`` link that
+        is also sent in a ``Link`` header.
+
+        """
+        base_url = self.application.get_url_prefix(self.request)
+        page = {
+            'self': base_url + self.request.uri,
+            'items': items,
+        }
+        if last_entry is not None:
+            page['next'] = '{0}{1}?{2}'.format(
+                base_url, self.request.path, http.urlencode([
+                    ('cursor', encode_cursor(last_entry)),
+                    ('limit', limit),
+                ]))
+            self.set_header('Link', '<{0}>; rel="next"'.format(page['next']))
+        self.send_representation(page)
+
+    def send_representation(self, representation):
+        """Encode `representation` in the negotiated type and write it.
+
+        :returns: the encoded body
+
+        """
+        media_type = self.get_response_media_type()
+        with self.timer.measure('encode'):
+            body = self.codecs[media_type].encode(representation)
+        self.set_header('Content-Type', media_type)
+        self.set_header('Vary', 'Accept')
+        self.write(body)
+        return body
 
     @property
     def request_body(self):
@@ -92,32 +916,58 @@ class BaseHandler(RequestHandler):
 
         - 400: if the content cannot be decoded
         - 415: if the content type is unsupported
-        - 500: if the no handler is available for the content type
+        - 500: if the no codec is available for the content type
 
         """
         if self._request_body is None:
-            self.require_request_body()
-            full_content_type = self.request.headers.get(
-                'Content-Type',
-                'application/octet-stream'
-            )
-            parsed = werkzeug.http.parse_options_header(
-                full_content_type)
-            (content_type, content_options) = parsed
-            if content_type not in self.supported_media_types:
-                raise HTTPError(http.UNSUPPORTED_MEDIA_TYPE)
-            if content_type.startswith('application/json'):
-                charset = content_options.get('charset', 'utf-8')
-                self._request_body = json.loads(
-                    self.request.body.decode(charset))
-            else:
-                raise HTTPError(
-                    http.INTERNAL_SERVER_ERROR,
-                    reason='Unimplemented Content Type',
-                    log_message='{0} is not implemented in {1}.{2}'.format(
-                        content_type,
-                        self.__class__.__name__,
-                        'request_body',
-                    ),
-                )
+            with self.timer.measure('parse'):
+                self._request_body = self._parse_request_body()
         return self._request_body
+
+    def _parse_request_body(self):
+        self.require_request_body()
+        full_content_type = self.request.headers.get(
+            'Content-Type',
+            'application/octet-stream'
+        )
+        parsed = werkzeug.http.parse_options_header(
+            full_content_type)
+        (content_type, content_options) = parsed
+        if content_type not in self.supported_media_types:
+            raise HTTPError(http.UNSUPPORTED_MEDIA_TYPE)
+        body_codec = self.codecs.get(content_type)
+        if body_codec is not None:
+            try:
+                return body_codec.decode(
+                    self.request.body,
+                    content_options.get('charset', 'utf-8'))
+            except ValueError as error:
+                raise HTTPError(http.BAD_REQUEST,
+                                log_message=str(error))
+        else:
+            raise HTTPError(
+                http.INTERNAL_SERVER_ERROR,
+                reason='Unimplemented Content Type',
+                log_message='{0} is not implemented in {1}.{2}'.format(
+                    content_type,
+                    self.__class__.__name__,
+                    'request_body',
+                ),
+            )
+
+
+if codec.has_native_msgpack():
+    BaseHandler.register_codec(codec.MessagePackCodec())
+
+
+def _links(model_class, instance, names):
+    """Yield ``(name, target_class, item_ids)`` for the named relations."""
+    representation = None
+    for name in names:
+        target_class = _relations.get((model_class, name))
+        if target_class is None:
+            continue
+        if representation is None:
+            representation = instance.as_dictionary()
+        yield name, target_class, [
+            url.rsplit('/', 1)[-1] for url in representation.get(name, ())]
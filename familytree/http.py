@@ -11,15 +11,24 @@ except ImportError:  # pragma: no cover
     import httplib as _httpclient
 
 try:
-    from urllib.parse import urljoin
+    from urllib.parse import urlencode, urljoin, urlsplit
 except ImportError:  # pragma: no cover
-    from urlparse import urljoin
+    from urllib import urlencode
+    from urlparse import urljoin, urlsplit
 
 
 BAD_REQUEST = _httpclient.BAD_REQUEST
+CONFLICT = _httpclient.CONFLICT
 CREATED = _httpclient.CREATED
+FAILED_DEPENDENCY = _httpclient.FAILED_DEPENDENCY
 INTERNAL_SERVER_ERROR = _httpclient.INTERNAL_SERVER_ERROR
+METHOD_NOT_ALLOWED = _httpclient.METHOD_NOT_ALLOWED
+NOT_ACCEPTABLE = _httpclient.NOT_ACCEPTABLE
 NOT_FOUND = _httpclient.NOT_FOUND
 NO_CONTENT = _httpclient.NO_CONTENT
+NOT_MODIFIED = _httpclient.NOT_MODIFIED
 OK = _httpclient.OK
+PRECONDITION_FAILED = _httpclient.PRECONDITION_FAILED
+PRECONDITION_REQUIRED = 428  # RFC 6585, missing from Python 2 httplib
+REQUEST_ENTITY_TOO_LARGE = _httpclient.REQUEST_ENTITY_TOO_LARGE
 UNSUPPORTED_MEDIA_TYPE = _httpclient.UNSUPPORTED_MEDIA_TYPE
@@ -1,39 +1,156 @@
+import functools
 import logging
 
 import helper
+import helper.config
+import tornado.escape
 import tornado.ioloop
 import tornado.log
+import tornado.util
 import tornado.web
 
 from . import __version__
+from . import batch
+from . import bulk
+from . import debug
 from . import event
-from . import http
+from . import handlers
+from . import metrics
 from . import person
+from . import profiling
+from . import server
+from . import storage
 
 
 LOGGER = logging.getLogger(__name__)
+_STRING_TYPES = (tornado.util.unicode_type, tornado.util.bytes_type)
+
+
+def _compile_reverse(url_spec):
+    """Return a function that reverses `url_spec` into a path.
+
+    The function produces the same result as :meth:`URLSpec.reverse`
+    but the template is looked up once instead of on every call.
+
+    """
+    template = getattr(url_spec, '_path', None)
+    group_count = getattr(url_spec, '_group_count', None)
+    if template is None:
+        return url_spec.reverse
+    if not group_count:
+        return lambda: template
+
+    def reverse(*args):
+        assert len(args) == group_count, 'wrong number of arguments'
+        return template % tuple(
+            tornado.escape.url_escape(
+                arg if isinstance(arg, _STRING_TYPES) else str(arg),
+                plus=False)
+            for arg in args)
+
+    return reverse
 
 
 class Application(tornado.web.Application):
 
+    """The family tree web application.
+
+    A reverse function is compiled for every handler when it is
+    added and indexed by both handler class and handler name so that
+    :meth:`get_url_for` is a dictionary lookup and a string format.
+
+    """
+
     def __init__(self):
+        self._reversers = {}
         handlers = []
+        handlers.extend(batch.get_handlers('/batch'))
+        handlers.extend(bulk.get_handlers('/bulk'))
+        handlers.extend(debug.get_handlers('/debug'))
         handlers.extend(event.get_handlers('/event'))
+        handlers.extend(metrics.get_handlers('/metrics'))
         handlers.extend(person.get_handlers('/person'))
         super(Application, self).__init__(handlers)
 
-    def get_url_for(self, request, handler, *args):
-        url_spec = self.named_handlers.get(handler)
-        if not url_spec:
-            for host_patn, specs in self.handlers:
-                for cur_spec in specs:
-                    if cur_spec.handler_class == handler:
-                        url_spec = cur_spec
-                        break
-        if url_spec is not None:
-            return http.urljoin(request.full_url(), url_spec.reverse(*args))
+    def add_handlers(self, host_pattern, host_handlers):
+        super(Application, self).add_handlers(host_pattern, host_handlers)
+        reversers = {}
+        for name, url_spec in self.named_handlers.items():
+            reversers[name] = _compile_reverse(url_spec)
+        for _, url_specs in self.handlers:
+            for url_spec in url_specs:
+                if url_spec.handler_class not in reversers:
+                    reversers[url_spec.handler_class] = _compile_reverse(
+                        url_spec)
+        self._reversers = reversers
+
+    def get_url_prefix(self, request):
+        """Return the scheme and host that links for `request` start with."""
+        return '{0}://{1}'.format(request.protocol, request.host)
+
+    def reverse_path(self, handler, *args):
+        """Return the path that routes to `handler`.
+
+        :param handler: a handler class or the name of a handler
+        :param args: the values for the groups in the handler's
+            pattern
+        :returns: the path or :data:`None` if `handler` is unknown
+
+        """
+        reverse = self._reversers.get(handler)
+        if reverse is None:
+            return None
+        return reverse(*args)
+
+    def resolve_path(self, path):
+        """Return the handler that `path` routes to.
+
+        :param str path: the path portion of a URL
+        :returns: a ``(handler_class, args)`` tuple where `args` are
+            the unescaped values of the groups in the handler's
+            pattern, or :data:`None` if no handler matches
+
+        This is the inverse of :meth:`reverse_path`.  Only the
+        handlers that match every host are considered.
+
+        """
+        for host_pattern, url_specs in self.handlers:
+            if host_pattern.pattern != '.*$':
+                continue
+            for url_spec in url_specs:
+                match = url_spec.regex.match(path)
+                if match is not None:
+                    return url_spec.handler_class, tuple(
+                        tornado.escape.url_unescape(arg, plus=False)
+                        for arg in match.groups())
         return None
 
+    def get_body_consumer(self, request):
+        """Return the callable that the body of `request` is streamed to.
+
+        :param tornado.httpserver.HTTPRequest request: a request whose
+            body has not been read yet
+        :returns: the result of the ``get_body_consumer`` class
+            method of the handler that `request` routes to, or
+            :data:`None` if the body should be read as a whole
+
+        This is called by :class:`familytree.server.HTTPServer`.
+
+        """
+        target = self.resolve_path(request.path)
+        if target is None:
+            return None
+        get_consumer = getattr(target[0], 'get_body_consumer', None)
+        if get_consumer is None:
+            return None
+        return get_consumer(request)
+
+    def get_url_for(self, request, handler, *args):
+        path = self.reverse_path(handler, *args)
+        if path is None:
+            return None
+        return self.get_url_prefix(request) + path
+
 
 application = Application()
 
@@ -44,18 +161,165 @@ class Controller(helper.Controller):
     def __init__(self, *args):
         super(Controller, self).__init__(*args)
         self.io_loop = None
+        self.http_server = None
+        self.supervisor = None
+        self.shutdown_timeout = 10.0
 
     def run(self):
-        """Instantiate and start the IOLoop."""
+        """Bind the listening sockets and serve requests.
+
+        Requests are served by an IOLoop in this process unless the
+        ``workers`` setting asks for more than one worker process.
+        In that case this process supervises the workers (see
+        :mod:`familytree.server`) and the storage backend has to be
+        shared by them.
+
+        """
         LOGGER.info('%s v%s started', self.APPNAME, self.VERSION)
         self.setup()
+        self.configure()
+
+        settings = self.config.application
+        workers = int(settings.get('workers', 1))
+        port = int(settings.get('port', 7654))
+        address = settings.get('address') or ''
+        reuse_port = bool(settings.get('reuse_port', False))
+        if workers != 1 and not storage.get_backend().shared:
+            raise ValueError('the storage backend cannot be shared by '
+                             'several worker processes')
+
         self.set_state(self.STATE_ACTIVE)
-        application.listen(7654)
+        bind = functools.partial(server.bind_sockets, port, address,
+                                 reuse_port=reuse_port)
+        sockets = None if reuse_port else bind()
+        if workers == 1:
+            self.serve(sockets or bind())
+        else:
+            self.supervisor = server.Supervisor(workers)
+            self.supervisor.run(lambda task_id: self.serve(sockets or bind()))
+
+    def configure(self):
+        """Apply the ``Application`` configuration section.
+
+        The listening sockets and the number of workers are not
+        changed by this.
+
+        The instance cache and the response cache are disabled when
+        there is more than one worker since each worker would keep
+        its own and never see the writes of the others.  The indexes
+        are searched by the shared storage backend in that case.
+
+        """
+        settings = self.config.application
+        storage_settings = settings.get('storage')
+        response_cache_size = int(settings.get('response_cache_size', 0))
+        if (int(settings.get('workers', 1)) != 1 or
+                self.supervisor is not None):
+            storage_settings = dict(storage_settings or {})
+            if (int(storage_settings.get('cache_size', 0)) or
+                    response_cache_size):
+                LOGGER.warning('Disabling caches that worker processes '
+                               'cannot share')
+            storage_settings['cache_size'] = 0
+            response_cache_size = 0
+        storage.configure(storage_settings)
+        handlers.configure_response_cache(response_cache_size)
+        handlers.configure_paging(
+            int(settings.get('page_size', 20)),
+            int(settings.get('max_page_size', 100)))
+        handlers.configure_embedding(
+            int(settings.get('max_embed_depth', 2)))
+        metrics.configure_metrics(settings.get('metrics_directory'))
+        profile_settings = settings.get('profiling') or {}
+        profiling.configure_profiling(
+            bool(profile_settings.get('enabled', False)),
+            profile_settings.get('token'),
+            int(profile_settings.get('max_profiles', 20)),
+            profile_settings.get('directory'))
+        self.shutdown_timeout = float(settings.get('shutdown_timeout', 10))
+
+    def serve(self, sockets):
+        """Instantiate the IOLoop and handle requests on `sockets`.
+
+        This returns once the IOLoop is stopped by :meth:`drain` and
+        the storage layer has finished writing.
+
+        """
+        self.http_server = server.HTTPServer(application)
+        self.http_server.add_sockets(sockets)
         self.io_loop = tornado.ioloop.IOLoop.instance()
-        self.io_loop.start()
+        storage.get_backend().start_maintenance(self.io_loop)
+        if self.supervisor is not None:
+            tornado.ioloop.PeriodicCallback(
+                self.check_supervisor, 1000, self.io_loop).start()
+        tornado.ioloop.PeriodicCallback(
+            metrics.write_snapshot, metrics.SNAPSHOT_INTERVAL * 1000,
+            self.io_loop).start()
+        try:
+            self.io_loop.start()
+        finally:
+            storage.shutdown()
+
+    def drain(self):
+        """Finish the requests in progress and stop the IOLoop.
+
+        New connections are no longer accepted and requests that are
+        still running after ``shutdown_timeout`` seconds are
+        abandoned.
+
+        """
+        LOGGER.info('Finishing requests in progress')
+        self.http_server.drain(self.shutdown_timeout, self.io_loop.stop)
+
+    def check_supervisor(self):
+        """Drain a worker process whose supervisor has exited."""
+        if self.supervisor is not None and self.supervisor.orphaned:
+            LOGGER.warning('The supervisor has exited')
+            self.supervisor = None
+            self.drain()
+
+    def on_sighup(self, signum_unused, frame_unused):
+        """Reload the configuration file and replace the workers.
+
+        The file is read into a new configuration object since
+        :meth:`helper.config.Config.reload` does not update the
+        ``Application`` section.  The logging configuration is
+        updated in every process.
+
+        """
+        LOGGER.info('Received SIGHUP')
+        try:
+            self.config = helper.config.Config(self.args.config)
+        except ValueError as error:
+            LOGGER.error('Could not reload configuration: %s', error)
+            return
+        if self.logging_config.update(self.config.logging, self.debug):
+            LOGGER.info('Logging configuration updated')
+        self.configuration_reloaded()
+
+    def configuration_reloaded(self):
+        """Apply the new configuration by replacing the workers.
+
+        This only has an effect in the process that supervises the
+        workers, which is only started when ``workers`` is not 1.  A
+        single process keeps the rest of its configuration until it
+        is restarted since it cannot be replaced without dropping
+        connections or, with the memory backend, the stored data.
+
+        """
+        if self.supervisor is None:
+            LOGGER.warning('Only the logging configuration is reloaded '
+                           'by a single process, restart it or run more '
+                           'than one worker to apply the rest')
+        elif self.supervisor.task_id is None:
+            self.configure()
+            self.supervisor.reload()
 
     def cleanup(self):
-        self.io_loop.stop()
+        if self.supervisor is not None and self.supervisor.task_id is None:
+            self.supervisor.stop()
+        elif self.io_loop is not None:
+            self.io_loop.add_callback_from_signal(self.drain)
 
 
 def main():
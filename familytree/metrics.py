@@ -0,0 +1,299 @@
+"""Request and storage metrics.
+
+Every request that a :class:`~familytree.handlers.BaseHandler`
+finishes is counted in a latency histogram for its handler, method
+and status along with the number of bytes that were received and
+sent.  The storage layer records the latency of each of its
+operations in the same way.  The histograms use the fixed
+:data:`BUCKETS` so recording a value is a lookup and three
+additions.
+
+The ``/metrics`` resource returns everything in the `Prometheus text
+format`_.  It is rendered from counters that are already summed so a
+scrape costs the same no matter how many requests were served.
+
+Each process keeps its own metrics.  When requests are served by
+several worker processes, set the ``metrics_directory`` setting to a
+directory that the workers share.  Every worker writes a snapshot of
+its metrics there every :data:`SNAPSHOT_INTERVAL` seconds and the
+worker that serves ``/metrics`` adds up the recent snapshots of the
+others.  Snapshots of workers that have exited are removed once they
+are three intervals old, which a scraper sees as a counter reset.
+
+.. _Prometheus text format: https://prometheus.io/docs/instrumenting/
+   exposition_formats/
+
+"""
+import bisect
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from tornado import web
+
+
+LOGGER = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+"""Upper bounds of the latency histogram buckets in seconds."""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SNAPSHOT_INTERVAL = 5.0
+"""How often, in seconds, a worker writes its snapshot."""
+
+REQUEST_DURATION = 'familytree_http_request_duration_seconds'
+REQUEST_BYTES = 'familytree_http_request_bytes_total'
+RESPONSE_BYTES = 'familytree_http_response_bytes_total'
+STORAGE_DURATION = 'familytree_storage_operation_duration_seconds'
+
+_snapshot_directory = None
+
+
+class Registry(object):
+
+    """A set of metric families.
+
+    A family is either a *counter* or a *histogram* with a fixed set
+    of label names.  Values are kept for each combination of label
+    values that is recorded.  Recording is safe from any thread.
+
+    """
+
+    def __init__(self):
+        super(Registry, self).__init__()
+        self._families = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_counter(self, name, documentation, label_names):
+        """Declare a counter family."""
+        self._families[name] = _Family('counter', documentation,
+                                       label_names, ())
+
+    def add_histogram(self, name, documentation, label_names,
+                      buckets=BUCKETS):
+        """Declare a histogram family with upper bucket bounds."""
+        self._families[name] = _Family('histogram', documentation,
+                                       label_names, tuple(buckets))
+
+    def increment(self, name, labels, amount=1):
+        """Add `amount` to the counter `name` for the `labels` tuple."""
+        family = self._families[name]
+        with self._lock:
+            values = family.values.get(labels)
+            if values is None:
+                values = family.values[labels] = [0]
+            values[0] += amount
+
+    def observe(self, name, labels, value):
+        """Count `value` in the histogram `name` for the `labels` tuple."""
+        family = self._families[name]
+        with self._lock:
+            values = family.values.get(labels)
+            if values is None:
+                # a count per bucket, the +Inf bucket, the sum and the count
+                values = family.values[labels] = [0] * (
+                    len(family.buckets) + 3)
+            values[bisect.bisect_left(family.buckets, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def snapshot(self):
+        """Return a copy of every value that can be encoded as JSON."""
+        with self._lock:
+            return dict(
+                (name, [[list(labels), list(values)]
+                        for labels, values in family.values.items()])
+                for name, family in self._families.items())
+
+    def render(self, snapshots=()):
+        """Return the metrics in the Prometheus text format.
+
+        :param snapshots: results of :meth:`snapshot` from other
+            registries with the same families that are added to the
+            values of this one
+
+        """
+        merged = {}
+        for snapshot in [self.snapshot()] + list(snapshots):
+            for name, series in snapshot.items():
+                totals = merged.setdefault(name, {})
+                for labels, values in series:
+                    labels = tuple(labels)
+                    current = totals.get(labels)
+                    if current is None:
+                        totals[labels] = list(values)
+                    elif len(current) == len(values):
+                        for index, value in enumerate(values):
+                            current[index] += value
+
+        lines = []
+        for name, family in self._families.items():
+            lines.append('# HELP {0} {1}'.format(name, family.documentation))
+            lines.append('# TYPE {0} {1}'.format(name, family.kind))
+            for labels, values in sorted(merged.get(name, {}).items()):
+                pairs = list(zip(family.label_names, labels))
+                if family.kind == 'counter':
+                    lines.append(_sample(name, pairs, values[0]))
+                    continue
+                cumulative = 0
+                for bound, count in zip(family.buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(_sample(name + '_bucket',
+                                         pairs + [('le', bound)],
+                                         cumulative))
+                lines.append(_sample(name + '_sum', pairs, values[-2]))
+                lines.append(_sample(name + '_count', pairs, values[-1]))
+        return '\n'.join(lines) + '\n'
+
+
+class _Family(object):
+
+    def __init__(self, kind, documentation, label_names, buckets):
+        self.kind = kind
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self.values = {}
+
+
+def _sample(name, pairs, value):
+    if pairs:
+        name += '{' + ','.join(
+            '{0}="{1}"'.format(label, _escape(label_value))
+            for label, label_value in pairs) + '}'
+    return '{0} {1}'.format(name, _format_number(value))
+
+
+def _escape(value):
+    if isinstance(value, float):
+        return _format_number(value)
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+_registry = Registry()
+_registry.add_histogram(REQUEST_DURATION,
+                        'Time taken to handle a request.',
+                        ('handler', 'method', 'status'))
+_registry.add_counter(REQUEST_BYTES,
+                      'Bytes received in request bodies.',
+                      ('handler', 'method'))
+_registry.add_counter(RESPONSE_BYTES,
+                      'Bytes sent in response bodies.',
+                      ('handler', 'method', 'status'))
+_registry.add_histogram(STORAGE_DURATION,
+                        'Time taken by a storage layer operation.',
+                        ('operation',))
+
+
+def get_registry():
+    """Return the :class:`Registry` that this process records in."""
+    return _registry
+
+
+def configure_metrics(snapshot_directory=None):
+    """Share the metrics of several worker processes.
+
+    :param str snapshot_directory: the directory that the workers
+        write their snapshots to or :data:`None` to report the
+        metrics of the serving process only
+
+    """
+    global _snapshot_directory
+
+    if snapshot_directory and not os.path.isdir(snapshot_directory):
+        os.makedirs(snapshot_directory)
+    _snapshot_directory = snapshot_directory or None
+
+
+def record_request(handler, method, status, duration, request_bytes,
+                   response_bytes):
+    """Record a finished request.
+
+    :param str handler: the name of the handler class
+    :param str method: the HTTP method
+    :param int status: the response status code
+    :param float duration: the time taken in seconds
+    :param int request_bytes: the size of the request body
+    :param int response_bytes: the size of the response body
+
+    """
+    status = str(status)
+    _registry.observe(REQUEST_DURATION, (handler, method, status), duration)
+    _registry.increment(REQUEST_BYTES, (handler, method), request_bytes)
+    _registry.increment(RESPONSE_BYTES, (handler, method, status),
+                        response_bytes)
+
+
+def record_storage_operation(operation, duration):
+    """Record a storage operation that took `duration` seconds."""
+    _registry.observe(STORAGE_DURATION, (operation,), duration)
+
+
+def write_snapshot():
+    """Save the metrics of this process for the other workers."""
+    if _snapshot_directory is None:
+        return
+    path = os.path.join(_snapshot_directory, '{0}.json'.format(os.getpid()))
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'w') as snapshot_file:
+            json.dump(_registry.snapshot(), snapshot_file)
+        os.rename(temporary, path)
+    except (IOError, OSError) as error:
+        LOGGER.warning('Could not write metrics snapshot: %s', error)
+
+
+def render():
+    """Return the metrics of every worker in the Prometheus format."""
+    snapshots = []
+    if _snapshot_directory is not None:
+        own_name = '{0}.json'.format(os.getpid())
+        oldest = time.time() - 3 * SNAPSHOT_INTERVAL
+        for name in os.listdir(_snapshot_directory):
+            if not name.endswith('.json') or name == own_name:
+                continue
+            path = os.path.join(_snapshot_directory, name)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+                    continue
+                with open(path) as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (IOError, OSError, ValueError):
+                continue
+    return _registry.render(snapshots)
+
+
+def get_handlers(url_stem):
+    return [
+        (url_stem, MetricsHandler),
+    ]
+
+
+class MetricsHandler(web.RequestHandler):
+
+    """Root resource that reports the metrics."""
+
+    def get(self):
+        """Retrieve the metrics in the Prometheus text format.
+
+        The request and storage latency histograms and the byte
+        counters are described in :mod:`familytree.metrics`.
+
+        :status 200: the response contains the metrics
+
+        """
+        self.set_header('Content-Type', CONTENT_TYPE)
+        self.write(render())
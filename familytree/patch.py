@@ -0,0 +1,224 @@
+"""Partial updates of representations.
+
+A client changes a few members of a resource by sending a *patch*
+document instead of the whole representation.  Two formats are
+supported:
+
+- `JSON Merge Patch`_ (``application/merge-patch+json``) is an object
+  that mirrors the representation.  Members that are present replace
+  the current values, nested objects are merged recursively, and a
+  :data:`null` value removes the member.  Lists are replaced as a
+  whole.
+
+- `JSON Patch`_ (``application/json-patch+json``) is a list of
+  operations that each target a single location with a JSON pointer.
+  It can change one element of a list without repeating the others.
+
+Both functions work on plain documents so tuples are converted to
+lists by :func:`to_document` before a patch is applied.
+
+.. _JSON Merge Patch: https://tools.ietf.org/html/rfc7386
+.. _JSON Patch: https://tools.ietf.org/html/rfc6902
+
+"""
+from tornado.util import bytes_type, unicode_type
+
+
+_STRING_TYPES = (unicode_type, bytes_type)
+_MISSING = object()
+
+
+class InvalidPatch(ValueError):
+
+    """The patch document is malformed.
+
+    This is raised for patches that could never be applied, such as
+    an unknown operation or a pointer that does not start with ``/``.
+
+    """
+
+
+class PatchConflict(Exception):
+
+    """The patch cannot be applied to the current document.
+
+    This is raised when an operation refers to a location that does
+    not exist or when a ``test`` operation fails.
+
+    """
+
+
+def to_document(value):
+    """Return a copy of `value` made of dictionaries and lists."""
+    if isinstance(value, dict):
+        return dict((key, to_document(element))
+                    for key, element in value.items())
+    if isinstance(value, (list, tuple)):
+        return [to_document(element) for element in value]
+    return value
+
+
+def apply_merge_patch(document, patch):
+    """Return `document` with a JSON Merge Patch applied.
+
+    :param document: the current value
+    :param patch: the decoded merge patch
+    :returns: the patched value.  Parts of `document` that the
+        patch does not change are shared with the result.
+
+    """
+    if not isinstance(patch, dict):
+        return to_document(patch)
+    result = dict(document) if isinstance(document, dict) else {}
+    for name, value in patch.items():
+        if value is None:
+            result.pop(name, None)
+        else:
+            result[name] = apply_merge_patch(result.get(name), value)
+    return result
+
+
+def apply_json_patch(document, patch):
+    """Return `document` with a JSON Patch applied.
+
+    :param document: the current value.  It is not modified.
+    :param list patch: the decoded list of operations
+    :returns: the patched value
+    :raises InvalidPatch: if `patch` is malformed
+    :raises PatchConflict: if an operation cannot be applied
+
+    The operations are applied in order and the patch is applied
+    completely or not at all.
+
+    """
+    if not isinstance(patch, list):
+        raise InvalidPatch('a JSON Patch must be a list of operations')
+    root = [to_document(document)]
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise InvalidPatch('operation must be an object')
+        try:
+            apply_operation = _OPERATIONS[operation.get('op')]
+        except (KeyError, TypeError):
+            raise InvalidPatch(
+                'unknown operation {0!r}'.format(operation.get('op')))
+        apply_operation(root, operation)
+    return root[0]
+
+
+def _parse_pointer(pointer):
+    if not isinstance(pointer, _STRING_TYPES):
+        raise InvalidPatch('pointer must be a string')
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise InvalidPatch('malformed pointer {0!r}'.format(pointer))
+    return [token.replace('~1', '/').replace('~0', '~')
+            for token in pointer[1:].split('/')]
+
+
+def _resolve(root, pointer):
+    """Return the container and key that `pointer` refers to.
+
+    `root` is a single element list that holds the document so
+    that the empty pointer can be replaced like any other location.
+
+    """
+    tokens = _parse_pointer(pointer)
+    container, key = root, 0
+    for token in tokens:
+        container = _get(container, key, pointer)
+        if isinstance(container, dict):
+            key = token
+        elif isinstance(container, list):
+            key = _list_index(container, token, pointer)
+        else:
+            raise PatchConflict('{0} does not exist'.format(pointer))
+    return container, key
+
+
+def _list_index(container, token, pointer):
+    if token == '-':
+        return len(container)
+    if not token.isdigit() or (token.startswith('0') and token != '0'):
+        raise PatchConflict('{0} is not a list index'.format(pointer))
+    return int(token)
+
+
+def _get(container, key, pointer):
+    try:
+        if isinstance(container, list) and key >= len(container):
+            raise IndexError(key)
+        return container[key]
+    except (IndexError, KeyError):
+        raise PatchConflict('{0} does not exist'.format(pointer))
+
+
+def _value(operation):
+    if 'value' not in operation:
+        raise InvalidPatch('{0} requires a value'.format(operation['op']))
+    return to_document(operation['value'])
+
+
+def _add(root, operation, value=_MISSING):
+    if value is _MISSING:
+        value = _value(operation)
+    container, key = _resolve(root, operation.get('path'))
+    if isinstance(container, list) and container is not root:
+        if key > len(container):
+            raise PatchConflict('{0} is out of range'.format(
+                operation.get('path')))
+        container.insert(key, value)
+    else:
+        container[key] = value
+
+
+def _remove(root, operation):
+    container, key = _resolve(root, operation.get('path'))
+    value = _get(container, key, operation.get('path'))
+    del container[key]
+    if container is root:
+        root.append(None)
+    return value
+
+
+def _replace(root, operation):
+    value = _value(operation)
+    container, key = _resolve(root, operation.get('path'))
+    _get(container, key, operation.get('path'))
+    container[key] = value
+
+
+def _move(root, operation):
+    source = operation.get('from')
+    target = operation.get('path')
+    if (isinstance(source, _STRING_TYPES) and
+            isinstance(target, _STRING_TYPES) and
+            target.startswith(source + '/')):
+        raise InvalidPatch('cannot move {0} into itself'.format(source))
+    value = _remove(root, {'path': source})
+    _add(root, operation, value)
+
+
+def _copy(root, operation):
+    container, key = _resolve(root, operation.get('from'))
+    value = _get(container, key, operation.get('from'))
+    _add(root, operation, to_document(value))
+
+
+def _test(root, operation):
+    value = _value(operation)
+    container, key = _resolve(root, operation.get('path'))
+    if _get(container, key, operation.get('path')) != value:
+        raise PatchConflict('{0} does not match'.format(
+            operation.get('path')))
+
+
+_OPERATIONS = {
+    'add': _add,
+    'remove': _remove,
+    'replace': _replace,
+    'move': _move,
+    'copy': _copy,
+    'test': _test,
+}
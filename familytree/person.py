@@ -1,5 +1,7 @@
 import uuid
 
+from tornado import gen
+from tornado.util import bytes_type, unicode_type
 from tornado.web import HTTPError
 
 from . import handlers
@@ -15,14 +17,11 @@ def get_handlers(url_stem):
 
 
 def get_applicable_actions(person):
-    return [
-        {
-            'name': 'delete-person',
-            'method': 'DELETE',
-            'handler': PersonHandler,
-            'args': (person.id,)
-        },
-    ]
+    return _action_card.bind(person.id)
+
+
+_MEMBERS = frozenset(['display_name', 'events', 'id'])
+_STRING_TYPES = (unicode_type, bytes_type)
 
 
 class Person(object):
@@ -37,23 +36,47 @@ class Person(object):
     :raises AssertionError: if neither the `display_name` nor the
         `person_id` are included
 
+    People are indexed by name and by the events that they were
+    involved in.
+
     """
 
+    storage_indexes = (
+        storage.SortedIndex('display_name'),
+        storage.HashIndex('events'),
+    )
+
     def __init__(self, display_name=None, person_id=None):
         assert display_name or person_id
 
         super(Person, self).__init__()
         self.display_name = display_name
         self.id = person_id
-        self.events = []
+        self.events = ()
 
     def add_event(self, event):
         """Associate an event with this person.
 
         :param event: the event that this person was involved in
 
+        The list of events is an immutable tuple so that it can be
+        shared with stored records.  It is replaced instead of being
+        modified in place.
+
         """
-        self.events.append(event)
+        self.events = self.events + (event,)
+
+    def validate(self):
+        """Check that this person can be saved.
+
+        :raises ValueError: if the display name is not a string
+
+        The display name is the key of a sorted index so it has to be
+        comparable with the names of the other people.
+
+        """
+        if not isinstance(self.display_name, _STRING_TYPES):
+            raise ValueError('display_name must be a string')
 
     def remove_event(self, event):
         """Remove an event associated with this person.
@@ -62,11 +85,28 @@ class Person(object):
         :raises ValueError: if `event` is not associated with this person
 
         """
-        self.events.remove(event)
+        index = self.events.index(event)
+        self.events = self.events[:index] + self.events[index + 1:]
+
+    def discard_event(self, event_id):
+        """Remove the links to an event by its identifier.
+
+        :param str event_id: the unique identifier of the event
+
+        Links are matched by their last path segment so a link that
+        was made under another host name is removed as well.  Nothing
+        happens if the person does not link to the event.
 
-    def as_dictionary(self):
+        """
+        self.events = tuple(url for url in self.events
+                            if url.rsplit('/', 1)[-1] != event_id)
+
+    def as_dictionary(self, fields=None):
         """Return a dictionary representation.
 
+        :param fields: if specified, only the members named in this
+            collection are included
+
         The result can be used with :meth:`from_dictionary` to
         recreate this person.  In other words,
 
@@ -76,11 +116,14 @@ class Person(object):
         (True, True)
 
         """
-        return {
-            'display_name': self.display_name,
-            'id': self.id,
-            'events': self.events,
-        }
+        if fields is None:
+            return {
+                'display_name': self.display_name,
+                'id': self.id,
+                'events': self.events,
+            }
+        return dict((name, getattr(self, name)) for name in fields
+                    if name in _MEMBERS)
 
     @classmethod
     def from_dictionary(cls, person_data):
@@ -89,25 +132,67 @@ class Person(object):
         :param dict person_data:
         :returns: a :class:`Person` instance
 
-        >>> data = {'display_name': 'some name', 'id': '1234', 'events': []}
+        >>> data = {'display_name': 'some name', 'id': '1234', 'events': ()}
         >>> person = Person.from_dictionary(data)
         >>> person.as_dictionary() == data
         True
 
+        The events are converted to a tuple which is free when
+        `person_data` is a stored record.
+
         """
         person = Person(
             person_id=person_data.get('id'),
             display_name=person_data['display_name'],
         )
-        for event in person_data.get('events', []):
-            person.events.append(event)
+        person.events = tuple(person_data.get('events', ()))
         return person
 
 
 class CreatePersonHandler(handlers.BaseHandler):
 
-    """Root resource that creates a person."""
+    """Root resource that lists people and creates a person."""
+
+    @gen.coroutine
+    def get(self):
+        """List people in order of their display names.
+
+        :query int limit: the most people to return
+        :query str cursor: the position to continue listing from.
+            Use the ``next`` link of the previous page instead of
+            building it.
+        :query embed: ``events`` to embed the events of each person
+        :query int depth: how many levels of links to embed
+        :query fields: comma-separated members to include in each
+            representation.  The ``self`` link is always included.
+        :requestheader Accept: the requested representation type
+        :responseheader Link: the ``next`` link if there are more
+            people
+
+        The response is an object with an ``items`` list that holds
+        the person representations.  Each page costs the same no
+        matter how far into the collection it is.
+
+        :status 200: the response contains a page of people
+        :status 400: the ``limit`` or ``cursor`` is malformed
 
+        """
+        limit = self.get_page_limit()
+        after = self.get_page_cursor()
+        people, last_entry = yield storage.query_page_async(
+            Person, 'display_name', limit, after=after)
+        fields = self.get_requested_fields()
+        items = [self.get_representation(
+            a_person, model_handler=PersonHandler,
+            actions=get_applicable_actions(a_person), fields=fields)
+            for a_person in people]
+        if self.wants_embedded():
+            embedded = yield self.get_embedded(Person, people)
+            for item, item_embedded in zip(items, embedded):
+                item['embedded'] = item_embedded
+        self.send_page(items, limit, last_entry)
+
+    @gen.coroutine
     def post(self):
         """Create a new person.
 
@@ -124,64 +209,174 @@ class CreatePersonHandler(handlers.BaseHandler):
             person resource
         :status 201: a new resource was created
         :status 400: something is wrong with the included
-            representation
+            representation, e.g., the ``display_name`` is missing or
+            is not a string
         :status 415: the enclosed media-type is not recognized
 
         """
         try:
             a_person = self.deserialize_model_instance(Person)
-            a_person.id = uuid.uuid4().hex
-            storage.save_item(a_person, a_person.id)
+            a_person.validate()
+        except (AssertionError, KeyError):
+            raise HTTPError(http.BAD_REQUEST)
+        except ValueError as error:
+            raise HTTPError(http.BAD_REQUEST, reason=str(error))
 
-            self.serialize_model_instance(
-                a_person,
-                actions=get_applicable_actions(a_person),
-                model_handler=PersonHandler,
-            )
-            self.set_status(http.CREATED)
+        a_person.id = uuid.uuid4().hex
+        version = yield storage.save_item_async(a_person, a_person.id)
 
-        except KeyError:
-            raise HTTPError(http.BAD_REQUEST)
+        self.serialize_model_instance(
+            a_person,
+            actions=get_applicable_actions(a_person),
+            model_handler=PersonHandler,
+            version=version,
+        )
+        self.set_status(http.CREATED)
 
 
 class PersonHandler(handlers.BaseHandler):
 
     """Manages a person."""
 
+    @gen.coroutine
     def get(self, person_id):
         """Retrieve a Person by unique identifier.
 
         :param person_id: the unique identifier assigned to a person
+        :query embed: ``events`` to include the representations of
+            the person's events in the ``embedded`` member
+        :query int depth: how many levels of links to embed
+        :query fields: comma-separated members to include in the
+            representation.  The ``self`` link is always included.
         :requestheader Accept: the requested representation type
+        :requestheader If-None-Match: entity tags that the client has
+        :responseheader Etag: the version of the person.  When related
+            resources are embedded, it is a hash of the response.
 
         :status 200: the response contains a representation of the
             requested person
+        :status 304: the client already has the current version
         :status 404: `person_id` refers to a non-existent person
 
         """
+        embedding = self.wants_embedded()
+        if not embedding and self.send_cached_response((Person, person_id)):
+            return
         try:
-            a_person = storage.get_item(Person, person_id)
+            a_person, version = yield storage.get_versioned_item_async(
+                Person, person_id)
         except storage.InstanceNotFound:
             raise HTTPError(http.NOT_FOUND)
 
+        embedded = None
+        if embedding:
+            embedded, = yield self.get_embedded(Person, [a_person])
+            version = None
+        elif self.check_not_modified(version):
+            return
         self.serialize_model_instance(
             a_person,
             actions=get_applicable_actions(a_person),
             model_handler=PersonHandler,
+            version=version,
+            embedded=embedded,
         )
         self.set_status(http.OK)
 
+    @gen.coroutine
+    def patch(self, person_id):
+        """Change some members of a Person.
+
+        :param person_id: the unique identifier assigned to a person
+        :requestheader Content-Type: ``application/merge-patch+json``
+            or ``application/json-patch+json``
+        :requestheader If-Match: the version that the patch was
+            made from
+        :requestheader Prefer: ``return=minimal`` to omit the
+            representation from the response
+        :responseheader Etag: the new version of the person
+
+        The patch is applied to the representation that is stored.
+        Only the ``display_name`` can be changed.  The ``events`` are
+        changed by patching the events that the person is involved
+        in instead.
+
+        :status 200: the person was changed and the response contains
+            its new representation
+        :status 204: the person was changed
+        :status 400: the patch is malformed, changes a read-only
+            member, or leaves a ``display_name`` that is not a string
+        :status 404: `person_id` refers to a non-existent person
+        :status 409: the patch does not apply to the person
+        :status 412: the person is not at a version in ``If-Match``
+        :status 415: the enclosed media-type is not a patch format
+        :status 428: the request does not include ``If-Match``
+
+        """
+        expected_version = self.require_expected_version()
+        try:
+            a_person, version = yield storage.get_versioned_item_async(
+                Person, person_id)
+        except storage.InstanceNotFound:
+            raise HTTPError(http.NOT_FOUND)
+        if version not in expected_version:
+            raise HTTPError(http.PRECONDITION_FAILED)
+
+        changes = self.apply_patch(a_person.as_dictionary(),
+                                   read_only=('id', 'events'))
+        try:
+            a_person = Person.from_dictionary(changes)
+            a_person.validate()
+        except (AssertionError, KeyError):
+            raise HTTPError(http.BAD_REQUEST)
+        except ValueError as error:
+            raise HTTPError(http.BAD_REQUEST, reason=str(error))
+        try:
+            version = yield storage.save_item_async(
+                a_person, person_id, expected_version=version)
+        except storage.InstanceNotFound:
+            raise HTTPError(http.NOT_FOUND)
+        except storage.VersionConflict:
+            raise HTTPError(http.PRECONDITION_FAILED)
+
+        if self.prefers_minimal_response():
+            self.set_version(version)
+            self.set_status(http.NO_CONTENT)
+            return
+        self.serialize_model_instance(
+            a_person,
+            actions=get_applicable_actions(a_person),
+            model_handler=PersonHandler,
+            version=version,
+        )
+        self.set_status(http.OK)
+
+    @gen.coroutine
     def delete(self, person_id):
         """Delete a Person
 
         :param person_id: the unique identifier assigned to a person
+        :requestheader If-Match: only delete the person if it is at
+            one of these versions
 
         :status 204: the requested person has been deleted
         :status 404: `person_id` refers to a non-existent person
+        :status 412: the person is not at a version in ``If-Match``
 
         """
         try:
-            storage.delete_item(Person, person_id)
-            self.set_status(http.NO_CONTENT)
+            yield storage.delete_item_async(
+                Person, person_id,
+                expected_version=self.get_expected_version())
         except storage.InstanceNotFound:
             raise HTTPError(http.NOT_FOUND)
+        except storage.VersionConflict:
+            raise HTTPError(http.PRECONDITION_FAILED)
+        self.set_status(http.NO_CONTENT)
+
+
+_action_card = handlers.ActionCard(
+    ('delete-person', 'DELETE', PersonHandler),
+    ('update-person', 'PATCH', PersonHandler),
+)
+handlers.register_model(Person, PersonHandler, get_applicable_actions)
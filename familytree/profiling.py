@@ -0,0 +1,361 @@
+"""Profile a single request on demand.
+
+Profiling is disabled unless the ``enabled`` member of the
+``profiling`` setting is true.  When it is enabled, a request to any
+:class:`~familytree.handlers.BaseHandler` is profiled with
+:mod:`cProfile` if it sends the ``X-Profile`` header or the
+``profile`` query parameter with the configured ``token`` as its
+value.  Profiling stays disabled when there is no token::
+
+    curl -H 'X-Profile: s3cret' http://localhost:7654/person/1a2b
+
+The response carries the URL of the profile in its ``X-Profile``
+header.  The profile is stored once the request has finished and can
+be read from ``/debug/profiles`` as a text report or as a
+:mod:`pstats` file.  Those resources require the token as well.
+
+Only the code that runs on behalf of the profiled request is
+profiled, including storage operations that run on the thread pool,
+so other requests that are served at the same time do not show up
+in the profile.  Each process profiles one request at a time and a
+request that asks for a profile while another one is being profiled
+is served without one.
+
+The most recent ``max_profiles`` profiles are kept in the memory of
+the process that served the request.  When requests are served by
+several worker processes, set ``directory`` to a directory that the
+workers share.  Each profile is then saved there as a ``.prof`` file
+that :mod:`pstats` and other tools can load, and every worker lists
+the profiles of all of them.
+
+"""
+import collections
+import cProfile
+import hmac
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+
+
+LOGGER = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+"""Request header that asks for a profile and response header that
+holds its URL."""
+
+PARAMETER = 'profile'
+"""Query parameter that asks for a profile."""
+
+ABANDON_AFTER = 60.0
+"""Seconds after which an unfinished profile no longer blocks others."""
+
+_enabled = False
+_token = None
+_max_profiles = 20
+_directory = None
+_profiles = collections.OrderedDict()
+_lock = threading.Lock()
+_active = None
+_current = threading.local()
+
+
+def configure_profiling(enabled=False, token=None, max_profiles=20,
+                        directory=None):
+    """Enable or disable profiling.
+
+    :param bool enabled: allow clients to ask for profiles.  This
+        is ignored and profiling stays disabled unless `token` is
+        set as well.
+    :param str token: the value that a request has to send to be
+        profiled or to read the stored profiles
+    :param int max_profiles: the number of profiles to keep
+    :param str directory: save the profiles in this directory instead
+        of keeping them in memory
+
+    """
+    global _enabled, _token, _max_profiles, _directory
+
+    if enabled and not token:
+        LOGGER.warning('Not enabling profiling without a token')
+        enabled = False
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with _lock:
+        _enabled = bool(enabled)
+        _token = token or None
+        _max_profiles = max_profiles
+        _directory = directory or None
+        _profiles.clear()
+
+
+def is_enabled():
+    """Can clients ask for profiles?"""
+    return _enabled
+
+
+def start(handler):
+    """Start profiling the request of `handler` if it asks for it.
+
+    :param tornado.web.RequestHandler handler: the handler of the
+        request
+    :returns: a :class:`Session` that is activated for the code that
+        runs on behalf of the request or :data:`None` if the request
+        is not profiled
+
+    """
+    global _active
+
+    if not _enabled:
+        return None
+    value = _get_requested_token(handler)
+    if value is None:
+        return None
+    if not _matches_token(value):
+        LOGGER.warning('Ignoring profile request with the wrong token')
+        return None
+
+    with _lock:
+        now = time.time()
+        if _active is not None and now - _active.started < ABANDON_AFTER:
+            LOGGER.info('Not profiling %s %s since %s is being profiled',
+                        handler.request.method, handler.request.path,
+                        _active.id)
+            return None
+        _active = Session()
+        return _active
+
+
+def is_authorized(handler):
+    """May the request of `handler` read the stored profiles?
+
+    :returns: :data:`True` if profiling is enabled and the request
+        sends the configured token in the ``X-Profile`` header or the
+        ``profile`` query parameter
+
+    """
+    if not _enabled:
+        return False
+    value = _get_requested_token(handler)
+    return value is not None and _matches_token(value)
+
+
+def _get_requested_token(handler):
+    value = handler.request.headers.get(HEADER)
+    if value is None:
+        value = handler.get_query_argument(PARAMETER, None)
+    return value
+
+
+def _matches_token(value):
+    return _token is not None and hmac.compare_digest(
+        value.encode('utf-8'), _token.encode('utf-8'))
+
+
+def bind(function):
+    """Profile `function` wherever it is called for the current session.
+
+    :returns: a callable that profiles `function` into the session of
+        the request that is running now.  `function` is returned
+        as-is if the request is not profiled.
+
+    """
+    session = getattr(_current, 'session', None)
+    if session is None:
+        return function
+
+    def wrapper(*args, **kwargs):
+        with session.activate():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def list_profiles():
+    """Return the descriptions of the stored profiles, newest first.
+
+    Each description is a dictionary with the ``id`` of the profile,
+    the ``handler``, ``method``, ``path`` and ``status`` of the
+    request, its ``duration`` in milliseconds and the ``created``
+    time as seconds since the epoch.
+
+    """
+    if _directory is None:
+        with _lock:
+            return [description for description, _ in
+                    reversed(list(_profiles.values()))]
+
+    descriptions = []
+    for name in os.listdir(_directory):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(_directory, name)) as json_file:
+                    descriptions.append(json.load(json_file))
+            except (IOError, OSError, ValueError):
+                continue
+    return sorted(descriptions, key=lambda d: d['created'], reverse=True)
+
+
+def get_profile(profile_id):
+    """Return the statistics of a stored profile.
+
+    :param str profile_id: the identifier of the profile
+    :returns: a :class:`pstats.Stats` instance
+    :raises KeyError: if there is no such profile
+
+    """
+    if _directory is None:
+        with _lock:
+            stored = _profiles[profile_id][1]
+        # a copy so that sorting does not change the stored profile
+        stats = pstats.Stats()
+        stats.add(stored)
+        return stats
+
+    path = os.path.join(_directory, profile_id + '.prof')
+    try:
+        return pstats.Stats(path)
+    except (IOError, OSError):
+        raise KeyError(profile_id)
+
+
+class Session(object):
+
+    """Collects the profile of one request.
+
+    .. attribute:: id
+
+       the unique identifier of the profile
+
+    The request is profiled while the session is active in one or
+    more threads.  Each thread records into its own
+    :class:`cProfile.Profile` and they are added together when
+    :meth:`finish` is called.
+
+    """
+
+    def __init__(self):
+        super(Session, self).__init__()
+        self.id = uuid.uuid4().hex
+        self.started = time.time()
+        self.finished = False
+        self._profilers = {}
+        self._lock = threading.Lock()
+
+    def activate(self):
+        """Return a context manager that profiles in the calling thread.
+
+        This is suitable for use as a
+        :class:`~tornado.stack_context.StackContext` factory.
+
+        """
+        return _Activation(self)
+
+    def finish(self, handler):
+        """Stop profiling and store the profile of `handler`'s request."""
+        global _active
+
+        current = threading.current_thread()
+        profilers = []
+        with self._lock:
+            self.finished = True
+            for thread, (profiler, depth) in self._profilers.items():
+                if thread is current and depth:
+                    profiler.disable()
+                    self._profilers[thread] = (profiler, 0)
+                elif depth:
+                    # still running in another thread, which disables
+                    # it when it is done
+                    continue
+                profilers.append(profiler)
+        with _lock:
+            if _active is self:
+                _active = None
+
+        stats = pstats.Stats(*profilers)
+        request = handler.request
+        description = {
+            'id': self.id,
+            'handler': handler.__class__.__name__,
+            'method': request.method,
+            'path': request.path,
+            'status': handler.get_status(),
+            'duration': round(request.request_time() * 1000.0, 3),
+            'created': self.started,
+        }
+        _store(description, stats)
+
+    def _enter(self):
+        thread = threading.current_thread()
+        with self._lock:
+            if self.finished:
+                return False
+            profiler, depth = self._profilers.get(thread, (None, 0))
+            if profiler is None:
+                profiler = cProfile.Profile()
+            self._profilers[thread] = (profiler, depth + 1)
+        if depth == 0:
+            try:
+                profiler.enable()
+            except ValueError:  # pragma: no cover
+                # another profiler is active in this interpreter
+                with self._lock:
+                    self._profilers[thread] = (profiler, 0)
+                return False
+        return True
+
+    def _exit(self):
+        thread = threading.current_thread()
+        with self._lock:
+            profiler, depth = self._profilers.get(thread, (None, 0))
+            if not depth:
+                return
+            self._profilers[thread] = (profiler, depth - 1)
+        if depth == 1:
+            profiler.disable()
+
+
+class _Activation(object):
+
+    def __init__(self, session):
+        self.session = session
+        self.previous = None
+        self.entered = False
+
+    def __enter__(self):
+        self.previous = getattr(_current, 'session', None)
+        _current.session = self.session
+        self.entered = self.session._enter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.session = self.previous
+        if self.entered:
+            self.session._exit()
+
+
+def _store(description, stats):
+    if _directory is None:
+        with _lock:
+            _profiles[description['id']] = (description, stats)
+            while len(_profiles) > _max_profiles:
+                _profiles.popitem(last=False)
+        return
+
+    path = os.path.join(_directory, description['id'])
+    try:
+        stats.dump_stats(path + '.prof')
+        with open(path + '.json', 'w') as json_file:
+            json.dump(description, json_file)
+    except (IOError, OSError) as error:
+        LOGGER.warning('Could not save profile %s: %s', description['id'],
+                       error)
+        return
+    for old in list_profiles()[_max_profiles:]:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(_directory, old['id'] + extension))
+            except OSError:
+                pass
@@ -0,0 +1,419 @@
+"""Serve the application from several processes.
+
+Tornado runs a single IOLoop per process so one process uses one
+core.  :class:`Supervisor` forks a number of *worker* processes that
+each run their own IOLoop and accept connections on the same port.
+
+By default the listening sockets are bound once by the parent before
+it forks so every worker inherits them and the kernel hands each new
+connection to whichever worker accepts it first.  When the
+``reuse_port`` setting is enabled, each worker binds its own socket
+with ``SO_REUSEPORT`` instead and the kernel spreads the connections
+evenly over the workers.
+
+The parent does not serve requests.  It waits for the workers to exit
+and restarts the ones that crash.  A worker that exits with a zero
+status was stopped on purpose and is not restarted, just like
+:func:`tornado.process.fork_processes`.  Tornado's helper is not used
+directly because it keeps the process identifiers of the workers to
+itself so the parent could not stop or replace them.
+
+Workers are stopped gracefully.  :meth:`HTTPServer.drain` stops
+accepting connections, closes the idle ones and waits for the
+requests in progress to finish before the worker exits.
+:meth:`Supervisor.reload` uses this to replace every worker without
+dropping connections: new workers are started on the same sockets
+before the old ones are asked to drain.  Connections that arrive in
+between wait in the listen backlog of the sockets, which the parent
+keeps open.  With ``reuse_port`` each worker has its own socket so
+the few connections that are queued on an old worker's socket when
+it is closed are reset.
+
+Request bodies are normally read as a whole before the application
+is called.  The application can have the connection stream the body
+of a request instead, see :class:`_Connection`.
+
+Workers share nothing but the storage backend so it has to be one
+that several processes can use at once (see
+:attr:`~familytree.storage.base.StorageBackend.shared`).
+
+"""
+import errno
+import functools
+import logging
+import os
+import signal
+import socket
+import sys
+import weakref
+
+import tornado.escape
+import tornado.httpserver
+import tornado.httputil
+import tornado.netutil
+import tornado.process
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def bind_sockets(port, address=None, reuse_port=False, backlog=128):
+    """Create the listening sockets for `address` and `port`.
+
+    :param int port: the port to listen on
+    :param str address: the host name or address to listen on.  The
+        sockets listen on every interface if this is empty.
+    :param bool reuse_port: set ``SO_REUSEPORT`` so that several
+        processes can bind their own socket to the same port
+    :param int backlog: the length of the pending connection queue
+    :returns: a list of non-blocking listening sockets, one for each
+        address that `address` resolves to
+    :raises ValueError: if `reuse_port` is requested on a platform
+        that does not support it
+
+    """
+    if not reuse_port:
+        return tornado.netutil.bind_sockets(port, address or None,
+                                            backlog=backlog)
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise ValueError('SO_REUSEPORT is not supported on this platform')
+
+    sockets = []
+    addresses = socket.getaddrinfo(address or None, port, socket.AF_UNSPEC,
+                                   socket.SOCK_STREAM, 0, socket.AI_PASSIVE)
+    for family, socktype, proto, _, sockaddr in set(addresses):
+        sock = socket.socket(family, socktype, proto)
+        tornado.netutil.set_close_exec(sock.fileno())
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if family == socket.AF_INET6 and hasattr(socket, 'IPPROTO_IPV6'):
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.setblocking(0)
+        sock.bind(sockaddr)
+        sock.listen(backlog)
+        sockets.append(sock)
+    return sockets
+
+
+class HTTPServer(tornado.httpserver.HTTPServer):
+
+    """An HTTP server that finishes its requests before it stops.
+
+    :param request_callback: the application that handles requests
+
+    The keyword parameters are the same as those of
+    :class:`tornado.httpserver.HTTPServer`.
+
+    .. attribute:: connections
+
+       the open client connections
+
+    .. attribute:: poll_interval
+
+       how often, in seconds, :meth:`drain` checks whether the
+       requests in progress have finished
+
+    """
+
+    poll_interval = 0.1
+
+    def __init__(self, request_callback, **kwargs):
+        super(HTTPServer, self).__init__(request_callback, **kwargs)
+        self.connections = weakref.WeakSet()
+        self.draining = False
+
+    def handle_stream(self, stream, address):
+        self.connections.add(_Connection(
+            stream, address, self.request_callback, self.no_keep_alive,
+            self.xheaders, self.protocol))
+
+    def drain(self, timeout, callback):
+        """Stop accepting connections and finish the requests in progress.
+
+        :param float timeout: the most seconds to wait for requests
+            to finish
+        :param callback: called without parameters once every
+            connection is closed or `timeout` has passed
+
+        Idle connections are closed immediately and the others are
+        closed as soon as their response has been written instead of
+        being kept alive.  Calling this again has no effect.
+
+        """
+        if self.draining:
+            return
+        self.draining = True
+        self.no_keep_alive = True
+        self.stop()
+        deadline = self.io_loop.time() + timeout
+
+        def check():
+            busy = 0
+            for connection in list(self.connections):
+                if connection.stream.closed():
+                    continue
+                connection.no_keep_alive = True
+                if connection.busy or connection.stream.writing():
+                    busy += 1
+                else:
+                    connection.close()
+            if busy and self.io_loop.time() < deadline:
+                self.io_loop.add_timeout(
+                    self.io_loop.time() + self.poll_interval, check)
+                return
+            if busy:
+                LOGGER.warning('Abandoning %d requests that did not finish '
+                               'within %s seconds', busy, timeout)
+            callback()
+
+        check()
+
+
+class _Connection(tornado.httpserver.HTTPConnection):
+
+    """A connection that knows whether a request is in progress.
+
+    A request is in progress from the time that its headers have been
+    read, which includes reading the body, until the response is
+    finished.  Tornado does not expose this so the header callback is
+    extended.
+
+    The body of a request can also be passed to the application as
+    it is read.  If the application has a ``get_body_consumer``
+    method, it is called with each request that has a body before
+    the body is read.  When it returns a callable, the body is passed
+    to the callable :attr:`chunk_size` bytes at a time instead of
+    being buffered.  The callable may return a Future and the next
+    chunk is not read until it resolves, so a slow consumer slows
+    down the client instead of the body piling up in memory.  The
+    request is handed to the application once the whole body has been
+    consumed, with an empty ``body`` and the callable as its
+    ``body_consumer`` attribute.  The connection is closed if the
+    consumer fails.
+
+    .. attribute:: chunk_size
+
+       the most bytes that are passed to a body consumer at once
+
+    """
+
+    busy = False
+    chunk_size = 64 * 1024
+
+    def _on_headers(self, data):
+        self.busy = True
+        request = self._get_streamed_request(data)
+        if request is None:
+            super(_Connection, self)._on_headers(data)
+            return
+        self._request = request
+        if request.headers.get('Expect') == '100-continue':
+            self.stream.write(b'HTTP/1.1 100 (Continue)\r\n\r\n')
+        self._read_body_chunk(int(request.headers['Content-Length']))
+
+    def finish(self):
+        self.busy = False
+        super(_Connection, self).finish()
+
+    def _get_streamed_request(self, data):
+        # Tornado parses the request again when it is not streamed so
+        # malformed requests are left for it to report
+        get_consumer = getattr(self.request_callback, 'get_body_consumer',
+                               None)
+        if get_consumer is None:
+            return None
+        try:
+            data = tornado.escape.native_str(data.decode('latin1'))
+            eol = data.find('\r\n')
+            method, uri, version = data[:eol].split(' ')
+            headers = tornado.httputil.HTTPHeaders.parse(data[eol:])
+            content_length = int(headers.get('Content-Length') or 0)
+        except ValueError:
+            return None
+        if not version.startswith('HTTP/') or content_length <= 0:
+            return None
+
+        if self.address_family in (socket.AF_INET, socket.AF_INET6):
+            remote_ip = self.address[0]
+        else:
+            remote_ip = '0.0.0.0'
+        request = tornado.httpserver.HTTPRequest(
+            connection=self, method=method, uri=uri, version=version,
+            headers=headers, remote_ip=remote_ip, protocol=self.protocol)
+        request.body = b''
+        request.body_consumer = get_consumer(request)
+        if request.body_consumer is None:
+            return None
+        return request
+
+    def _read_body_chunk(self, remaining):
+        if remaining <= 0:
+            self.request_callback(self._request)
+            return
+        size = min(remaining, self.chunk_size)
+        self.stream.read_bytes(size, functools.partial(
+            self._on_body_chunk, remaining - size))
+
+    def _on_body_chunk(self, remaining, data):
+        result = self._request.body_consumer(data)
+        if result is None:
+            self._read_body_chunk(remaining)
+        else:
+            self.stream.io_loop.add_future(result, functools.partial(
+                self._on_body_chunk_consumed, remaining))
+
+    def _on_body_chunk_consumed(self, remaining, future):
+        try:
+            future.result()
+        except Exception:
+            LOGGER.exception('Failed to consume the body of %s %s',
+                             self._request.method, self._request.uri)
+            self.close()
+            return
+        self._read_body_chunk(remaining)
+
+
+class Supervisor(object):
+
+    """Runs worker processes and restarts the ones that crash.
+
+    :param int workers: the number of worker processes.  One worker
+        is started for each CPU if this is zero or less.
+    :param int max_restarts: the number of times that crashed workers
+        are restarted before the supervisor gives up
+
+    .. attribute:: children
+
+       the running workers as a dictionary that maps each process
+       identifier to the worker's task identifier
+
+    .. attribute:: task_id
+
+       the task identifier of the current process if it is a worker
+       or :data:`None` in the parent
+
+    """
+
+    def __init__(self, workers, max_restarts=100):
+        super(Supervisor, self).__init__()
+        if workers <= 0:
+            workers = tornado.process.cpu_count()
+        self.workers = workers
+        self.max_restarts = max_restarts
+        self.children = {}
+        self.retiring = set()
+        self.restarts = 0
+        self.stopping = False
+        self.task_id = None
+        self.pid = os.getpid()
+        self._serve = None
+
+    @property
+    def orphaned(self):
+        """Has the parent of this worker process exited?"""
+        return self.task_id is not None and os.getppid() != self.pid
+
+    def run(self, serve):
+        """Start the workers and wait until they have all exited.
+
+        :param serve: called in each worker process with the task
+            identifier of the worker, a number between zero and
+            :attr:`workers`.  The worker exits when it returns.
+        :raises RuntimeError: if the workers crash more than
+            :attr:`max_restarts` times
+
+        This only returns in the parent process.
+
+        """
+        LOGGER.info('Starting %d worker processes', self.workers)
+        self._serve = serve
+        for task_id in range(self.workers):
+            self._start(serve, task_id)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                raise
+            task_id = self.children.pop(pid, None)
+            if task_id is None:
+                continue
+            retired = pid in self.retiring
+            self.retiring.discard(pid)
+            if os.WIFSIGNALED(status):
+                LOGGER.warning('Worker %d (pid %d) was killed by signal %d',
+                               task_id, pid, os.WTERMSIG(status))
+            elif os.WEXITSTATUS(status) != 0:
+                LOGGER.warning('Worker %d (pid %d) exited with status %d',
+                               task_id, pid, os.WEXITSTATUS(status))
+            else:
+                LOGGER.info('Worker %d (pid %d) exited', task_id, pid)
+                continue
+            if self.stopping or retired:
+                continue
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                self.stop()
+                raise RuntimeError('workers crashed too many times')
+            self._start(serve, task_id)
+
+    def reload(self):
+        """Replace every worker with a new one.
+
+        A new worker is started for each task before the old workers
+        are sent ``SIGTERM``.  The old workers drain their
+        connections and are not restarted once they exit.
+
+        """
+        if self.stopping or self._serve is None:
+            return
+        old_workers = dict(self.children)
+        LOGGER.info('Replacing %d worker processes', len(old_workers))
+        for task_id in sorted(set(old_workers.values())):
+            self._start(self._serve, task_id)
+        self.retiring.update(old_workers)
+        for pid in old_workers:
+            self._terminate(pid)
+
+    def stop(self):
+        """Ask every worker to exit.
+
+        The workers are sent ``SIGTERM`` and are not restarted once
+        they exit.  :meth:`run` returns when the last one has exited.
+
+        """
+        self.stopping = True
+        for pid in list(self.children):
+            self._terminate(pid)
+
+    def _terminate(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError as error:
+            if error.errno != errno.ESRCH:
+                raise
+
+    def _start(self, serve, task_id):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = task_id
+            return
+
+        # This is the worker.  It must never return into the parent's
+        # call stack, which would run the parent's cleanup code.
+        status = 0
+        try:
+            self.children = {}
+            self.retiring = set()
+            self.task_id = task_id
+            serve(task_id)
+        except Exception:
+            LOGGER.exception('Worker %d failed', task_id)
+            status = 1
+        finally:
+            logging.shutdown()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
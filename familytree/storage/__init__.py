@@ -0,0 +1,938 @@
+"""Storage Abstraction.
+
+This module implements a storage layer for model instances.  A model
+instance is defined as an object that implements the
+:class:`ModelInstance` abstraction.  Any class that implements this
+abstraction can be saved by calling :func:`save_item` and retrieved
+by a call to :func:`get_item`.
+
+The records themselves are kept by a *storage backend* (see
+:class:`~familytree.storage.base.StorageBackend`).  The in-memory
+backend is used until :func:`configure` is called to select a
+different one.  The following backends are available by name:
+
+- ``memory``: :class:`~familytree.storage.memory.MemoryBackend`
+- ``sqlite``: :class:`~familytree.storage.sqlite.SQLiteBackend`
+- ``logfile``: :class:`~familytree.storage.logfile.LogStructuredBackend`
+
+A backend can also be named by its fully-qualified class name.
+
+Each of the storage functions has a ``_async`` counterpart that
+returns a :class:`~concurrent.futures.Future` instead of blocking
+the caller.  Request handlers should always use these since they
+run on the IOLoop.  Operations against a backend that does blocking
+I/O are run on a bounded thread pool.  Operations against a backend
+that does not block are run immediately and return a resolved
+future.
+
+Records are frozen (see :func:`freeze`) when they are saved so that
+the stored snapshot cannot be changed through a reference held by
+the model instance that produced it or by anything that reads it.
+This lets backends that keep records in memory hand the same record
+to every reader without copying it.
+
+Each record carries a *version* that is a hash of its content.  It is
+stored in the record under the ``_version`` member when the record is
+saved.  :func:`get_versioned_item` returns it alongside the model
+instance so that handlers can use it as an entity tag, and the write
+functions accept an `expected_version` that makes the write fail
+with :exc:`VersionConflict` if the record changed in the meantime.
+The backend compares the versions in the same transaction that makes
+the write (see :meth:`~StorageBackend.commit`) so the check and the
+write are atomic even when several processes share the backend.
+
+Records can optionally be kept in a bounded LRU cache (see
+:class:`~familytree.storage.cache.InstanceCache`) so that hot records
+are not read from the backend on every read.  The cache is disabled
+unless the ``cache_size`` storage setting is greater than zero.  It
+holds frozen records, not model instances, so a hit only saves the
+backend read: every read still creates a new model instance from the
+record with ``from_dictionary``.  Callers can modify the instances
+that they get without affecting other readers.  Each process has its own
+cache so it should only be enabled when a single process writes to
+the backend.
+
+Writes that belong together should be made through a
+:class:`Transaction` which buffers them and hands them to the backend
+as a single batch when it is committed.  Durable backends apply the
+batch atomically and sync it to disk once.
+
+Every record of a model class can be read in key order with
+:func:`scan_items`, which is how the store is exported.
+
+Model classes can declare secondary indexes (see
+:mod:`familytree.storage.index`) that are searched with
+:func:`query_keys` and :func:`query` and paged through with
+:func:`query_page`.  The indexes of a model class
+are built from a :meth:`~StorageBackend.scan` of its namespace the
+first time that they are searched and are updated by every write
+made through this module from then on.  Like the instance cache,
+these indexes are kept by each process so they do not see writes
+made by other processes.  When the backend is
+:attr:`~StorageBackend.shared`, searches are passed to
+:meth:`~StorageBackend.find` instead so that the backend answers
+them from the records that every process writes.
+
+The latency of every storage function, including the time spent
+waiting for the backend and the index lock, is recorded in the
+:mod:`~familytree.metrics` under the name of the function.  A
+function that calls another one, like :func:`query`, is only
+recorded once.  The latency is also added to the
+:class:`~familytree.timing.RequestTimer` of the request that the
+function runs for.
+
+"""
+import collections
+import functools
+import hashlib
+import importlib
+import json
+import threading
+import time
+
+from concurrent import futures
+from tornado import concurrent
+
+from .. import metrics
+from .. import profiling
+from .. import timing
+from . import cache
+from . import index
+from . import memory
+from .base import StorageBackend
+from .index import HashIndex, SortedIndex
+
+
+BACKENDS = {
+    'memory': 'familytree.storage.memory.MemoryBackend',
+    'sqlite': 'familytree.storage.sqlite.SQLiteBackend',
+    'logfile': 'familytree.storage.logfile.LogStructuredBackend',
+}
+
+_backend = memory.MemoryBackend()
+_executor = None
+_max_threads = 4
+_cache = None
+_indexes = {}
+_index_lock = threading.RLock()
+_VERSION = '_version'
+_listeners = []
+_measuring = threading.local()
+
+
+class InstanceNotFound(Exception):
+    """Raised when a model instance is not found.
+
+    :param type model_class: the class that was used in the
+        lookup
+    :param str item_id: the unique identifier that was used in
+        the lookup operation
+
+    Both of the parameters are saved as matching attributes.
+
+    """
+
+    def __init__(self, model_class, item_id):
+        super(InstanceNotFound, self).__init__(
+            'instance of {0} not found with id of {1}'.format(
+                model_class, item_id)
+        )
+        self.model_class = model_class
+        self.instance_id = item_id
+
+
+class InstancesNotFound(InstanceNotFound):
+    """Raised when some of the instances in a batch are not found.
+
+    :param type model_class: the class that was used in the
+        lookup
+    :param list item_ids: the unique identifiers that were not
+        found in the order that they were requested
+
+    The missing identifiers are available as the ``instance_ids``
+    attribute.  The ``instance_id`` attribute is set to the first of
+    them so this exception can be handled as an
+    :exc:`InstanceNotFound`.
+
+    """
+
+    def __init__(self, model_class, item_ids):
+        super(InstancesNotFound, self).__init__(model_class, item_ids[0])
+        self.args = (
+            'instances of {0} not found with ids of {1}'.format(
+                model_class, ', '.join(str(i) for i in item_ids)),
+        )
+        self.instance_ids = list(item_ids)
+
+
+class VersionConflict(Exception):
+    """Raised when a conditional write finds an unexpected version.
+
+    :param type model_class: the class of the instance being written
+    :param str item_id: the unique identifier of the instance
+    :param str version: the version that is currently stored
+
+    The parameters are saved as the ``model_class``, ``instance_id``
+    and ``version`` attributes.
+
+    """
+
+    def __init__(self, model_class, item_id, version):
+        super(VersionConflict, self).__init__(
+            'instance of {0} with id of {1} is at version {2}'.format(
+                model_class, item_id, version)
+        )
+        self.model_class = model_class
+        self.instance_id = item_id
+        self.version = version
+
+
+class FrozenDict(dict):
+    """A :class:`dict` that cannot be modified after it is created.
+
+    This is a :class:`dict` subclass so that it can be passed
+    anywhere a dictionary is expected, including :func:`json.dumps`.
+
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('stored records cannot be modified')
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """Return an immutable snapshot of `value`.
+
+    Dictionaries are converted to :class:`FrozenDict` instances and
+    lists to tuples, recursively.  Anything else is returned as-is
+    since model representations are otherwise made of strings,
+    numbers and :data:`None`.
+
+    """
+    if isinstance(value, dict):
+        if isinstance(value, FrozenDict):
+            return value
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class ModelInstance:
+    """Simple model instance.
+
+    A model instance is any object:
+
+    1. that implements the :meth:`as_dictionary` method
+    2. whose class implements a :meth:`from_dictionary` class
+       method
+
+    It does not have to have this class in its ``__mro__``.  All
+    that is required is the implementation of the two methods such
+    that::
+
+        o.__class__.from_dictionary(o.as_dictionary()) == o
+
+    is true for all instances of ``o``.
+
+    The dictionary that is passed to :meth:`from_dictionary` may
+    contain members whose names start with an underscore.  These are
+    maintained by the storage layer and should be ignored.  It may
+    also be a frozen record that is shared with other readers.  Lists in the
+    record are tuples so an implementation can share them instead of
+    copying them, but it must not try to modify the record.
+
+    """
+
+    def as_dictionary(self, fields=None):
+        """Return a dictionary representation of this object.
+
+        :param fields: if specified, only the members named in this
+            collection should be included.  The storage layer never
+            passes it but the request handlers do when a client asks
+            for a sparse representation.
+
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def from_dictionary(cls, dict_repr):
+        """Create a model instance from a dictionary.
+
+        :param dict dict_repr: a dictionary return from calling the
+            :meth:`as_dictionary` method on a model instance
+        :returns: a model instance
+
+        """
+        raise NotImplementedError
+
+
+def configure(settings=None):
+    """Select and configure the storage backend.
+
+    :param dict settings: the ``storage`` member of the application
+        configuration.  The ``backend`` member names the backend
+        either by one of the names in :data:`BACKENDS` or by its
+        fully-qualified class name.  The ``threads`` member limits
+        the number of threads used to run blocking backend operations
+        and defaults to 4.  The ``cache_size`` member is the number
+        of records to cache and defaults to 0 which disables the
+        cache.  The remaining members are passed to the backend as
+        keyword parameters.
+    :returns: the newly installed backend
+    :raises ValueError: if the backend cannot be found
+
+    """
+    global _backend, _cache, _indexes, _max_threads
+
+    settings = dict(settings or {})
+    backend_name = settings.pop('backend', 'memory')
+    threads = int(settings.pop('threads', 4))
+    cache_size = int(settings.pop('cache_size', 0))
+    class_path = BACKENDS.get(backend_name, backend_name)
+    module_name, _, class_name = class_path.rpartition('.')
+    try:
+        backend_class = getattr(importlib.import_module(module_name),
+                                class_name)
+    except (ImportError, AttributeError, ValueError):
+        raise ValueError('unknown storage backend {0}'.format(backend_name))
+
+    _backend.close()
+    _shutdown_executor()
+    _backend = backend_class(**settings)
+    _max_threads = threads
+    _cache = cache.InstanceCache(cache_size) if cache_size > 0 else None
+    _indexes = {}
+    return _backend
+
+
+def get_backend():
+    """Return the active :class:`StorageBackend` instance."""
+    return _backend
+
+
+def get_cache():
+    """Return the active instance cache or :data:`None`."""
+    return _cache
+
+
+def get_executor():
+    """Return the executor that runs operations for the active backend.
+
+    Backends that set :attr:`~StorageBackend.blocking` are run on a
+    thread pool that is created the first time that it is needed.
+    Otherwise, the operation is run immediately in the calling thread.
+
+    """
+    global _executor
+
+    if not _backend.blocking:
+        return concurrent.dummy_executor
+    if _executor is None:
+        _executor = _Executor(max_workers=_max_threads)
+    return _executor
+
+
+def shutdown():
+    """Wait for outstanding operations and close the backend."""
+    _shutdown_executor()
+    _backend.close()
+
+
+class _Executor(futures.ThreadPoolExecutor):
+    """Thread pool that runs each call for the caller's request.
+
+    The request timer and profile of the caller are carried over to
+    the thread that runs the call.
+
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super(_Executor, self).submit(
+            timing.bind(profiling.bind(fn)), *args, **kwargs)
+
+
+def _shutdown_executor():
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _asynchronous(function):
+    """Create a Future-returning version of a storage function."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return get_executor().submit(function, *args, **kwargs)
+
+    wrapper.__name__ = function.__name__ + '_async'
+    wrapper.__doc__ = (
+        'Run :func:`{0}` and return a :class:`~concurrent.futures.Future`'
+        ' that resolves to its result.'.format(function.__name__))
+    return wrapper
+
+
+def _measured(function):
+    """Record the latency of a storage function in the metrics."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_measuring, 'active', False):
+            return function(*args, **kwargs)
+        _measuring.active = True
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _measuring.active = False
+            duration = time.time() - start
+            metrics.record_storage_operation(function.__name__, duration)
+            timing.record('storage', duration)
+
+    return wrapper
+
+
+def get_namespace(model_class):
+    """Return the namespace that instances of `model_class` live in."""
+    return model_class.__name__
+
+
+def compute_version(record):
+    """Return the version of `record` as a string.
+
+    The version is a hash of the canonical JSON encoding of the
+    record so equal records always have the same version.  The
+    ``_version`` member itself is not included.
+
+    """
+    content = dict((key, value) for key, value in record.items()
+                   if key != _VERSION)
+    encoded = json.dumps(content, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def get_version(record):
+    """Return the version of a stored record.
+
+    Records that were saved before versions were recorded do not
+    have a ``_version`` member so their version is computed.
+
+    """
+    return record.get(_VERSION) or compute_version(record)
+
+
+@_measured
+def get_item(item_type, item_id):
+    """Retrieve an item of a specific type by id.
+
+    :param type item_type: the type of item to retrieve
+    :param str item_id: the unique ID of the item to retrieve
+    :returns: the model instance identified by ``item_id``
+    :raises InstanceNotFound: when no instance exists with ``item_id``
+
+    """
+    return get_versioned_item(item_type, item_id)[0]
+
+
+@_measured
+def get_versioned_item(item_type, item_id):
+    """Retrieve an item and its version.
+
+    :param type item_type: the type of item to retrieve
+    :param str item_id: the unique ID of the item to retrieve
+    :returns: ``(instance, version)`` tuple
+    :raises InstanceNotFound: when no instance exists with ``item_id``
+
+    """
+    instance_cache = _cache
+    if instance_cache is not None:
+        entry = instance_cache.get((item_type, item_id))
+        if entry is not None:
+            record, version = entry
+            return item_type.from_dictionary(record), version
+        generation = instance_cache.generation
+
+    try:
+        dict_repr = _backend.get(get_namespace(item_type), item_id)
+    except KeyError:
+        raise InstanceNotFound(item_type, item_id)
+    version = get_version(dict_repr)
+
+    if instance_cache is not None:
+        dict_repr = freeze(dict_repr)
+        instance_cache.put((item_type, item_id), (dict_repr, version),
+                           generation)
+    return item_type.from_dictionary(dict_repr), version
+
+
+@_measured
+def save_item(item, item_id, expected_version=None):
+    """Save an item to the persistence layer.
+
+    :param ModelInstance item: the item to save
+    :param str item_id: the unique identifier associated with ``item``
+    :param expected_version: if this is specified, then the item is
+        only saved if the stored version is equal to it.  This can
+        also be a collection of acceptable versions.
+    :returns: the version of the saved record
+    :raises InstanceNotFound: when `expected_version` is specified
+        and no instance exists with ``item_id``
+    :raises VersionConflict: when the stored version is not the
+        expected version
+
+    """
+    record = _snapshot(item)
+    namespace = get_namespace(item.__class__)
+    with _index_lock:
+        if expected_version is None:
+            _backend.put(namespace, item_id, record)
+        else:
+            _backend.commit([(namespace, item_id, record)], _version_check(
+                [(item.__class__, item_id, expected_version)]))
+        _update_index(item.__class__, item_id, record)
+    _invalidate([(item.__class__, item_id)])
+    return record[_VERSION]
+
+
+@_measured
+def delete_item(item_type, item_id, expected_version=None):
+    """Delete an item from the persistence layer.
+
+    :param type item_type: the type of item to retrieve
+    :param str item_id: the unique ID of the item to retrieve
+    :param expected_version: if this is specified, then the item is
+        only deleted if the stored version is equal to it.  This can
+        also be a collection of acceptable versions.
+    :raises InstanceNotFound: when no instance exists with ``item_id``
+    :raises VersionConflict: when the stored version is not the
+        expected version
+
+    """
+    namespace = get_namespace(item_type)
+    try:
+        with _index_lock:
+            if expected_version is None:
+                _backend.delete(namespace, item_id)
+            else:
+                _backend.commit([(namespace, item_id, None)], _version_check(
+                    [(item_type, item_id, expected_version)]))
+            _update_index(item_type, item_id, None)
+    except KeyError:
+        raise InstanceNotFound(item_type, item_id)
+    finally:
+        _invalidate([(item_type, item_id)])
+
+
+@_measured
+def get_items(item_type, item_ids, ignore_missing=False):
+    """Retrieve many items of a specific type with one backend call.
+
+    :param type item_type: the type of items to retrieve
+    :param item_ids: iterable of the unique IDs to retrieve
+    :param bool ignore_missing: leave instances that do not exist
+        out of the result instead of raising an exception
+    :returns: :class:`list` of model instances in the same order as
+        `item_ids`
+    :raises InstancesNotFound: when any of the instances do not
+        exist unless `ignore_missing` is set.  Every missing
+        identifier is included in the exception.
+
+    """
+    return [item_type.from_dictionary(record) for record
+            in _get_records(item_type, item_ids, ignore_missing)]
+
+
+@_measured
+def get_versioned_items(item_type, item_ids, ignore_missing=False):
+    """Retrieve many items and their versions with one backend call.
+
+    This accepts the same parameters as :func:`get_items` and returns
+    a :class:`list` of ``(instance, version)`` tuples.  The versions
+    can be passed as the `expected_version` of a later write so that
+    it fails if another writer changed the item in between.
+
+    """
+    return [(item_type.from_dictionary(record), get_version(record))
+            for record in _get_records(item_type, item_ids, ignore_missing)]
+
+
+def _get_records(item_type, item_ids, ignore_missing):
+    item_ids = list(item_ids)
+    records = {}
+    instance_cache = _cache
+    if instance_cache is not None:
+        generation = instance_cache.generation
+        for item_id in item_ids:
+            entry = instance_cache.get((item_type, item_id))
+            if entry is not None:
+                records[item_id] = entry[0]
+
+    wanted = [item_id for item_id in item_ids if item_id not in records]
+    if wanted:
+        found = _backend.get_many(get_namespace(item_type), wanted)
+        missing = [item_id for item_id in wanted if item_id not in found]
+        if missing and not ignore_missing:
+            raise InstancesNotFound(item_type, missing)
+        for item_id, dict_repr in found.items():
+            if instance_cache is not None:
+                dict_repr = freeze(dict_repr)
+                instance_cache.put((item_type, item_id),
+                                   (dict_repr, get_version(dict_repr)),
+                                   generation)
+            records[item_id] = dict_repr
+
+    return [records[item_id] for item_id in item_ids if item_id in records]
+
+
+@_measured
+def save_items(items):
+    """Save many items to the persistence layer with one backend call.
+
+    :param items: iterable of ``(item, item_id)`` pairs.  The items
+        do not have to be of the same type.
+
+    """
+    items = list(items)
+    records = [(get_namespace(item.__class__), item_id, _snapshot(item))
+               for item, item_id in items]
+    if records:
+        with _index_lock:
+            _backend.put_many(records)
+            for (item, item_id), (_, _, record) in zip(items, records):
+                _update_index(item.__class__, item_id, record)
+        _invalidate([(item.__class__, item_id) for item, item_id in items])
+
+
+@_measured
+def delete_items(item_type, item_ids):
+    """Delete many items from the persistence layer with one backend call.
+
+    :param type item_type: the type of items to delete
+    :param item_ids: iterable of the unique IDs to delete
+    :raises InstancesNotFound: when any of the instances do not
+        exist.  The instances that did exist are deleted.
+
+    """
+    item_ids = list(item_ids)
+    if item_ids:
+        with _index_lock:
+            missing = _backend.delete_many(get_namespace(item_type),
+                                           item_ids)
+            for item_id in item_ids:
+                _update_index(item_type, item_id, None)
+        _invalidate([(item_type, item_id) for item_id in item_ids])
+        if missing:
+            raise InstancesNotFound(item_type, missing)
+
+
+class Transaction(object):
+    """A unit of work that commits many writes at once.
+
+    Writes are buffered until :meth:`commit` is called.  They are then
+    passed to :meth:`~StorageBackend.commit` in a single call.  Saving
+    or deleting the same item more than once in a transaction keeps
+    the last write.  A transaction can be used as a context manager
+    that commits when the block exits normally and discards the
+    buffered writes when it raises::
+
+        with storage.Transaction() as transaction:
+            transaction.save_item(event, event.id)
+            transaction.delete_item(Person, person_id)
+
+    Request handlers should call :meth:`commit_async` instead.
+
+    Unlike :func:`delete_item`, deleting an item that does not exist
+    is not an error.
+
+    """
+
+    def __init__(self):
+        super(Transaction, self).__init__()
+        self.changes = collections.OrderedDict()
+        self.expected_versions = {}
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.changes.clear()
+            self.expected_versions.clear()
+
+    def save_item(self, item, item_id, expected_version=None):
+        """Save `item` when the transaction is committed.
+
+        :returns: the version that the item has once the transaction
+            is committed
+
+        If `expected_version` is specified, then the commit fails
+        unless the stored version of the item matches it.
+
+        """
+        key = (item.__class__, item_id)
+        record = _snapshot(item)
+        self.changes[key] = record
+        if expected_version is not None:
+            self.expected_versions[key] = expected_version
+        return get_version(record)
+
+    def save_items(self, items):
+        """Save ``(item, item_id)`` pairs when the transaction commits."""
+        for item, item_id in items:
+            self.save_item(item, item_id)
+
+    def delete_item(self, item_type, item_id, expected_version=None):
+        """Delete an item when the transaction is committed.
+
+        If `expected_version` is specified, then the commit fails
+        unless the stored version of the item matches it.
+
+        """
+        self.changes[(item_type, item_id)] = None
+        if expected_version is not None:
+            self.expected_versions[(item_type, item_id)] = expected_version
+
+    def delete_items(self, item_type, item_ids):
+        """Delete many items when the transaction is committed."""
+        for item_id in item_ids:
+            self.delete_item(item_type, item_id)
+
+    @_measured
+    def commit(self):
+        """Apply the buffered writes with one backend call.
+
+        :raises InstanceNotFound: when an item with an expected
+            version does not exist
+        :raises VersionConflict: when the stored version of an item
+            does not match its expected version.  Nothing is written.
+
+        """
+        changes, self.changes = self.changes, collections.OrderedDict()
+        expected, self.expected_versions = self.expected_versions, {}
+        if not changes:
+            return
+        records = [(get_namespace(item_type), item_id, record)
+                   for (item_type, item_id), record in changes.items()]
+        with _index_lock:
+            if expected:
+                _backend.commit(records, _version_check(
+                    [key + (version,) for key, version in expected.items()]))
+            else:
+                _backend.commit(records)
+            for (item_type, item_id), record in changes.items():
+                _update_index(item_type, item_id, record)
+        _invalidate(list(changes))
+
+    def commit_async(self):
+        """Run :meth:`commit` and return a Future that tracks it."""
+        return get_executor().submit(self.commit)
+
+
+def scan_items(item_type, group_size=100):
+    """Read every stored record of `item_type` in key order.
+
+    :param type item_type: the model class to read
+    :param int group_size: the number of records to read with each
+        backend call
+    :returns: an iterator of lists that hold up to `group_size`
+        ``(item_id, record)`` pairs.  The records are the stored
+        dictionaries without their version.
+
+    The identifiers are listed when the iteration starts and the
+    records are read one group at a time as the iterator advances,
+    so only one group of records is in memory.  Records that are
+    deleted during the iteration are skipped and records that are
+    created are not included.  Each step blocks on the backend so a
+    request handler should advance the iterator on the executor
+    returned by :func:`get_executor`.
+
+    """
+    namespace = get_namespace(item_type)
+    item_ids = sorted(_backend.keys(namespace))
+    for start in range(0, len(item_ids), group_size):
+        wanted = item_ids[start:start + group_size]
+        found = _backend.get_many(namespace, wanted)
+        yield [(item_id, dict((name, value)
+                              for name, value in found[item_id].items()
+                              if name != _VERSION))
+               for item_id in wanted if item_id in found]
+
+
+@_measured
+def query_keys(item_type, index_name, **criteria):
+    """Search a secondary index of `item_type`.
+
+    :param type item_type: the model class that declares the index
+        in its ``storage_indexes`` attribute
+    :param str index_name: the name of the index to search
+    :keyword equals: only return entries whose key is equal to this
+    :keyword low: only return entries whose key is greater than or
+        equal to this.  *Sorted indexes only.*
+    :keyword high: only return entries whose key is less than this.
+        *Sorted indexes only.*
+    :keyword str prefix: only return entries whose key starts with
+        this.  *Sorted indexes only.*
+    :keyword tuple after: only return entries that follow this
+        ``(key, item_id)`` entry.  *Sorted indexes only.*
+    :keyword int limit: the most entries to return
+    :returns: :class:`list` of ``(key, item_id)`` pairs.  A sorted
+        index returns them in key order and a hash index returns
+        them in identifier order.
+    :raises ValueError: if the index does not exist or does not
+        support the criteria
+
+    """
+    if _backend.shared:
+        for definition in getattr(item_type, 'storage_indexes', ()):
+            if definition.name == index_name:
+                return _backend.find(get_namespace(item_type), definition,
+                                     **criteria)
+        raise ValueError('no index named {0}'.format(index_name))
+    with _index_lock:
+        return _get_indexes(item_type).find(index_name, **criteria)
+
+
+@_measured
+def query(item_type, index_name, **criteria):
+    """Retrieve the instances that match a secondary index search.
+
+    This accepts the same parameters as :func:`query_keys` and
+    returns a :class:`list` of model instances in index order.  The
+    instances are read with a single call to :func:`get_items`.
+
+    """
+    item_ids, seen = [], set()
+    for _, item_id in query_keys(item_type, index_name, **criteria):
+        if item_id not in seen:
+            seen.add(item_id)
+            item_ids.append(item_id)
+    return get_items(item_type, item_ids)
+
+
+@_measured
+def query_page(item_type, index_name, limit, after=None):
+    """Retrieve one page of instances in the order of a sorted index.
+
+    :param type item_type: the model class that declares the index
+    :param str index_name: the name of a sorted index
+    :param int limit: the most instances to return
+    :param tuple after: the ``(key, item_id)`` entry that the
+        previous page ended with
+    :returns: a ``(instances, last_entry)`` tuple.  `last_entry` is
+        the entry to pass as `after` to retrieve the next page or
+        :data:`None` if this is the last page.
+
+    The cost of a page depends on `limit` and not on how deep into
+    the index it starts since `after` is found with a binary search,
+    or with an index seek when a shared backend searches the index.
+    An item that is deleted after its entry was found is left out of
+    the page.
+
+    """
+    entries = query_keys(item_type, index_name, after=after,
+                         limit=limit + 1)
+    last_entry = entries[limit - 1] if len(entries) > limit else None
+    instances = get_items(item_type,
+                          [item_id for _, item_id in entries[:limit]],
+                          ignore_missing=True)
+    return instances, last_entry
+
+
+def _snapshot(item):
+    record = dict(item.as_dictionary())
+    record[_VERSION] = compute_version(record)
+    return freeze(record)
+
+
+def _version_check(expected):
+    """Return a backend commit check for ``(type, id, version)`` tuples."""
+
+    def check(get):
+        for item_type, item_id, expected_version in expected:
+            try:
+                record = get(get_namespace(item_type), item_id)
+            except KeyError:
+                raise InstanceNotFound(item_type, item_id)
+            version = get_version(record)
+            if isinstance(expected_version, (list, tuple, set, frozenset)):
+                matched = version in expected_version
+            else:
+                matched = version == expected_version
+            if not matched:
+                raise VersionConflict(item_type, item_id, version)
+
+    return check
+
+
+def _get_indexes(item_type):
+    namespace = get_namespace(item_type)
+    with _index_lock:
+        indexes = _indexes.get(namespace)
+        if indexes is None:
+            indexes = index.IndexSet(getattr(item_type, 'storage_indexes', ()))
+            indexes.load(_backend.scan(namespace))
+            _indexes[namespace] = indexes
+        return indexes
+
+
+def _update_index(item_type, item_id, record):
+    indexes = _indexes.get(get_namespace(item_type))
+    if indexes is not None:
+        if record is None:
+            indexes.remove(item_id)
+        else:
+            indexes.add(item_id, record)
+
+
+def add_write_listener(listener):
+    """Call `listener` whenever items are written.
+
+    :param listener: a callable that is passed a :class:`list` of
+        ``(model_class, item_id)`` keys after they are saved or
+        deleted.  It may be called from a thread pool thread.
+
+    This lets caches of things that are derived from stored items
+    stay consistent with the storage layer.
+
+    """
+    _listeners.append(listener)
+
+
+def remove_write_listener(listener):
+    """Stop calling a listener added by :func:`add_write_listener`."""
+    _listeners.remove(listener)
+
+
+def _invalidate(keys):
+    if _cache is not None:
+        _cache.invalidate(keys)
+    for listener in _listeners:
+        listener(keys)
+
+
+get_item_async = _asynchronous(get_item)
+get_versioned_item_async = _asynchronous(get_versioned_item)
+save_item_async = _asynchronous(save_item)
+delete_item_async = _asynchronous(delete_item)
+get_items_async = _asynchronous(get_items)
+get_versioned_items_async = _asynchronous(get_versioned_items)
+save_items_async = _asynchronous(save_items)
+delete_items_async = _asynchronous(delete_items)
+query_keys_async = _asynchronous(query_keys)
+query_async = _asynchronous(query)
+query_page_async = _asynchronous(query_page)
@@ -0,0 +1,240 @@
+"""Storage backend abstraction.
+
+A storage backend is responsible for persisting the dictionary
+representations of model instances.  The :mod:`familytree.storage`
+module is the only consumer of backends.  It handles converting
+model instances to and from dictionaries and hands the dictionaries
+to the configured backend.
+
+Records are grouped by *namespace*.  The namespace is derived from
+the model class by :func:`familytree.storage.get_namespace` and each
+record is identified by a string within its namespace.
+
+"""
+
+
+class StorageBackend(object):
+
+    """Interface that every storage backend implements.
+
+    :param dict settings: the backend-specific configuration
+        taken from the ``storage`` member of the ``Application``
+        configuration section
+
+    Backends are created when the configuration is read which is
+    *before* the process forks into workers.  Any resources that
+    cannot be shared across processes (e.g., file handles or database
+    connections) should be acquired in :meth:`open` which is called
+    lazily from the process that uses the backend.
+
+    .. attribute:: blocking
+
+       Set this to :data:`True` if the backend performs blocking I/O.
+       Operations on blocking backends are run on a thread pool so
+       they do not stall the IOLoop.  Blocking backends must be safe
+       to use from multiple threads.
+
+    .. attribute:: shared
+
+       Set this to :data:`True` if several processes can use the
+       backend at the same time and see each other's writes.  The
+       application refuses to start more than one worker process
+       unless the backend is shared.
+
+    """
+
+    blocking = True
+    shared = False
+
+    def __init__(self, **settings):
+        super(StorageBackend, self).__init__()
+        self.settings = settings
+
+    def open(self):
+        """Acquire any resources required by the backend."""
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+    def start_maintenance(self, io_loop):
+        """Schedule periodic housekeeping on `io_loop`.
+
+        :param tornado.ioloop.IOLoop io_loop: the loop that the
+            process is running
+
+        This is called once the IOLoop is available.  Backends that
+        need to do background work (e.g., compaction) should do it in
+        small steps scheduled on `io_loop`.
+
+        """
+
+    def stop_maintenance(self):
+        """Cancel anything scheduled by :meth:`start_maintenance`."""
+
+    def get(self, namespace, item_id):
+        """Retrieve a record.
+
+        :param str namespace: the namespace that the record lives in
+        :param str item_id: the unique identifier of the record
+        :returns: the dictionary that was saved by :meth:`put`
+        :raises KeyError: if the record does not exist
+
+        """
+        raise NotImplementedError
+
+    def put(self, namespace, item_id, record):
+        """Insert or replace a record.
+
+        :param str namespace: the namespace that the record lives in
+        :param str item_id: the unique identifier of the record
+        :param dict record: the record to store
+
+        """
+        raise NotImplementedError
+
+    def delete(self, namespace, item_id):
+        """Remove a record.
+
+        :param str namespace: the namespace that the record lives in
+        :param str item_id: the unique identifier of the record
+        :raises KeyError: if the record does not exist
+
+        """
+        raise NotImplementedError
+
+    def scan(self, namespace):
+        """Iterate over every record in a namespace.
+
+        :param str namespace: the namespace to read
+        :returns: iterable of ``(item_id, record)`` pairs in no
+            particular order
+
+        This is used to build secondary indexes so it is called
+        rarely and may be slow.
+
+        """
+        raise NotImplementedError
+
+    def keys(self, namespace):
+        """Return the identifiers of every record in a namespace.
+
+        :param str namespace: the namespace to read
+        :returns: iterable of identifiers in no particular order
+
+        The default implementation calls :meth:`scan` so it reads
+        every record.  Backends should override this when they can
+        list the identifiers without reading the records.
+
+        """
+        return [item_id for item_id, _ in self.scan(namespace)]
+
+    def find(self, namespace, definition, **criteria):
+        """Search the records of a namespace by a secondary index.
+
+        :param str namespace: the namespace to search
+        :param definition: the
+            :class:`~familytree.storage.index.HashIndex` or
+            :class:`~familytree.storage.index.SortedIndex` that
+            describes the index
+        :param criteria: the keyword parameters accepted by
+            :func:`familytree.storage.query_keys`
+        :returns: :class:`list` of ``(key, item_id)`` pairs in the
+            order of the index
+        :raises ValueError: if the index does not support the criteria
+
+        The storage layer calls this instead of searching the indexes
+        that it keeps in memory when the backend is :attr:`shared`
+        since those do not see the writes of other processes.  The
+        default implementation builds the index from a :meth:`scan`
+        on every call so shared backends should override it.
+
+        """
+        table = definition.create_table()
+        for item_id, record in self.scan(namespace):
+            table.add(item_id, definition.keys(record))
+        return table.find(**criteria)
+
+    def get_many(self, namespace, item_ids):
+        """Retrieve many records from a single namespace.
+
+        :param str namespace: the namespace that the records live in
+        :param list item_ids: the unique identifiers of the records
+        :returns: :class:`dict` that maps each identifier that was
+            found to its record.  Identifiers that do not exist are
+            omitted.
+
+        The default implementation calls :meth:`get` for each record.
+        Backends should override this when they can do better.
+
+        """
+        found = {}
+        for item_id in item_ids:
+            try:
+                found[item_id] = self.get(namespace, item_id)
+            except KeyError:
+                pass
+        return found
+
+    def put_many(self, records):
+        """Insert or replace many records.
+
+        :param list records: ``(namespace, item_id, record)`` tuples
+
+        The default implementation calls :meth:`put` for each record.
+        Backends should override this when they can do better.
+
+        """
+        for namespace, item_id, record in records:
+            self.put(namespace, item_id, record)
+
+    def delete_many(self, namespace, item_ids):
+        """Remove many records from a single namespace.
+
+        :param str namespace: the namespace that the records live in
+        :param list item_ids: the unique identifiers of the records
+        :returns: :class:`list` of the identifiers that did not exist
+
+        The default implementation calls :meth:`delete` for each
+        record.  Backends should override this when they can do
+        better.
+
+        """
+        missing = []
+        for item_id in item_ids:
+            try:
+                self.delete(namespace, item_id)
+            except KeyError:
+                missing.append(item_id)
+        return missing
+
+    def commit(self, changes, check=None):
+        """Apply a batch of writes as a single unit.
+
+        :param list changes: ``(namespace, item_id, record)`` tuples.
+            A `record` of :data:`None` deletes the record.  Deleting a
+            record that does not exist is not an error.
+        :param check: if this is specified, it is called before
+            anything is written with a function that reads a record
+            like :meth:`get`.  Nothing is written if it raises.
+
+        Durable backends should apply the batch atomically and sync it
+        to disk once.  The default implementation calls :meth:`put`
+        and :meth:`delete` for each change so it is only atomic for
+        backends that cannot fail part way through.
+
+        The storage layer uses `check` to compare the versions of
+        conditional writes.  A :attr:`shared` backend has to call it
+        in the same transaction that applies the batch so that
+        another process cannot change the records in between.
+
+        """
+        if check is not None:
+            check(self.get)
+        for namespace, item_id, record in changes:
+            if record is None:
+                try:
+                    self.delete(namespace, item_id)
+                except KeyError:
+                    pass
+            else:
+                self.put(namespace, item_id, record)
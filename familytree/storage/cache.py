@@ -0,0 +1,79 @@
+"""Cache of stored records."""
+import collections
+import threading
+
+
+class InstanceCache(object):
+
+    """Bounded least-recently-used cache of stored records.
+
+    :param int max_size: the most records to retain
+
+    Entries are keyed by ``(model_class, item_id)``.  Despite the
+    name, model instances are not cached.  The storage layer caches
+    the frozen record of each item along with its version, which
+    saves the backend read, and still creates a new instance from
+    the record with ``from_dictionary`` for every read.  The cache is
+    safe to use from the storage thread pool.
+
+    A lookup that misses and then reads from the backend can race
+    with a write that invalidates the same key.  To keep the stale
+    result out of the cache, read :attr:`generation` *before* going
+    to the backend and pass it to :meth:`put`.  The value is only
+    cached if nothing was invalidated in the meantime.
+
+    .. attribute:: hits
+
+       the number of lookups that were served from the cache
+
+    .. attribute:: misses
+
+       the number of lookups that were not
+
+    """
+
+    def __init__(self, max_size):
+        super(InstanceCache, self).__init__()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for `key` or :data:`None`."""
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation):
+        """Cache `value` unless the cache changed since `generation`."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        """Remove `keys` from the cache."""
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
@@ -0,0 +1,317 @@
+"""Secondary indexes over stored records.
+
+A model class declares its indexes in a ``storage_indexes`` class
+attribute::
+
+    class Person(object):
+        storage_indexes = (
+            storage.SortedIndex('display_name'),
+            storage.HashIndex('events'),
+        )
+
+Each index is keyed on one member of the dictionary returned by
+:meth:`~familytree.storage.ModelInstance.as_dictionary`.  When the
+member is a list, each of its elements is indexed separately so that
+"every event involving this person" is a single lookup.  Records
+that do not have the member, or where it is :data:`None`, are not
+included in the index.
+
+A :class:`HashIndex` answers equality lookups.  A :class:`SortedIndex`
+also answers range and prefix lookups and returns its entries in key
+order so it can be used to page through a collection.
+
+"""
+import bisect
+import itertools
+
+from tornado.util import bytes_type, unicode_type
+
+
+_UNSET = object()
+_CHUNK_SIZE = 512
+
+
+class HashIndex(object):
+
+    """Index records by equality of a single member.
+
+    :param str field: the member of the record to index
+    :param str name: the name that the index is queried by.  This
+        defaults to `field`.
+
+    """
+
+    def __init__(self, field, name=None):
+        super(HashIndex, self).__init__()
+        self.field = field
+        self.name = name or field
+
+    def keys(self, record):
+        """Return the index keys for `record`."""
+        value = record.get(self.field)
+        if value is None:
+            return ()
+        if isinstance(value, (list, tuple)):
+            return tuple(key for key in value if key is not None)
+        return (value,)
+
+    def create_table(self):
+        """Return an empty table that holds the entries of this index."""
+        return _HashTable()
+
+
+class SortedIndex(HashIndex):
+
+    """Index records in the order of a single member.
+
+    :param str field: the member of the record to index
+    :param str name: the name that the index is queried by.  This
+        defaults to `field`.
+
+    :param tuple key_types: the types of the keys that are indexed.
+        This defaults to strings.
+
+    The keys of a sorted index have to be comparable with each other
+    so values of other types are left out of the index, just like
+    :data:`None`.  A record whose member holds one of them is still
+    stored but cannot be found through this index.
+
+    """
+
+    def __init__(self, field, name=None, key_types=None):
+        super(SortedIndex, self).__init__(field, name)
+        self.key_types = key_types or (unicode_type, bytes_type)
+
+    def keys(self, record):
+        return tuple(key for key in super(SortedIndex, self).keys(record)
+                     if isinstance(key, self.key_types))
+
+    def create_table(self):
+        return _SortedTable()
+
+
+class IndexSet(object):
+
+    """The indexes that are declared for a single namespace.
+
+    :param definitions: iterable of :class:`HashIndex` and
+        :class:`SortedIndex` instances
+
+    This class is not thread-safe.  The storage layer serializes
+    access to it.
+
+    """
+
+    def __init__(self, definitions):
+        super(IndexSet, self).__init__()
+        self.definitions = list(definitions)
+        self.tables = dict((definition.name, definition.create_table())
+                           for definition in self.definitions)
+
+    def load(self, records):
+        """Index every ``(item_id, record)`` pair in `records`.
+
+        This fills a new index set with one sort per sorted index
+        instead of inserting the entries one at a time.  It replaces
+        the entries that the index set already has.
+
+        """
+        keys = [(item_id, [definition.keys(record)
+                           for definition in self.definitions])
+                for item_id, record in records]
+        for position, definition in enumerate(self.definitions):
+            self.tables[definition.name].load(
+                (item_id, record_keys[position])
+                for item_id, record_keys in keys)
+
+    def add(self, item_id, record):
+        """Index `record` under `item_id`, replacing any prior entries."""
+        for definition in self.definitions:
+            self.tables[definition.name].add(item_id,
+                                             definition.keys(record))
+
+    def remove(self, item_id):
+        """Remove every entry for `item_id`."""
+        for table in self.tables.values():
+            table.remove(item_id)
+
+    def find(self, name, **criteria):
+        """Look up entries in the index called `name`.
+
+        :param str name: the name of the index to search
+        :param criteria: the keyword parameters accepted by
+            :func:`familytree.storage.query_keys`
+        :returns: :class:`list` of ``(key, item_id)`` pairs
+        :raises ValueError: if there is no index called `name` or
+            the index does not support the criteria
+
+        """
+        try:
+            table = self.tables[name]
+        except KeyError:
+            raise ValueError('no index named {0}'.format(name))
+        return table.find(**criteria)
+
+
+class _HashTable(object):
+
+    def __init__(self):
+        self._ids = {}
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, items):
+        self._ids, self._keys = {}, {}
+        for item_id, keys in items:
+            self.add(item_id, keys)
+
+    def add(self, item_id, keys):
+        self.remove(item_id)
+        if keys:
+            self._keys[item_id] = keys
+            for key in keys:
+                self._ids.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id):
+        for key in self._keys.pop(item_id, ()):
+            item_ids = self._ids[key]
+            item_ids.discard(item_id)
+            if not item_ids:
+                del self._ids[key]
+
+    def find(self, equals=_UNSET, limit=None, **criteria):
+        if equals is _UNSET or criteria:
+            raise ValueError('hash indexes only support equality lookups')
+        entries = [(equals, item_id)
+                   for item_id in sorted(self._ids.get(equals, ()))]
+        return entries if limit is None else entries[:limit]
+
+
+class _SortedTable(object):
+
+    # the (key, item_id) entries are kept in sorted chunks so that an
+    # insert or removal only moves the entries of a single chunk.
+    # _maxes holds the last entry of each chunk so that the chunk of
+    # an entry is found by bisection as well.
+
+    def __init__(self):
+        self._chunks = []
+        self._maxes = []
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, items):
+        items = list(items)
+        entries = [(key, item_id) for item_id, keys in items
+                   for key in keys]
+        try:
+            entries.sort()
+        except TypeError:
+            # some keys cannot be compared with each other so they
+            # are added one at a time to leave them out
+            self._chunks, self._maxes, self._keys = [], [], {}
+            for item_id, keys in items:
+                self.add(item_id, keys)
+            return
+        self._chunks = [entries[start:start + _CHUNK_SIZE]
+                        for start in range(0, len(entries), _CHUNK_SIZE)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._keys = dict((item_id, tuple(keys))
+                          for item_id, keys in items if keys)
+
+    def add(self, item_id, keys):
+        # the index is updated after the record was written so a key
+        # that cannot be compared with the others is skipped instead
+        # of failing part way through
+        self.remove(item_id)
+        added = []
+        for key in keys:
+            try:
+                self._insert((key, item_id))
+            except TypeError:
+                continue
+            added.append(key)
+        if added:
+            self._keys[item_id] = tuple(added)
+
+    def remove(self, item_id):
+        for key in self._keys.pop(item_id, ()):
+            self._delete((key, item_id))
+
+    def find(self, equals=_UNSET, low=None, high=None, prefix=None,
+             after=None, limit=None):
+        starts = [(0, 0)]
+        if equals is not _UNSET:
+            starts.append(self._bisect((equals,)))
+        if low is not None:
+            starts.append(self._bisect((low,)))
+        if prefix is not None:
+            starts.append(self._bisect((prefix,)))
+        if after is not None:
+            starts.append(self._bisect(tuple(after), right=True))
+
+        found = []
+        for entry in self._iterate(*max(starts)):
+            if limit is not None and len(found) >= limit:
+                break
+            key = entry[0]
+            if equals is not _UNSET and key != equals:
+                break
+            if high is not None and key >= high:
+                break
+            if prefix is not None and not key.startswith(prefix):
+                break
+            found.append(entry)
+        return found
+
+    def _bisect(self, value, right=False):
+        locate = bisect.bisect_right if right else bisect.bisect_left
+        index = locate(self._maxes, value)
+        if index == len(self._maxes):
+            return index, 0
+        return index, locate(self._chunks[index], value)
+
+    def _iterate(self, index, offset):
+        if index < len(self._chunks):
+            for entry in self._chunks[index][offset:]:
+                yield entry
+            for chunk in itertools.islice(self._chunks, index + 1, None):
+                for entry in chunk:
+                    yield entry
+
+    def _insert(self, entry):
+        if not self._chunks:
+            self._chunks.append([entry])
+            self._maxes.append(entry)
+            return
+        index = bisect.bisect_left(self._maxes, entry)
+        if index == len(self._maxes):
+            index -= 1
+            self._chunks[index].append(entry)
+            self._maxes[index] = entry
+        else:
+            bisect.insort(self._chunks[index], entry)
+        chunk = self._chunks[index]
+        if len(chunk) > 2 * _CHUNK_SIZE:
+            self._chunks[index:index + 1] = [chunk[:_CHUNK_SIZE],
+                                             chunk[_CHUNK_SIZE:]]
+            self._maxes[index:index + 1] = [chunk[_CHUNK_SIZE - 1],
+                                            chunk[-1]]
+
+    def _delete(self, entry):
+        index = bisect.bisect_left(self._maxes, entry)
+        if index == len(self._maxes):
+            return
+        chunk = self._chunks[index]
+        position = bisect.bisect_left(chunk, entry)
+        if position < len(chunk) and chunk[position] == entry:
+            del chunk[position]
+            if not chunk:
+                del self._chunks[index]
+                del self._maxes[index]
+            elif position == len(chunk):
+                self._maxes[index] = chunk[-1]
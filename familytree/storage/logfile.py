@@ -0,0 +1,526 @@
+"""Append-only log-structured storage backend.
+
+This backend appends every change to the end of a *segment* file and
+never modifies data in place.  An in-memory index maps each record
+key to the location of its most recent version so a read is a single
+dictionary lookup followed by a slice of the memory-mapped segment.
+The index is rebuilt by replaying the segments when the backend is
+opened.
+
+Each entry in a segment is a length-prefixed record consisting of a
+fixed-size header (payload length and CRC-32 of the payload) followed
+by a JSON-encoded payload.  A torn entry at the end of a segment, for
+example from a crash in the middle of a write, fails the CRC check
+and is discarded when the segment is replayed.
+
+Changes that are committed together (see
+:meth:`~familytree.storage.base.StorageBackend.commit`) are written
+after a *batch marker* that holds the number of entries in the batch.
+A batch is only replayed if all of its entries are intact so a crash
+part way through writing one loses the whole batch instead of
+leaving half of it behind.  A batch is never split across segments.
+
+Old versions of records and deletion markers accumulate in the
+segments that are no longer being written to.  They are removed by
+*compaction* which copies the live records from all of the sealed
+segments into fresh segments and then removes the originals.
+Compaction runs on the Tornado IOLoop in small time slices so that it
+does not stall request processing.
+
+The following settings are recognized:
+
+- ``directory``: where the segment files are stored.  This setting
+  is required.
+- ``segment_size``: the size in bytes at which the active segment is
+  sealed and a new one is started.  Defaults to 64MB.
+- ``fsync``: should each write be synced to disk before it is
+  acknowledged?  Defaults to ``true``.
+- ``compaction_interval``: how often, in seconds, to check whether
+  compaction is necessary.  Defaults to 60 seconds.
+- ``compaction_threshold``: the fraction of dead bytes in the sealed
+  segments that triggers compaction.  Defaults to 0.5.
+- ``compaction_slice``: the longest that a single slice of compaction
+  work is allowed to hold the IOLoop in seconds.  Defaults to 0.005.
+
+This backend assumes that it is the only writer of its directory so
+it cannot be shared between processes.
+
+"""
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from tornado import ioloop
+
+from . import base
+
+
+LOGGER = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>II')
+_SEGMENT_NAME = re.compile(r'^(\d{10})\.(\d{4})\.seg$')
+_PUT = 'p'
+_DELETE = 'd'
+_BATCH = 'b'
+
+
+def _encode(operation, namespace, item_id, record=None):
+    payload = [operation, namespace, item_id]
+    if operation == _PUT:
+        payload.append(record)
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return _HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff) + data
+
+
+def _decode(payload):
+    return json.loads(bytes(payload).decode('utf-8'))
+
+
+class _Segment(object):
+
+    """A single segment file.
+
+    :param str directory: the directory that contains the segment
+    :param int major: the primary sort key of the segment
+    :param int minor: the secondary sort key of the segment
+
+    Segments are replayed in ``(major, minor)`` order.  New segments
+    are started with a larger major number than any existing segment.
+    Compaction output uses the major number of the newest segment
+    that it compacted and a larger minor number so that it sorts
+    after its inputs and before anything written since.
+
+    """
+
+    def __init__(self, directory, major, minor=0):
+        self.key = (major, minor)
+        self.path = os.path.join(
+            directory, '{0:010d}.{1:04d}.seg'.format(major, minor))
+        self.size = 0
+        self.live_bytes = 0
+        self._file = None
+        self._map = None
+
+    def open_for_append(self):
+        self._file = open(self.path, 'ab')
+        self.size = self._file.tell()
+
+    def append(self, entry):
+        offset = self.size
+        self._file.write(entry)
+        self.size += len(entry)
+        return offset
+
+    def flush(self, sync):
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def seal(self, sync):
+        if self._file is not None:
+            self.flush(sync)
+            self._file.close()
+            self._file = None
+
+    def read(self, offset, length):
+        """Return ``length`` bytes of payload starting at ``offset``."""
+        start = offset + _HEADER.size
+        if self._map is None or len(self._map) < start + length:
+            self._remap()
+        return self._map[start:start + length]
+
+    def _remap(self):
+        if self._file is not None:
+            self._file.flush()
+        if self._map is not None:
+            self._map.close()
+        with open(self.path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def entries(self):
+        """Iterate over the valid entries in the segment.
+
+        Each entry is yielded as an ``(offset, length, payload)``
+        tuple.  Iteration stops at the first torn or corrupt entry.
+
+        """
+        if os.path.getsize(self.path) == 0:
+            return
+        self._remap()
+        offset, end = 0, len(self._map)
+        while offset + _HEADER.size <= end:
+            length, crc = _HEADER.unpack_from(self._map, offset)
+            start = offset + _HEADER.size
+            payload = self._map[start:start + length]
+            if len(payload) != length:
+                break
+            if zlib.crc32(payload) & 0xffffffff != crc:
+                break
+            yield offset, length, payload
+            offset = start + length
+
+    def truncate(self):
+        """Discard anything after the last valid entry."""
+        if os.path.getsize(self.path) != self.size:
+            LOGGER.warning('truncating %s to %d bytes', self.path, self.size)
+            self.close()
+            with open(self.path, 'r+b') as handle:
+                handle.truncate(self.size)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        os.unlink(self.path)
+
+
+class _Compaction(object):
+
+    """Incrementally copy live records out of the sealed segments.
+
+    :param LogStructuredBackend backend: the backend to compact
+    :param tornado.ioloop.IOLoop io_loop: the loop to run on
+
+    Each call to :meth:`run_slice` copies records until the time slice
+    configured on the backend is exhausted and then reschedules itself
+    on the IOLoop.
+
+    """
+
+    def __init__(self, backend, io_loop):
+        self.backend = backend
+        self.io_loop = io_loop
+        self.inputs = list(backend.segments[:-1])
+        self.outputs = []
+        self.cancelled = False
+        self._entries = self._iterate_inputs()
+
+    def _iterate_inputs(self):
+        for segment in self.inputs:
+            for offset, length, payload in segment.entries():
+                yield segment, offset, length, payload
+
+    def start(self):
+        LOGGER.info('compacting %d segments', len(self.inputs))
+        self.io_loop.add_callback(self.run_slice)
+
+    def run_slice(self):
+        if self.cancelled:
+            return
+        backend = self.backend
+        deadline = time.time() + backend.compaction_slice
+        with backend.lock:
+            for segment, offset, length, payload in self._entries:
+                self._copy_if_live(segment, offset, length, payload)
+                if time.time() >= deadline:
+                    self.io_loop.add_callback(self.run_slice)
+                    return
+            self._finish()
+
+    def cancel(self):
+        """Stop compacting and remove the segments written so far.
+
+        The input segments still hold every record that was copied so
+        the partial outputs are unlinked rather than left for the next
+        replay to read.  The index may still refer to the outputs so
+        this is only safe while the backend is being closed.
+
+        """
+        self.cancelled = True
+        for output in self.outputs:
+            output.remove()
+        self.outputs = []
+
+    def _copy_if_live(self, segment, offset, length, payload):
+        backend = self.backend
+        operation, namespace, item_id = _decode(payload)[:3]
+        key = (namespace, item_id)
+        if operation != _PUT or backend.index.get(key) != (
+                segment, offset, length):
+            return
+
+        entry_size = _HEADER.size + length
+        output = self.outputs[-1] if self.outputs else None
+        if output is None or output.size + entry_size > backend.segment_size:
+            if output is not None:
+                output.seal(backend.fsync)
+            major = self.inputs[-1].key[0]
+            minor = max(s.key[1] for s in self.inputs + self.outputs) + 1
+            output = _Segment(backend.directory, major, minor)
+            output.open_for_append()
+            self.outputs.append(output)
+
+        new_offset = output.append(
+            _HEADER.pack(length, zlib.crc32(payload) & 0xffffffff) +
+            bytes(payload))
+        output.live_bytes += entry_size
+        backend.index[key] = (output, new_offset, length)
+
+    def _finish(self):
+        backend = self.backend
+        for output in self.outputs:
+            output.seal(backend.fsync)
+        for segment in self.inputs:
+            backend.segments.remove(segment)
+            segment.remove()
+        backend.segments[:0] = self.outputs
+        backend.compaction = None
+        LOGGER.info('compacted %d segments into %d', len(self.inputs),
+                    len(self.outputs))
+
+
+class LogStructuredBackend(base.StorageBackend):
+
+    """Store records in append-only segment files."""
+
+    def __init__(self, **settings):
+        super(LogStructuredBackend, self).__init__(**settings)
+        self.directory = settings['directory']
+        self.segment_size = int(settings.get('segment_size', 64 << 20))
+        self.fsync = bool(settings.get('fsync', True))
+        self.compaction_interval = float(
+            settings.get('compaction_interval', 60.0))
+        self.compaction_threshold = float(
+            settings.get('compaction_threshold', 0.5))
+        self.compaction_slice = float(settings.get('compaction_slice', 0.005))
+        self.lock = threading.RLock()
+        self.index = {}
+        self.segments = []
+        self.compaction = None
+        self._opened = False
+        self._periodic = None
+
+    @property
+    def active_segment(self):
+        return self.segments[-1]
+
+    def open(self):
+        with self.lock:
+            if self._opened:
+                return
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            keys = []
+            for name in os.listdir(self.directory):
+                match = _SEGMENT_NAME.match(name)
+                if match:
+                    keys.append((int(match.group(1)), int(match.group(2))))
+            for major, minor in sorted(keys):
+                segment = _Segment(self.directory, major, minor)
+                self.segments.append(segment)
+                self._replay(segment)
+                segment.truncate()
+
+            major = self.segments[-1].key[0] + 1 if self.segments else 1
+            self._start_segment(major)
+            self._opened = True
+
+    def close(self):
+        with self.lock:
+            self.stop_maintenance()
+            if self.compaction is not None:
+                self.compaction.cancel()
+                self.compaction = None
+            for segment in self.segments:
+                segment.seal(self.fsync)
+                segment.close()
+            self.segments = []
+            self.index = {}
+            self._opened = False
+
+    def start_maintenance(self, io_loop):
+        self.stop_maintenance()
+        self._periodic = ioloop.PeriodicCallback(
+            lambda: self.maybe_compact(io_loop),
+            self.compaction_interval * 1000.0, io_loop=io_loop)
+        self._periodic.start()
+
+    def stop_maintenance(self):
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+
+    @property
+    def dead_fraction(self):
+        """The fraction of the sealed segments that is garbage."""
+        sealed = self.segments[:-1]
+        size = sum(segment.size for segment in sealed)
+        if not size:
+            return 0.0
+        return 1.0 - float(sum(s.live_bytes for s in sealed)) / size
+
+    def maybe_compact(self, io_loop):
+        """Start compaction if enough of the sealed segments is garbage.
+
+        :param tornado.ioloop.IOLoop io_loop: the loop to run
+            compaction on
+        :returns: the new :class:`_Compaction` or :data:`None` if
+            compaction was not started
+
+        """
+        with self.lock:
+            if not self._opened or self.compaction is not None:
+                return None
+            if self.dead_fraction < self.compaction_threshold:
+                return None
+            self.compaction = _Compaction(self, io_loop)
+            self.compaction.start()
+            return self.compaction
+
+    def _replay(self, segment):
+        batch, remaining = [], 0
+        for offset, length, payload in segment.entries():
+            payload = _decode(payload)
+            if payload[0] == _BATCH:
+                batch, remaining = [], payload[2]
+                continue
+            batch.append((offset, length, payload))
+            if remaining > 1:
+                remaining -= 1
+                continue
+            for entry_offset, entry_length, entry_payload in batch:
+                self._apply(segment, entry_offset, entry_length,
+                            entry_payload)
+            segment.size = offset + _HEADER.size + length
+            batch, remaining = [], 0
+
+    def _start_segment(self, major):
+        segment = _Segment(self.directory, major)
+        segment.open_for_append()
+        self.segments.append(segment)
+
+    def _apply(self, segment, offset, length, payload):
+        key = (payload[1], payload[2])
+        previous = self.index.pop(key, None)
+        if previous is not None:
+            previous[0].live_bytes -= _HEADER.size + previous[2]
+        if payload[0] == _PUT:
+            self.index[key] = (segment, offset, length)
+            segment.live_bytes += _HEADER.size + length
+
+    def _reserve(self, size):
+        segment = self.active_segment
+        if segment.size and segment.size + size > self.segment_size:
+            segment.seal(self.fsync)
+            self._start_segment(segment.key[0] + 1)
+        return self.active_segment
+
+    def _append_all(self, entries):
+        """Append entries and sync the segment once.
+
+        :param list entries: ``(operation, namespace, item_id, entry)``
+            tuples
+
+        More than one entry is written as a batch that is replayed
+        entirely or not at all.
+
+        """
+        if not entries:
+            return
+        batch = len(entries) > 1
+        if batch:
+            marker = _encode(_BATCH, '', len(entries))
+            size = len(marker) + sum(len(entry[3]) for entry in entries)
+            self._reserve(size).append(marker)
+        for operation, namespace, item_id, entry in entries:
+            segment = self.active_segment if batch else self._reserve(
+                len(entry))
+            offset = segment.append(entry)
+            if operation == _PUT:
+                self._apply(segment, offset, len(entry) - _HEADER.size,
+                            (operation, namespace, item_id))
+            else:
+                self._apply(None, None, None, (operation, namespace, item_id))
+        self.active_segment.flush(self.fsync)
+
+    def get(self, namespace, item_id):
+        with self.lock:
+            self.open()
+            segment, offset, length = self.index[(namespace, item_id)]
+            return _decode(segment.read(offset, length))[3]
+
+    def put(self, namespace, item_id, record):
+        entry = _encode(_PUT, namespace, item_id, record)
+        with self.lock:
+            self.open()
+            self._append_all([(_PUT, namespace, item_id, entry)])
+
+    def delete(self, namespace, item_id):
+        entry = _encode(_DELETE, namespace, item_id)
+        with self.lock:
+            self.open()
+            if (namespace, item_id) not in self.index:
+                raise KeyError(item_id)
+            self._append_all([(_DELETE, namespace, item_id, entry)])
+
+    def scan(self, namespace):
+        with self.lock:
+            self.open()
+            return [(item_id, _decode(segment.read(offset, length))[3])
+                    for (record_namespace, item_id), (segment, offset, length)
+                    in self.index.items()
+                    if record_namespace == namespace]
+
+    def keys(self, namespace):
+        with self.lock:
+            self.open()
+            return [item_id for record_namespace, item_id in self.index
+                    if record_namespace == namespace]
+
+    def get_many(self, namespace, item_ids):
+        found = {}
+        with self.lock:
+            self.open()
+            for item_id in item_ids:
+                location = self.index.get((namespace, item_id))
+                if location is not None:
+                    segment, offset, length = location
+                    found[item_id] = _decode(segment.read(offset, length))[3]
+        return found
+
+    def put_many(self, records):
+        entries = [
+            (_PUT, namespace, item_id,
+             _encode(_PUT, namespace, item_id, record))
+            for namespace, item_id, record in records]
+        with self.lock:
+            self.open()
+            self._append_all(entries)
+
+    def delete_many(self, namespace, item_ids):
+        with self.lock:
+            self.open()
+            missing, entries = [], []
+            for item_id in item_ids:
+                if (namespace, item_id) in self.index:
+                    entries.append((_DELETE, namespace, item_id,
+                                    _encode(_DELETE, namespace, item_id)))
+                else:
+                    missing.append(item_id)
+            self._append_all(entries)
+        return missing
+
+    def commit(self, changes, check=None):
+        entries = []
+        for namespace, item_id, record in changes:
+            operation = _DELETE if record is None else _PUT
+            entries.append((operation, namespace, item_id,
+                            _encode(operation, namespace, item_id, record)))
+        with self.lock:
+            self.open()
+            if check is not None:
+                check(self.get)
+            self._append_all(entries)
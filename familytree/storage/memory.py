@@ -0,0 +1,47 @@
+"""In-memory storage backend."""
+from . import base
+
+
+class MemoryBackend(base.StorageBackend):
+
+    """Keep records in a process-local dictionary.
+
+    This is the default backend.  It is very fast but nothing is
+    shared between processes and everything is lost when the process
+    exits.
+
+    """
+
+    blocking = False
+
+    def __init__(self, **settings):
+        super(MemoryBackend, self).__init__(**settings)
+        self.records = {}
+
+    def get(self, namespace, item_id):
+        return self.records[(namespace, item_id)]
+
+    def put(self, namespace, item_id, record):
+        self.records[(namespace, item_id)] = record
+
+    def delete(self, namespace, item_id):
+        del self.records[(namespace, item_id)]
+
+    def scan(self, namespace):
+        return [(item_id, record)
+                for (record_namespace, item_id), record in self.records.items()
+                if record_namespace == namespace]
+
+    def keys(self, namespace):
+        return [item_id for record_namespace, item_id in self.records
+                if record_namespace == namespace]
+
+    def get_many(self, namespace, item_ids):
+        records = self.records
+        return dict(((item_id, records[(namespace, item_id)])
+                     for item_id in item_ids
+                     if (namespace, item_id) in records))
+
+    def put_many(self, records):
+        for namespace, item_id, record in records:
+            self.records[(namespace, item_id)] = record
@@ -0,0 +1,294 @@
+"""SQLite storage backend.
+
+This backend stores each namespace in its own table inside of a
+single SQLite database.  The database is opened in write-ahead log
+mode so that multiple processes can read concurrently while one of
+them is writing.  Records are stored as JSON documents.
+
+The following settings are recognized:
+
+- ``database``: the path to the database file.  This setting is
+  required.
+- ``timeout``: how many seconds to wait for another process to
+  release a lock on the database.  Defaults to 5 seconds.
+- ``synchronous``: the value of SQLite's ``synchronous`` pragma.
+  Defaults to ``NORMAL`` which is durable in WAL mode as long as
+  the operating system does not crash.
+
+Each thread uses its own connection so that reads issued from the
+storage thread pool can proceed concurrently.
+
+Secondary indexes are searched in SQL so that every process sees the
+same results.  A sorted index is backed by an expression index on the
+member that is created the first time that it is searched.  Only
+records where the member is a string are included, so a sorted index
+over a list member does not find anything with this backend.  Hash
+indexes are searched with :func:`json_each` which reads every record
+of the namespace.
+
+"""
+import contextlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from . import base
+from . import index
+
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_MAX_PARAMETERS = 500
+_UNSET = object()
+
+
+class _Table(object):
+
+    """SQL statements for a single namespace.
+
+    The statements are generated once per table and reused verbatim
+    so that :mod:`sqlite3` can serve them from its statement cache
+    instead of preparing them for every call.
+
+    """
+
+    def __init__(self, name):
+        if not _IDENTIFIER.match(name):
+            raise ValueError('{0!r} is not a valid table name'.format(name))
+        self.create = ('CREATE TABLE IF NOT EXISTS "{0}" ('
+                       ' id TEXT PRIMARY KEY NOT NULL,'
+                       ' data TEXT NOT NULL)').format(name)
+        self.select = 'SELECT data FROM "{0}" WHERE id = ?'.format(name)
+        self.upsert = ('INSERT OR REPLACE INTO "{0}" (id, data)'
+                       ' VALUES (?, ?)').format(name)
+        self.delete = 'DELETE FROM "{0}" WHERE id = ?'.format(name)
+        self.scan = 'SELECT id, data FROM "{0}"'.format(name)
+        self.keys = 'SELECT id FROM "{0}"'.format(name)
+        self.name = name
+        self.indexed = set()
+        self._select_many = {}
+
+    def select_many(self, count):
+        """Return a statement that selects `count` records by id."""
+        try:
+            return self._select_many[count]
+        except KeyError:
+            statement = 'SELECT id, data FROM "{0}" WHERE id IN ({1})'.format(
+                self.name, ', '.join('?' * count))
+            self._select_many[count] = statement
+            return statement
+
+    def create_index(self, field):
+        """Return a statement that indexes the string values of `field`."""
+        return ('CREATE INDEX IF NOT EXISTS "{0}.{1}" ON "{0}" ({2}, id)'
+                ' WHERE {3}').format(self.name, field, _key(field),
+                                     _is_text(field))
+
+
+def _key(field):
+    return "json_extract(data, '$.{0}')".format(field)
+
+
+def _is_text(field):
+    return "json_type(data, '$.{0}') = 'text'".format(field)
+
+
+class SQLiteBackend(base.StorageBackend):
+
+    """Store records in a SQLite database."""
+
+    shared = True
+
+    def __init__(self, **settings):
+        super(SQLiteBackend, self).__init__(**settings)
+        self.database = settings['database']
+        self.timeout = float(settings.get('timeout', 5.0))
+        self.synchronous = settings.get('synchronous', 'NORMAL')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._pid = None
+        self._tables = {}
+
+    @property
+    def connection(self):
+        """The connection for the current thread.
+
+        SQLite connections cannot be shared across a ``fork`` so the
+        connection is (re)opened whenever the process identifier
+        changes.
+
+        """
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self.open()
+        return self._local.connection
+
+    def open(self):
+        connection = sqlite3.connect(
+            self.database, timeout=self.timeout, isolation_level=None,
+            cached_statements=256, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous={0}'.format(self.synchronous))
+        with self._lock:
+            if self._pid != os.getpid():
+                self._connections = []
+                self._tables = {}
+                self._pid = os.getpid()
+            self._connections.append(connection)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for connection in self._connections:
+                    connection.close()
+            self._connections = []
+            self._tables = {}
+            self._local = threading.local()
+
+    def _get_table(self, namespace):
+        connection = self.connection
+        try:
+            return self._tables[namespace]
+        except KeyError:
+            table = _Table(namespace)
+            connection.execute(table.create)
+            with self._lock:
+                self._tables[namespace] = table
+            return table
+
+    def get(self, namespace, item_id):
+        table = self._get_table(namespace)
+        row = self.connection.execute(table.select, (item_id,)).fetchone()
+        if row is None:
+            raise KeyError(item_id)
+        return json.loads(row[0])
+
+    def put(self, namespace, item_id, record):
+        table = self._get_table(namespace)
+        self.connection.execute(table.upsert, (item_id, json.dumps(record)))
+
+    def delete(self, namespace, item_id):
+        table = self._get_table(namespace)
+        cursor = self.connection.execute(table.delete, (item_id,))
+        if cursor.rowcount == 0:
+            raise KeyError(item_id)
+
+    def scan(self, namespace):
+        table = self._get_table(namespace)
+        return [(item_id, json.loads(data))
+                for item_id, data in self.connection.execute(table.scan)]
+
+    def keys(self, namespace):
+        table = self._get_table(namespace)
+        return [row[0] for row in self.connection.execute(table.keys)]
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+
+    def find(self, namespace, definition, equals=_UNSET, low=None,
+             high=None, prefix=None, after=None, limit=None):
+        if not _IDENTIFIER.match(definition.field):
+            raise ValueError('{0!r} is not a valid field name'.format(
+                definition.field))
+        table = self._get_table(namespace)
+        if isinstance(definition, index.SortedIndex):
+            return self._find_sorted(table, definition.field, equals, low,
+                                     high, prefix, after, limit)
+        if (equals is _UNSET or low is not None or high is not None or
+                prefix is not None or after is not None):
+            raise ValueError('hash indexes only support equality lookups')
+        statement = ('SELECT DISTINCT t.id FROM "{0}" AS t,'
+                     " json_each(t.data, '$.{1}') AS j"
+                     ' WHERE j.value = ? ORDER BY t.id LIMIT ?').format(
+                         table.name, definition.field)
+        rows = self.connection.execute(
+            statement, (equals, -1 if limit is None else limit))
+        return [(equals, row[0]) for row in rows]
+
+    def _find_sorted(self, table, field, equals, low, high, prefix, after,
+                     limit):
+        if field not in table.indexed:
+            self.connection.execute(table.create_index(field))
+            with self._lock:
+                table.indexed.add(field)
+        key = _key(field)
+        conditions, parameters = [_is_text(field)], []
+        if equals is not _UNSET:
+            conditions.append(key + ' = ?')
+            parameters.append(equals)
+        if low is not None:
+            conditions.append(key + ' >= ?')
+            parameters.append(low)
+        if high is not None:
+            conditions.append(key + ' < ?')
+            parameters.append(high)
+        if prefix is not None:
+            conditions.extend([key + ' >= ?', 'substr({0}, 1, ?) = ?'.format(
+                key)])
+            parameters.extend([prefix, len(prefix), prefix])
+        if after is not None:
+            # the row value comparison alone does not seek the index
+            conditions.extend([key + ' >= ?', '({0}, id) > (?, ?)'.format(
+                key)])
+            parameters.extend([after[0], after[0], after[1]])
+        parameters.append(-1 if limit is None else limit)
+        statement = ('SELECT {0}, id FROM "{1}" WHERE {2}'
+                     ' ORDER BY {0}, id LIMIT ?').format(
+                         key, table.name, ' AND '.join(conditions))
+        return [tuple(row) for row in
+                self.connection.execute(statement, parameters)]
+
+    def get_many(self, namespace, item_ids):
+        table = self._get_table(namespace)
+        found = {}
+        for start in range(0, len(item_ids), _MAX_PARAMETERS):
+            chunk = item_ids[start:start + _MAX_PARAMETERS]
+            rows = self.connection.execute(
+                table.select_many(len(chunk)), chunk)
+            for item_id, data in rows:
+                found[item_id] = json.loads(data)
+        return found
+
+    def put_many(self, records):
+        tables = [(self._get_table(namespace), item_id, record)
+                  for namespace, item_id, record in records]
+        with self._transaction() as connection:
+            for table, item_id, record in tables:
+                connection.execute(table.upsert,
+                                   (item_id, json.dumps(record)))
+
+    def delete_many(self, namespace, item_ids):
+        table = self._get_table(namespace)
+        missing = []
+        with self._transaction() as connection:
+            for item_id in item_ids:
+                if connection.execute(table.delete, (item_id,)).rowcount == 0:
+                    missing.append(item_id)
+        return missing
+
+    def commit(self, changes, check=None):
+        tables = [(self._get_table(namespace), item_id, record)
+                  for namespace, item_id, record in changes]
+        with self._transaction() as connection:
+            if check is not None:
+                # reads use the connection of this thread so they see
+                # the database as it is locked by the transaction
+                check(self.get)
+            for table, item_id, record in tables:
+                if record is None:
+                    connection.execute(table.delete, (item_id,))
+                else:
+                    connection.execute(table.upsert,
+                                       (item_id, json.dumps(record)))
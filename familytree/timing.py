@@ -0,0 +1,229 @@
+"""Where the time of a request goes.
+
+Each :class:`~familytree.handlers.BaseHandler` creates a
+:class:`RequestTimer` that adds up the time spent in each *phase* of
+the request:
+
+- ``parse``: decoding the request body, including parsing its
+  ``Content-Type`` header
+- ``storage``: the storage layer functions (see
+  :mod:`familytree.storage`)
+- ``links``: building URLs with
+  :meth:`~familytree.handlers.BaseHandler.get_url_for`
+- ``encode``: encoding the response body
+
+The timer is made current for the code that runs on behalf of the
+request, including the storage operations that run on the thread
+pool, so the storage layer adds to it with :func:`record` without
+knowing about requests.  Storage operations that run in parallel
+are each counted in full so the phases can add up to more than the
+duration of the request.
+
+When the response is finished, :func:`log_request` writes one line
+of JSON to the ``familytree.access`` logger::
+
+    {"calls": {"encode": 1, "links": 4, "storage": 1},
+     "duration": 12.41, "handler": "PersonHandler", "method": "GET",
+     "path": "/person/1a2b", "phases": {"encode": 0.31, "links": 0.12,
+     "storage": 9.87}, "status": 200}
+
+Durations are in milliseconds.  Responses with a 4xx status are
+logged as warnings, 5xx as errors and the rest as information.  The
+level of the logger and :class:`SampleFilter` in the ``Logging``
+section of the configuration file control how many are written.
+
+"""
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+
+LOGGER = logging.getLogger('familytree.access')
+
+_current = threading.local()
+
+
+class RequestTimer(object):
+
+    """Adds up the time spent in the phases of a request.
+
+    .. attribute:: phases
+
+       dictionary that maps each phase name to the seconds spent in it
+
+    .. attribute:: calls
+
+       dictionary that maps each phase name to the number of times
+       that it was recorded
+
+    A timer is safe to record in from several threads.
+
+    """
+
+    def __init__(self):
+        super(RequestTimer, self).__init__()
+        self.phases = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, duration):
+        """Add `duration` seconds to `phase`."""
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + duration
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def summary(self):
+        """Return :attr:`phases` in milliseconds and :attr:`calls`."""
+        with self._lock:
+            return (dict((phase, round(duration * 1000.0, 3))
+                         for phase, duration in self.phases.items()),
+                    dict(self.calls))
+
+    def measure(self, phase):
+        """Return a context manager that adds its duration to `phase`."""
+        return _Measurement(self, phase)
+
+    def activate(self):
+        """Return a context manager that makes this the current timer.
+
+        This is suitable for use as a
+        :class:`~tornado.stack_context.StackContext` factory.
+
+        """
+        return _Activation(self)
+
+
+class _Measurement(object):
+
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.phase, time.time() - self.start)
+
+
+class _Activation(object):
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_current, 'timer', None)
+        _current.timer = self.timer
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.timer = self.previous
+
+
+class SampleFilter(logging.Filter):
+
+    """Pass a random sample of the log records.
+
+    :param float rate: the fraction of records to pass, between 0
+        and 1
+    :param level: records at this level or above are always passed
+
+    Use it in the ``Logging`` section of the configuration file to
+    log only some of the requests::
+
+        filters:
+          sampled:
+            (): familytree.timing.SampleFilter
+            rate: 0.1
+
+    """
+
+    def __init__(self, rate=1.0, level=logging.WARNING):
+        super(SampleFilter, self).__init__()
+        self.rate = float(rate)
+        if not isinstance(level, int):
+            level = logging.getLevelName(str(level).upper())
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno >= self.level or random.random() < self.rate
+
+
+class _Entry(object):
+
+    """A log message that is only encoded if it is written."""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, sort_keys=True)
+
+
+def get_current():
+    """Return the timer of the request that is running or :data:`None`."""
+    return getattr(_current, 'timer', None)
+
+
+def record(phase, duration):
+    """Add `duration` seconds to `phase` of the current timer, if any."""
+    timer = getattr(_current, 'timer', None)
+    if timer is not None:
+        timer.add(phase, duration)
+
+
+def bind(function):
+    """Make the current timer current wherever `function` is called.
+
+    :returns: a callable that runs `function` with the timer that is
+        current now.  `function` is returned as-is if there is none.
+
+    This carries the timer of a request over to the thread that runs
+    a storage operation.
+
+    """
+    timer = get_current()
+    if timer is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with timer.activate():
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def log_request(handler):
+    """Write the access log line of a finished request.
+
+    :param tornado.web.RequestHandler handler: the handler that
+        served the request.  Its ``timer`` attribute holds the
+        :class:`RequestTimer` of the request.
+
+    """
+    status = handler.get_status()
+    if status >= 500:
+        level = logging.ERROR
+    elif status >= 400:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    if not LOGGER.isEnabledFor(level):
+        return
+
+    request = handler.request
+    phases, calls = handler.timer.summary()
+    LOGGER.log(level, '%s', _Entry({
+        'handler': handler.__class__.__name__,
+        'method': request.method,
+        'path': request.path,
+        'status': status,
+        'duration': round(request.request_time() * 1000.0, 3),
+        'phases': phases,
+        'calls': calls,
+    }))
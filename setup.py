@@ -48,7 +48,10 @@ setup(
         'Programming Language :: Python',
     ],
     entry_points={
-        'console_scripts': ['family-tree-web = familytree.main:main'],
+        'console_scripts': [
+            'family-tree-web = familytree.main:main',
+            'family-tree-export = familytree.bulk:export_main',
+        ],
     },
     cmdclass={
         'test': setupext.Tox,
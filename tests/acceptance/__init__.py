@@ -1,4 +1,6 @@
 from familytree import main
+from familytree import person
+from familytree import storage
 from ..helpers import tornado
 
 
@@ -85,3 +87,31 @@ class AcceptanceTestCase(
 
         """
         return cls.post_json('event', body)
+
+    @classmethod
+    def link_before_next_commit(cls, a_person, event_url):
+        """Add `event_url` to `a_person` just before the next commit.
+
+        :param dict a_person: the JSON representation of the person
+        :param str event_url: the link to add to the person
+
+        This simulates another request that changes the person after
+        the request under test read it.
+
+        """
+        commit = storage.Transaction.commit
+        person_id = a_person['self'].rsplit('/', 1)[-1]
+        pending = [True]
+
+        def interfering_commit(transaction):
+            if pending:
+                pending.pop()
+                stored = storage.get_item(person.Person, person_id)
+                stored.add_event(event_url)
+                other = storage.Transaction()
+                other.save_item(stored, person_id)
+                commit(other)
+            commit(transaction)
+
+        cls.patch('familytree.storage.Transaction.commit',
+                  new=interfering_commit)
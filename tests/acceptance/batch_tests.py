@@ -0,0 +1,185 @@
+import json
+
+from . import AcceptanceTestCase
+
+
+class WhenRunningBatch(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_json('batch', {'operations': [
+            {'id': 'mother', 'method': 'POST', 'url': '/person',
+             'body': {'display_name': 'Mother'}},
+            {'id': 'child', 'method': 'POST', 'url': '/person',
+             'body': {'display_name': 'Child'}},
+            {'id': 'birth', 'method': 'POST', 'url': '/event',
+             'body': {'people': [{'$ref': 'mother'}, {'$ref': 1}]}},
+            {'method': 'GET', 'url': {'$ref': 'child'}},
+        ]})
+        cls.results = cls.response['results']
+        cls.mother = cls.get_json(cls.results[0]['body']['self'])
+
+    def should_return_ok(self):
+        self.assertEqual(self.response['committed'], True)
+
+    def should_return_result_for_each_operation(self):
+        self.assertEqual([result['status'] for result in self.results],
+                         [201, 201, 201, 200])
+        self.assertEqual([result.get('id') for result in self.results],
+                         ['mother', 'child', 'birth', None])
+
+    def should_resolve_references_to_earlier_results(self):
+        self.assertEqual(self.results[2]['body']['people'], [
+            self.results[0]['body']['self'],
+            self.results[1]['body']['self'],
+        ])
+
+    def should_read_writes_of_earlier_operations(self):
+        self.assertEqual(self.results[3]['body']['events'],
+                         [self.results[2]['body']['self']])
+
+    def should_commit_writes(self):
+        self.assertEqual(self.mother['events'],
+                         [self.results[2]['body']['self']])
+
+
+class WhenBatchOperationFails(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('batch', {'operations': [
+            {'id': 'someone', 'method': 'POST', 'url': '/person',
+             'body': {'display_name': 'Someone'}},
+            {'method': 'DELETE', 'url': '/person/0000'},
+            {'method': 'POST', 'url': '/person',
+             'body': {'display_name': 'Someone Else'}},
+        ]})
+        cls.response = cls.last_response
+        cls.body = json.loads(cls.response.body.decode('utf-8'))
+        cls.get_json(cls.body['results'][0]['body']['self'])
+
+    def should_return_status_of_failed_operation(self):
+        self.assertEqual(self.response.code, 404)
+
+    def should_not_commit_writes(self):
+        self.assertEqual(self.body['committed'], False)
+        self.assertEqual(self.last_response.code, 404)
+
+    def should_report_each_operation(self):
+        self.assertEqual(
+            [result['status'] for result in self.body['results']],
+            [201, 404, 424])
+        self.assertIn('error', self.body['results'][1])
+
+
+class WhenBatchCreatesPersonWithNumericDisplayName(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('batch', {'operations': [
+            {'method': 'POST', 'url': '/person', 'body': {'display_name': 5}},
+        ]})
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenBatchRefersToUnknownOperation(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('batch', {'operations': [
+            {'method': 'POST', 'url': '/event',
+             'body': {'people': [{'$ref': 'nobody'}]}},
+        ]})
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenBatchUsesUnsupportedMethod(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('batch', {'operations': [
+            {'method': 'PUT', 'url': '/person'},
+        ]})
+
+    def should_fail_with_method_not_allowed(self):
+        self.assertEqual(self.last_response.code, 405)
+
+
+class WhenBatchDeletesEvent(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBatchDeletesEvent, cls).arrange()
+        cls.person = cls.make_person(display_name='person')
+        cls.event = cls.make_event(people=[cls.person['self']])
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_json('batch', {'operations': [
+            {'method': 'DELETE', 'url': cls.event['self']},
+        ]})
+        cls.person = cls.get_json(cls.person['self'])
+
+    def should_delete_event(self):
+        self.assertEqual(self.response['results'], [{'status': 204}])
+
+    def should_remove_event_from_people(self):
+        self.assertEqual(self.person['events'], [])
+
+
+class WhenBatchDeletesEventUnderOtherHost(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBatchDeletesEventUnderOtherHost, cls).arrange()
+        cls.person = cls.make_person(display_name='person')
+        cls.event = cls.make_event(people=[cls.person['self']])
+
+    @classmethod
+    def act(cls):
+        request = cls.build_request(
+            'batch',
+            body={'operations': [
+                {'method': 'DELETE', 'url': cls.event['self']},
+            ]},
+            headers={'Content-Type': 'application/json',
+                     'Host': 'other.example.com'},
+        )
+        cls.http_post(request)
+        cls.response = cls.decode_json_response()
+        cls.person = cls.get_json(cls.person['self'])
+
+    def should_delete_event(self):
+        self.assertEqual(self.response['results'], [{'status': 204}])
+
+    def should_remove_event_from_people(self):
+        self.assertEqual(self.person['events'], [])
+
+
+class WhenPersonChangesWhileBatchCreatesEvent(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonChangesWhileBatchCreatesEvent, cls).arrange()
+        cls.person = cls.make_person(display_name='Busy')
+        cls.other_url = 'http://example.com/event/other'
+        cls.link_before_next_commit(cls.person, cls.other_url)
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_json('batch', {'operations': [
+            {'method': 'POST', 'url': '/event',
+             'body': {'people': [cls.person['self']]}},
+        ]})
+        cls.person = cls.get_json(cls.person['self'])
+
+    def should_commit_batch(self):
+        self.assertEqual(self.response['committed'], True)
+
+    def should_keep_both_links(self):
+        self.assertEqual(self.person['events'], [
+            self.other_url, self.response['results'][0]['body']['self']])
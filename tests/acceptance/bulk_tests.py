@@ -0,0 +1,203 @@
+import json
+
+from tornado.httpclient import HTTPRequest
+
+from familytree import bulk
+from familytree import http
+from familytree import server
+from ..helpers import tornado
+from . import AcceptanceTestCase
+import familytree.main
+
+
+class WhenImportingRecords(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        lines = [{'person': {'id': 'b0f1', 'display_name': 'imported'}}]
+        lines.extend({'person': {'display_name': 'bulk {0}'.format(index)}}
+                     for index in range(250))
+        lines.append({'event': {'id': 'b0f2',
+                                'people': [cls.my_url + '/person/b0f1']}})
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nbad\n'
+        request = HTTPRequest(
+            http.urljoin(cls.my_url, 'bulk/import'), body=body,
+            headers={'Content-Type': 'application/x-ndjson'})
+        cls.http_post(request)
+        cls.summary = cls.decode_json_response()
+        cls.person = cls.get_json('person/b0f1')
+        cls.event = cls.get_json('event/b0f2')
+
+    def should_return_counts(self):
+        self.assertEqual(self.summary['imported'],
+                         {'person': 251, 'event': 1})
+        self.assertEqual(self.summary['lines'], 253)
+
+    def should_report_errors(self):
+        self.assertEqual(self.summary['failed'], 1)
+        self.assertEqual(self.summary['errors'][0]['line'], 253)
+
+    def should_store_records_with_their_ids(self):
+        self.assertEqual(self.person['display_name'], 'imported')
+        self.assertEqual(self.event['people'], [self.person['self']])
+
+
+class WhenImportingWithUnsupportedContentType(tornado.TornadoTestCase):
+
+    @classmethod
+    def make_application(cls):
+        return familytree.main.Application()
+
+    @classmethod
+    def act(cls):
+        cls.http_post(cls.build_request(
+            'bulk/import', body='{}',
+            headers={'Content-Type': 'application/json'}))
+
+    def should_fail_with_unsupported_media_type(self):
+        self.assertEqual(self.last_response.code, 415)
+
+
+class WhenImportingTooLargeBody(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenImportingTooLargeBody, cls).arrange()
+        cls.patch('familytree.bulk.ImportHandler.max_body_size', new=10)
+
+    @classmethod
+    def act(cls):
+        request = HTTPRequest(
+            http.urljoin(cls.my_url, 'bulk/import'),
+            body=json.dumps({'person': {'display_name': 'too large'}}),
+            headers={'Content-Type': 'application/x-ndjson'})
+        cls.http_post(request)
+
+    def should_fail_with_request_entity_too_large(self):
+        self.assertEqual(self.last_response.code, 413)
+
+
+class _StreamedImportTestCase(AcceptanceTestCase):
+
+    server_class = server.HTTPServer
+
+    @classmethod
+    def arrange(cls):
+        super(_StreamedImportTestCase, cls).arrange()
+        cls.patch('familytree.server._Connection.chunk_size', new=64)
+        cls.patch('familytree.bulk.ImportHandler.max_body_size', new=10)
+
+    @classmethod
+    def post_records(cls, lines):
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        cls.http_post(HTTPRequest(
+            http.urljoin(cls.my_url, 'bulk/import'), body=body,
+            headers={'Content-Type': 'application/x-ndjson'}))
+
+
+class WhenStreamingImport(_StreamedImportTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenStreamingImport, cls).arrange()
+        cls.feed = cls.patch('familytree.bulk.Importer.feed',
+                             autospec=True, side_effect=bulk.Importer.feed)
+
+    @classmethod
+    def act(cls):
+        cls.post_records(
+            [{'person': {'id': 'c0f1', 'display_name': 'streamed'}}] +
+            [{'person': {'display_name': 'bulk {0}'.format(index)}}
+             for index in range(20)])
+        cls.summary = cls.decode_json_response()
+        cls.person = cls.get_json('person/c0f1')
+
+    def should_not_limit_body_size(self):
+        self.assertEqual(self.last_response.code, 200)
+
+    def should_import_records(self):
+        self.assertEqual(self.summary['imported'],
+                         {'person': 21, 'event': 0})
+        self.assertEqual(self.person['display_name'], 'streamed')
+
+    def should_feed_body_as_it_is_read(self):
+        chunks = [call[0][1] for call in self.feed.call_args_list]
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+
+
+class WhenStreamedImportFails(_StreamedImportTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenStreamedImportFails, cls).arrange()
+        cls.patch('familytree.bulk.Importer.feed',
+                  side_effect=RuntimeError('storage is down'))
+
+    @classmethod
+    def act(cls):
+        cls.post_records([{'person': {'display_name': 'lost'}}])
+
+    def should_close_connection(self):
+        self.assertEqual(self.last_response.code, 599)
+
+
+class WhenStreamingServerReceivesOtherRequests(_StreamedImportTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.person = cls.make_person(display_name='buffered')
+
+    def should_read_body_as_a_whole(self):
+        self.assertEqual(self.last_response.code, 201)
+        self.assertEqual(self.person['display_name'], 'buffered')
+
+
+class _ExportTestCase(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ExportTestCase, cls).arrange()
+        cls.person = cls.make_person(display_name='exported')
+        cls.event = cls.make_event(people=[cls.person['self']])
+
+    @classmethod
+    def export(cls, accept):
+        cls.http_get(HTTPRequest(http.urljoin(cls.my_url, 'bulk/export'),
+                                 headers={'Accept': accept}))
+        return cls.last_response.body.decode('utf-8')
+
+
+class WhenExportingStore(_ExportTestCase):
+
+    @classmethod
+    def act(cls):
+        body = cls.export('application/x-ndjson')
+        cls.records = [json.loads(line) for line in body.splitlines()]
+
+    def should_use_chunked_encoding(self):
+        self.assertEqual(self.header('Transfer-Encoding'), 'chunked')
+
+    def should_return_ndjson(self):
+        self.assertEqual(self.header('Content-Type'), 'application/x-ndjson')
+
+    def should_include_each_record(self):
+        self.assertIn({'person': {'id': self.person['id'],
+                                  'display_name': 'exported',
+                                  'events': [self.event['self']]}},
+                      self.records)
+        self.assertIn({'event': {'id': self.event['id'],
+                                 'people': [self.person['self']]}},
+                      self.records)
+
+
+class WhenExportingStoreAsJSON(_ExportTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.records = json.loads(cls.export('application/json'))
+
+    def should_return_array_of_records(self):
+        self.assertIn({'event': {'id': self.event['id'],
+                                 'people': [self.person['self']]}},
+                      self.records)
@@ -0,0 +1,105 @@
+from familytree import handlers
+from . import AcceptanceTestCase
+
+
+class WhenListingPeople(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenListingPeople, cls).arrange()
+        cls.people = [cls.make_person(display_name='list-{0}'.format(name))
+                      for name in ('c', 'a', 'e', 'b', 'd')]
+
+    @classmethod
+    def act(cls):
+        cls.pages = []
+        url = 'person?limit=2'
+        while url is not None and len(cls.pages) < 1000:
+            page = cls.get_json(url)
+            cls.pages.append(page)
+            url = page.get('next')
+        cls.link = cls.header('Link')
+
+    def names(self):
+        return [person['display_name']
+                for page in self.pages for person in page['items']
+                if person['display_name'].startswith('list-')]
+
+    def should_list_people_in_name_order(self):
+        self.assertEqual(self.names(), ['list-a', 'list-b', 'list-c',
+                                        'list-d', 'list-e'])
+
+    def should_limit_page_size(self):
+        for page in self.pages:
+            self.assertLessEqual(len(page['items']), 2)
+
+    def should_include_representations(self):
+        person = self.pages[0]['items'][0]
+        self.assertIn('self', person)
+        self.assertIn('delete-person', person['actions'])
+
+    def should_omit_next_link_from_last_page(self):
+        self.assertNotIn('next', self.pages[-1])
+        self.assertIsNone(self.link)
+
+
+class WhenListingEvents(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenListingEvents, cls).arrange()
+        cls.person = cls.make_person(display_name='person')
+        cls.events = [cls.make_event(people=[cls.person['self']])
+                      for _ in range(3)]
+
+    @classmethod
+    def act(cls):
+        cls.first = cls.get_json('event?limit=1')
+        cls.link = cls.header('Link')
+        cls.second = cls.get_json(cls.first['next'])
+
+    def should_return_first_page(self):
+        self.assertEqual(len(self.first['items']), 1)
+
+    def should_send_next_link_header(self):
+        self.assertEqual(self.link,
+                         '<{0}>; rel="next"'.format(self.first['next']))
+
+    def should_continue_after_previous_page(self):
+        self.assertGreater(self.second['items'][0]['id'],
+                           self.first['items'][0]['id'])
+
+
+class WhenListingWithMalformedCursor(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.get_json('person?cursor=not-a-cursor')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenListingWithNumericCursorKey(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenListingWithNumericCursorKey, cls).arrange()
+        cls.make_person(display_name='Someone')
+
+    @classmethod
+    def act(cls):
+        cls.get_json('person?cursor=' + handlers.encode_cursor([5, 'a']))
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenListingWithInvalidLimit(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.get_json('event?limit=0')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
@@ -0,0 +1,137 @@
+import marshal
+
+from familytree import profiling
+from . import AcceptanceTestCase
+
+
+class _ProfilingTestCase(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ProfilingTestCase, cls).arrange()
+        profiling.configure_profiling(True, 's3cret')
+
+    @classmethod
+    def teardown_class(cls):
+        profiling.configure_profiling()
+        super(_ProfilingTestCase, cls).teardown_class()
+
+    @classmethod
+    def build_profile_request(cls, query, media_type):
+        request = cls.build_request(cls.profile_url + query,
+                                    headers={'X-Profile': 's3cret'})
+        request.headers['Accept'] = media_type
+        return request
+
+    @classmethod
+    def get_profiles(cls):
+        cls.http_get(cls.build_request('debug/profiles',
+                                       headers={'X-Profile': 's3cret'}))
+        return cls.decode_json_response()['profiles']
+
+
+class WhenProfilingRequest(_ProfilingTestCase):
+
+    @classmethod
+    def act(cls):
+        person = cls.make_person(display_name='Profiled')
+        request = cls.build_request(person['self'],
+                                    headers={'X-Profile': 's3cret'})
+        cls.http_get(request)
+        cls.profile_url = cls.header('X-Profile')
+        cls.profiles = cls.get_profiles()
+
+        cls.http_get(cls.build_profile_request('?limit=5', 'text/plain'))
+        cls.report = cls.last_response.body.decode('utf-8')
+        cls.http_get(cls.build_profile_request('',
+                                               'application/octet-stream'))
+        cls.stats = marshal.loads(cls.last_response.body)
+
+    def should_link_to_profile(self):
+        self.assertEqual(self.profiles[0]['self'], self.profile_url)
+
+    def should_describe_profiled_request(self):
+        self.assertEqual(self.profiles[0]['handler'], 'PersonHandler')
+        self.assertEqual(self.profiles[0]['status'], 200)
+
+    def should_report_functions_by_cumulative_time(self):
+        self.assertIn('Ordered by: cumulative time', self.report)
+
+    def should_include_serialization(self):
+        self.assertIn('serialize_model_instance',
+                      [name for _, _, name in self.stats])
+
+
+class WhenProfilingWithInvalidSortKey(_ProfilingTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.http_get(cls.build_request('event?profile=s3cret'))
+        cls.profile_url = cls.header('X-Profile')
+        cls.http_get(cls.build_profile_request('?sort=bogus', 'text/plain'))
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenListingProfilesWithoutToken(_ProfilingTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.http_get(cls.build_request('event?profile=s3cret'))
+        cls.profile_url = cls.header('X-Profile')
+        cls.http_get(cls.build_request('debug/profiles'))
+        cls.listing = cls.last_response
+        cls.http_get(cls.build_request(cls.profile_url + '?profile=guess'))
+
+    def should_not_list_profiles(self):
+        self.assertEqual(self.listing.code, 404)
+
+    def should_not_return_profile(self):
+        self.assertEqual(self.last_response.code, 404)
+
+
+class WhenListingProfilesWithToken(_ProfilingTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.http_get(cls.build_request('event?profile=s3cret'))
+        cls.profiles = cls.get_profiles()
+
+    def should_list_profiles(self):
+        self.assertEqual(self.last_response.code, 200)
+
+    def should_not_profile_listing(self):
+        self.assertIsNone(self.header('X-Profile'))
+        self.assertEqual(len(self.profiles), 1)
+
+
+class WhenProfilingEventDelete(_ProfilingTestCase):
+
+    @classmethod
+    def act(cls):
+        person = cls.make_person(display_name='Profiled')
+        event = cls.make_event(people=[person['self']])
+        cls.http_delete(cls.build_request(event['self'] + '?profile=s3cret'))
+        cls.response = cls.last_response
+        cls.person = cls.get_json(person['self'])
+
+    def should_delete_event(self):
+        self.assertEqual(self.response.code, 204)
+
+    def should_remove_event_from_people(self):
+        self.assertEqual(self.person['events'], [])
+
+
+class WhenListingProfilesWhileDisabled(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.http_get(cls.build_request('debug/profiles',
+                                       headers={'X-Profile': '1'}))
+
+    def should_not_find_profiles(self):
+        self.assertEqual(self.last_response.code, 404)
+
+    def should_not_profile(self):
+        self.assertIsNone(self.header('X-Profile'))
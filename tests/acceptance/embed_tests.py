@@ -0,0 +1,96 @@
+from familytree import storage
+from . import AcceptanceTestCase
+from ..helpers.compat import mock
+
+
+class _EmbedTestCase(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_EmbedTestCase, cls).arrange()
+        cls.mother = cls.make_person(display_name='mother')
+        cls.child = cls.make_person(display_name='child')
+        cls.event = cls.make_event(
+            people=[cls.mother['self'], cls.child['self']])
+        cls.get_items = cls.patch(
+            'familytree.storage.get_items_async',
+            new=mock.Mock(wraps=storage.get_items_async))
+
+
+class WhenEmbeddingPeopleInEvent(_EmbedTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.get_json(cls.event['self'] + '?embed=people')
+
+    def should_embed_people_in_link_order(self):
+        self.assertEqual(
+            [person['display_name']
+             for person in self.response['embedded']['people']],
+            ['mother', 'child'])
+
+    def should_embed_full_representations(self):
+        person = self.response['embedded']['people'][0]
+        self.assertEqual(person['self'], self.mother['self'])
+        self.assertIn('delete-person', person['actions'])
+
+    def should_keep_links(self):
+        self.assertEqual(self.response['people'],
+                         [self.mother['self'], self.child['self']])
+
+    def should_read_people_in_one_call(self):
+        self.assertEqual(self.get_items.call_count, 1)
+
+
+class WhenEmbeddingTwoLevels(_EmbedTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.get_json(
+            cls.mother['self'] + '?embed=events,people&depth=5')
+
+    def should_embed_events_of_person(self):
+        events = self.response['embedded']['events']
+        self.assertEqual([event['self'] for event in events],
+                         [self.event['self']])
+
+    def should_embed_people_of_embedded_events(self):
+        event = self.response['embedded']['events'][0]
+        self.assertEqual(
+            [person['self'] for person in event['embedded']['people']],
+            [self.mother['self'], self.child['self']])
+
+    def should_stop_at_maximum_depth(self):
+        event = self.response['embedded']['events'][0]
+        for person in event['embedded']['people']:
+            self.assertNotIn('embedded', person)
+
+    def should_read_each_level_in_one_call(self):
+        self.assertEqual(self.get_items.call_count, 2)
+
+
+class WhenEmbeddingInCollection(_EmbedTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.get_json('event?embed=people&limit=100')
+
+    def should_embed_people_of_each_event(self):
+        event, = [event for event in self.response['items']
+                  if event['id'] == self.event['id']]
+        self.assertEqual(
+            [person['self'] for person in event['embedded']['people']],
+            [self.mother['self'], self.child['self']])
+
+    def should_read_people_in_one_call(self):
+        self.assertEqual(self.get_items.call_count, 1)
+
+
+class WhenEmbeddingUnknownRelation(_EmbedTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.get_json(cls.event['self'] + '?embed=cousins')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
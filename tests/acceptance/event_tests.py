@@ -1,3 +1,4 @@
+from familytree import storage
 from . import AcceptanceTestCase
 from ..helpers.compat import mock
 
@@ -79,3 +80,81 @@ class WhenFetchingDeletedEvent(AcceptanceTestCase):
 
     def should_return_not_found(self):
         self.assertEqual(self.last_response.code, 404)
+
+
+class WhenDeleteOfCachedEventFailsPrecondition(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDeleteOfCachedEventFailsPrecondition, cls).arrange()
+        cls.patch('familytree.storage._cache',
+                  new=storage.cache.InstanceCache(100))
+        cls.person = cls.make_person(display_name='Cached')
+        cls.event = cls.make_event(people=[cls.person['self']])
+        cls.get_json(cls.person['self'])
+
+    @classmethod
+    def act(cls):
+        cls.http_delete(cls.build_request(
+            cls.event['self'], headers={'If-Match': '"stale"'}))
+        cls.status = cls.last_response.code
+        cls.person = cls.get_json(cls.person['self'])
+
+    def should_fail_precondition(self):
+        self.assertEqual(self.status, 412)
+
+    def should_keep_event_link_of_cached_person(self):
+        self.assertEqual(self.person['events'], [self.event['self']])
+
+
+class WhenPersonChangesWhileCreatingEvent(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonChangesWhileCreatingEvent, cls).arrange()
+        cls.person = cls.make_person(display_name='Busy')
+        cls.other_url = 'http://example.com/event/other'
+        cls.link_before_next_commit(cls.person, cls.other_url)
+
+    @classmethod
+    def act(cls):
+        cls.event = cls.make_event(people=[cls.person['self']])
+        cls.status = cls.last_response.code
+        cls.person = cls.get_json(cls.person['self'])
+
+    def should_create_event(self):
+        self.assertEqual(self.status, 201)
+
+    def should_keep_both_links(self):
+        self.assertEqual(self.person['events'],
+                         [self.other_url, self.event['self']])
+
+
+class WhenCreatingEventWithUnknownPerson(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('event', {'people': [cls.my_url + '/person/abc123']})
+
+    def should_fail_with_not_found(self):
+        self.assertEqual(self.last_response.code, 404)
+
+
+class WhenCreatingEventWithNonStringPeople(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('event', {'people': [1234]})
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenCreatingEventFromNonObject(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('event', ['people'])
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
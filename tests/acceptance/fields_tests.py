@@ -0,0 +1,52 @@
+from . import AcceptanceTestCase
+
+
+class _FieldsTestCase(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_FieldsTestCase, cls).arrange()
+        cls.person = cls.make_person(display_name='sparse')
+
+
+class WhenGettingSparsePerson(_FieldsTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.full = cls.get_json(cls.person['self'])
+        cls.response = cls.get_json(
+            cls.person['self'] + '?fields=display_name')
+
+    def should_include_requested_fields(self):
+        self.assertEqual(self.response['display_name'], 'sparse')
+
+    def should_include_self_link(self):
+        self.assertEqual(self.response['self'], self.person['self'])
+
+    def should_exclude_other_fields(self):
+        self.assertEqual(sorted(self.response), ['display_name', 'self'])
+
+    def should_not_share_cached_response_with_full_representation(self):
+        self.assertIn('actions', self.full)
+
+
+class WhenGettingSparsePersonWithActions(_FieldsTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.get_json(
+            cls.person['self'] + '?fields=id&fields=actions')
+
+    def should_include_requested_fields(self):
+        self.assertEqual(sorted(self.response), ['actions', 'id', 'self'])
+
+
+class WhenListingSparsePeople(_FieldsTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.get_json('person?fields=id&limit=100')
+
+    def should_limit_each_item_to_requested_fields(self):
+        for item in self.response['items']:
+            self.assertEqual(sorted(item), ['id', 'self'])
@@ -0,0 +1,119 @@
+import json
+
+import familytree.main
+from familytree import codec
+from familytree import handlers
+from ..helpers import tornado
+
+
+class _MediaTypeTestCase(tornado.TornadoTestCase):
+
+    @classmethod
+    def make_application(cls):
+        return familytree.main.Application()
+
+    @classmethod
+    def arrange(cls):
+        super(_MediaTypeTestCase, cls).arrange()
+        cls.msgpack = codec.MessagePackCodec()
+        # the handlers only offer MessagePack with the C extension
+        cls.patch('familytree.handlers.BaseHandler.codecs', new=dict(
+            handlers.BaseHandler.codecs,
+            **{'application/msgpack': cls.msgpack}))
+        cls.patch('familytree.handlers.BaseHandler.supported_media_types',
+                  new=handlers.BaseHandler.supported_media_types |
+                  set(['application/msgpack']))
+
+    @classmethod
+    def post_person(cls, body, content_type, accept):
+        return cls.http_post(cls.build_request(
+            'person', body=body,
+            headers={'Content-Type': content_type, 'Accept': accept}))
+
+
+class WhenCreatingPersonWithMessagePack(_MediaTypeTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_person(
+            cls.msgpack.encode({'display_name': 'packed'}),
+            'application/msgpack', 'application/msgpack')
+        cls.person = cls.msgpack.decode(cls.response.body)
+
+    def should_create_person(self):
+        self.assertEqual(self.response.code, 201)
+
+    def should_send_message_pack_content_type(self):
+        self.assertEqual(self.response.headers['Content-Type'],
+                         'application/msgpack')
+
+    def should_vary_by_accept(self):
+        self.assertEqual(self.response.headers['Vary'], 'Accept')
+
+    def should_return_decoded_representation(self):
+        self.assertEqual(self.person['display_name'], 'packed')
+        self.assertIn('delete-person', self.person['actions'])
+
+
+class WhenFetchingPersonWithAccept(_MediaTypeTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenFetchingPersonWithAccept, cls).arrange()
+        cls.post_person(json.dumps({'display_name': 'plain'}),
+                        'application/json', 'application/json')
+        cls.url = cls.last_response.headers['Location']
+
+    @classmethod
+    def act(cls):
+        cls.packed = cls.http_get(cls.build_request(
+            cls.url, headers={
+                'Accept': 'application/json;q=0.5, application/msgpack'}))
+        cls.default = cls.http_get(cls.build_request(
+            cls.url, headers={'Accept': '*/*'}))
+
+    def should_send_preferred_media_type(self):
+        self.assertEqual(self.packed.headers['Content-Type'],
+                         'application/msgpack')
+        self.assertEqual(self.msgpack.decode(self.packed.body)['self'],
+                         self.url)
+
+    def should_send_json_when_anything_is_acceptable(self):
+        self.assertEqual(self.default.headers['Content-Type'],
+                         'application/json')
+        self.assertEqual(
+            json.loads(self.default.body.decode('utf-8'))['self'], self.url)
+
+
+class WhenCreatingPersonWithUnacceptableMediaType(_MediaTypeTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_person(
+            json.dumps({'display_name': 'nobody'}),
+            'application/json', 'text/html')
+
+    def should_fail_with_not_acceptable(self):
+        self.assertEqual(self.response.code, 406)
+
+
+class WhenCreatingPersonWithMalformedBody(_MediaTypeTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_person(
+            b'\xc1', 'application/msgpack', 'application/json')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.response.code, 400)
+
+
+class WhenCreatingPersonWithUnhashableMapKey(_MediaTypeTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.post_person(
+            b'\x81\x90\x00', 'application/msgpack', 'application/json')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.response.code, 400)
@@ -0,0 +1,38 @@
+from . import AcceptanceTestCase
+
+
+class WhenScrapingMetrics(AcceptanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.person = cls.make_person(display_name='Measured')
+        cls.get_json(cls.person['self'])
+        cls.http_get('metrics')
+        cls.lines = cls.last_response.body.decode('utf-8').splitlines()
+
+    def should_succeed(self):
+        self.assertEqual(self.last_response.code, 200)
+
+    def should_return_text_format(self):
+        self.assertTrue(self.header('Content-Type').startswith(
+            'text/plain; version=0.0.4'))
+
+    def should_include_request_latency(self):
+        self.assertTrue(any(
+            line.startswith('familytree_http_request_duration_seconds_count'
+                            '{handler="PersonHandler",method="GET",'
+                            'status="200"} ')
+            for line in self.lines))
+
+    def should_include_response_bytes(self):
+        self.assertTrue(any(
+            line.startswith('familytree_http_response_bytes_total'
+                            '{handler="CreatePersonHandler",method="POST",'
+                            'status="201"} ')
+            for line in self.lines))
+
+    def should_include_storage_latency(self):
+        self.assertTrue(any(
+            line.startswith('familytree_storage_operation_duration_seconds'
+                            '_count{operation="get_versioned_item"} ')
+            for line in self.lines))
@@ -0,0 +1,156 @@
+import json
+
+from . import AcceptanceTestCase
+
+
+MERGE_PATCH = 'application/merge-patch+json'
+JSON_PATCH = 'application/json-patch+json'
+
+
+class _PatchTestCase(AcceptanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_PatchTestCase, cls).arrange()
+        cls.person = cls.make_person(display_name='before')
+        cls.etag = cls.header('Etag')
+
+    @classmethod
+    def patch_json(cls, url, body, content_type, headers=None):
+        request = cls.build_request(url, body=body, headers=headers or {})
+        request.headers['Content-Type'] = content_type
+        cls.http_patch(request)
+        if cls.last_response.code == 200:
+            return json.loads(cls.last_response.body.decode('utf-8'))
+        return None
+
+
+class WhenMergePatchingPerson(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.patch_json(
+            cls.person['self'], {'display_name': 'after'}, MERGE_PATCH,
+            headers={'If-Match': cls.etag})
+        cls.new_etag = cls.header('Etag')
+        cls.stored = cls.get_json(cls.person['self'])
+
+    def should_return_ok(self):
+        self.assertEqual(self.response['display_name'], 'after')
+
+    def should_store_change(self):
+        self.assertEqual(self.stored['display_name'], 'after')
+
+    def should_return_new_version(self):
+        self.assertNotEqual(self.new_etag, self.etag)
+        self.assertEqual(self.header('Etag'), self.new_etag)
+
+    def should_include_update_action(self):
+        self.assert_has_action(self.stored, 'update-person')
+
+
+class WhenPatchingPersonWithoutIfMatch(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patch_json(cls.person['self'], {'display_name': 'after'},
+                       MERGE_PATCH)
+
+    def should_return_precondition_required(self):
+        self.assertEqual(self.last_response.code, 428)
+
+
+class WhenPatchingStalePerson(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patch_json(cls.person['self'], {'display_name': 'first'},
+                       MERGE_PATCH, headers={'If-Match': cls.etag})
+        cls.patch_json(cls.person['self'], {'display_name': 'second'},
+                       MERGE_PATCH, headers={'If-Match': cls.etag})
+        cls.status = cls.last_response.code
+        cls.stored = cls.get_json(cls.person['self'])
+
+    def should_return_precondition_failed(self):
+        self.assertEqual(self.status, 412)
+
+    def should_keep_first_change(self):
+        self.assertEqual(self.stored['display_name'], 'first')
+
+
+class WhenPatchingPersonEvents(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patch_json(cls.person['self'], {'events': ['x']}, MERGE_PATCH,
+                       headers={'If-Match': cls.etag})
+
+    def should_return_bad_request(self):
+        self.assertEqual(self.last_response.code, 400)
+
+
+class WhenPatchingPersonWithMinimalResponse(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patch_json(
+            cls.person['self'],
+            [{'op': 'replace', 'path': '/display_name', 'value': 'after'}],
+            JSON_PATCH,
+            headers={'If-Match': cls.etag, 'Prefer': 'return=minimal'})
+
+    def should_return_no_content(self):
+        self.assertEqual(self.last_response.code, 204)
+
+    def should_return_new_version(self):
+        self.assertNotEqual(self.header('Etag'), self.etag)
+
+
+class WhenAddingPersonToEvent(_PatchTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenAddingPersonToEvent, cls).arrange()
+        cls.other = cls.make_person(display_name='other')
+        cls.event = cls.make_event(people=[cls.other['self']])
+        cls.get_json(cls.event['self'])
+        cls.event_etag = cls.header('Etag')
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.patch_json(
+            cls.event['self'],
+            [{'op': 'add', 'path': '/people/-',
+              'value': cls.person['self']}],
+            JSON_PATCH, headers={'If-Match': cls.event_etag})
+        cls.stored_person = cls.get_json(cls.person['self'])
+
+    def should_add_person_to_event(self):
+        self.assertEqual(self.response['people'],
+                         [self.other['self'], self.person['self']])
+
+    def should_link_person_to_event(self):
+        self.assertEqual(self.stored_person['events'], [self.event['self']])
+
+
+class WhenRemovingPersonFromEvent(_PatchTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRemovingPersonFromEvent, cls).arrange()
+        cls.event = cls.make_event(people=[cls.person['self']])
+        cls.get_json(cls.event['self'])
+        cls.event_etag = cls.header('Etag')
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.patch_json(
+            cls.event['self'], {'people': []}, MERGE_PATCH,
+            headers={'If-Match': cls.event_etag})
+        cls.stored_person = cls.get_json(cls.person['self'])
+
+    def should_remove_person_from_event(self):
+        self.assertEqual(self.response['people'], [])
+
+    def should_unlink_person_from_event(self):
+        self.assertEqual(self.stored_person['events'], [])
@@ -1,5 +1,6 @@
 from ..helpers import tornado
 from . import AcceptanceTestCase
+import familytree.handlers
 import familytree.main
 
 
@@ -42,6 +43,22 @@ class WhenCreatingPersonWithoutDisplayName(PersonApiTestCase):
         self.assertEqual(self.last_response.code, 400)
 
 
+class WhenCreatingPersonWithNumericDisplayName(PersonApiTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.post_json('person', {'display_name': 5})
+        cls.response = cls.last_response
+        cls.people = cls.get_json('person?limit=100')
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.response.code, 400)
+
+    def should_not_store_person(self):
+        self.assertNotIn(5, [item['display_name']
+                             for item in self.people['items']])
+
+
 class WhenCreatingPersonWithUnrecognizedContentType(tornado.TornadoTestCase):
 
     @classmethod
@@ -129,3 +146,77 @@ class WhenDeletingPerson(PersonApiTestCase):
     def should_return_not_found_after_delete(self):
         response = self.http_get(self.person['self'])
         self.assertEqual(response.code, 404)
+
+
+class WhenFetchingUnmodifiedPerson(PersonApiTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenFetchingUnmodifiedPerson, cls).arrange()
+        cls.person = cls.make_person(display_name='display name')
+        cls.etag = cls.header('Etag')
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.http_get(cls.build_request(
+            cls.person['self'], headers={'If-None-Match': cls.etag}))
+
+    def should_return_not_modified(self):
+        self.assertEqual(self.response.code, 304)
+
+    def should_return_same_etag(self):
+        self.assertEqual(self.response.headers['Etag'], self.etag)
+
+
+class WhenDeletingModifiedPerson(PersonApiTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDeletingModifiedPerson, cls).arrange()
+        cls.person = cls.make_person(display_name='display name')
+
+    @classmethod
+    def act(cls):
+        cls.response = cls.http_delete(cls.build_request(
+            cls.person['self'], headers={'If-Match': '"stale"'}))
+
+    def should_return_precondition_failed(self):
+        self.assertEqual(self.response.code, 412)
+
+    def should_not_delete_person(self):
+        response = self.http_get(self.person['self'])
+        self.assertEqual(response.code, 200)
+
+
+class WhenFetchingCachedPerson(PersonApiTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenFetchingCachedPerson, cls).arrange()
+        cls.cache = familytree.handlers.configure_response_cache(1 << 20)
+        cls.person = cls.make_person(display_name='display name')
+        cls.first = cls.get_json(cls.person['self'])
+
+    @classmethod
+    def act(cls):
+        cls.second = cls.get_json(cls.person['self'])
+        cls.etag = cls.header('Etag')
+        cls.perform_action(cls.person, 'delete-person')
+        cls.after_delete = cls.http_get(cls.person['self'])
+
+    @classmethod
+    def teardown_class(cls):
+        familytree.handlers.configure_response_cache(0)
+        super(WhenFetchingCachedPerson, cls).teardown_class()
+
+    def should_serve_repeat_read_from_cache(self):
+        self.assertEqual(self.cache.hits, 1)
+
+    def should_return_same_representation(self):
+        self.assertEqual(self.second, self.first)
+
+    def should_send_etag_from_cache(self):
+        self.assertIsNotNone(self.etag)
+
+    def should_invalidate_cached_response_on_write(self):
+        self.assertEqual(self.after_delete.code, 404)
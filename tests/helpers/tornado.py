@@ -29,6 +29,7 @@ def log(msg_format, *args, **kwargs):  # pragma no cover
 class TornadoTestCase(fluenttest.TestCase, unittest.TestCase):
     show_trace = False
     last_response = None
+    server_class = HTTPServer
 
     @classmethod
     def make_application(cls):  # pragma no cover
@@ -57,7 +58,7 @@ class TornadoTestCase(fluenttest.TestCase, unittest.TestCase):
         cls.io_loop.make_current()
 
         cls.client = AsyncHTTPClient(io_loop=cls.io_loop)
-        cls.server = HTTPServer(cls.application, io_loop=cls.io_loop)
+        cls.server = cls.server_class(cls.application, io_loop=cls.io_loop)
         cls.server.add_sockets([sock])
 
     @classmethod
@@ -120,6 +121,10 @@ class TornadoTestCase(fluenttest.TestCase, unittest.TestCase):
     def http_delete(cls, request):
         return cls._fetch('DELETE', request)
 
+    @classmethod
+    def http_patch(cls, request):
+        return cls._fetch('PATCH', request)
+
     @classmethod
     def build_request(cls, path, **kwargs):
         return HTTPRequest(http.urljoin(cls.my_url, path), **kwargs)
@@ -1,6 +1,16 @@
+import copy
+import json
+import os.path
+import shutil
+import tempfile
+
 import fluenttest
 
 from familytree import storage
+from familytree import timing
+from familytree.storage import logfile
+from familytree.storage import memory
+from familytree.storage import sqlite
 from ..helpers.compat import mock
 from ..helpers.compat import unittest
 
@@ -10,9 +20,11 @@ class StorageTestCase(fluenttest.TestCase, unittest.TestCase):
     @classmethod
     def arrange(cls):
         super(StorageTestCase, cls).arrange()
-        cls.storage_layer = cls.patch('familytree.storage._STORAGE')
+        cls.backend = cls.patch('familytree.storage._backend')
         cls.storage_type = mock.MagicMock()
+        cls.storage_type.__name__ = 'ModelClass'
         cls.storage_item = mock.Mock()
+        cls.storage_item.as_dictionary.return_value = {'id': 'item'}
 
 
 class MissingItemMixin(object):
@@ -77,13 +89,13 @@ class WhenGettingItem(StorageTestCase):
     def act(cls):
         cls.item = storage.get_item(cls.storage_type, mock.sentinel.item_id)
 
-    def should_retrieve_item_by_key(self):
-        self.storage_layer.__getitem__.assert_called_once_with(
-            (str(self.storage_type), mock.sentinel.item_id))
+    def should_retrieve_item_from_backend(self):
+        self.backend.get.assert_called_once_with(
+            'ModelClass', mock.sentinel.item_id)
 
     def should_create_item_from_dict_repr(self):
         self.storage_type.from_dictionary.assert_called_once_with(
-            self.storage_layer.__getitem__.return_value)
+            self.backend.get.return_value)
 
     def should_return_created_item(self):
         self.assertIs(
@@ -95,7 +107,7 @@ class WhenGettingItemThatDoesNotExist(MissingItemMixin, StorageTestCase):
     @classmethod
     def arrange(cls):
         super(WhenGettingItemThatDoesNotExist, cls).arrange()
-        cls.storage_layer.__getitem__.side_effect = KeyError
+        cls.backend.get.side_effect = KeyError
 
     @classmethod
     def act(cls):
@@ -116,9 +128,10 @@ class WhenSavingItem(StorageTestCase):
         self.storage_item.as_dictionary.assert_called_once_with()
 
     def should_save_item(self):
-        self.storage_layer.__setitem__.assert_called_once_with(
-            (str(self.storage_item.__class__), mock.sentinel.item_id),
-            self.storage_item.as_dictionary.return_value,
+        self.backend.put.assert_called_once_with(
+            'Mock', mock.sentinel.item_id,
+            {'id': 'item',
+             '_version': storage.compute_version({'id': 'item'})},
         )
 
 
@@ -132,9 +145,9 @@ class WhenDeletingItem(StorageTestCase):
     def act(cls):
         storage.delete_item(cls.storage_type, mock.sentinel.item_id)
 
-    def should_delete_item_by_key(self):
-        self.storage_layer.__delitem__.assert_called_once_with(
-            (str(self.storage_type), mock.sentinel.item_id))
+    def should_delete_item_from_backend(self):
+        self.backend.delete.assert_called_once_with(
+            'ModelClass', mock.sentinel.item_id)
 
 
 class WhenDeletingItemThatDoesNotExist(MissingItemMixin, WhenDeletingItem):
@@ -142,4 +155,1241 @@ class WhenDeletingItemThatDoesNotExist(MissingItemMixin, WhenDeletingItem):
     @classmethod
     def arrange(cls):
         super(WhenDeletingItemThatDoesNotExist, cls).arrange()
-        cls.storage_layer.__delitem__.side_effect = KeyError
+        cls.backend.delete.side_effect = KeyError
+
+
+###############################################################################
+# get_items
+###############################################################################
+
+class WhenGettingItems(StorageTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGettingItems, cls).arrange()
+        cls.backend.get_many.return_value = {
+            'one': mock.sentinel.one, 'two': mock.sentinel.two}
+        cls.storage_type.from_dictionary.side_effect = lambda d: d
+
+    @classmethod
+    def act(cls):
+        cls.items = storage.get_items(cls.storage_type, ['two', 'one'])
+
+    def should_retrieve_items_from_backend_at_once(self):
+        self.backend.get_many.assert_called_once_with(
+            'ModelClass', ['two', 'one'])
+
+    def should_return_items_in_requested_order(self):
+        self.assertEqual(self.items, [mock.sentinel.two, mock.sentinel.one])
+
+
+class WhenGettingItemsThatDoNotExist(StorageTestCase):
+
+    allowed_exceptions = storage.InstanceNotFound
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGettingItemsThatDoNotExist, cls).arrange()
+        cls.backend.get_many.return_value = {'two': mock.sentinel.two}
+
+    @classmethod
+    def act(cls):
+        storage.get_items(cls.storage_type, ['one', 'two', 'three'])
+
+    def should_raise_instances_not_found(self):
+        self.assertIsInstance(self.exception, storage.InstancesNotFound)
+
+    def should_report_each_missing_item(self):
+        self.assertEqual(self.exception.instance_ids, ['one', 'three'])
+
+    def should_report_first_missing_item_as_instance_id(self):
+        self.assertEqual(self.exception.instance_id, 'one')
+
+
+class WhenGettingNoItems(StorageTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.items = storage.get_items(cls.storage_type, [])
+
+    def should_not_call_backend(self):
+        self.assertFalse(self.backend.get_many.called)
+
+    def should_return_empty_list(self):
+        self.assertEqual(self.items, [])
+
+
+###############################################################################
+# save_items
+###############################################################################
+
+class WhenSavingItems(StorageTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.save_items([(cls.storage_item, mock.sentinel.item_id)])
+
+    def should_save_items_in_one_backend_call(self):
+        self.backend.put_many.assert_called_once_with([
+            ('Mock', mock.sentinel.item_id,
+             {'id': 'item',
+              '_version': storage.compute_version({'id': 'item'})}),
+        ])
+
+
+###############################################################################
+# delete_items
+###############################################################################
+
+class WhenDeletingItems(StorageTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDeletingItems, cls).arrange()
+        cls.backend.delete_many.return_value = []
+
+    @classmethod
+    def act(cls):
+        storage.delete_items(cls.storage_type, ['one', 'two'])
+
+    def should_delete_items_in_one_backend_call(self):
+        self.backend.delete_many.assert_called_once_with(
+            'ModelClass', ['one', 'two'])
+
+
+class WhenDeletingItemsThatDoNotExist(WhenDeletingItems):
+
+    allowed_exceptions = storage.InstanceNotFound
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDeletingItemsThatDoNotExist, cls).arrange()
+        cls.backend.delete_many.return_value = ['two']
+
+    def should_report_each_missing_item(self):
+        self.assertEqual(self.exception.instance_ids, ['two'])
+
+
+def _record(item_id):
+    record = {'id': item_id}
+    record['_version'] = storage.compute_version(record)
+    return record
+
+
+class _Model(object):
+
+    def __init__(self, item_id):
+        self.id = item_id
+
+    def as_dictionary(self):
+        return {'id': self.id}
+
+    @classmethod
+    def from_dictionary(cls, data):
+        return cls(data['id'])
+
+
+###############################################################################
+# Instance cache
+###############################################################################
+
+class InstanceCacheTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(InstanceCacheTestCase, cls).arrange()
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=memory.MemoryBackend())
+        cls.cache = cls.patch('familytree.storage._cache',
+                              new=storage.cache.InstanceCache(10))
+        storage.save_items([(_Model('one'), 'one'), (_Model('two'), 'two')])
+
+
+class WhenGettingCachedItem(InstanceCacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.first = storage.get_item(_Model, 'one')
+        cls.first.id = 'changed'
+        cls.second = storage.get_item(_Model, 'one')
+        cls.batch = storage.get_items(_Model, ['two', 'one'])
+
+    def should_return_new_instance_for_each_read(self):
+        self.assertIsNot(self.first, self.second)
+
+    def should_not_share_changes_between_readers(self):
+        self.assertEqual(self.second.id, 'one')
+
+    def should_serve_batch_from_cache(self):
+        self.assertEqual([item.id for item in self.batch], ['two', 'one'])
+
+    def should_count_hits(self):
+        self.assertEqual(self.cache.hits, 2)
+
+    def should_count_misses(self):
+        self.assertEqual(self.cache.misses, 2)
+
+
+class WhenSavingCachedItem(InstanceCacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.first = storage.get_item(_Model, 'one')
+        storage.save_item(_Model('one'), 'one')
+        cls.second = storage.get_item(_Model, 'one')
+
+    def should_invalidate_cached_instance(self):
+        self.assertIsNot(self.first, self.second)
+
+
+class WhenDeletingCachedItem(InstanceCacheTestCase):
+
+    allowed_exceptions = storage.InstanceNotFound
+
+    @classmethod
+    def act(cls):
+        storage.get_items(_Model, ['one', 'two'])
+        storage.delete_items(_Model, ['one'])
+        storage.delete_item(_Model, 'two')
+        storage.get_item(_Model, 'one')
+
+    def should_not_return_deleted_instance(self):
+        self.assertIsInstance(self.exception, storage.InstanceNotFound)
+
+
+###############################################################################
+# Transaction
+###############################################################################
+
+class TransactionTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(TransactionTestCase, cls).arrange()
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=memory.MemoryBackend())
+        cls.cache = cls.patch('familytree.storage._cache',
+                              new=storage.cache.InstanceCache(10))
+        storage.save_items([(_Model('one'), 'one'), (_Model('two'), 'two')])
+        cls.cached = storage.get_item(_Model, 'one')
+        cls.backend.commit = mock.Mock(wraps=cls.backend.commit)
+
+
+class WhenCommittingTransaction(TransactionTestCase):
+
+    @classmethod
+    def act(cls):
+        with storage.Transaction() as transaction:
+            cls.version = transaction.save_item(_Model('one'), 'one')
+            transaction.save_items([(_Model('three'), 'three')])
+            transaction.delete_item(_Model, 'two')
+            transaction.delete_items(_Model, ['four'])
+            cls.buffered = cls.backend.commit.called
+
+    def should_buffer_writes_until_commit(self):
+        self.assertFalse(self.buffered)
+
+    def should_commit_in_one_backend_call(self):
+        self.backend.commit.assert_called_once_with([
+            ('_Model', 'one', _record('one')),
+            ('_Model', 'three', _record('three')),
+            ('_Model', 'two', None),
+            ('_Model', 'four', None),
+        ])
+
+    def should_apply_writes(self):
+        self.assertEqual(storage.get_item(_Model, 'three').id, 'three')
+        with self.assertRaises(storage.InstanceNotFound):
+            storage.get_item(_Model, 'two')
+
+    def should_invalidate_cached_instances(self):
+        self.assertIsNot(storage.get_item(_Model, 'one'), self.cached)
+
+    def should_return_version_of_saved_item(self):
+        _, version = storage.get_versioned_item(_Model, 'one')
+        self.assertEqual(self.version, version)
+
+
+class WhenTransactionFails(TransactionTestCase):
+
+    allowed_exceptions = RuntimeError
+
+    @classmethod
+    def act(cls):
+        with storage.Transaction() as transaction:
+            transaction.delete_item(_Model, 'one')
+            raise RuntimeError()
+
+    def should_not_commit(self):
+        self.assertFalse(self.backend.commit.called)
+
+    def should_discard_writes(self):
+        self.assertEqual(storage.get_item(_Model, 'one').id, 'one')
+
+
+###############################################################################
+# Versions
+###############################################################################
+
+class VersionTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(VersionTestCase, cls).arrange()
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=memory.MemoryBackend())
+        cls.version = storage.save_item(_Model('one'), 'one')
+
+
+class WhenReadingVersionedItem(VersionTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.instance, cls.read_version = storage.get_versioned_item(
+            _Model, 'one')
+        cls.backend.put('_Model', 'old', {'id': 'old'})
+        cls.old_instance, cls.old_version = storage.get_versioned_item(
+            _Model, 'old')
+
+    def should_return_saved_version(self):
+        self.assertEqual(self.read_version, self.version)
+
+    def should_return_instance(self):
+        self.assertEqual(self.instance.id, 'one')
+
+    def should_derive_version_from_content(self):
+        self.assertEqual(self.version, storage.compute_version({'id': 'one'}))
+
+    def should_compute_version_of_unversioned_record(self):
+        self.assertEqual(self.old_version,
+                         storage.compute_version({'id': 'old'}))
+
+
+class WhenWritingExpectedVersion(VersionTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.delete_item(_Model, 'one', expected_version=[cls.version])
+
+    def should_write(self):
+        with self.assertRaises(storage.InstanceNotFound):
+            storage.get_item(_Model, 'one')
+
+
+class WhenWritingUnexpectedVersion(VersionTestCase):
+
+    allowed_exceptions = storage.VersionConflict
+
+    @classmethod
+    def act(cls):
+        storage.save_item(_Model('one'), 'one', expected_version='stale')
+
+    def should_raise_version_conflict(self):
+        self.assertEqual(self.exception.version, self.version)
+
+
+class WhenCommittingUnexpectedVersion(VersionTestCase):
+
+    allowed_exceptions = storage.VersionConflict
+
+    @classmethod
+    def act(cls):
+        with storage.Transaction() as transaction:
+            transaction.save_item(_Model('two'), 'two')
+            transaction.delete_item(_Model, 'one', expected_version='stale')
+
+    def should_raise_version_conflict(self):
+        self.assertIsInstance(self.exception, storage.VersionConflict)
+
+    def should_not_write_anything(self):
+        with self.assertRaises(storage.InstanceNotFound):
+            storage.get_item(_Model, 'two')
+
+
+###############################################################################
+# Metrics
+###############################################################################
+
+class WhenMeasuringStorageOperations(fluenttest.TestCase, unittest.TestCase):
+
+    allowed_exceptions = storage.InstanceNotFound
+
+    @classmethod
+    def arrange(cls):
+        super(WhenMeasuringStorageOperations, cls).arrange()
+        cls.patch('familytree.storage._backend', new=memory.MemoryBackend())
+        cls.record = cls.patch(
+            'familytree.storage.metrics.record_storage_operation')
+
+    @classmethod
+    def act(cls):
+        storage.save_item(_Model('one'), 'one')
+        storage.get_item(_Model, 'one')
+        with storage.Transaction() as transaction:
+            transaction.delete_item(_Model, 'one')
+        storage.get_item_async(_Model, 'one').result()
+
+    def should_record_each_operation_once(self):
+        self.assertEqual([c[0][0] for c in self.record.call_args_list],
+                         ['save_item', 'get_item', 'commit', 'get_item'])
+
+    def should_record_duration(self):
+        for call in self.record.call_args_list:
+            self.assertGreaterEqual(call[0][1], 0)
+
+
+class WhenTimingStorageOperationsOnThreadPool(fluenttest.TestCase,
+                                              unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenTimingStorageOperationsOnThreadPool, cls).arrange()
+        cls.patch('familytree.storage._backend', new=memory.MemoryBackend())
+        storage.save_item(_Model('one'), 'one')
+        cls.timer = timing.RequestTimer()
+        cls.executor = storage._Executor(max_workers=1)
+
+    @classmethod
+    def act(cls):
+        with cls.timer.activate():
+            cls.executor.submit(storage.get_items, _Model, ['one']).result()
+        cls.executor.submit(storage.get_item, _Model, 'one').result()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.executor.shutdown()
+        super(WhenTimingStorageOperationsOnThreadPool, cls).teardown_class()
+
+    def should_add_to_timer_of_caller(self):
+        self.assertEqual(self.timer.calls, {'storage': 1})
+
+
+###############################################################################
+# Secondary indexes
+###############################################################################
+
+class _IndexedModel(_Model):
+
+    storage_indexes = (storage.SortedIndex('name'),)
+
+    def __init__(self, item_id, name=None):
+        super(_IndexedModel, self).__init__(item_id)
+        self.name = name
+
+    def as_dictionary(self):
+        return {'id': self.id, 'name': self.name}
+
+    @classmethod
+    def from_dictionary(cls, data):
+        return cls(data['id'], data['name'])
+
+
+class SecondaryIndexTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(SecondaryIndexTestCase, cls).arrange()
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=memory.MemoryBackend())
+        cls.patch('familytree.storage._indexes', new={})
+        storage.save_items([(_IndexedModel('1', 'bob'), '1'),
+                            (_IndexedModel('2', 'alice'), '2')])
+
+
+class WhenQueryingIndex(SecondaryIndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.before = storage.query_keys(_IndexedModel, 'name', prefix='')
+        storage.save_item(_IndexedModel('3', 'bobby'), '3')
+        storage.save_item(_IndexedModel('2', 'zoe'), '2')
+        storage.delete_item(_IndexedModel, '1')
+        cls.after = storage.query(_IndexedModel, 'name', low='b')
+
+    def should_build_index_from_existing_records(self):
+        self.assertEqual(self.before, [('alice', '2'), ('bob', '1')])
+
+    def should_update_index_on_writes(self):
+        self.assertEqual([instance.id for instance in self.after],
+                         ['3', '2'])
+
+
+class WhenQueryingIndexAfterBatchWrites(SecondaryIndexTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.query_keys(_IndexedModel, 'name', equals='bob')
+        storage.save_items([(_IndexedModel('3', 'bob'), '3')])
+        storage.delete_items(_IndexedModel, ['1'])
+        cls.result = storage.query_keys(_IndexedModel, 'name', equals='bob')
+
+    def should_update_index(self):
+        self.assertEqual(self.result, [('bob', '3')])
+
+
+class WhenPagingThroughIndex(SecondaryIndexTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.save_items([(_IndexedModel('3', 'carol'), '3'),
+                            (_IndexedModel('4', 'dave'), '4')])
+        cls.first, cls.first_entry = storage.query_page(
+            _IndexedModel, 'name', 2)
+        cls.backend.delete(storage.get_namespace(_IndexedModel), '3')
+        cls.last, cls.last_entry = storage.query_page(
+            _IndexedModel, 'name', 2, after=cls.first_entry)
+
+    def should_return_first_page_in_index_order(self):
+        self.assertEqual([instance.id for instance in self.first],
+                         ['2', '1'])
+
+    def should_return_entry_to_continue_from(self):
+        self.assertEqual(self.first_entry, ('bob', '1'))
+
+    def should_skip_items_missing_from_backend(self):
+        self.assertEqual([instance.id for instance in self.last], ['4'])
+
+    def should_not_return_entry_for_last_page(self):
+        self.assertIsNone(self.last_entry)
+
+
+class WhenScanningItems(SecondaryIndexTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.save_items([(_IndexedModel('4', 'dave'), '4'),
+                            (_IndexedModel('3', 'carol'), '3')])
+        groups = storage.scan_items(_IndexedModel, group_size=2)
+        cls.first = next(groups)
+        cls.backend.delete(storage.get_namespace(_IndexedModel), '3')
+        cls.rest = list(groups)
+
+    def should_return_records_in_key_order(self):
+        self.assertEqual([item_id for item_id, _ in self.first], ['1', '2'])
+
+    def should_return_records_without_version(self):
+        self.assertEqual(self.first[0][1], {'id': '1', 'name': 'bob'})
+
+    def should_skip_items_deleted_during_scan(self):
+        self.assertEqual([[item_id for item_id, _ in group]
+                          for group in self.rest], [['4']])
+
+
+class WhenQueryingUndeclaredIndex(SecondaryIndexTestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        storage.query_keys(_Model, 'name', equals='bob')
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+###############################################################################
+# Frozen records
+###############################################################################
+
+class FrozenRecordTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(FrozenRecordTestCase, cls).arrange()
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=memory.MemoryBackend())
+        cls.item = mock.Mock()
+        cls.item.as_dictionary.return_value = {
+            'id': 'one', 'events': ['a'], 'nested': {'key': ['value']}}
+
+
+class WhenSavingFrozenRecord(FrozenRecordTestCase):
+
+    @classmethod
+    def act(cls):
+        storage.save_item(cls.item, 'one')
+        cls.record = cls.backend.get('Mock', 'one')
+
+    def should_store_frozen_dictionary(self):
+        self.assertIsInstance(self.record, storage.FrozenDict)
+
+    def should_convert_lists_to_tuples(self):
+        self.assertEqual(self.record['events'], ('a',))
+
+    def should_freeze_nested_values(self):
+        self.assertEqual(self.record['nested'], {'key': ('value',)})
+        self.assertIsInstance(self.record['nested'], storage.FrozenDict)
+
+    def should_not_alias_saved_dictionary(self):
+        self.item.as_dictionary.return_value['events'].append('b')
+        self.assertEqual(self.record['events'], ('a',))
+
+    def should_remain_json_serializable(self):
+        self.assertEqual(json.loads(json.dumps(self.record))['events'], ['a'])
+
+    def should_share_record_with_copies(self):
+        self.assertIs(copy.deepcopy(self.record), self.record)
+
+
+class WhenModifyingFrozenRecord(FrozenRecordTestCase):
+
+    allowed_exceptions = TypeError
+
+    @classmethod
+    def act(cls):
+        storage.save_item(cls.item, 'one')
+        cls.backend.get('Mock', 'one')['id'] = 'two'
+
+    def should_raise_type_error(self):
+        self.assertIsInstance(self.exception, TypeError)
+
+    def should_not_modify_stored_record(self):
+        self.assertEqual(self.backend.get('Mock', 'one')['id'], 'one')
+
+
+###############################################################################
+# Asynchronous API
+###############################################################################
+
+class _AsynchronousTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_AsynchronousTestCase, cls).arrange()
+        cls.patch('familytree.storage._backend', new=cls.make_backend())
+        cls.patch('familytree.storage._executor', new=None)
+        storage.save_item(_Model('one'), 'one')
+
+    @classmethod
+    def act(cls):
+        cls.found = storage.get_item_async(_Model, 'one')
+        cls.missing = storage.get_item_async(_Model, 'two')
+        cls.found.exception(timeout=5)
+        cls.missing.exception(timeout=5)
+
+    @classmethod
+    def teardown_class(cls):
+        storage.shutdown()
+        super(_AsynchronousTestCase, cls).teardown_class()
+
+    def should_resolve_to_model_instance(self):
+        self.assertEqual(self.found.result().id, 'one')
+
+    def should_fail_with_instance_not_found(self):
+        self.assertIsInstance(self.missing.exception(),
+                              storage.InstanceNotFound)
+
+
+class WhenUsingNonBlockingBackendAsynchronously(_AsynchronousTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        return memory.MemoryBackend()
+
+    def should_resolve_immediately(self):
+        self.assertTrue(self.found.done())
+
+    def should_not_create_thread_pool(self):
+        self.assertIsNone(storage._executor)
+
+
+class WhenUsingBlockingBackendAsynchronously(_AsynchronousTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        cls.directory = tempfile.mkdtemp()
+        return sqlite.SQLiteBackend(
+            database=os.path.join(cls.directory, 'storage.db'))
+
+    @classmethod
+    def teardown_class(cls):
+        super(WhenUsingBlockingBackendAsynchronously, cls).teardown_class()
+        shutil.rmtree(cls.directory)
+
+    def should_run_on_thread_pool(self):
+        self.assertIsNotNone(storage._executor)
+
+
+###############################################################################
+# configure
+###############################################################################
+
+class ConfigureTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(ConfigureTestCase, cls).arrange()
+        cls.original_backend = cls.patch('familytree.storage._backend')
+        cls.patch('familytree.storage._cache', new=None)
+        cls.patch('familytree.storage._max_threads', new=4)
+        cls.settings = {}
+
+    @classmethod
+    def act(cls):
+        cls.returned = storage.configure(cls.settings)
+
+    def should_close_original_backend(self):
+        self.original_backend.close.assert_called_once_with()
+
+    def should_install_returned_backend(self):
+        self.assertIs(storage.get_backend(), self.returned)
+
+
+class WhenConfiguringDefaultBackend(ConfigureTestCase):
+
+    def should_use_memory_backend(self):
+        self.assertIsInstance(self.returned, memory.MemoryBackend)
+
+    def should_disable_instance_cache(self):
+        self.assertIsNone(storage.get_cache())
+
+
+class WhenConfiguringBackendByName(ConfigureTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenConfiguringBackendByName, cls).arrange()
+        cls.settings = {'backend': 'sqlite', 'database': ':memory:',
+                        'cache_size': 100}
+
+    def should_create_named_backend(self):
+        self.assertIsInstance(self.returned, sqlite.SQLiteBackend)
+
+    def should_pass_settings_to_backend(self):
+        self.assertEqual(self.returned.database, ':memory:')
+
+    def should_create_instance_cache(self):
+        self.assertEqual(storage.get_cache().max_size, 100)
+
+    def should_not_modify_settings(self):
+        self.assertEqual(self.settings['backend'], 'sqlite')
+
+
+class WhenConfiguringBackendByClassName(ConfigureTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenConfiguringBackendByClassName, cls).arrange()
+        cls.settings = {'backend': 'familytree.storage.memory.MemoryBackend'}
+
+    def should_create_named_backend(self):
+        self.assertIsInstance(self.returned, memory.MemoryBackend)
+
+
+class WhenConfiguringUnknownBackend(fluenttest.TestCase, unittest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenConfiguringUnknownBackend, cls).arrange()
+        cls.original_backend = cls.patch('familytree.storage._backend')
+
+    @classmethod
+    def act(cls):
+        storage.configure({'backend': 'no.such.Backend'})
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+    def should_retain_original_backend(self):
+        self.assertIs(storage.get_backend(), self.original_backend)
+
+
+###############################################################################
+# Storage Backends
+###############################################################################
+
+class _BackendTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_BackendTestCase, cls).arrange()
+        cls.backend = cls.make_backend()
+
+    @classmethod
+    def act(cls):
+        cls.backend.put('Thing', 'one', {'id': 'one', 'value': [1, 2]})
+        cls.backend.put('Thing', 'two', {'id': 'two', 'value': []})
+        cls.backend.put('Thing', 'two', {'id': 'two', 'value': [3]})
+        cls.backend.put('Other', 'one', {'id': 'one'})
+        cls.backend.put('Thing', 'three', {'id': 'three'})
+        cls.backend.delete('Thing', 'three')
+        cls.backend.put_many([('Thing', 'four', {'id': 'four'}),
+                              ('Other', 'four', {'id': 'four'}),
+                              ('Thing', 'five', {'id': 'five'})])
+        cls.missing = cls.backend.delete_many('Thing', ['five', 'six'])
+        cls.backend.put('Batch', 'one', {'id': 'one'})
+        cls.backend.commit([('Batch', 'two', {'id': 'two'}),
+                            ('Batch', 'one', None),
+                            ('Batch', 'three', None)])
+        cls.checked = []
+        cls.backend.commit([('Batch', 'four', {'id': 'four'})],
+                           cls.check_commit)
+        try:
+            cls.backend.commit([('Batch', 'five', {'id': 'five'})],
+                               cls.reject_commit)
+        except ValueError:
+            pass
+
+    @classmethod
+    def check_commit(cls, get):
+        cls.checked.append(get('Batch', 'two'))
+
+    @classmethod
+    def reject_commit(cls, get):
+        raise ValueError(get('Batch', 'two'))
+
+    @classmethod
+    def teardown_class(cls):
+        cls.backend.close()
+        super(_BackendTestCase, cls).teardown_class()
+
+    def should_retrieve_stored_record(self):
+        self.assertEqual(self.backend.get('Thing', 'one'),
+                         {'id': 'one', 'value': [1, 2]})
+
+    def should_retrieve_replaced_record(self):
+        self.assertEqual(self.backend.get('Thing', 'two'),
+                         {'id': 'two', 'value': [3]})
+
+    def should_separate_namespaces(self):
+        self.assertEqual(self.backend.get('Other', 'one'), {'id': 'one'})
+
+    def should_raise_key_error_for_missing_record(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'six')
+
+    def should_retrieve_many_records(self):
+        self.assertEqual(
+            self.backend.get_many('Thing', ['one', 'four', 'five']),
+            {'one': {'id': 'one', 'value': [1, 2]}, 'four': {'id': 'four'}})
+
+    def should_store_many_records_across_namespaces(self):
+        self.assertEqual(self.backend.get('Other', 'four'), {'id': 'four'})
+
+    def should_delete_many_records(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'five')
+
+    def should_report_missing_records_when_deleting_many(self):
+        self.assertEqual(self.missing, ['six'])
+
+    def should_raise_key_error_for_deleted_record(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'three')
+
+    def should_raise_key_error_when_deleting_missing_record(self):
+        with self.assertRaises(KeyError):
+            self.backend.delete('Thing', 'six')
+
+    def should_commit_mixed_changes(self):
+        self.assertEqual(self.backend.get('Batch', 'two'), {'id': 'two'})
+        with self.assertRaises(KeyError):
+            self.backend.get('Batch', 'one')
+
+    def should_check_commit_before_writing(self):
+        self.assertEqual(self.checked, [{'id': 'two'}])
+        self.assertEqual(self.backend.get('Batch', 'four'), {'id': 'four'})
+
+    def should_not_write_when_check_fails(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Batch', 'five')
+
+    def should_scan_namespace(self):
+        self.assertEqual(
+            sorted(self.backend.scan('Thing')),
+            [('four', {'id': 'four'}), ('one', {'id': 'one', 'value': [1, 2]}),
+             ('two', {'id': 'two', 'value': [3]})])
+
+    def should_list_keys_of_namespace(self):
+        self.assertEqual(sorted(self.backend.keys('Thing')),
+                         ['four', 'one', 'two'])
+
+
+class WhenUsingMemoryBackend(_BackendTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        return memory.MemoryBackend()
+
+
+class WhenUsingSQLiteBackend(_BackendTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.database = os.path.join(cls.directory, 'storage.db')
+        return sqlite.SQLiteBackend(database=cls.database)
+
+    @classmethod
+    def teardown_class(cls):
+        super(WhenUsingSQLiteBackend, cls).teardown_class()
+        shutil.rmtree(cls.directory)
+
+    def should_use_write_ahead_log(self):
+        row = self.backend.connection.execute('PRAGMA journal_mode')
+        self.assertEqual(row.fetchone()[0].lower(), 'wal')
+
+    def should_share_records_with_other_connections(self):
+        other = sqlite.SQLiteBackend(database=self.database)
+        try:
+            self.assertEqual(other.get('Other', 'one'), {'id': 'one'})
+        finally:
+            other.close()
+
+    def should_reject_invalid_namespace(self):
+        with self.assertRaises(ValueError):
+            self.backend.get('"; DROP TABLE Thing; --', 'one')
+
+    def should_check_commit_inside_transaction(self):
+        in_transaction = []
+        self.backend.commit(
+            [], lambda get: in_transaction.append(
+                self.backend.connection.in_transaction))
+        self.assertEqual(in_transaction, [True])
+
+
+class _BackendIndexTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_BackendIndexTestCase, cls).arrange()
+        cls.backend = cls.make_backend()
+        cls.sorted_index = storage.SortedIndex('name')
+        cls.hash_index = storage.HashIndex('tags')
+
+    @classmethod
+    def act(cls):
+        cls.backend.put_many([
+            ('Thing', '1', {'name': 'bob', 'tags': ['a', 'b']}),
+            ('Thing', '2', {'name': 'alice', 'tags': 'a'}),
+            ('Thing', '3', {'name': 'bobby', 'tags': ['b', 'b']}),
+            ('Thing', '4', {'name': 'bob'}),
+            ('Thing', '5', {'name': 5, 'tags': None}),
+            ('Thing', '6', {'tags': ['c']}),
+        ])
+
+    @classmethod
+    def teardown_class(cls):
+        cls.backend.close()
+        super(_BackendIndexTestCase, cls).teardown_class()
+
+    def find(self, definition, **criteria):
+        return self.backend.find('Thing', definition, **criteria)
+
+    def should_find_string_keys_in_order(self):
+        self.assertEqual(self.find(self.sorted_index),
+                         [('alice', '2'), ('bob', '1'), ('bob', '4'),
+                          ('bobby', '3')])
+
+    def should_find_equal_keys(self):
+        self.assertEqual(self.find(self.sorted_index, equals='bob'),
+                         [('bob', '1'), ('bob', '4')])
+
+    def should_find_range_of_keys(self):
+        self.assertEqual(self.find(self.sorted_index, low='b', high='bobby'),
+                         [('bob', '1'), ('bob', '4')])
+
+    def should_find_keys_by_prefix(self):
+        self.assertEqual(self.find(self.sorted_index, prefix='bo', limit=2),
+                         [('bob', '1'), ('bob', '4')])
+
+    def should_find_keys_after_entry(self):
+        self.assertEqual(
+            self.find(self.sorted_index, after=('bob', '1'), limit=2),
+            [('bob', '4'), ('bobby', '3')])
+
+    def should_find_hashed_keys_in_identifier_order(self):
+        self.assertEqual(self.find(self.hash_index, equals='b'),
+                         [('b', '1'), ('b', '3')])
+
+    def should_find_scalar_hashed_keys(self):
+        self.assertEqual(self.find(self.hash_index, equals='a', limit=1),
+                         [('a', '1')])
+
+    def should_reject_range_lookup_of_hash_index(self):
+        with self.assertRaises(ValueError):
+            self.find(self.hash_index, low='a')
+
+
+class WhenFindingWithDefaultImplementation(_BackendIndexTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        return memory.MemoryBackend()
+
+
+class WhenFindingWithSQLiteBackend(_BackendIndexTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        cls.directory = tempfile.mkdtemp()
+        return sqlite.SQLiteBackend(
+            database=os.path.join(cls.directory, 'storage.db'))
+
+    @classmethod
+    def teardown_class(cls):
+        super(WhenFindingWithSQLiteBackend, cls).teardown_class()
+        shutil.rmtree(cls.directory)
+
+    def should_page_with_expression_index(self):
+        self.find(self.sorted_index)
+        plan = self.backend.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT json_extract(data, \'$.name\'), id'
+            ' FROM "Thing" WHERE json_type(data, \'$.name\') = \'text\''
+            ' AND json_extract(data, \'$.name\') >= ?'
+            ' ORDER BY json_extract(data, \'$.name\'), id LIMIT 2',
+            ('bob',)).fetchall()
+        self.assertIn('Thing.name', plan[0][-1])
+
+    def should_reject_invalid_field_name(self):
+        with self.assertRaises(ValueError):
+            self.find(storage.SortedIndex("name') --"))
+
+
+class WhenQueryingSharedBackend(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenQueryingSharedBackend, cls).arrange()
+        cls.directory = tempfile.mkdtemp()
+        database = os.path.join(cls.directory, 'storage.db')
+        cls.backend = cls.patch('familytree.storage._backend',
+                                new=sqlite.SQLiteBackend(database=database))
+        cls.other = sqlite.SQLiteBackend(database=database)
+        cls.indexes = cls.patch('familytree.storage._indexes', new={})
+        storage.save_items([(_IndexedModel('1', 'bob'), '1'),
+                            (_IndexedModel('2', 'alice'), '2')])
+
+    @classmethod
+    def act(cls):
+        cls.first, cls.first_entry = storage.query_page(
+            _IndexedModel, 'name', 1)
+        cls.other.put(storage.get_namespace(_IndexedModel), '3',
+                      {'id': '3', 'name': 'bert'})
+        cls.rest, cls.last_entry = storage.query_page(
+            _IndexedModel, 'name', 5, after=cls.first_entry)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.backend.close()
+        cls.other.close()
+        shutil.rmtree(cls.directory)
+        super(WhenQueryingSharedBackend, cls).teardown_class()
+
+    def should_return_first_page(self):
+        self.assertEqual([instance.id for instance in self.first], ['2'])
+
+    def should_see_writes_of_other_processes(self):
+        self.assertEqual([instance.id for instance in self.rest],
+                         ['3', '1'])
+
+    def should_not_build_indexes_in_memory(self):
+        self.assertEqual(self.indexes, {})
+
+    def should_reject_undeclared_index(self):
+        with self.assertRaises(ValueError):
+            storage.query_keys(_IndexedModel, 'other', equals='bob')
+
+
+class WhenUsingLogStructuredBackend(_BackendTestCase):
+
+    @classmethod
+    def make_backend(cls):
+        cls.directory = tempfile.mkdtemp()
+        return logfile.LogStructuredBackend(directory=cls.directory)
+
+    @classmethod
+    def teardown_class(cls):
+        super(WhenUsingLogStructuredBackend, cls).teardown_class()
+        shutil.rmtree(cls.directory)
+
+    def should_replay_records_when_reopened(self):
+        other = logfile.LogStructuredBackend(directory=self.directory)
+        try:
+            self.assertEqual(other.get('Thing', 'two'),
+                             {'id': 'two', 'value': [3]})
+            with self.assertRaises(KeyError):
+                other.get('Thing', 'three')
+            self.assertEqual(other.get('Batch', 'two'), {'id': 'two'})
+            with self.assertRaises(KeyError):
+                other.get('Batch', 'one')
+        finally:
+            other.close()
+
+
+class LogStructuredTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(LogStructuredTestCase, cls).arrange()
+        cls.directory = tempfile.mkdtemp()
+        cls.backend = logfile.LogStructuredBackend(
+            directory=cls.directory, segment_size=256, fsync=False)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.backend.close()
+        shutil.rmtree(cls.directory)
+        super(LogStructuredTestCase, cls).teardown_class()
+
+    @classmethod
+    def reopen(cls):
+        cls.backend.close()
+        cls.backend = logfile.LogStructuredBackend(
+            directory=cls.directory, segment_size=256, fsync=False)
+
+
+class WhenReplayingTornSegment(LogStructuredTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenReplayingTornSegment, cls).arrange()
+        cls.backend.put('Thing', 'one', {'id': 'one'})
+        cls.backend.put('Thing', 'two', {'id': 'two'})
+        segment = cls.backend.active_segment
+        cls.backend.close()
+        with open(segment.path, 'r+b') as handle:
+            handle.truncate(segment.size - 3)
+
+    @classmethod
+    def act(cls):
+        cls.reopen()
+
+    def should_retain_complete_records(self):
+        self.assertEqual(self.backend.get('Thing', 'one'), {'id': 'one'})
+
+    def should_discard_torn_record(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'two')
+
+
+class WhenReplayingTornBatch(LogStructuredTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenReplayingTornBatch, cls).arrange()
+        cls.backend.put('Thing', 'one', {'id': 'one'})
+        cls.backend.commit([('Thing', 'two', {'id': 'two'}),
+                            ('Thing', 'one', None),
+                            ('Thing', 'three', {'id': 'three'})])
+        segment = cls.backend.active_segment
+        cls.backend.close()
+        with open(segment.path, 'r+b') as handle:
+            handle.truncate(segment.size - 3)
+
+    @classmethod
+    def act(cls):
+        cls.reopen()
+
+    def should_discard_complete_entries_of_torn_batch(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'two')
+
+    def should_not_apply_deletes_from_torn_batch(self):
+        self.assertEqual(self.backend.get('Thing', 'one'), {'id': 'one'})
+
+
+class WhenCompactingSegments(LogStructuredTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCompactingSegments, cls).arrange()
+        cls.io_loop = mock.Mock()
+        for generation in range(10):
+            for item_id in ('one', 'two', 'three'):
+                cls.backend.put('Thing', item_id,
+                                {'id': item_id, 'generation': generation})
+        cls.backend.delete('Thing', 'three')
+        cls.sealed_before = cls.backend.segments[:-1]
+        cls.dead_fraction = cls.backend.dead_fraction
+
+    @classmethod
+    def act(cls):
+        cls.backend.compaction_slice = 0.0
+        cls.compaction = cls.backend.maybe_compact(cls.io_loop)
+        cls.slices = 0
+        while cls.io_loop.add_callback.call_count > cls.slices:
+            cls.slices += 1
+            cls.compaction.run_slice()
+
+    def should_have_accumulated_garbage(self):
+        self.assertGreater(self.dead_fraction, 0.5)
+
+    def should_run_in_multiple_slices(self):
+        self.assertGreater(self.slices, 1)
+
+    def should_remove_compacted_segments(self):
+        for segment in self.sealed_before:
+            self.assertFalse(os.path.exists(segment.path))
+
+    def should_leave_no_garbage(self):
+        self.assertEqual(self.backend.dead_fraction, 0.0)
+
+    def should_retain_latest_records(self):
+        self.assertEqual(self.backend.get('Thing', 'one'),
+                         {'id': 'one', 'generation': 9})
+        self.assertEqual(self.backend.get('Thing', 'two'),
+                         {'id': 'two', 'generation': 9})
+
+    def should_not_resurrect_deleted_records(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'three')
+
+    def should_replay_compacted_segments(self):
+        self.reopen()
+        self.assertEqual(self.backend.get('Thing', 'two'),
+                         {'id': 'two', 'generation': 9})
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'three')
+
+
+class WhenCancellingCompaction(LogStructuredTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCancellingCompaction, cls).arrange()
+        cls.io_loop = mock.Mock()
+        for generation in range(10):
+            for item_id in ('one', 'two', 'three'):
+                cls.backend.put('Thing', item_id,
+                                {'id': item_id, 'generation': generation})
+        cls.backend.delete('Thing', 'three')
+        cls.files_before = set(os.listdir(cls.directory))
+
+    @classmethod
+    def act(cls):
+        cls.backend.compaction_slice = 0.0
+        cls.compaction = cls.backend.maybe_compact(cls.io_loop)
+        while not cls.compaction.outputs:
+            cls.compaction.run_slice()
+        cls.slices = cls.io_loop.add_callback.call_count
+        cls.outputs = list(cls.compaction.outputs)
+        cls.backend.close()
+        cls.files_after = set(os.listdir(cls.directory))
+        cls.reopen()
+
+    def should_have_started_writing_outputs(self):
+        self.assertTrue(self.outputs)
+
+    def should_cancel_between_slices(self):
+        self.assertGreater(self.slices, 1)
+        self.assertTrue(self.compaction.cancelled)
+
+    def should_remove_partial_outputs(self):
+        for output in self.outputs:
+            self.assertFalse(os.path.exists(output.path))
+
+    def should_keep_input_segments(self):
+        self.assertEqual(self.files_after, self.files_before)
+
+    def should_retain_latest_records(self):
+        self.assertEqual(self.backend.get('Thing', 'one'),
+                         {'id': 'one', 'generation': 9})
+        self.assertEqual(self.backend.get('Thing', 'two'),
+                         {'id': 'two', 'generation': 9})
+
+    def should_not_resurrect_deleted_records(self):
+        with self.assertRaises(KeyError):
+            self.backend.get('Thing', 'three')
@@ -1,8 +1,25 @@
+from tornado import concurrent
 import fluenttest
 
 from ..helpers.compat import mock
 
 
+def resolved_future(result=None, exception=None):
+    """Return a future that has already completed.
+
+    :param result: the value that the future resolves to
+    :param Exception exception: if specified, the future fails
+        with this exception instead
+
+    """
+    future = concurrent.TracebackFuture()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
 class TornadoHandlerTestCase(fluenttest.TestCase):
 
     @classmethod
@@ -13,6 +30,7 @@ class TornadoHandlerTestCase(fluenttest.TestCase):
 
         cls.request = mock.Mock()
         cls.request.headers = {}
+        cls.request.arguments = {}
 
 
 class ActionCardTestMixin(object):
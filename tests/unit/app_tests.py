@@ -1,8 +1,13 @@
 import fluenttest
+import tornado.web
 
 from familytree.main import Application, main
 from ..helpers.compat import mock
 from ..helpers.compat import unittest
+import familytree.batch
+import familytree.bulk
+import familytree.debug
+import familytree.metrics
 import familytree.person
 
 
@@ -42,6 +47,18 @@ class WhenApplicationIsCreated(fluenttest.TestCase, unittest.TestCase):
     def should_install_PersonHandler(self):
         self.assert_was_installed(familytree.person.PersonHandler)
 
+    def should_install_BatchHandler(self):
+        self.assert_was_installed(familytree.batch.BatchHandler)
+
+    def should_install_ImportHandler(self):
+        self.assert_was_installed(familytree.bulk.ImportHandler)
+
+    def should_install_ProfilesHandler(self):
+        self.assert_was_installed(familytree.debug.ProfilesHandler)
+
+    def should_install_MetricsHandler(self):
+        self.assert_was_installed(familytree.metrics.MetricsHandler)
+
 
 class WhenRunningMain(fluenttest.TestCase, unittest.TestCase):
 
@@ -63,76 +80,75 @@ class _GetUrlForTestCase(fluenttest.TestCase, unittest.TestCase):
     @classmethod
     def arrange(cls):
         super(_GetUrlForTestCase, cls).arrange()
+        cls.request = mock.Mock(protocol='http', host='example.com')
+        cls.application = Application()
+        cls.application.add_handlers('.*', [
+            tornado.web.url('/things/(.*)', mock.sentinel.handler,
+                            name='thing'),
+            tornado.web.url('/other/(.*)', mock.sentinel.handler),
+        ])
 
-        cls.request = mock.Mock()
-        cls.handler_urlspec = mock.Mock()
 
-        cls.application = Application()
-        cls.application.named_handlers = mock.Mock()
+class WhenGettingUrlForClass(_GetUrlForTestCase):
 
     @classmethod
     def act(cls):
         cls.result = cls.application.get_url_for(
-            cls.request, mock.sentinel.handler)
+            cls.request, mock.sentinel.handler, 'a b/c')
 
-    def should_lookup_named_handler(self):
-        self.application.named_handlers.get.assert_called_once_with(
-            mock.sentinel.handler)
+    def should_use_first_matching_spec(self):
+        self.assertTrue(self.result.startswith('http://example.com/things/'))
 
+    def should_escape_arguments_like_urlspec(self):
+        self.assertEqual(self.result, 'http://example.com/things/a%20b/c')
 
-class _SuccessfulGetUrlForTestCase(_GetUrlForTestCase):
 
-    @classmethod
-    def arrange(cls):
-        super(_SuccessfulGetUrlForTestCase, cls).arrange()
-        cls.urljoin = cls.patch('familytree.main.http').urljoin
+class WhenGettingUrlForNamedHandler(_GetUrlForTestCase):
 
-    def should_extract_full_url_from_request(self):
-        self.request.full_url.assert_called_once_with()
-
-    def should_reverse_urlspec(self):
-        self.handler_urlspec.reverse.assert_called_once_with()
-
-    def should_generate_url_from_urlspec_and_request(self):
-        self.urljoin.assert_called_once_with(
-            self.request.full_url.return_value,
-            self.handler_urlspec.reverse.return_value,
-        )
+    @classmethod
+    def act(cls):
+        cls.result = cls.application.get_url_for(cls.request, 'thing', 42)
 
     def should_return_generated_url(self):
-        self.assertIs(self.result, self.urljoin.return_value)
+        self.assertEqual(self.result, 'http://example.com/things/42')
 
 
-class WhenGettingUrlForNamedHandler(_SuccessfulGetUrlForTestCase):
+class WhenGettingUrlForMissingClass(_GetUrlForTestCase):
 
     @classmethod
-    def arrange(cls):
-        super(WhenGettingUrlForNamedHandler, cls).arrange()
-        cls.application.named_handlers.get.return_value = cls.handler_urlspec
+    def act(cls):
+        cls.result = cls.application.get_url_for(
+            cls.request, mock.sentinel.other_handler)
+
+    def should_return_none(self):
+        self.assertIsNone(self.result)
 
 
-class WhenGettingUrlForClass(_SuccessfulGetUrlForTestCase):
+class WhenGettingUrlForInstalledHandler(_GetUrlForTestCase):
 
     @classmethod
-    def arrange(cls):
-        super(WhenGettingUrlForClass, cls).arrange()
-        cls.handler_urlspec.handler_class = mock.sentinel.handler
-        cls.application.named_handlers.get.return_value = None
-        cls.application.handlers = [
-            (mock.sentinel.host_pattern, [cls.handler_urlspec]),
-        ]
+    def act(cls):
+        cls.result = cls.application.reverse_path(
+            familytree.person.PersonHandler, 'abc')
 
+    def should_return_path(self):
+        self.assertEqual(self.result, '/person/abc')
 
-class WhenGettingUrlForMissingClass(_GetUrlForTestCase):
+
+class WhenResolvingPath(_GetUrlForTestCase):
 
     @classmethod
-    def arrange(cls):
-        super(WhenGettingUrlForMissingClass, cls).arrange()
-        cls.application.named_handlers.get.return_value = None
-        cls.handler_urlspec.handler_class = mock.sentinel.other_handler
-        cls.application.handlers = [
-            (mock.sentinel.host_pattern, [cls.handler_urlspec]),
-        ]
+    def act(cls):
+        cls.result = cls.application.resolve_path('/things/a%20b/c')
+        cls.installed = cls.application.resolve_path('/person/abc')
+        cls.missing = cls.application.resolve_path('/nothing')
 
-    def should_return_none(self):
-        self.assertIsNone(self.result)
+    def should_return_handler_and_unescaped_arguments(self):
+        self.assertEqual(self.result, (mock.sentinel.handler, ('a b/c',)))
+
+    def should_resolve_installed_handlers(self):
+        self.assertEqual(self.installed,
+                         (familytree.person.PersonHandler, ('abc',)))
+
+    def should_return_none_for_unknown_path(self):
+        self.assertIsNone(self.missing)
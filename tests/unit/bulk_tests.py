@@ -0,0 +1,161 @@
+import json
+
+import fluenttest
+
+from familytree import bulk
+from familytree.event import Event
+from familytree.person import Person
+from ..helpers.compat import unittest
+
+
+class _ImporterTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ImporterTestCase, cls).arrange()
+        cls.save_items = cls.patch('familytree.bulk.storage.save_items')
+        cls.saved = []
+        cls.save_items.side_effect = lambda items: cls.saved.append(
+            list(items))
+        cls.importer = bulk.Importer(group_size=2, max_line_length=64)
+
+
+class WhenImportingRecordsInChunks(_ImporterTestCase):
+
+    @classmethod
+    def act(cls):
+        data = (b'{"person": {"id": "a1", "display_name": "one"}}\n'
+                b'\n'
+                b'{"person": {"display_name": "two"}}\n'
+                b'{"event": {"id": "e1", "people": []}}')
+        for offset in range(0, len(data), 7):
+            cls.importer.feed(data[offset:offset + 7])
+        cls.before_close = len(cls.saved)
+        cls.importer.close()
+        cls.summary = cls.importer.get_summary()
+
+    def should_save_full_groups_while_parsing(self):
+        self.assertEqual(self.before_close, 1)
+
+    def should_save_remaining_records_when_closed(self):
+        self.assertEqual([len(group) for group in self.saved], [2, 1])
+
+    def should_save_records_as_model_instances(self):
+        (first, first_id), (second, second_id) = self.saved[0]
+        self.assertIsInstance(first, Person)
+        self.assertEqual(first_id, 'a1')
+        self.assertEqual(second.display_name, 'two')
+        self.assertEqual(second.id, second_id)
+        self.assertIsInstance(self.saved[1][0][0], Event)
+
+    def should_count_lines_and_records(self):
+        self.assertEqual(self.summary, {
+            'lines': 4,
+            'imported': {'person': 2, 'event': 1},
+            'failed': 0,
+            'errors': [],
+        })
+
+
+class WhenImportingMalformedRecords(_ImporterTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.importer.feed(b'not json\n'
+                          b'{"plant": {}}\n'
+                          b'{"person": {}}\n'
+                          b'{"person": {"id": "XYZ", "display_name": "x"}}\n'
+                          b'{"event": {"people": "abc"}}\n'
+                          b'{"person": {"display_name": 5}}\n'
+                          b'{"person": {"display_name": "ok"}}\n')
+        cls.importer.close()
+        cls.summary = cls.importer.get_summary()
+
+    def should_report_each_failed_line(self):
+        self.assertEqual([error['line'] for error in self.summary['errors']],
+                         [1, 2, 3, 4, 5, 6])
+
+    def should_import_the_remaining_records(self):
+        self.assertEqual(self.summary['imported']['person'], 1)
+        self.assertEqual(self.summary['failed'], 6)
+
+
+class WhenImportingLongLine(_ImporterTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.importer.feed(b'{"person": {"display_name": "')
+        cls.importer.feed(b'x' * 100)
+        cls.importer.feed(b'"}}\n{"person": {"display_name": "ok"}}')
+        cls.importer.close()
+        cls.summary = cls.importer.get_summary()
+
+    def should_report_long_line(self):
+        self.assertEqual(self.summary['errors'],
+                         [{'line': 1, 'error': 'line is too long'}])
+
+    def should_import_following_lines(self):
+        self.assertEqual(self.summary['imported']['person'], 1)
+        self.assertEqual(self.summary['lines'], 2)
+
+
+class WhenImportingManyMalformedRecords(_ImporterTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.importer.max_errors = 3
+        cls.importer.feed(b'[]\n' * 10)
+        cls.importer.close()
+        cls.summary = cls.importer.get_summary()
+
+    def should_count_every_error(self):
+        self.assertEqual(self.summary['failed'], 10)
+
+    def should_only_keep_the_first_errors(self):
+        self.assertEqual(len(self.summary['errors']), 3)
+
+
+class _ExportTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ExportTestCase, cls).arrange()
+        groups = {
+            Event: [[('e1', {'id': 'e1', 'people': []})]],
+            Person: [[('p1', {'id': 'p1', 'display_name': 'one'}),
+                      ('p2', {'id': 'p2', 'display_name': 'two'})], []],
+        }
+        cls.scan_items = cls.patch('familytree.bulk.storage.scan_items')
+        cls.scan_items.side_effect = lambda item_type, group_size: iter(
+            groups[item_type])
+
+
+class WhenExportingRecords(_ExportTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.chunks = list(bulk.export_chunks(group_size=2))
+
+    def should_write_one_chunk_per_group(self):
+        self.assertEqual(len(self.chunks), 2)
+
+    def should_write_one_record_per_line(self):
+        lines = b''.join(self.chunks).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'event': {'id': 'e1', 'people': []}},
+            {'person': {'id': 'p1', 'display_name': 'one'}},
+            {'person': {'id': 'p2', 'display_name': 'two'}},
+        ])
+
+
+class WhenExportingRecordsAsArray(_ExportTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.chunks = list(bulk.export_chunks(group_size=2, as_array=True))
+
+    def should_write_json_array(self):
+        self.assertEqual(
+            [list(record) for record in json.loads(
+                b''.join(self.chunks).decode('utf-8'))],
+            [['event'], ['person'], ['person']])
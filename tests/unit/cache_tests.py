@@ -0,0 +1,70 @@
+import fluenttest
+
+from familytree.storage.cache import InstanceCache
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+
+
+class CacheTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(CacheTestCase, cls).arrange()
+        cls.cache = InstanceCache(2)
+        cls.cache.put('one', mock.sentinel.one, cls.cache.generation)
+        cls.cache.put('two', mock.sentinel.two, cls.cache.generation)
+
+
+class WhenCacheExceedsMaximumSize(CacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.cache.get('one')
+        cls.cache.put('three', mock.sentinel.three, cls.cache.generation)
+
+    def should_not_exceed_maximum_size(self):
+        self.assertEqual(len(self.cache), 2)
+
+    def should_evict_least_recently_used_instance(self):
+        self.assertIsNone(self.cache.get('two'))
+
+    def should_retain_recently_used_instance(self):
+        self.assertIs(self.cache.get('one'), mock.sentinel.one)
+
+
+class WhenLookingUpCachedInstances(CacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.hit = cls.cache.get('one')
+        cls.miss = cls.cache.get('three')
+
+    def should_return_cached_instance(self):
+        self.assertIs(self.hit, mock.sentinel.one)
+
+    def should_return_none_for_missing_instance(self):
+        self.assertIsNone(self.miss)
+
+    def should_count_hits(self):
+        self.assertEqual(self.cache.hits, 1)
+
+    def should_count_misses(self):
+        self.assertEqual(self.cache.misses, 1)
+
+
+class WhenInvalidatingCachedInstances(CacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.generation = cls.cache.generation
+        cls.cache.invalidate(['one'])
+        cls.cache.put('three', mock.sentinel.three, cls.generation)
+
+    def should_remove_invalidated_instance(self):
+        self.assertIsNone(self.cache.get('one'))
+
+    def should_retain_other_instances(self):
+        self.assertIs(self.cache.get('two'), mock.sentinel.two)
+
+    def should_not_cache_instance_read_before_invalidation(self):
+        self.assertIsNone(self.cache.get('three'))
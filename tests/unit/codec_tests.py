@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import fluenttest
+
+from familytree import codec
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+
+
+class _JSONCodecTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    implementation = 'json'
+
+    @classmethod
+    def arrange(cls):
+        super(_JSONCodecTestCase, cls).arrange()
+        if getattr(codec, cls.implementation) is None:
+            raise unittest.SkipTest(
+                '{0} is not installed'.format(cls.implementation))
+        cls.codec = codec.JSONCodec(cls.implementation)
+        cls.value = {'name': u'Jürgen', 'events': ['a', 'b'],
+                     'count': 2, 'missing': None}
+
+    @classmethod
+    def act(cls):
+        cls.encoded = cls.codec.encode(cls.value)
+        cls.decoded = cls.codec.decode(cls.encoded, 'utf-8')
+        cls.latin1 = cls.codec.decode(
+            u'{"name": "Jürgen"}'.encode('latin-1'), 'latin-1')
+        try:
+            cls.codec.decode(b'{"name"', 'utf-8')
+        except ValueError as error:
+            cls.malformed_error = error
+        else:  # pragma: no cover
+            cls.malformed_error = None
+
+    def should_encode_to_bytes(self):
+        self.assertIsInstance(self.encoded, bytes)
+
+    def should_round_trip_value(self):
+        self.assertEqual(self.decoded, self.value)
+
+    def should_decode_using_charset(self):
+        self.assertEqual(self.latin1, {'name': u'Jürgen'})
+
+    def should_report_malformed_document_as_value_error(self):
+        self.assertIsInstance(self.malformed_error, ValueError)
+
+
+class WhenUsingStandardLibraryJSONCodec(_JSONCodecTestCase):
+    implementation = 'json'
+
+
+class WhenUsingOrjsonCodec(_JSONCodecTestCase):
+    implementation = 'orjson'
+
+
+class WhenUsingUjsonCodec(_JSONCodecTestCase):
+    implementation = 'ujson'
+
+
+class WhenCreatingDefaultJSONCodec(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def act(cls):
+        cls.codec = codec.JSONCodec()
+
+    def should_prefer_fastest_installed_implementation(self):
+        if codec.orjson is not None:
+            self.assertEqual(self.codec.implementation, 'orjson')
+        elif codec.ujson is not None:  # pragma: no cover
+            self.assertEqual(self.codec.implementation, 'ujson')
+        else:  # pragma: no cover
+            self.assertEqual(self.codec.implementation, 'json')
+
+    def should_handle_json_media_type(self):
+        self.assertEqual(self.codec.media_type, 'application/json')
+
+
+class _MessagePackCodecTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    implementation = 'python'
+
+    @classmethod
+    def arrange(cls):
+        super(_MessagePackCodecTestCase, cls).arrange()
+        if getattr(codec, cls.implementation, True) is None:
+            raise unittest.SkipTest(
+                '{0} is not installed'.format(cls.implementation))
+        cls.codec = codec.MessagePackCodec(cls.implementation)
+        cls.values = [
+            None, True, False, 0, 127, 128, 65536, 2 ** 40, -1, -33,
+            -2 ** 40, 1.5, u'', u'Jürgen', u'x' * 40, u'x' * 70000,
+            b'\x00\xff', list(range(20)), {u'a': [1, {u'b': None}]},
+            dict((u'k{0}'.format(n), n) for n in range(20)),
+        ]
+
+    @classmethod
+    def act(cls):
+        cls.decoded = [cls.codec.decode(cls.codec.encode(value))
+                       for value in cls.values]
+        cls.errors = []
+        for data in (b'', b'\x92\x01', b'\xc1', b'\x01\x02', b'\xa3ab',
+                     b'\x81\x90\x00', b'\x91' * 100000 + b'\x00'):
+            try:
+                cls.codec.decode(data)
+            except ValueError as error:
+                cls.errors.append(error)
+
+    def should_round_trip_values(self):
+        self.assertEqual(self.decoded, self.values)
+
+    def should_encode_to_bytes(self):
+        self.assertIsInstance(self.codec.encode({u'a': 1}), bytes)
+
+    def should_report_malformed_documents_as_value_error(self):
+        self.assertEqual(len(self.errors), 7)
+
+
+class WhenUsingPythonMessagePackCodec(_MessagePackCodecTestCase):
+    implementation = 'python'
+
+    def should_use_compact_encoding(self):
+        self.assertEqual(self.codec.encode({u'a': 1}), b'\x81\xa1a\x01')
+
+    def should_refuse_unknown_types(self):
+        with self.assertRaises(TypeError):
+            self.codec.encode(object())
+
+
+class WhenUsingMsgpackCodec(_MessagePackCodecTestCase):
+    implementation = 'msgpack'
+
+
+class _NativeMessagePackTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    module = None
+
+    @classmethod
+    def arrange(cls):
+        super(_NativeMessagePackTestCase, cls).arrange()
+        cls.patch('familytree.codec.msgpack', new=cls.module)
+
+    @classmethod
+    def act(cls):
+        cls.native = codec.has_native_msgpack()
+
+
+class WhenMessagePackIsMissing(_NativeMessagePackTestCase):
+
+    def should_not_report_native_msgpack(self):
+        self.assertFalse(self.native)
+
+
+class WhenMessagePackIsPurePython(_NativeMessagePackTestCase):
+
+    module = mock.Mock()
+    module.Packer.__module__ = 'msgpack.fallback'
+
+    def should_not_report_native_msgpack(self):
+        self.assertFalse(self.native)
+
+
+class WhenMessagePackIsCompiled(_NativeMessagePackTestCase):
+
+    module = mock.Mock()
+    module.Packer.__module__ = 'msgpack._cmsgpack'
+
+    def should_report_native_msgpack(self):
+        self.assertTrue(self.native)
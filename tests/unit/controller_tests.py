@@ -46,6 +46,9 @@ class WhenCreatingController(ControllerTestCase, unittest.TestCase):
     def should_initialize_io_loop_property(self):
         self.assertIsNone(self.controller.io_loop)
 
+    def should_initialize_supervisor_property(self):
+        self.assertIsNone(self.controller.supervisor)
+
 
 ###############################################################################
 # Controller.run
@@ -57,12 +60,27 @@ class WhenControllerRuns(ControllerTestCase, unittest.TestCase):
     def arrange(cls):
         super(WhenControllerRuns, cls).arrange()
         cls.application = cls.patch('familytree.main.application')
+        cls.server = cls.patch('familytree.main.server')
+        cls.http_server = cls.server.HTTPServer
         tornado_ioloop = cls.patch('familytree.main.tornado.ioloop')
         cls.ioloop_instance = tornado_ioloop.IOLoop.instance
         cls.logger = cls.patch('familytree.main.LOGGER')
+        cls.storage = cls.patch('familytree.main.storage')
+        cls.handlers = cls.patch('familytree.main.handlers')
+        cls.metrics = cls.patch('familytree.main.metrics')
+        cls.profiling = cls.patch('familytree.main.profiling')
 
         cls.controller = familytree.main.Controller(
             mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.config = mock.Mock()
+        cls.controller.config.application = {
+            'storage': mock.sentinel.storage_settings,
+            'response_cache_size': '1024',
+            'max_page_size': '50',
+            'shutdown_timeout': '2.5',
+            'metrics_directory': '/run/family-tree',
+            'profiling': {'enabled': True, 'token': 's3cret'},
+        }
         cls.controller.setup = mock.Mock()
         cls.controller.set_state = mock.Mock()
 
@@ -80,24 +98,182 @@ class WhenControllerRuns(ControllerTestCase, unittest.TestCase):
     def should_setup_controller(self):
         self.controller.setup.assert_called_once_with()
 
+    def should_configure_storage(self):
+        self.storage.configure.assert_called_once_with(
+            mock.sentinel.storage_settings)
+
+    def should_configure_response_cache(self):
+        self.handlers.configure_response_cache.assert_called_once_with(1024)
+
+    def should_configure_paging(self):
+        self.handlers.configure_paging.assert_called_once_with(20, 50)
+
+    def should_configure_embedding(self):
+        self.handlers.configure_embedding.assert_called_once_with(2)
+
+    def should_configure_metrics(self):
+        self.metrics.configure_metrics.assert_called_once_with(
+            '/run/family-tree')
+
+    def should_configure_profiling(self):
+        self.profiling.configure_profiling.assert_called_once_with(
+            True, 's3cret', 20, None)
+
     def should_set_state_to_active(self):
         self.controller.set_state.assert_called_once_with(
             self.controller.STATE_ACTIVE)
 
-    def should_tell_application_to_listen(self):
-        self.application.listen.assert_called_once_with(7654)
+    def should_bind_default_port(self):
+        self.server.bind_sockets.assert_called_once_with(
+            7654, '', reuse_port=False)
+
+    def should_create_http_server(self):
+        self.http_server.assert_called_once_with(self.application)
+
+    def should_serve_bound_sockets(self):
+        self.http_server.return_value.add_sockets.assert_called_once_with(
+            self.server.bind_sockets.return_value)
+
+    def should_not_start_workers(self):
+        self.assertFalse(self.server.Supervisor.called)
+        self.assertIsNone(self.controller.supervisor)
 
     def should_get_ioloop_instance(self):
         self.ioloop_instance.assert_called_once_with()
 
+    def should_start_storage_maintenance(self):
+        backend = self.storage.get_backend.return_value
+        backend.start_maintenance.assert_called_once_with(
+            self.ioloop_instance.return_value)
+
     def should_start_tornado_ioloop(self):
         self.ioloop_instance.return_value.start.assert_called_once_with()
 
+    def should_shutdown_storage_when_ioloop_stops(self):
+        self.storage.shutdown.assert_called_once_with()
+
+    def should_read_shutdown_timeout(self):
+        self.assertEqual(self.controller.shutdown_timeout, 2.5)
+
+    def should_save_http_server(self):
+        self.assertIs(self.controller.http_server,
+                      self.http_server.return_value)
+
     def should_save_ioloop_instance(self):
         self.assertIs(
             self.controller.io_loop, self.ioloop_instance.return_value)
 
 
+class _ControllerRunTestCase(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ControllerRunTestCase, cls).arrange()
+        cls.application = cls.patch('familytree.main.application')
+        cls.server = cls.patch('familytree.main.server')
+        cls.http_server = cls.server.HTTPServer
+        cls.server.Supervisor.return_value.run.side_effect = (
+            lambda serve: serve(0))
+        tornado_ioloop = cls.patch('familytree.main.tornado.ioloop')
+        cls.ioloop_instance = tornado_ioloop.IOLoop.instance
+        cls.patch('familytree.main.LOGGER')
+        cls.storage = cls.patch('familytree.main.storage')
+        cls.storage.get_backend.return_value.shared = True
+        cls.handlers = cls.patch('familytree.main.handlers')
+
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.config = mock.Mock()
+        cls.controller.config.application = {
+            'storage': {'backend': 'sqlite'},
+            'address': '127.0.0.1',
+            'port': '8000',
+        }
+        cls.controller.setup = mock.Mock()
+        cls.controller.set_state = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.controller.run()
+
+
+class WhenControllerRunsSeveralWorkers(_ControllerRunTestCase,
+                                       unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenControllerRunsSeveralWorkers, cls).arrange()
+        cls.controller.config.application.update({
+            'workers': '4',
+            'response_cache_size': '1024',
+            'storage': {'backend': 'sqlite', 'cache_size': '100'},
+        })
+
+    def should_disable_instance_cache(self):
+        self.storage.configure.assert_called_once_with(
+            {'backend': 'sqlite', 'cache_size': 0})
+
+    def should_disable_response_cache(self):
+        self.handlers.configure_response_cache.assert_called_once_with(0)
+
+    def should_bind_configured_address_before_forking(self):
+        self.server.bind_sockets.assert_called_once_with(
+            8000, '127.0.0.1', reuse_port=False)
+
+    def should_create_supervisor(self):
+        self.server.Supervisor.assert_called_once_with(4)
+
+    def should_save_supervisor(self):
+        self.assertIs(self.controller.supervisor,
+                      self.server.Supervisor.return_value)
+
+    def should_serve_inherited_sockets_in_workers(self):
+        self.http_server.return_value.add_sockets.assert_called_once_with(
+            self.server.bind_sockets.return_value)
+
+    def should_start_ioloop_in_workers(self):
+        self.ioloop_instance.return_value.start.assert_called_once_with()
+
+
+class WhenControllerRunsWorkersWithReusePort(_ControllerRunTestCase,
+                                             unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenControllerRunsWorkersWithReusePort, cls).arrange()
+        cls.controller.config.application['workers'] = 0
+        cls.controller.config.application['reuse_port'] = True
+
+    def should_create_supervisor(self):
+        self.server.Supervisor.assert_called_once_with(0)
+
+    def should_bind_sockets_in_workers(self):
+        self.server.bind_sockets.assert_called_once_with(
+            8000, '127.0.0.1', reuse_port=True)
+        self.http_server.return_value.add_sockets.assert_called_once_with(
+            self.server.bind_sockets.return_value)
+
+
+class WhenControllerRunsWorkersWithUnsharedStorage(_ControllerRunTestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenControllerRunsWorkersWithUnsharedStorage, cls).arrange()
+        cls.storage.get_backend.return_value.shared = False
+        cls.controller.config.application['workers'] = 2
+
+    def should_raise_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+    def should_not_bind_sockets(self):
+        assert not self.server.bind_sockets.called
+
+    def should_not_start_workers(self):
+        assert not self.server.Supervisor.called
+
+
 ###############################################################################
 # Controller.cleanup
 ###############################################################################
@@ -107,13 +283,228 @@ class WhenCleaningUpController(ControllerTestCase):
     @classmethod
     def arrange(cls):
         super(WhenCleaningUpController, cls).arrange()
+        cls.storage = cls.patch('familytree.main.storage')
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.io_loop = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.controller.cleanup()
+
+    def should_drain_from_ioloop(self):
+        add_callback = self.controller.io_loop.add_callback_from_signal
+        add_callback.assert_called_once_with(self.controller.drain)
+
+    def should_not_stop_io_loop_immediately(self):
+        assert not self.controller.io_loop.stop.called
+
+    def should_not_shutdown_storage_before_draining(self):
+        assert not self.storage.shutdown.called
+
+
+class WhenCleaningUpSupervisingController(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCleaningUpSupervisingController, cls).arrange()
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.supervisor = mock.Mock(task_id=None)
+
+    @classmethod
+    def act(cls):
+        cls.controller.cleanup()
+
+    def should_stop_workers(self):
+        self.controller.supervisor.stop.assert_called_once_with()
+
+
+class WhenCleaningUpWorkerController(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCleaningUpWorkerController, cls).arrange()
         cls.controller = familytree.main.Controller(
             mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.supervisor = mock.Mock(task_id=3)
         cls.controller.io_loop = mock.Mock()
 
     @classmethod
     def act(cls):
         cls.controller.cleanup()
 
-    def should_stop_io_loop(self):
-        self.controller.io_loop.stop.assert_called_once_with()
+    def should_not_stop_other_workers(self):
+        assert not self.controller.supervisor.stop.called
+
+    def should_drain_from_ioloop(self):
+        add_callback = self.controller.io_loop.add_callback_from_signal
+        add_callback.assert_called_once_with(self.controller.drain)
+
+
+###############################################################################
+# Controller.drain
+###############################################################################
+
+class WhenDrainingController(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDrainingController, cls).arrange()
+        cls.patch('familytree.main.LOGGER')
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.io_loop = mock.Mock()
+        cls.controller.http_server = mock.Mock()
+        cls.controller.shutdown_timeout = 7.5
+
+    @classmethod
+    def act(cls):
+        cls.controller.drain()
+
+    def should_drain_http_server(self):
+        self.controller.http_server.drain.assert_called_once_with(
+            7.5, self.controller.io_loop.stop)
+
+
+class WhenWorkerControllerLosesSupervisor(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenWorkerControllerLosesSupervisor, cls).arrange()
+        cls.patch('familytree.main.LOGGER')
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.supervisor = mock.Mock(orphaned=True)
+        cls.controller.drain = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.controller.check_supervisor()
+        cls.controller.check_supervisor()
+
+    def should_drain_once(self):
+        self.controller.drain.assert_called_once_with()
+
+    def should_forget_supervisor(self):
+        assert self.controller.supervisor is None
+
+
+###############################################################################
+# Controller.on_sighup
+###############################################################################
+
+class _SighupTestCase(ControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_SighupTestCase, cls).arrange()
+        cls.patch('familytree.main.LOGGER')
+        cls.config_class = cls.patch('familytree.main.helper.config.Config')
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.args = mock.Mock(config=mock.sentinel.config_path)
+        cls.controller.config = mock.sentinel.old_config
+        cls.controller.debug = mock.sentinel.debug
+        cls.controller.logging_config = mock.Mock()
+        cls.controller.configuration_reloaded = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.controller.on_sighup(1, None)
+
+
+class WhenControllerReceivesSighup(_SighupTestCase):
+
+    def should_read_configuration_file(self):
+        self.config_class.assert_called_once_with(mock.sentinel.config_path)
+
+    def should_replace_configuration(self):
+        assert self.controller.config is self.config_class.return_value
+
+    def should_update_logging_configuration(self):
+        self.controller.logging_config.update.assert_called_once_with(
+            self.config_class.return_value.logging, mock.sentinel.debug)
+
+    def should_apply_configuration(self):
+        self.controller.configuration_reloaded.assert_called_once_with()
+
+
+class WhenControllerReceivesSighupWithoutConfiguration(_SighupTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenControllerReceivesSighupWithoutConfiguration,
+              cls).arrange()
+        cls.config_class.side_effect = ValueError
+
+    def should_keep_configuration(self):
+        assert self.controller.config is mock.sentinel.old_config
+
+    def should_not_apply_configuration(self):
+        assert not self.controller.configuration_reloaded.called
+
+    def should_not_update_logging_configuration(self):
+        assert not self.controller.logging_config.update.called
+
+
+###############################################################################
+# Controller.configuration_reloaded
+###############################################################################
+
+class _ReloadingControllerTestCase(ControllerTestCase):
+
+    task_id = None
+
+    @classmethod
+    def arrange(cls):
+        super(_ReloadingControllerTestCase, cls).arrange()
+        cls.logger = cls.patch('familytree.main.LOGGER')
+        cls.storage = cls.patch('familytree.main.storage')
+        cls.patch('familytree.main.handlers')
+        cls.controller = familytree.main.Controller(
+            mock.sentinel.args, mock.sentinel.operating_system)
+        cls.controller.config = mock.Mock()
+        cls.controller.config.application = {
+            'storage': {'backend': 'sqlite', 'cache_size': '100'},
+        }
+        cls.controller.supervisor = mock.Mock(task_id=cls.task_id)
+
+    @classmethod
+    def act(cls):
+        cls.controller.configuration_reloaded()
+
+
+class WhenSupervisingControllerReloads(_ReloadingControllerTestCase):
+
+    def should_apply_configuration_without_caches(self):
+        self.storage.configure.assert_called_once_with(
+            {'backend': 'sqlite', 'cache_size': 0})
+
+    def should_replace_workers(self):
+        self.controller.supervisor.reload.assert_called_once_with()
+
+
+class WhenWorkerControllerReloads(_ReloadingControllerTestCase):
+
+    task_id = 0
+
+    def should_not_replace_workers(self):
+        assert not self.controller.supervisor.reload.called
+
+    def should_not_reconfigure_storage(self):
+        assert not self.storage.configure.called
+
+
+class WhenSingleProcessControllerReloads(_ReloadingControllerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSingleProcessControllerReloads, cls).arrange()
+        cls.controller.supervisor = None
+
+    def should_not_reconfigure_storage(self):
+        assert not self.storage.configure.called
+
+    def should_warn_that_workers_are_needed(self):
+        assert self.logger.warning.call_count == 1
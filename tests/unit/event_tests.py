@@ -3,7 +3,8 @@ import fluenttest
 
 from familytree import event
 from familytree import person
-from . import ActionCardTestMixin, TornadoHandlerTestCase
+from familytree import storage
+from . import ActionCardTestMixin, TornadoHandlerTestCase, resolved_future
 from ..helpers.compat import mock
 from ..helpers.compat import unittest
 
@@ -33,22 +34,30 @@ class WhenGettingApplicableActions(ActionCardTestMixin, fluenttest.TestCase):
 # CreateEventHandler.post
 ###############################################################################
 
-class CreateEventHandlerTestCase(TornadoHandlerTestCase):
+class _CreateEventHandlerTestCase(TornadoHandlerTestCase, unittest.TestCase):
 
     @classmethod
     def arrange(cls):
-        super(CreateEventHandlerTestCase, cls).arrange()
+        super(_CreateEventHandlerTestCase, cls).arrange()
         cls.get_actions = cls.patch('familytree.event.get_applicable_actions')
         cls.storage = cls.patch('familytree.event.storage')
+        cls.storage.get_versioned_items_async.return_value = (
+            resolved_future([]))
+        cls.transaction = cls.storage.Transaction.return_value
+        cls.transaction.commit_async.return_value = resolved_future()
         cls.uuid_module = cls.patch('familytree.event.uuid')
+        cls.body = {'people': []}
+        cls.patch('familytree.handlers.BaseHandler.request_body',
+                  new_callable=mock.PropertyMock, return_value=cls.body)
         cls.handler = event.CreateEventHandler(cls.application, cls.request)
+        cls.handler.get_url_for = mock.Mock()
         cls.handler.deserialize_model_instance = mock.Mock()
         cls.handler.serialize_model_instance = mock.Mock()
         cls.handler.set_status = mock.Mock()
 
     @classmethod
     def act(cls):
-        cls.response = cls.handler.post()
+        cls.response = cls.handler.post().result()
 
     def should_deserialize_model_instance(self):
         self.handler.deserialize_model_instance.assert_called_once_with(
@@ -58,11 +67,14 @@ class CreateEventHandlerTestCase(TornadoHandlerTestCase):
         self.uuid_module.uuid4.assert_called_once_with()
 
     def should_save_model_instance(self):
-        self.storage.save_item.assert_any_call(
+        self.transaction.save_item.assert_any_call(
             self.handler.deserialize_model_instance.return_value,
             self.uuid_module.uuid4.return_value.hex,
         )
 
+    def should_commit_everything_at_once(self):
+        self.transaction.commit_async.assert_called_once_with()
+
     def should_serialize_model_instance(self):
         self.handler.serialize_model_instance.assert_called_once_with(
             self.handler.deserialize_model_instance.return_value,
@@ -74,7 +86,7 @@ class CreateEventHandlerTestCase(TornadoHandlerTestCase):
         self.handler.set_status.assert_called_once_with(201)
 
 
-class WhenPostingToCreateEventHandler(CreateEventHandlerTestCase):
+class WhenPostingToCreateEventHandler(_CreateEventHandlerTestCase):
 
     @classmethod
     def arrange(cls):
@@ -83,25 +95,19 @@ class WhenPostingToCreateEventHandler(CreateEventHandlerTestCase):
         an_event.people = []
 
 
-class WhenPostingToCreateEventHandlerWithPeople(CreateEventHandlerTestCase):
+class WhenPostingToCreateEventHandlerWithPeople(_CreateEventHandlerTestCase):
 
     @classmethod
     def arrange(cls):
         super(WhenPostingToCreateEventHandlerWithPeople, cls).arrange()
-        cls.handler.get_url_for = mock.Mock()
-        cls.person_url = mock.Mock()
-        cls.person_url.split.return_value = [
-            mock.sentinel.path, mock.sentinel.person_id]
-        an_event = cls.handler.deserialize_model_instance.return_value
-        an_event.people = [cls.person_url]
-        cls.person = cls.storage.get_item.return_value
-
-    def should_extract_id_from_person_url(self):
-        self.person_url.split.assert_called_once_with('/')
+        cls.body['people'] = ['http://example.com/person/1234']
+        cls.person = mock.Mock()
+        cls.storage.get_versioned_items_async.return_value = (
+            resolved_future([(cls.person, mock.sentinel.version)]))
 
-    def should_retrieve_person_from_storage(self):
-        self.storage.get_item.assert_called_once_with(
-            person.Person, mock.sentinel.person_id)
+    def should_retrieve_people_from_storage(self):
+        self.storage.get_versioned_items_async.assert_called_once_with(
+            person.Person, ['1234'])
 
     def should_fetch_url_for_event(self):
         self.handler.get_url_for.assert_called_once_with(
@@ -111,8 +117,142 @@ class WhenPostingToCreateEventHandlerWithPeople(CreateEventHandlerTestCase):
         self.person.add_event.assert_called_once_with(
             self.handler.get_url_for.return_value)
 
-    def should_save_modified_person(self):
-        self.storage.save_item.assert_any_call(self.person, self.person.id)
+    def should_save_person_at_the_version_read(self):
+        self.transaction.save_item.assert_any_call(
+            self.person, self.person.id,
+            expected_version=mock.sentinel.version)
+
+
+class _PersonChangesWhilePostingTestCase(TornadoHandlerTestCase,
+                                         unittest.TestCase):
+
+    allowed_exceptions = web.HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(_PersonChangesWhilePostingTestCase, cls).arrange()
+        cls.storage = cls.patch('familytree.event.storage')
+        cls.storage.InstanceNotFound = storage.InstanceNotFound
+        cls.storage.VersionConflict = storage.VersionConflict
+        cls.person = mock.Mock()
+        cls.storage.get_versioned_items_async.side_effect = (
+            lambda *args: resolved_future(
+                [(cls.person, mock.sentinel.version)]))
+        cls.transaction = cls.storage.Transaction.return_value
+        cls.patch('familytree.handlers.BaseHandler.request_body',
+                  new_callable=mock.PropertyMock,
+                  return_value={'people': ['http://example.com/person/1234']})
+        cls.handler = event.CreateEventHandler(cls.application, cls.request)
+        cls.handler.get_url_for = mock.Mock()
+        cls.handler.deserialize_model_instance = mock.Mock()
+        cls.handler.serialize_model_instance = mock.Mock()
+        cls.handler.set_status = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.handler.post().result()
+
+    @staticmethod
+    def conflict():
+        return resolved_future(exception=storage.VersionConflict(
+            person.Person, '1234', mock.sentinel.version))
+
+
+class WhenPersonChangesWhilePostingEvent(
+        _PersonChangesWhilePostingTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonChangesWhilePostingEvent, cls).arrange()
+        cls.transaction.commit_async.side_effect = [
+            cls.conflict(), resolved_future()]
+
+    def should_read_people_again(self):
+        self.assertEqual(
+            self.storage.get_versioned_items_async.call_count, 2)
+
+    def should_retry_the_commit(self):
+        self.assertEqual(self.transaction.commit_async.call_count, 2)
+
+    def should_set_status_to_created(self):
+        self.handler.set_status.assert_called_once_with(201)
+
+
+class WhenPersonKeepsChangingWhilePostingEvent(
+        _PersonChangesWhilePostingTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonKeepsChangingWhilePostingEvent, cls).arrange()
+        cls.transaction.commit_async.side_effect = (
+            lambda: cls.conflict())
+
+    def should_give_up_eventually(self):
+        self.assertEqual(self.transaction.commit_async.call_count,
+                         event._MAX_ATTEMPTS)
+
+    def should_raise_conflict(self):
+        self.assertEqual(self.exception.status_code, 409)
+
+
+class _InvalidEventPostTestCase(TornadoHandlerTestCase, unittest.TestCase):
+
+    allowed_exceptions = web.HTTPError
+    people = []
+
+    @classmethod
+    def arrange(cls):
+        super(_InvalidEventPostTestCase, cls).arrange()
+        cls.storage = cls.patch('familytree.event.storage')
+        cls.storage.InstanceNotFound = storage.InstanceNotFound
+        cls.storage.VersionConflict = storage.VersionConflict
+        cls.storage.get_versioned_items_async.return_value = (
+            resolved_future([]))
+        cls.patch('familytree.handlers.BaseHandler.request_body',
+                  new_callable=mock.PropertyMock,
+                  return_value={'people': cls.people})
+        cls.handler = event.CreateEventHandler(cls.application, cls.request)
+        cls.handler.get_url_for = mock.Mock()
+        cls.handler.deserialize_model_instance = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.handler.post().result()
+
+    def should_not_commit_anything(self):
+        transaction = self.storage.Transaction.return_value
+        self.assertFalse(transaction.commit_async.called)
+
+
+class WhenPostingEventWithNonStringPeople(_InvalidEventPostTestCase):
+
+    people = [{'self': 'http://example.com/person/1234'}]
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+
+class WhenPostingEventWithPeopleThatIsNotList(_InvalidEventPostTestCase):
+
+    people = 'http://example.com/person/1234'
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+
+class WhenPostingEventWithUnknownPerson(_InvalidEventPostTestCase):
+
+    people = ['http://example.com/person/1234']
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPostingEventWithUnknownPerson, cls).arrange()
+        cls.storage.get_versioned_items_async.return_value = (
+            resolved_future(exception=storage.InstancesNotFound(
+                person.Person, ['1234'])))
+
+    def should_fail_with_not_found(self):
+        self.assertEqual(self.exception.status_code, 404)
 
 
 ###############################################################################
@@ -126,17 +266,19 @@ class WhenEventHandlerGets(TornadoHandlerTestCase):
         super(WhenEventHandlerGets, cls).arrange()
         cls.get_actions = cls.patch('familytree.event.get_applicable_actions')
         cls.storage = cls.patch('familytree.event.storage')
-        cls.event = cls.storage.get_item.return_value
+        cls.event = mock.Mock()
+        cls.storage.get_versioned_item_async.return_value = resolved_future(
+            (cls.event, 'v1'))
         cls.handler = event.EventHandler(cls.application, cls.request)
         cls.handler.serialize_model_instance = mock.Mock()
         cls.handler.set_status = mock.Mock()
 
     @classmethod
     def act(cls):
-        cls.response = cls.handler.get(mock.sentinel.event_id)
+        cls.response = cls.handler.get(mock.sentinel.event_id).result()
 
     def should_retrieve_event_from_data_store(self):
-        self.storage.get_item.assert_called_once_with(
+        self.storage.get_versioned_item_async.assert_called_once_with(
             event.Event, mock.sentinel.event_id)
 
     def should_serialize_model_instance(self):
@@ -144,6 +286,8 @@ class WhenEventHandlerGets(TornadoHandlerTestCase):
             self.event,
             actions=self.get_actions.return_value,
             model_handler=event.EventHandler,
+            version='v1',
+            embedded=None,
         )
 
     def should_set_status_to_ok(self):
@@ -162,21 +306,29 @@ class EventHandlerDeleteTestCase(TornadoHandlerTestCase, unittest.TestCase):
         cls.storage = cls.patch('familytree.event.storage')
         cls.target_event = mock.Mock()
         cls.target_event.people = []
-        cls.get_item_returns = [cls.target_event]
-        cls.storage.get_item.side_effect = cls.get_item_returns
+        cls.people = []
+        cls.storage.get_item_async.return_value = resolved_future(
+            cls.target_event)
+        cls.storage.get_versioned_items_async.return_value = (
+            resolved_future(cls.people))
+        cls.transaction = cls.storage.Transaction.return_value
+        cls.transaction.commit_async.return_value = resolved_future()
         cls.handler = event.EventHandler(cls.application, cls.request)
 
     @classmethod
     def act(cls):
-        cls.response = cls.handler.delete(mock.sentinel.event_id)
+        cls.response = cls.handler.delete(mock.sentinel.event_id).result()
 
     def should_retrieve_event_from_data_store(self):
-        self.storage.get_item.assert_any_call(
+        self.storage.get_item_async.assert_any_call(
             event.Event, mock.sentinel.event_id)
 
-    def should_delete_item_from_data_store(self):
-        self.storage.delete_item.assert_called_once_with(
-            event.Event, mock.sentinel.event_id)
+    def should_delete_item_in_transaction(self):
+        self.transaction.delete_item.assert_called_once_with(
+            event.Event, mock.sentinel.event_id, expected_version=None)
+
+    def should_commit_transaction(self):
+        self.transaction.commit_async.assert_called_once_with()
 
 
 class WhenEventHandlerDeletes(EventHandlerDeleteTestCase):
@@ -190,15 +342,27 @@ class WhenEventHandlerDeletes(EventHandlerDeleteTestCase):
         self.handler.set_status.assert_called_once_with(204)
 
 
-class WhenEventHandlerDeletesMissingItem(EventHandlerDeleteTestCase):
+class WhenEventHandlerDeletesMissingItem(TornadoHandlerTestCase,
+                                         unittest.TestCase):
 
     allowed_exceptions = Exception
 
     @classmethod
     def arrange(cls):
         super(WhenEventHandlerDeletesMissingItem, cls).arrange()
+        cls.storage = cls.patch('familytree.event.storage')
         cls.storage.InstanceNotFound = RuntimeError
-        cls.storage.delete_item.side_effect = RuntimeError
+        cls.storage.get_item_async.return_value = resolved_future(
+            exception=RuntimeError())
+        cls.handler = event.EventHandler(cls.application, cls.request)
+
+    @classmethod
+    def act(cls):
+        cls.handler.delete(mock.sentinel.event_id).result()
+
+    def should_not_commit_anything(self):
+        transaction = self.storage.Transaction.return_value
+        self.assertFalse(transaction.commit_async.called)
 
     def should_raise_http_error(self):
         self.assertIsInstance(self.exception, web.HTTPError)
@@ -213,7 +377,7 @@ class WhenEventHandlerDeletesItemWithPeople(EventHandlerDeleteTestCase):
     def arrange(cls):
         super(WhenEventHandlerDeletesItemWithPeople, cls).arrange()
         cls.person = mock.Mock()
-        cls.get_item_returns.append(cls.person)
+        cls.people.append((cls.person, mock.sentinel.version))
 
         cls.person_url = mock.Mock()
         cls.person_url.rsplit.return_value = [
@@ -223,13 +387,15 @@ class WhenEventHandlerDeletesItemWithPeople(EventHandlerDeleteTestCase):
     def should_extract_id_from_person_url(self):
         self.person_url.rsplit.assert_called_once_with('/', 1)
 
-    def should_retrieve_person_from_data_store(self):
-        self.storage.get_item.assert_any_call(person.Person, mock.sentinel.id)
+    def should_retrieve_people_from_data_store(self):
+        self.storage.get_versioned_items_async.assert_called_once_with(
+            person.Person, [mock.sentinel.id])
 
     def should_remove_event_from_person(self):
-        self.person.remove_event.assert_called_once_with(
-            self.request.full_url.return_value)
+        self.person.discard_event.assert_called_once_with(
+            mock.sentinel.event_id)
 
-    def should_save_modified_person(self):
-        self.storage.save_item.assert_called_once_with(
-            self.person, self.person.id)
+    def should_save_modified_people(self):
+        self.transaction.save_item.assert_called_once_with(
+            self.person, self.person.id,
+            expected_version=mock.sentinel.version)
@@ -1,6 +1,9 @@
 from tornado.web import HTTPError
+import fluenttest
 
-from familytree.handlers import BaseHandler
+from familytree import codec
+from familytree import handlers
+from familytree.handlers import ActionCard, BaseHandler
 from . import TornadoHandlerTestCase
 from ..helpers.compat import mock
 from ..helpers.compat import unittest
@@ -31,16 +34,27 @@ class WhenGettingUrlFromBaseHandler(BaseHandlerTestCase):
 
     @classmethod
     def act(cls):
+        cls.application.reverse_path.return_value = '/path'
+        cls.application.get_url_prefix.return_value = 'http://host'
         cls.returned = cls.handler.get_url_for(
             mock.sentinel.handler, *cls.args)
+        cls.handler.get_url_for(mock.sentinel.handler, *cls.args)
 
-    def should_get_url_from_application(self):
-        self.application.get_url_for.assert_called_once_with(
-            self.request,
+    def should_reverse_path_with_application(self):
+        self.application.reverse_path.assert_called_with(
             mock.sentinel.handler,
             *self.args
         )
 
+    def should_compute_prefix_once_per_request(self):
+        self.application.get_url_prefix.assert_called_once_with(self.request)
+
+    def should_return_absolute_url(self):
+        self.assertEqual(self.returned, 'http://host/path')
+
+    def should_time_link_building(self):
+        self.assertEqual(self.handler.timer.calls, {'links': 2})
+
 
 ###############################################################################
 # BaseHandler.require_request_body
@@ -107,8 +121,9 @@ class _SerializeModelInstanceTestCase(BaseHandlerTestCase):
     def arrange(cls):
         super(_SerializeModelInstanceTestCase, cls).arrange()
         cls.model_instance = mock.Mock()
-        cls.model_representation = mock.MagicMock()
-        cls.json_dumps = cls.patch('familytree.handlers.json').dumps
+        cls.model_representation = {'id': mock.sentinel.id}
+        cls.codec = mock.Mock()
+        cls.handler.codecs = {'application/json': cls.codec}
         cls.handler.set_header = mock.Mock()
         cls.handler.write = mock.Mock()
         cls.model_instance.as_dictionary.return_value = (
@@ -117,8 +132,8 @@ class _SerializeModelInstanceTestCase(BaseHandlerTestCase):
     def should_convert_instance_to_dictionary(self):
         self.model_instance.as_dictionary.assert_called_once_with()
 
-    def should_dump_dictionary_as_json(self):
-        self.json_dumps.assert_called_once_with(self.model_representation)
+    def should_encode_dictionary_with_codec(self):
+        self.codec.encode.assert_called_once_with(self.model_representation)
 
     def should_set_content_type_header(self):
         self.handler.set_header.assert_any_call(
@@ -126,7 +141,7 @@ class _SerializeModelInstanceTestCase(BaseHandlerTestCase):
 
     def should_write_serialized_instance(self):
         self.handler.write.assert_called_once_with(
-            self.json_dumps.return_value)
+            self.codec.encode.return_value)
 
 
 class WhenSerializingModelInstance(_SerializeModelInstanceTestCase):
@@ -163,9 +178,20 @@ class WhenSerializingModelInstanceWithHandlerSpecified(
         )
 
     def should_set_self_link_in_representation(self):
-        self.model_representation.__setitem__.assert_any_call(
-            'self', self.handler.get_url_for.return_value,
-        )
+        self.assertEqual(self.model_representation['self'],
+                         self.handler.get_url_for.return_value)
+
+
+class WhenSerializingModelInstanceWithVersion(
+        _SerializeModelInstanceTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.serialize_model_instance(
+            cls.model_instance, version='abc')
+
+    def should_set_etag_header(self):
+        self.handler.set_header.assert_any_call('Etag', '"abc"')
 
 
 class WhenSerializingModelInstanceWithActions(_SerializeModelInstanceTestCase):
@@ -182,16 +208,12 @@ class WhenSerializingModelInstanceWithActions(_SerializeModelInstanceTestCase):
         cls.action = mock.MagicMock()
         cls.action.__getitem__.side_effect = cls.action_dict.get
         cls.handler.get_url_for = mock.Mock()
-        cls.action_card = cls.model_representation.setdefault.return_value
 
     @classmethod
     def act(cls):
         cls.returned = cls.handler.serialize_model_instance(
             cls.model_instance, actions=[cls.action])
 
-    def should_create_action_card(self):
-        self.model_representation.setdefault.assert_any_call('actions', {})
-
     def should_extract_name_from_action(self):
         self.action.__getitem__.assert_any_call('name')
 
@@ -211,15 +233,113 @@ class WhenSerializingModelInstanceWithActions(_SerializeModelInstanceTestCase):
         )
 
     def should_add_action_to_representation(self):
-        self.action_card.__setitem__.assert_any_call(
-            self.action_dict['name'],
+        self.assertEqual(
+            self.model_representation['actions'],
             {
-                'method': self.action_dict['method'],
-                'url': self.handler.get_url_for.return_value,
+                self.action_dict['name']: {
+                    'method': self.action_dict['method'],
+                    'url': self.handler.get_url_for.return_value,
+                },
             },
         )
 
 
+class WhenSerializingModelInstanceWithActionCard(
+        _SerializeModelInstanceTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSerializingModelInstanceWithActionCard, cls).arrange()
+        cls.handler.get_url_for = mock.Mock()
+        cls.action_card = ActionCard(
+            ('delete', 'DELETE', mock.sentinel.handler),
+            ('update', 'PUT', mock.sentinel.other_handler),
+        ).bind(mock.sentinel.arg)
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.serialize_model_instance(
+            cls.model_instance, actions=cls.action_card)
+
+    def should_get_url_for_each_action(self):
+        self.handler.get_url_for.assert_any_call(
+            mock.sentinel.handler, mock.sentinel.arg)
+        self.handler.get_url_for.assert_any_call(
+            mock.sentinel.other_handler, mock.sentinel.arg)
+
+    def should_add_rendered_card_to_representation(self):
+        url = self.handler.get_url_for.return_value
+        self.assertEqual(
+            self.model_representation['actions'],
+            {
+                'delete': {'method': 'DELETE', 'url': url},
+                'update': {'method': 'PUT', 'url': url},
+            },
+        )
+
+
+class WhenSerializingSparseModelInstance(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSerializingSparseModelInstance, cls).arrange()
+        cls.request.arguments = {'fields': [b'name,', b'age']}
+        cls.model_instance = mock.Mock()
+        cls.model_instance.as_dictionary.return_value = {
+            'id': mock.sentinel.id, 'name': mock.sentinel.name}
+        cls.codec = mock.Mock()
+        cls.handler.codecs = {'application/json': cls.codec}
+        cls.handler.get_url_for = mock.Mock()
+        cls.handler.set_header = mock.Mock()
+        cls.handler.write = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.handler.serialize_model_instance(
+            cls.model_instance, model_handler=mock.sentinel.handler,
+            actions=ActionCard(('delete', 'DELETE', mock.sentinel.handler)))
+
+    def should_ask_instance_for_requested_fields_and_id(self):
+        self.model_instance.as_dictionary.assert_called_once_with(
+            fields=frozenset(['name', 'age', 'id']))
+
+    def should_link_to_instance_with_id(self):
+        self.handler.get_url_for.assert_called_once_with(
+            mock.sentinel.handler, mock.sentinel.id)
+
+    def should_encode_requested_fields_and_self_link(self):
+        self.codec.encode.assert_called_once_with({
+            'name': mock.sentinel.name,
+            'self': self.handler.get_url_for.return_value,
+        })
+
+
+class WhenGettingRequestedFields(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGettingRequestedFields, cls).arrange()
+        cls.request.arguments = {'fields': [b'id,name', b'actions']}
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_requested_fields()
+
+    def should_split_each_argument(self):
+        self.assertEqual(self.returned,
+                         frozenset(['id', 'name', 'actions']))
+
+
+class WhenGettingRequestedFieldsWithoutArgument(BaseHandlerTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_requested_fields()
+
+    def should_return_none(self):
+        self.assertIsNone(self.returned)
+
+
 ###############################################################################
 # BaseHandler.deserialize_model_instance
 ###############################################################################
@@ -230,24 +350,44 @@ class WhenDeserializingModelInstance(BaseHandlerTestCase):
     def arrange(cls):
         super(WhenDeserializingModelInstance, cls).arrange()
         cls.model_class = mock.Mock()
-        cls.request_body_property = cls.patch(
-            'familytree.handlers.BaseHandler.request_body',
-            new_callable=mock.PropertyMock,
-        )
+        cls.body = {'name': 'value'}
+        cls.patch('familytree.handlers.BaseHandler.request_body',
+                  new_callable=mock.PropertyMock, return_value=cls.body)
 
     @classmethod
     def act(cls):
         cls.instance = cls.handler.deserialize_model_instance(cls.model_class)
 
     def should_create_model_from_request_body(self):
-        self.model_class.from_dictionary.assert_called_once_with(
-            self.request_body_property)
+        self.model_class.from_dictionary.assert_called_once_with(self.body)
 
     def should_return_model_instance(self):
         self.assertEqual(
             self.instance, self.model_class.from_dictionary.return_value)
 
 
+class WhenDeserializingModelInstanceFromNonObject(BaseHandlerTestCase):
+
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDeserializingModelInstanceFromNonObject, cls).arrange()
+        cls.model_class = mock.Mock()
+        cls.patch('familytree.handlers.BaseHandler.request_body',
+                  new_callable=mock.PropertyMock, return_value=['value'])
+
+    @classmethod
+    def act(cls):
+        cls.handler.deserialize_model_instance(cls.model_class)
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+    def should_not_create_model(self):
+        self.assertFalse(self.model_class.from_dictionary.called)
+
+
 ###############################################################################
 # BaseHandler.request_body
 ###############################################################################
@@ -270,6 +410,8 @@ class _RequestBodyTestCase(BaseHandlerTestCase):
 
         cls.supported_media_types = mock.MagicMock()
         cls.handler.supported_media_types = cls.supported_media_types
+        cls.codec = mock.Mock()
+        cls.handler.codecs = {cls.content_type: cls.codec}
 
     @classmethod
     def act(cls):
@@ -287,32 +429,24 @@ class _RequestBodyTestCase(BaseHandlerTestCase):
             mock.sentinel.full_content_type)
 
 
-class WhenGeneratingRequestBodyFromJson(_RequestBodyTestCase):
+class WhenGeneratingRequestBodyWithCodec(_RequestBodyTestCase):
 
     @classmethod
     def arrange(cls):
-        super(WhenGeneratingRequestBodyFromJson, cls).arrange()
-        cls.json_loads = cls.patch('familytree.handlers.json').loads
+        super(WhenGeneratingRequestBodyWithCodec, cls).arrange()
         cls.supported_media_types.__contains__.return_value = True
-        cls.content_type.startswith.return_value = True
-
-    def should_check_for_json_content_type(self):
-        self.content_type.startswith.assert_any_call('application/json')
 
     def should_retrieve_charset(self):
         self.content_options.get.assert_called_once_with(
             'charset', 'utf-8')
 
-    def should_decode_request_body(self):
-        self.handler.request.body.decode.assert_called_once_with(
+    def should_decode_request_body_with_codec(self):
+        self.codec.decode.assert_called_once_with(
+            self.handler.request.body,
             self.content_options.get.return_value)
 
-    def should_load_json_body(self):
-        self.json_loads.assert_called_once_with(
-            self.handler.request.body.decode.return_value)
-
-    def should_return_json_result(self):
-        self.assertEqual(self.returned, self.json_loads.return_value)
+    def should_return_decoded_result(self):
+        self.assertEqual(self.returned, self.codec.decode.return_value)
 
 
 class WhenGeneratingRequestBodyFromUnsupportedType(_RequestBodyTestCase):
@@ -337,7 +471,7 @@ class WhenGeneratingRequestBodyFromUnimplementedType(_RequestBodyTestCase):
     def arrange(cls):
         super(WhenGeneratingRequestBodyFromUnimplementedType, cls).arrange()
         cls.supported_media_types.__contains__.return_value = True
-        cls.content_type.startswith.return_value = False
+        cls.handler.codecs = {}
 
     def should_raise_http_error(self):
         self.assertIsInstance(self.exception, HTTPError)
@@ -355,14 +489,25 @@ class WhenGeneratingRequestBodyFromUnimplementedType(_RequestBodyTestCase):
         )
 
 
+class WhenGeneratingRequestBodyFromMalformedContent(_RequestBodyTestCase):
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGeneratingRequestBodyFromMalformedContent, cls).arrange()
+        cls.supported_media_types.__contains__.return_value = True
+        cls.codec.decode.side_effect = ValueError
+
+    def should_raise_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+
 class WhenGeneratingRequestBodySecondTime(_RequestBodyTestCase):
 
     @classmethod
     def arrange(cls):
         super(WhenGeneratingRequestBodySecondTime, cls).arrange()
-        cls.json_loads = cls.patch('familytree.handlers.json').loads
         cls.supported_media_types.__contains__.return_value = True
-        cls.content_type.startswith.return_value = True
 
     @classmethod
     def act(cls):
@@ -371,3 +516,420 @@ class WhenGeneratingRequestBodySecondTime(_RequestBodyTestCase):
 
     def should_return_same_value(self):
         self.assertIs(self.returned, self.second_returned)
+
+
+###############################################################################
+# BaseHandler.get_response_media_type
+###############################################################################
+
+class WhenNegotiatingWithoutAcceptHeader(BaseHandlerTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_response_media_type()
+
+    def should_return_default_media_type(self):
+        self.assertEqual(self.returned, 'application/json')
+
+
+class WhenNegotiatingPreferredMediaType(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenNegotiatingPreferredMediaType, cls).arrange()
+        cls.handler.codecs = dict(
+            cls.handler.codecs,
+            **{'application/msgpack': codec.MessagePackCodec()})
+        cls._header_contents['Accept'] = (
+            'application/json;q=0.1, application/msgpack')
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_response_media_type()
+
+    def should_return_preferred_media_type(self):
+        self.assertEqual(self.returned, 'application/msgpack')
+
+
+class WhenNegotiatingWildcardMediaType(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenNegotiatingWildcardMediaType, cls).arrange()
+        cls._header_contents['Accept'] = 'application/*'
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_response_media_type()
+
+    def should_prefer_default_media_type(self):
+        self.assertEqual(self.returned, 'application/json')
+
+
+class WhenNegotiatingUnavailableMediaType(BaseHandlerTestCase):
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenNegotiatingUnavailableMediaType, cls).arrange()
+        cls._header_contents['Accept'] = 'text/html'
+
+    @classmethod
+    def act(cls):
+        cls.handler.get_response_media_type()
+
+    def should_raise_not_acceptable(self):
+        self.assertEqual(self.exception.status_code, 406)
+
+
+###############################################################################
+# BaseHandler.check_not_modified
+###############################################################################
+
+class WhenCheckingModifiedVersion(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCheckingModifiedVersion, cls).arrange()
+        cls._header_contents['If-None-Match'] = '"old"'
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.check_not_modified('new')
+
+    def should_return_false(self):
+        self.assertFalse(self.returned)
+
+    def should_leave_status_alone(self):
+        self.assertEqual(self.handler.get_status(), 200)
+
+
+class WhenCheckingUnmodifiedVersion(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCheckingUnmodifiedVersion, cls).arrange()
+        cls._header_contents['If-None-Match'] = 'W/"new"'
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.check_not_modified('new')
+
+    def should_return_true(self):
+        self.assertTrue(self.returned)
+
+    def should_set_status_to_not_modified(self):
+        self.assertEqual(self.handler.get_status(), 304)
+
+
+###############################################################################
+# BaseHandler.get_expected_version
+###############################################################################
+
+class WhenGettingExpectedVersion(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGettingExpectedVersion, cls).arrange()
+        cls._header_contents['If-Match'] = '"one", W/"two"'
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_expected_version()
+
+    def should_return_strong_entity_tags(self):
+        self.assertEqual(self.returned, frozenset(['one']))
+
+
+class WhenGettingExpectedVersionForAnyVersion(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenGettingExpectedVersionForAnyVersion, cls).arrange()
+        cls._header_contents['If-Match'] = '*'
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_expected_version()
+
+    def should_return_none(self):
+        self.assertIsNone(self.returned)
+
+
+class WhenRequiringExpectedVersionWithoutIfMatch(BaseHandlerTestCase):
+
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def act(cls):
+        cls.handler.require_expected_version()
+
+    def should_raise_precondition_required(self):
+        self.assertEqual(self.exception.status_code, 428)
+
+
+###############################################################################
+# BaseHandler.apply_patch
+###############################################################################
+
+class _ApplyPatchTestCase(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_ApplyPatchTestCase, cls).arrange()
+        cls._header_contents['Content-Length'] = '1'
+        cls._header_contents['Content-Type'] = (
+            'application/merge-patch+json')
+        cls.request.body = b'{"display_name": "new"}'
+        cls.representation = {'id': '1', 'display_name': 'old',
+                              'events': ('a',)}
+
+
+class WhenApplyingMergePatchToRepresentation(_ApplyPatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.apply_patch(cls.representation)
+
+    def should_return_patched_representation(self):
+        self.assertEqual(self.returned, {
+            'id': '1', 'display_name': 'new', 'events': ['a']})
+
+
+class WhenApplyingJSONPatchToRepresentation(_ApplyPatchTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenApplyingJSONPatchToRepresentation, cls).arrange()
+        cls._header_contents['Content-Type'] = 'application/json-patch+json'
+        cls.request.body = (
+            b'[{"op": "add", "path": "/events/-", "value": "b"}]')
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.apply_patch(cls.representation)
+
+    def should_return_patched_representation(self):
+        self.assertEqual(self.returned['events'], ['a', 'b'])
+
+
+class WhenApplyingPatchInUnsupportedFormat(_ApplyPatchTestCase):
+
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenApplyingPatchInUnsupportedFormat, cls).arrange()
+        cls._header_contents['Content-Type'] = 'application/json'
+
+    @classmethod
+    def act(cls):
+        cls.handler.apply_patch(cls.representation)
+
+    def should_raise_unsupported_media_type(self):
+        self.assertEqual(self.exception.status_code, 415)
+
+
+class WhenApplyingPatchToReadOnlyMember(_ApplyPatchTestCase):
+
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def act(cls):
+        cls.handler.apply_patch(cls.representation,
+                                read_only=('id', 'display_name'))
+
+    def should_raise_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+
+class WhenApplyingConflictingPatch(_ApplyPatchTestCase):
+
+    allowed_exceptions = HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenApplyingConflictingPatch, cls).arrange()
+        cls._header_contents['Content-Type'] = 'application/json-patch+json'
+        cls.request.body = b'[{"op": "remove", "path": "/missing"}]'
+
+    @classmethod
+    def act(cls):
+        cls.handler.apply_patch(cls.representation)
+
+    def should_raise_conflict(self):
+        self.assertEqual(self.exception.status_code, 409)
+
+
+###############################################################################
+# ActionCard
+###############################################################################
+
+class WhenBindingActionCard(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBindingActionCard, cls).arrange()
+        cls.card = ActionCard(('delete', 'DELETE', mock.sentinel.handler))
+
+    @classmethod
+    def act(cls):
+        cls.bound = cls.card.bind(mock.sentinel.arg)
+
+    def should_share_compiled_actions(self):
+        self.assertIs(self.bound.actions, self.card.actions)
+
+    def should_leave_original_card_unbound(self):
+        self.assertEqual(self.card.args, ())
+
+    def should_iterate_as_action_dictionaries(self):
+        self.assertEqual(list(self.bound), [{
+            'name': 'delete', 'method': 'DELETE',
+            'handler': mock.sentinel.handler, 'args': (mock.sentinel.arg,),
+        }])
+
+
+###############################################################################
+# Paging
+###############################################################################
+
+class WhenRoundTrippingCursor(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def act(cls):
+        cls.cursor = handlers.encode_cursor((u'J\xfcrgen', 'abc'))
+        cls.entry = handlers.decode_cursor(cls.cursor)
+
+    def should_be_url_safe(self):
+        self.assertRegexpMatches(self.cursor, '^[A-Za-z0-9_-]+$')
+
+    def should_decode_to_entry(self):
+        self.assertEqual(self.entry, (u'J\xfcrgen', 'abc'))
+
+
+class WhenDecodingMalformedCursor(fluenttest.TestCase, unittest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        handlers.decode_cursor(handlers.encode_cursor(['a', 'b', 'c']))
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+class WhenDecodingCursorWithNonStringKey(fluenttest.TestCase,
+                                         unittest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        handlers.decode_cursor(handlers.encode_cursor([5, 'b']))
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+class _PageLimitTestCase(BaseHandlerTestCase):
+
+    limit = None
+
+    @classmethod
+    def arrange(cls):
+        super(_PageLimitTestCase, cls).arrange()
+        cls.patch('familytree.handlers._default_page_size', new=10)
+        cls.patch('familytree.handlers._max_page_size', new=50)
+        cls.handler.get_argument = mock.Mock(return_value=cls.limit)
+
+    @classmethod
+    def act(cls):
+        cls.returned = cls.handler.get_page_limit()
+
+
+class WhenGettingDefaultPageLimit(_PageLimitTestCase):
+
+    def should_return_default_page_size(self):
+        self.assertEqual(self.returned, 10)
+
+
+class WhenGettingLargePageLimit(_PageLimitTestCase):
+
+    limit = '500'
+
+    def should_cap_page_size(self):
+        self.assertEqual(self.returned, 50)
+
+
+class WhenGettingInvalidPageLimit(_PageLimitTestCase):
+
+    allowed_exceptions = HTTPError
+    limit = 'ten'
+
+    def should_raise_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+
+class WhenConfiguringInconsistentPaging(fluenttest.TestCase,
+                                        unittest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        handlers.configure_paging(100, 10)
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+###############################################################################
+# BaseHandler.on_finish
+###############################################################################
+
+class WhenBaseHandlerFinishes(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBaseHandlerFinishes, cls).arrange()
+        cls.record_request = cls.patch(
+            'familytree.handlers.metrics.record_request')
+        cls.log_request = cls.patch('familytree.handlers.timing.log_request')
+        cls.request.method = 'POST'
+        cls.request.body = b'{"name": "value"}'
+        cls.request.request_time.return_value = 0.125
+
+    @classmethod
+    def act(cls):
+        cls.handler.set_status(201)
+        cls.handler.write(b'abc')
+        cls.handler.write(u'd\u00e9f')
+        cls.handler.write({'id': 1})
+        cls.handler.on_finish()
+
+    def should_record_request(self):
+        self.record_request.assert_called_once_with(
+            'BaseHandler', 'POST', 201, 0.125, 17, 3 + 4 + 9)
+
+    def should_log_request(self):
+        self.log_request.assert_called_once_with(self.handler)
+
+
+class WhenBaseHandlerParsesRequestBody(BaseHandlerTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBaseHandlerParsesRequestBody, cls).arrange()
+        cls._header_contents['Content-Type'] = 'application/json'
+        cls._header_contents['Content-Length'] = '2'
+        cls.request.body = b'{}'
+        cls.handler.timer = mock.MagicMock()
+
+    @classmethod
+    def act(cls):
+        cls.handler.request_body
+        cls.handler.request_body
+
+    def should_measure_parsing_once(self):
+        self.handler.timer.measure.assert_called_once_with('parse')
@@ -0,0 +1,197 @@
+import fluenttest
+
+from familytree.storage.index import HashIndex, IndexSet, SortedIndex
+from ..helpers.compat import unittest
+
+
+class IndexTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(IndexTestCase, cls).arrange()
+        cls.indexes = IndexSet([SortedIndex('name'), HashIndex('tags')])
+        cls.indexes.add('1', {'name': 'bob', 'tags': ['a', 'b']})
+        cls.indexes.add('2', {'name': 'alice', 'tags': ['b']})
+        cls.indexes.add('3', {'name': 'bobby', 'tags': None})
+        cls.indexes.add('4', {'name': 'carol'})
+
+
+class WhenLookingUpByEquality(IndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.tagged = cls.indexes.find('tags', equals='b')
+        cls.named = cls.indexes.find('name', equals='bob')
+
+    def should_return_entries_for_each_list_element(self):
+        self.assertEqual(self.tagged, [('b', '1'), ('b', '2')])
+
+    def should_return_exact_matches_from_sorted_index(self):
+        self.assertEqual(self.named, [('bob', '1')])
+
+
+class WhenLookingUpSortedRange(IndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.range = cls.indexes.find('name', low='b', high='c')
+        cls.prefix = cls.indexes.find('name', prefix='bob')
+        cls.page = cls.indexes.find('name', after=('bob', '1'), limit=2)
+
+    def should_return_keys_in_range(self):
+        self.assertEqual(self.range, [('bob', '1'), ('bobby', '3')])
+
+    def should_return_keys_with_prefix(self):
+        self.assertEqual(self.prefix, [('bob', '1'), ('bobby', '3')])
+
+    def should_resume_after_entry(self):
+        self.assertEqual(self.page, [('bobby', '3'), ('carol', '4')])
+
+
+class WhenReindexingRecord(IndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.indexes.add('1', {'name': 'zed', 'tags': ['c']})
+        cls.indexes.remove('2')
+
+    def should_replace_previous_keys(self):
+        self.assertEqual(self.indexes.find('name', equals='bob'), [])
+        self.assertEqual(self.indexes.find('tags', equals='a'), [])
+
+    def should_index_new_keys(self):
+        self.assertEqual(self.indexes.find('name', prefix='z'),
+                         [('zed', '1')])
+        self.assertEqual(self.indexes.find('tags', equals='c'),
+                         [('c', '1')])
+
+    def should_remove_deleted_record(self):
+        self.assertEqual(self.indexes.find('name', equals='alice'), [])
+        self.assertEqual(self.indexes.find('tags', equals='b'), [])
+
+
+class WhenSearchingHashIndexByRange(IndexTestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        cls.indexes.find('tags', low='a')
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+class WhenSearchingUnknownIndex(IndexTestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def act(cls):
+        cls.indexes.find('age', equals=1)
+
+    def should_raise_value_error(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+class WhenIndexingKeysOfOtherTypes(IndexTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenIndexingKeysOfOtherTypes, cls).arrange()
+        cls.mixed = IndexSet([SortedIndex('value', key_types=(int, str))])
+        cls.mixed.add('1', {'value': 'a'})
+
+    @classmethod
+    def act(cls):
+        cls.indexes.add('5', {'name': 5, 'tags': [5]})
+        cls.mixed.add('2', {'value': 2})
+        cls.mixed.add('3', {'value': 'b'})
+
+    def should_leave_other_types_out_of_sorted_index(self):
+        self.assertEqual(self.indexes.find('name', after=('bobby', '3')),
+                         [('carol', '4')])
+
+    def should_index_other_types_in_hash_index(self):
+        self.assertEqual(self.indexes.find('tags', equals=5), [(5, '5')])
+
+    def should_skip_keys_that_cannot_be_compared(self):
+        self.assertEqual(self.mixed.find('value'), [('a', '1'), ('b', '3')])
+
+
+class WhenLoadingIndexes(IndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.loaded = IndexSet([SortedIndex('name'), HashIndex('tags')])
+        cls.loaded.load([
+            ('4', {'name': 'carol'}),
+            ('3', {'name': 'bobby', 'tags': None}),
+            ('1', {'name': 'bob', 'tags': ['a', 'b']}),
+            ('2', {'name': 'alice', 'tags': ['b']}),
+        ])
+        cls.names = cls.loaded.find('name')
+        cls.tagged = cls.loaded.find('tags', equals='b')
+        cls.loaded.remove('1')
+        cls.loaded.add('5', {'name': 'bert'})
+
+    def should_sort_entries_like_added_ones(self):
+        self.assertEqual(self.names, self.indexes.find('name'))
+
+    def should_fill_hash_index(self):
+        self.assertEqual(self.tagged, [('b', '1'), ('b', '2')])
+
+    def should_allow_later_changes(self):
+        self.assertEqual(self.loaded.find('name', prefix='b'),
+                         [('bert', '5'), ('bobby', '3')])
+
+
+class WhenLoadingKeysThatCannotBeCompared(IndexTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.mixed = IndexSet([SortedIndex('value', key_types=(int, str))])
+        cls.mixed.load([('1', {'value': 'a'}), ('2', {'value': 2}),
+                        ('3', {'value': 'b'})])
+
+    def should_skip_keys_that_cannot_be_compared(self):
+        self.assertEqual(self.mixed.find('value'), [('a', '1'), ('b', '3')])
+
+
+class WhenChangingLargeSortedIndex(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenChangingLargeSortedIndex, cls).arrange()
+        cls.names = dict(
+            (str(number), 'name{0:05d}'.format(number * 7919 % 5000))
+            for number in range(5000))
+        cls.indexes = IndexSet([SortedIndex('name')])
+        cls.indexes.load((item_id, {'name': name})
+                         for item_id, name in cls.names.items())
+
+    @classmethod
+    def act(cls):
+        for number in range(0, 5000, 3):
+            cls.indexes.remove(str(number))
+            del cls.names[str(number)]
+        for number in range(5000, 7000):
+            cls.names[str(number)] = 'name{0:05d}'.format(number % 2500)
+            cls.indexes.add(str(number), {'name': cls.names[str(number)]})
+
+    def should_keep_entries_in_order(self):
+        self.assertEqual(
+            self.indexes.find('name'),
+            sorted((name, item_id) for item_id, name in self.names.items()))
+
+    def should_find_ranges_across_chunks(self):
+        self.assertEqual(
+            self.indexes.find('name', low='name01000', high='name02000'),
+            sorted((name, item_id) for item_id, name in self.names.items()
+                   if 'name01000' <= name < 'name02000'))
+
+    def should_resume_pages_across_chunks(self):
+        first = self.indexes.find('name', limit=600)
+        second = self.indexes.find('name', after=first[-1], limit=600)
+        self.assertEqual(first + second, self.indexes.find('name',
+                                                           limit=1200))
@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import fluenttest
+
+from familytree import metrics
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+
+
+class _RegistryTestCase(fluenttest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_RegistryTestCase, cls).arrange()
+        cls.registry = metrics.Registry()
+        cls.registry.add_histogram('latency_seconds', 'Latency.', ('path',),
+                                   buckets=(0.1, 1.0))
+        cls.registry.add_counter('bytes_total', 'Bytes.', ('path',))
+
+
+class WhenRenderingRegistry(_RegistryTestCase, unittest.TestCase):
+
+    @classmethod
+    def act(cls):
+        cls.registry.observe('latency_seconds', ('/a',), 0.05)
+        cls.registry.observe('latency_seconds', ('/a',), 0.1)
+        cls.registry.observe('latency_seconds', ('/a',), 0.5)
+        cls.registry.observe('latency_seconds', ('/a',), 3.0)
+        cls.registry.increment('bytes_total', ('say "hi"\n',), 10)
+        cls.registry.increment('bytes_total', ('say "hi"\n',), 5)
+        cls.lines = cls.registry.render().splitlines()
+
+    def should_describe_each_family(self):
+        self.assertEqual(self.lines[:2], ['# HELP latency_seconds Latency.',
+                                          '# TYPE latency_seconds histogram'])
+        self.assertIn('# TYPE bytes_total counter', self.lines)
+
+    def should_render_cumulative_buckets(self):
+        self.assertEqual(self.lines[2:5], [
+            'latency_seconds_bucket{path="/a",le="0.1"} 2',
+            'latency_seconds_bucket{path="/a",le="1.0"} 3',
+            'latency_seconds_bucket{path="/a",le="+Inf"} 4',
+        ])
+
+    def should_render_sum_and_count(self):
+        self.assertIn('latency_seconds_sum{path="/a"} 3.65', self.lines)
+        self.assertIn('latency_seconds_count{path="/a"} 4', self.lines)
+
+    def should_escape_label_values(self):
+        self.assertIn('bytes_total{path="say \\"hi\\"\\n"} 15', self.lines)
+
+
+class WhenRenderingRegistryWithSnapshots(_RegistryTestCase,
+                                         unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRenderingRegistryWithSnapshots, cls).arrange()
+        other = metrics.Registry()
+        other.add_histogram('latency_seconds', 'Latency.', ('path',),
+                            buckets=(0.1, 1.0))
+        other.add_counter('bytes_total', 'Bytes.', ('path',))
+        other.observe('latency_seconds', ('/a',), 0.5)
+        other.increment('bytes_total', ('/b',), 7)
+        cls.snapshot = json.loads(json.dumps(other.snapshot()))
+        cls.registry.observe('latency_seconds', ('/a',), 0.05)
+        cls.registry.increment('bytes_total', ('/a',), 3)
+
+    @classmethod
+    def act(cls):
+        cls.lines = cls.registry.render([cls.snapshot]).splitlines()
+
+    def should_add_matching_series(self):
+        self.assertIn('latency_seconds_bucket{path="/a",le="1.0"} 2',
+                      self.lines)
+        self.assertIn('latency_seconds_count{path="/a"} 2', self.lines)
+
+    def should_include_series_of_other_registries(self):
+        self.assertIn('bytes_total{path="/a"} 3', self.lines)
+        self.assertIn('bytes_total{path="/b"} 7', self.lines)
+
+
+class WhenRecordingRequest(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRecordingRequest, cls).arrange()
+        cls.registry = cls.patch('familytree.metrics._registry')
+
+    @classmethod
+    def act(cls):
+        metrics.record_request('PersonHandler', 'GET', 200, 0.25, 0, 512)
+
+    def should_observe_latency(self):
+        self.registry.observe.assert_called_once_with(
+            metrics.REQUEST_DURATION, ('PersonHandler', 'GET', '200'), 0.25)
+
+    def should_count_bytes(self):
+        self.registry.increment.assert_any_call(
+            metrics.REQUEST_BYTES, ('PersonHandler', 'GET'), 0)
+        self.registry.increment.assert_any_call(
+            metrics.RESPONSE_BYTES, ('PersonHandler', 'GET', '200'), 512)
+
+
+class WhenRenderingMetricsOfSeveralWorkers(fluenttest.TestCase,
+                                           unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRenderingMetricsOfSeveralWorkers, cls).arrange()
+        cls.directory = tempfile.mkdtemp()
+        cls.registry = metrics.Registry()
+        cls.registry.add_counter('requests_total', 'Requests.', ())
+        cls.registry.increment('requests_total', (), 2)
+        cls.patch('familytree.metrics._registry', new=cls.registry)
+        cls.patch('familytree.metrics.os.getpid', return_value=10)
+        metrics.configure_metrics(os.path.join(cls.directory, 'metrics'))
+
+        metrics.write_snapshot()
+        for name, count in (('11', 5), ('12', 100)):
+            path = os.path.join(cls.directory, 'metrics', name + '.json')
+            with open(path, 'w') as snapshot_file:
+                json.dump({'requests_total': [[[], [count]]]},
+                          snapshot_file)
+        cls.stale = path
+        stale_time = time.time() - 4 * metrics.SNAPSHOT_INTERVAL
+        os.utime(cls.stale, (stale_time, stale_time))
+
+    @classmethod
+    def act(cls):
+        cls.lines = metrics.render().splitlines()
+
+    @classmethod
+    def teardown_class(cls):
+        metrics.configure_metrics(None)
+        shutil.rmtree(cls.directory)
+        super(WhenRenderingMetricsOfSeveralWorkers, cls).teardown_class()
+
+    def should_write_snapshot_of_this_process(self):
+        path = os.path.join(self.directory, 'metrics', '10.json')
+        with open(path) as snapshot_file:
+            self.assertEqual(json.load(snapshot_file),
+                             {'requests_total': [[[], [2]]]})
+
+    def should_add_recent_snapshots_of_other_workers(self):
+        self.assertIn('requests_total 7', self.lines)
+
+    def should_remove_stale_snapshots(self):
+        self.assertFalse(os.path.exists(self.stale))
+
+
+class WhenWritingSnapshotWithoutDirectory(fluenttest.TestCase,
+                                          unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenWritingSnapshotWithoutDirectory, cls).arrange()
+        cls.open = cls.patch('familytree.metrics.open', create=True)
+
+    @classmethod
+    def act(cls):
+        metrics.write_snapshot()
+
+    def should_not_write_anything(self):
+        self.assertFalse(self.open.called)
+
+
+class WhenWritingSnapshotFails(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenWritingSnapshotFails, cls).arrange()
+        cls.patch('familytree.metrics._snapshot_directory', new='/metrics')
+        cls.patch('familytree.metrics.open', create=True,
+                  side_effect=IOError('read-only file system'))
+        cls.logger = cls.patch('familytree.metrics.LOGGER')
+
+    @classmethod
+    def act(cls):
+        metrics.write_snapshot()
+
+    def should_log_warning(self):
+        self.logger.warning.assert_called_once_with(
+            'Could not write metrics snapshot: %s', mock.ANY)
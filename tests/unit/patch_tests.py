@@ -0,0 +1,136 @@
+import fluenttest
+
+from familytree import patch
+from ..helpers.compat import unittest
+
+
+class _PatchTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_PatchTestCase, cls).arrange()
+        cls.document = {
+            'id': '1',
+            'display_name': 'name',
+            'events': ('a', 'b'),
+            'details': {'born': 1900, 'died': 1980},
+        }
+
+
+class WhenApplyingMergePatch(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patched = patch.apply_merge_patch(cls.document, {
+            'display_name': 'new name',
+            'events': ['c'],
+            'details': {'died': None, 'place': 'here'},
+        })
+
+    def should_replace_members(self):
+        self.assertEqual(self.patched['display_name'], 'new name')
+
+    def should_replace_lists(self):
+        self.assertEqual(self.patched['events'], ['c'])
+
+    def should_merge_objects(self):
+        self.assertEqual(self.patched['details'],
+                         {'born': 1900, 'place': 'here'})
+
+    def should_keep_other_members(self):
+        self.assertEqual(self.patched['id'], '1')
+
+    def should_not_modify_document(self):
+        self.assertEqual(self.document['details'],
+                         {'born': 1900, 'died': 1980})
+
+
+class WhenApplyingJSONPatch(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patched = patch.apply_json_patch(cls.document, [
+            {'op': 'test', 'path': '/id', 'value': '1'},
+            {'op': 'add', 'path': '/events/-', 'value': 'c'},
+            {'op': 'remove', 'path': '/events/0'},
+            {'op': 'replace', 'path': '/details/born', 'value': 1901},
+            {'op': 'copy', 'from': '/display_name', 'path': '/alias'},
+            {'op': 'move', 'from': '/details/died', 'path': '/died'},
+        ])
+
+    def should_apply_operations_in_order(self):
+        self.assertEqual(self.patched, {
+            'id': '1',
+            'display_name': 'name',
+            'alias': 'name',
+            'events': ['b', 'c'],
+            'details': {'born': 1901},
+            'died': 1980,
+        })
+
+    def should_not_modify_document(self):
+        self.assertEqual(self.document['events'], ('a', 'b'))
+
+
+class WhenApplyingJSONPatchWithEscapedPointer(_PatchTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.patched = patch.apply_json_patch({'a/b': {'~': 1}}, [
+            {'op': 'replace', 'path': '/a~1b/~0', 'value': 2},
+        ])
+
+    def should_unescape_pointer_tokens(self):
+        self.assertEqual(self.patched, {'a/b': {'~': 2}})
+
+
+class WhenJSONPatchTestFails(_PatchTestCase):
+
+    allowed_exceptions = patch.PatchConflict
+
+    @classmethod
+    def act(cls):
+        patch.apply_json_patch(cls.document, [
+            {'op': 'test', 'path': '/display_name', 'value': 'other'},
+        ])
+
+    def should_raise_patch_conflict(self):
+        self.assertIsInstance(self.exception, patch.PatchConflict)
+
+
+class WhenJSONPatchTargetsMissingMember(_PatchTestCase):
+
+    allowed_exceptions = patch.PatchConflict
+
+    @classmethod
+    def act(cls):
+        patch.apply_json_patch(cls.document, [
+            {'op': 'remove', 'path': '/events/5'},
+        ])
+
+    def should_raise_patch_conflict(self):
+        self.assertIsInstance(self.exception, patch.PatchConflict)
+
+
+class WhenJSONPatchHasUnknownOperation(_PatchTestCase):
+
+    allowed_exceptions = patch.InvalidPatch
+
+    @classmethod
+    def act(cls):
+        patch.apply_json_patch(cls.document, [{'op': 'frobnicate'}])
+
+    def should_raise_invalid_patch(self):
+        self.assertIsInstance(self.exception, ValueError)
+
+
+class WhenJSONPatchIsNotList(_PatchTestCase):
+
+    allowed_exceptions = patch.InvalidPatch
+
+    @classmethod
+    def act(cls):
+        patch.apply_json_patch(cls.document, {'display_name': 'x'})
+
+    def should_raise_invalid_patch(self):
+        self.assertIsInstance(self.exception, patch.InvalidPatch)
@@ -8,7 +8,7 @@ from familytree.person import (
     PersonHandler,
     get_applicable_actions,
 )
-from . import ActionCardTestMixin, TornadoHandlerTestCase
+from . import ActionCardTestMixin, TornadoHandlerTestCase, resolved_future
 from ..helpers.compat import mock
 from ..helpers.compat import unittest
 
@@ -47,6 +47,7 @@ class WhenPostingToCreatePersonHandler(TornadoHandlerTestCase):
     def arrange(cls):
         super(WhenPostingToCreatePersonHandler, cls).arrange()
         cls.storage = cls.patch('familytree.person.storage')
+        cls.storage.save_item_async.return_value = resolved_future('v1')
         cls.uuid_module = cls.patch('familytree.person.uuid')
         cls.get_actions = cls.patch('familytree.person.get_applicable_actions')
         cls.handler = CreatePersonHandler(cls.application, cls.request)
@@ -58,17 +59,20 @@ class WhenPostingToCreatePersonHandler(TornadoHandlerTestCase):
 
     @classmethod
     def act(cls):
-        cls.response = cls.handler.post()
+        cls.response = cls.handler.post().result()
 
     def should_deserialize_model_instance(self):
         self.handler.deserialize_model_instance.assert_called_once_with(
             Person)
 
+    def should_validate_person(self):
+        self.person.validate.assert_called_once_with()
+
     def should_generate_person_id(self):
         self.uuid_module.uuid4.assert_called_once_with()
 
     def should_save_model_instance(self):
-        self.storage.save_item.assert_called_once_with(
+        self.storage.save_item_async.assert_called_once_with(
             self.handler.deserialize_model_instance.return_value,
             self.uuid_module.uuid4.return_value.hex,
         )
@@ -78,6 +82,7 @@ class WhenPostingToCreatePersonHandler(TornadoHandlerTestCase):
             self.person,
             actions=self.get_actions.return_value,
             model_handler=PersonHandler,
+            version='v1',
         )
 
     def should_set_status_to_created(self):
@@ -93,12 +98,15 @@ class _PersonHandlerGetTestCase(TornadoHandlerTestCase, unittest.TestCase):
     @classmethod
     def arrange(cls):
         super(_PersonHandlerGetTestCase, cls).arrange()
-        cls.get_item = cls.patch('familytree.person.storage.get_item')
+        cls.get_item = cls.patch(
+            'familytree.person.storage.get_versioned_item_async')
+        cls.person = mock.Mock()
+        cls.get_item.return_value = resolved_future((cls.person, 'v1'))
         cls.handler = PersonHandler(cls.application, cls.request)
 
     @classmethod
     def act(cls):
-        cls.response = cls.handler.get(mock.sentinel.person_id)
+        cls.response = cls.handler.get(mock.sentinel.person_id).result()
 
     def should_retrieve_person_from_data_store(self):
         self.get_item.assert_called_once_with(Person, mock.sentinel.person_id)
@@ -110,7 +118,6 @@ class WhenPersonHandlerGets(_PersonHandlerGetTestCase):
     def arrange(cls):
         super(WhenPersonHandlerGets, cls).arrange()
         cls.get_actions = cls.patch('familytree.person.get_applicable_actions')
-        cls.person = cls.get_item.return_value
         cls.handler.serialize_model_instance = mock.Mock()
         cls.handler.set_status = mock.Mock()
 
@@ -119,12 +126,32 @@ class WhenPersonHandlerGets(_PersonHandlerGetTestCase):
             self.person,
             actions=self.get_actions.return_value,
             model_handler=PersonHandler,
+            version='v1',
+            embedded=None,
         )
 
     def should_set_status_to_ok(self):
         self.handler.set_status.assert_called_once_with(200)
 
 
+class WhenPersonHandlerGetsUnmodifiedPerson(_PersonHandlerGetTestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonHandlerGetsUnmodifiedPerson, cls).arrange()
+        cls.request.headers['If-None-Match'] = '"v0", "v1"'
+        cls.handler.serialize_model_instance = mock.Mock()
+
+    def should_set_status_to_not_modified(self):
+        self.assertEqual(self.handler.get_status(), 304)
+
+    def should_send_etag(self):
+        self.assertEqual(self.handler._headers['Etag'], b'"v1"')
+
+    def should_not_serialize_model_instance(self):
+        self.assertFalse(self.handler.serialize_model_instance.called)
+
+
 class WhenPersonHandlerGetsNonexistentPerson(_PersonHandlerGetTestCase):
 
     allowed_exceptions = web.HTTPError
@@ -132,12 +159,110 @@ class WhenPersonHandlerGetsNonexistentPerson(_PersonHandlerGetTestCase):
     @classmethod
     def arrange(cls):
         super(WhenPersonHandlerGetsNonexistentPerson, cls).arrange()
-        cls.get_item.side_effect = storage.InstanceNotFound(mock.Mock(), '')
+        cls.get_item.return_value = resolved_future(
+            exception=storage.InstanceNotFound(mock.Mock(), ''))
 
     def should_raise_not_found(self):
         self.assertEqual(self.exception.status_code, 404)
 
 
+###############################################################################
+# PersonHandler.patch()
+###############################################################################
+
+class _PersonHandlerPatchTestCase(TornadoHandlerTestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(_PersonHandlerPatchTestCase, cls).arrange()
+        cls.request.headers['If-Match'] = '"v1"'
+        cls.get_item = cls.patch(
+            'familytree.person.storage.get_versioned_item_async')
+        cls.get_item.return_value = resolved_future(
+            (Person('old', person_id='1234'), 'v1'))
+        cls.save_item = cls.patch(
+            'familytree.person.storage.save_item_async')
+        cls.save_item.return_value = resolved_future('v2')
+        cls.handler = PersonHandler(cls.application, cls.request)
+        cls.handler.apply_patch = mock.Mock()
+        cls.handler.apply_patch.return_value = {
+            'id': '1234', 'display_name': 'new', 'events': []}
+        cls.handler.serialize_model_instance = mock.Mock()
+
+    @classmethod
+    def act(cls):
+        cls.handler.patch('1234').result()
+
+
+class WhenPersonHandlerPatches(_PersonHandlerPatchTestCase):
+
+    def should_protect_id_and_events(self):
+        self.handler.apply_patch.assert_called_once_with(
+            {'id': '1234', 'display_name': 'old', 'events': ()},
+            read_only=('id', 'events'))
+
+    def should_save_patched_person_at_read_version(self):
+        (person, person_id), kwargs = self.save_item.call_args
+        self.assertEqual(person.display_name, 'new')
+        self.assertEqual(person_id, '1234')
+        self.assertEqual(kwargs, {'expected_version': 'v1'})
+
+    def should_serialize_new_version(self):
+        self.assertEqual(
+            self.handler.serialize_model_instance.call_args[1]['version'],
+            'v2')
+
+    def should_set_status_to_ok(self):
+        self.assertEqual(self.handler.get_status(), 200)
+
+
+class WhenPersonHandlerPatchesInvalidName(_PersonHandlerPatchTestCase):
+
+    allowed_exceptions = web.HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonHandlerPatchesInvalidName, cls).arrange()
+        cls.handler.apply_patch.return_value = {
+            'id': '1234', 'display_name': 5, 'events': []}
+
+    def should_fail_with_bad_request(self):
+        self.assertEqual(self.exception.status_code, 400)
+
+    def should_not_save_person(self):
+        self.assertFalse(self.save_item.called)
+
+
+class WhenPersonHandlerPatchesModifiedPerson(_PersonHandlerPatchTestCase):
+
+    allowed_exceptions = web.HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonHandlerPatchesModifiedPerson, cls).arrange()
+        cls.request.headers['If-Match'] = '"v0"'
+
+    def should_raise_precondition_failed(self):
+        self.assertEqual(self.exception.status_code, 412)
+
+    def should_not_save_person(self):
+        self.assertFalse(self.save_item.called)
+
+
+class WhenPersonHandlerPatchesConcurrently(_PersonHandlerPatchTestCase):
+
+    allowed_exceptions = web.HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonHandlerPatchesConcurrently, cls).arrange()
+        cls.save_item.return_value = resolved_future(
+            exception=storage.VersionConflict(Person, '1234', 'v3'))
+
+    def should_raise_precondition_failed(self):
+        self.assertEqual(self.exception.status_code, 412)
+
+
 ###############################################################################
 # PersonHandler.delete
 ###############################################################################
@@ -147,16 +272,18 @@ class _PersonHandlerDeleteTestCase(TornadoHandlerTestCase, unittest.TestCase):
     @classmethod
     def arrange(cls):
         super(_PersonHandlerDeleteTestCase, cls).arrange()
-        cls.delete_item = cls.patch('familytree.person.storage.delete_item')
+        cls.delete_item = cls.patch(
+            'familytree.person.storage.delete_item_async')
+        cls.delete_item.return_value = resolved_future()
         cls.handler = PersonHandler(cls.application, cls.request)
 
     @classmethod
     def act(cls):
-        cls.handler.delete(mock.sentinel.person_id)
+        cls.handler.delete(mock.sentinel.person_id).result()
 
     def should_call_delete_item(self):
         self.delete_item.assert_called_once_with(
-            Person, mock.sentinel.person_id)
+            Person, mock.sentinel.person_id, expected_version=None)
 
 
 class WhenPersonHandlerDeletes(_PersonHandlerDeleteTestCase):
@@ -170,6 +297,34 @@ class WhenPersonHandlerDeletes(_PersonHandlerDeleteTestCase):
         self.handler.set_status.assert_called_once_with(204)
 
 
+class WhenPersonHandlerDeletesModifiedPerson(TornadoHandlerTestCase,
+                                             unittest.TestCase):
+
+    allowed_exceptions = web.HTTPError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenPersonHandlerDeletesModifiedPerson, cls).arrange()
+        cls.request.headers['If-Match'] = '"v1"'
+        cls.delete_item = cls.patch(
+            'familytree.person.storage.delete_item_async')
+        cls.delete_item.return_value = resolved_future(
+            exception=storage.VersionConflict(Person, 'id', 'v2'))
+        cls.handler = PersonHandler(cls.application, cls.request)
+
+    @classmethod
+    def act(cls):
+        cls.handler.delete(mock.sentinel.person_id).result()
+
+    def should_pass_expected_version(self):
+        self.delete_item.assert_called_once_with(
+            Person, mock.sentinel.person_id,
+            expected_version=frozenset(['v1']))
+
+    def should_raise_precondition_failed(self):
+        self.assertEqual(self.exception.status_code, 412)
+
+
 class WhenPersonHandlerDeletesNonexistentPerson(_PersonHandlerDeleteTestCase):
 
     allowed_exceptions = web.HTTPError
@@ -177,7 +332,8 @@ class WhenPersonHandlerDeletesNonexistentPerson(_PersonHandlerDeleteTestCase):
     @classmethod
     def arrange(cls):
         super(WhenPersonHandlerDeletesNonexistentPerson, cls).arrange()
-        cls.delete_item.side_effect = storage.InstanceNotFound(mock.Mock(), '')
+        cls.delete_item.return_value = resolved_future(
+            exception=storage.InstanceNotFound(mock.Mock(), ''))
 
     def should_raise_not_found(self):
         self.assertEqual(self.exception.status_code, 404)
@@ -303,7 +459,7 @@ class WhenConvertingFromDictionary(FromDictionaryTestCase):
             self.person.display_name, self.dict_repr['display_name'])
 
     def should_populate_events(self):
-        self.assertEqual(self.person.events, [mock.sentinel.event])
+        self.assertEqual(self.person.events, (mock.sentinel.event,))
 
 
 class WhenConvertingFromDictionaryWithoutDisplayName(FromDictionaryTestCase):
@@ -334,38 +490,122 @@ class WhenConvertingFromDictionaryWithoutId(FromDictionaryTestCase):
 # Person.add_event
 ###############################################################################
 
-class WhenAddingEvent(fluenttest.TestCase):
+class WhenAddingEvent(fluenttest.TestCase, unittest.TestCase):
 
     @classmethod
     def arrange(cls):
         super(WhenAddingEvent, cls).arrange()
         cls.person = Person(mock.sentinel.display_name)
-        cls.person.events = mock.Mock()
+        cls.person.events = (mock.sentinel.existing_event,)
+        cls.original_events = cls.person.events
 
     @classmethod
     def act(cls):
         cls.person.add_event(mock.sentinel.event_url)
 
     def should_append_new_event(self):
-        self.person.events.append(mock.sentinel.event_url)
+        self.assertEqual(
+            self.person.events,
+            (mock.sentinel.existing_event, mock.sentinel.event_url))
+
+    def should_not_modify_original_events(self):
+        self.assertEqual(self.original_events,
+                         (mock.sentinel.existing_event,))
 
 
 ###############################################################################
 # Person.remove_event
 ###############################################################################
 
-class WhenRemovingEvent(fluenttest.TestCase):
+class WhenRemovingEvent(fluenttest.TestCase, unittest.TestCase):
 
     @classmethod
     def arrange(cls):
         super(WhenRemovingEvent, cls).arrange()
         cls.person = Person(mock.sentinel.display_name)
-        cls.person.events = mock.Mock()
+        cls.person.events = (mock.sentinel.first_event,
+                             mock.sentinel.event_url,
+                             mock.sentinel.last_event)
 
     @classmethod
     def act(cls):
         cls.person.remove_event(mock.sentinel.event_url)
 
     def should_remove_event_url(self):
-        self.person.events.remove.assert_called_once_with(
-            mock.sentinel.event_url)
+        self.assertEqual(
+            self.person.events,
+            (mock.sentinel.first_event, mock.sentinel.last_event))
+
+
+class WhenRemovingUnknownEvent(fluenttest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRemovingUnknownEvent, cls).arrange()
+        cls.person = Person(mock.sentinel.display_name)
+
+    @classmethod
+    def act(cls):
+        cls.person.remove_event(mock.sentinel.event_url)
+
+    def should_raise_value_error(self):
+        assert isinstance(self.exception, ValueError)
+
+
+###############################################################################
+# Person.discard_event
+###############################################################################
+
+class WhenDiscardingEvent(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDiscardingEvent, cls).arrange()
+        cls.person = Person(mock.sentinel.display_name)
+        cls.person.events = ('http://example.com/event/1234',
+                             'http://other.example.com/event/5678',
+                             'http://other.example.com/event/1234')
+
+    @classmethod
+    def act(cls):
+        cls.person.discard_event('1234')
+
+    def should_remove_links_to_event_from_any_host(self):
+        self.assertEqual(self.person.events,
+                         ('http://other.example.com/event/5678',))
+
+
+class WhenDiscardingUnknownEvent(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDiscardingUnknownEvent, cls).arrange()
+        cls.person = Person(mock.sentinel.display_name)
+        cls.person.events = ('http://example.com/event/1234',)
+
+    @classmethod
+    def act(cls):
+        cls.person.discard_event('5678')
+
+    def should_keep_other_events(self):
+        self.assertEqual(self.person.events,
+                         ('http://example.com/event/1234',))
+
+
+class WhenValidatingPersonWithoutStringName(fluenttest.TestCase):
+
+    allowed_exceptions = ValueError
+
+    @classmethod
+    def arrange(cls):
+        super(WhenValidatingPersonWithoutStringName, cls).arrange()
+        cls.person = Person(display_name=5)
+
+    @classmethod
+    def act(cls):
+        cls.person.validate()
+
+    def should_raise_value_error(self):
+        assert isinstance(self.exception, ValueError)
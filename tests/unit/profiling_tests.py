@@ -0,0 +1,276 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import fluenttest
+
+from familytree import profiling
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+
+
+def _busy_work():
+    return sorted(str(value) for value in range(100))
+
+
+class _ProfilingTestCase(fluenttest.TestCase):
+
+    enabled = True
+    token = '1'
+    directory = None
+    max_profiles = 20
+
+    @classmethod
+    def arrange(cls):
+        super(_ProfilingTestCase, cls).arrange()
+        cls.patch('familytree.profiling.LOGGER')
+        cls.patch('familytree.profiling._active', new=None)
+        profiling.configure_profiling(cls.enabled, cls.token,
+                                      cls.max_profiles, cls.directory)
+
+    @classmethod
+    def teardown_class(cls):
+        profiling.configure_profiling()
+        super(_ProfilingTestCase, cls).teardown_class()
+
+    @classmethod
+    def make_handler(cls, header=None, parameter=None, path='/person'):
+        handler = mock.Mock()
+        handler.request.headers = {}
+        if header is not None:
+            handler.request.headers[profiling.HEADER] = header
+        handler.get_query_argument.return_value = parameter
+        handler.request.method = 'GET'
+        handler.request.path = path
+        handler.request.request_time.return_value = 0.25
+        handler.get_status.return_value = 200
+        return handler
+
+
+class WhenStartingProfileWhileDisabled(_ProfilingTestCase,
+                                       unittest.TestCase):
+
+    enabled = False
+
+    @classmethod
+    def act(cls):
+        cls.session = profiling.start(cls.make_handler(header='1'))
+
+    def should_not_profile(self):
+        self.assertIsNone(self.session)
+
+
+class WhenEnablingProfilingWithoutToken(_ProfilingTestCase,
+                                        unittest.TestCase):
+
+    token = ''
+
+    @classmethod
+    def act(cls):
+        cls.session = profiling.start(cls.make_handler(header=''))
+        cls.authorized = profiling.is_authorized(cls.make_handler())
+
+    def should_stay_disabled(self):
+        self.assertFalse(profiling.is_enabled())
+
+    def should_not_profile(self):
+        self.assertIsNone(self.session)
+
+    def should_not_authorize(self):
+        self.assertFalse(self.authorized)
+
+
+class WhenStartingProfileWithoutBeingAsked(_ProfilingTestCase,
+                                           unittest.TestCase):
+
+    @classmethod
+    def act(cls):
+        cls.session = profiling.start(cls.make_handler())
+
+    def should_not_profile(self):
+        self.assertIsNone(self.session)
+
+
+class WhenStartingProfileWithToken(_ProfilingTestCase, unittest.TestCase):
+
+    token = 's3cret'
+
+    @classmethod
+    def act(cls):
+        cls.wrong = profiling.start(cls.make_handler(header='guess'))
+        cls.session = profiling.start(cls.make_handler(parameter='s3cret'))
+        cls.concurrent = profiling.start(cls.make_handler(header='s3cret'))
+
+    def should_not_profile_with_wrong_token(self):
+        self.assertIsNone(self.wrong)
+
+    def should_profile_with_matching_token(self):
+        self.assertIsInstance(self.session, profiling.Session)
+
+    def should_profile_one_request_at_a_time(self):
+        self.assertIsNone(self.concurrent)
+
+
+class WhenAuthorizingProfileRequests(_ProfilingTestCase, unittest.TestCase):
+
+    token = 's3cret'
+
+    @classmethod
+    def act(cls):
+        cls.missing = profiling.is_authorized(cls.make_handler())
+        cls.wrong = profiling.is_authorized(cls.make_handler(header='guess'))
+        cls.matching = profiling.is_authorized(
+            cls.make_handler(parameter='s3cret'))
+
+    def should_require_token(self):
+        self.assertFalse(self.missing)
+        self.assertFalse(self.wrong)
+
+    def should_authorize_matching_token(self):
+        self.assertTrue(self.matching)
+
+
+class WhenAuthorizingProfileRequestsWhileDisabled(_ProfilingTestCase,
+                                                  unittest.TestCase):
+
+    enabled = False
+
+    @classmethod
+    def act(cls):
+        cls.authorized = profiling.is_authorized(cls.make_handler())
+
+    def should_not_authorize(self):
+        self.assertFalse(self.authorized)
+
+
+class WhenStartingProfileAfterAbandonedOne(_ProfilingTestCase,
+                                           unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenStartingProfileAfterAbandonedOne, cls).arrange()
+        cls.abandoned = profiling.start(cls.make_handler(header='1'))
+        cls.abandoned.started -= profiling.ABANDON_AFTER + 1
+
+    @classmethod
+    def act(cls):
+        cls.session = profiling.start(cls.make_handler(header='1'))
+
+    def should_start_new_profile(self):
+        self.assertIsInstance(self.session, profiling.Session)
+        self.assertIsNot(self.session, self.abandoned)
+
+
+class WhenFinishingProfile(_ProfilingTestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenFinishingProfile, cls).arrange()
+        cls.handler = cls.make_handler(header='1')
+        cls.session = profiling.start(cls.handler)
+
+    @classmethod
+    def act(cls):
+        with cls.session.activate():
+            bound = profiling.bind(_busy_work)
+            with cls.session.activate():
+                _busy_work()
+        thread = threading.Thread(target=bound)
+        thread.start()
+        thread.join()
+        with cls.session.activate():
+            cls.session.finish(cls.handler)
+        cls.next_session = profiling.start(cls.make_handler(header='1'))
+
+    def should_list_profile(self):
+        self.assertEqual(profiling.list_profiles(), [{
+            'id': self.session.id,
+            'handler': 'Mock',
+            'method': 'GET',
+            'path': '/person',
+            'status': 200,
+            'duration': 250.0,
+            'created': self.session.started,
+        }])
+
+    def should_profile_every_thread(self):
+        stats = profiling.get_profile(self.session.id)
+        calls = [primitive for (_, _, name), (primitive, _, _, _, _)
+                 in stats.stats.items() if name == '_busy_work']
+        self.assertEqual(calls, [2])
+
+    def should_allow_next_profile(self):
+        self.assertIsInstance(self.next_session, profiling.Session)
+
+    def should_not_bind_without_profile(self):
+        self.assertIs(profiling.bind(_busy_work), _busy_work)
+
+
+class WhenGettingUnknownProfile(_ProfilingTestCase):
+
+    allowed_exceptions = KeyError
+
+    @classmethod
+    def act(cls):
+        profiling.get_profile('0123')
+
+    def should_raise_key_error(self):
+        assert isinstance(self.exception, KeyError)
+
+
+class WhenKeepingTooManyProfiles(_ProfilingTestCase, unittest.TestCase):
+
+    max_profiles = 2
+
+    @classmethod
+    def act(cls):
+        for path in ('/one', '/two', '/three'):
+            handler = cls.make_handler(header='1', path=path)
+            profiling.start(handler).finish(handler)
+
+    def should_keep_newest_profiles(self):
+        self.assertEqual([d['path'] for d in profiling.list_profiles()],
+                         ['/three', '/two'])
+
+
+class WhenSavingProfilesInDirectory(_ProfilingTestCase, unittest.TestCase):
+
+    max_profiles = 2
+
+    @classmethod
+    def arrange(cls):
+        cls.parent = tempfile.mkdtemp()
+        cls.directory = os.path.join(cls.parent, 'profiles')
+        super(WhenSavingProfilesInDirectory, cls).arrange()
+
+    @classmethod
+    def act(cls):
+        cls.sessions = []
+        for index, path in enumerate(('/one', '/two', '/three')):
+            handler = cls.make_handler(header='1', path=path)
+            session = profiling.start(handler)
+            session.started += index
+            with session.activate():
+                _busy_work()
+            session.finish(handler)
+            cls.sessions.append(session)
+
+    @classmethod
+    def teardown_class(cls):
+        super(WhenSavingProfilesInDirectory, cls).teardown_class()
+        shutil.rmtree(cls.parent)
+
+    def should_list_newest_profiles(self):
+        self.assertEqual([d['path'] for d in profiling.list_profiles()],
+                         ['/three', '/two'])
+
+    def should_save_pstats_files(self):
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(session.id + extension for session in self.sessions[1:]
+                   for extension in ('.json', '.prof')))
+
+    def should_load_profile(self):
+        stats = profiling.get_profile(self.sessions[2].id)
+        self.assertIn('_busy_work', [name for _, _, name in stats.stats])
@@ -0,0 +1,70 @@
+import fluenttest
+
+from familytree.handlers import CachedResponse, ResponseCache
+from ..helpers.compat import unittest
+
+
+def _response(body):
+    return CachedResponse(body, [('Content-Type', 'application/json')], None)
+
+
+class ResponseCacheTestCase(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(ResponseCacheTestCase, cls).arrange()
+        cls.cache = ResponseCache(10)
+        cls.cache.put(('one', 'http', 'a'), _response(b'1234'),
+                      cls.cache.generation)
+        cls.cache.put(('one', 'http', 'b'), _response(b'1234'),
+                      cls.cache.generation)
+
+
+class WhenResponseCacheExceedsMaximumBytes(ResponseCacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.cache.get(('one', 'http', 'a'))
+        cls.cache.put(('two', 'http', 'a'), _response(b'12345'),
+                      cls.cache.generation)
+
+    def should_not_exceed_maximum_bytes(self):
+        self.assertEqual(self.cache.size, 9)
+
+    def should_evict_least_recently_used_response(self):
+        self.assertIsNone(self.cache.get(('one', 'http', 'b')))
+
+    def should_retain_recently_used_response(self):
+        self.assertEqual(self.cache.get(('one', 'http', 'a')).body, b'1234')
+
+
+class WhenCachingOversizedResponse(ResponseCacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.cache.put(('two', 'http', 'a'), _response(b'x' * 11),
+                      cls.cache.generation)
+
+    def should_not_cache_response(self):
+        self.assertIsNone(self.cache.get(('two', 'http', 'a')))
+
+    def should_retain_other_responses(self):
+        self.assertEqual(len(self.cache), 2)
+
+
+class WhenInvalidatingResource(ResponseCacheTestCase):
+
+    @classmethod
+    def act(cls):
+        cls.generation = cls.cache.generation
+        cls.cache.invalidate(['one'])
+        cls.cache.put(('two', 'http', 'a'), _response(b'12'), cls.generation)
+
+    def should_remove_every_rendering(self):
+        self.assertEqual(len(self.cache), 0)
+
+    def should_release_bytes(self):
+        self.assertEqual(self.cache.size, 0)
+
+    def should_not_cache_response_rendered_before_invalidation(self):
+        self.assertIsNone(self.cache.get(('two', 'http', 'a')))
@@ -0,0 +1,312 @@
+import signal
+import socket
+
+import fluenttest
+
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+from familytree import server
+
+
+class _SupervisorTestCase(fluenttest.TestCase):
+
+    workers = 2
+    fork_results = ()
+    wait_results = ()
+
+    @classmethod
+    def arrange(cls):
+        super(_SupervisorTestCase, cls).arrange()
+        cls.fork = cls.patch('familytree.server.os.fork',
+                             side_effect=list(cls.fork_results))
+        cls.wait = cls.patch('familytree.server.os.wait',
+                             side_effect=list(cls.wait_results))
+        cls.kill = cls.patch('familytree.server.os.kill')
+        cls.exit = cls.patch('familytree.server.os._exit')
+        cls.patch('familytree.server.logging.shutdown')
+        cls.patch('familytree.server.LOGGER')
+        cls.serve = mock.Mock()
+        cls.supervisor = server.Supervisor(cls.workers, max_restarts=1)
+
+    @classmethod
+    def act(cls):
+        cls.supervisor.run(cls.serve)
+
+
+class WhenSupervisorRestartsCrashedWorker(_SupervisorTestCase,
+                                          unittest.TestCase):
+
+    fork_results = (101, 102, 103)
+    wait_results = ((101, signal.SIGKILL), (102, 0), (103, 0))
+
+    def should_fork_each_worker(self):
+        self.assertEqual(self.fork.call_count, 3)
+
+    def should_not_serve_in_parent(self):
+        self.assertFalse(self.serve.called)
+
+    def should_count_restart(self):
+        self.assertEqual(self.supervisor.restarts, 1)
+
+    def should_wait_for_every_worker(self):
+        self.assertEqual(self.supervisor.children, {})
+
+
+class WhenSupervisorWorkerExitsWithError(_SupervisorTestCase,
+                                         unittest.TestCase):
+
+    workers = 1
+    fork_results = (101, 102)
+    wait_results = ((101, 1 << 8), (102, 0))
+
+    def should_restart_worker(self):
+        self.assertEqual(self.fork.call_count, 2)
+
+
+class WhenSupervisorWorkersCrashTooOften(_SupervisorTestCase):
+
+    allowed_exceptions = RuntimeError
+    workers = 1
+    fork_results = (101, 102)
+    wait_results = ((101, signal.SIGSEGV), (102, signal.SIGSEGV))
+
+    def should_raise_runtime_error(self):
+        assert isinstance(self.exception, RuntimeError)
+
+    def should_stop_restarting(self):
+        assert self.fork.call_count == 2
+
+
+class WhenSupervisorIsStopped(_SupervisorTestCase, unittest.TestCase):
+
+    fork_results = (101, 102)
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSupervisorIsStopped, cls).arrange()
+
+        def wait():
+            if not cls.supervisor.stopping:
+                cls.supervisor.stop()
+            return wait_results.pop(0)
+
+        wait_results = [(101, signal.SIGTERM), (102, 0)]
+        cls.wait.side_effect = wait
+
+    def should_terminate_every_worker(self):
+        self.kill.assert_any_call(101, signal.SIGTERM)
+        self.kill.assert_any_call(102, signal.SIGTERM)
+
+    def should_not_restart_workers(self):
+        self.assertEqual(self.fork.call_count, 2)
+
+
+class WhenSupervisorReloads(_SupervisorTestCase, unittest.TestCase):
+
+    fork_results = (101, 102, 103, 104)
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSupervisorReloads, cls).arrange()
+
+        def wait():
+            if len(wait_results) == 4:
+                cls.supervisor.reload()
+            return wait_results.pop(0)
+
+        wait_results = [(101, signal.SIGKILL), (102, 0), (103, 0), (104, 0)]
+        cls.wait.side_effect = wait
+
+    def should_start_new_workers(self):
+        self.assertEqual(self.fork.call_count, 4)
+
+    def should_terminate_old_workers(self):
+        self.assertEqual(self.kill.call_args_list,
+                         [mock.call(101, signal.SIGTERM),
+                          mock.call(102, signal.SIGTERM)])
+
+    def should_not_restart_retired_workers(self):
+        self.assertEqual(self.supervisor.restarts, 0)
+
+
+class WhenSupervisorRunsInWorker(_SupervisorTestCase, unittest.TestCase):
+
+    workers = 1
+    fork_results = (0,)
+
+    def should_serve_with_task_id(self):
+        self.serve.assert_called_once_with(0)
+
+    def should_exit_without_error(self):
+        self.exit.assert_called_once_with(0)
+
+    def should_set_task_id(self):
+        self.assertEqual(self.supervisor.task_id, 0)
+
+
+class WhenSupervisorWorkerLosesParent(_SupervisorTestCase,
+                                      unittest.TestCase):
+
+    workers = 1
+    fork_results = (0,)
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSupervisorWorkerLosesParent, cls).arrange()
+        cls.patch('familytree.server.os.getppid', return_value=1)
+        cls.serve.side_effect = lambda task_id: cls.serve.orphaned.append(
+            cls.supervisor.orphaned)
+        cls.serve.orphaned = []
+
+    def should_be_orphaned(self):
+        self.assertEqual(self.serve.orphaned, [True])
+
+    def should_not_be_orphaned_in_parent(self):
+        self.supervisor.task_id = None
+        self.assertFalse(self.supervisor.orphaned)
+
+
+class WhenSupervisorWorkerFails(_SupervisorTestCase, unittest.TestCase):
+
+    workers = 1
+    fork_results = (0,)
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSupervisorWorkerFails, cls).arrange()
+        cls.serve.side_effect = IOError
+
+    def should_exit_with_error(self):
+        self.exit.assert_called_once_with(1)
+
+
+class _DrainingTestCase(fluenttest.TestCase):
+
+    now = 100.0
+
+    @classmethod
+    def arrange(cls):
+        super(_DrainingTestCase, cls).arrange()
+        cls.patch('familytree.server.LOGGER')
+        cls.http_server = server.HTTPServer(mock.Mock())
+        cls.http_server.io_loop = mock.Mock()
+        cls.http_server.io_loop.time.side_effect = [100.0, cls.now, cls.now]
+        cls.callback = mock.Mock()
+
+        cls.idle = cls.make_connection(busy=False)
+        cls.busy = cls.make_connection(busy=True)
+        cls.closed = cls.make_connection(busy=False, closed=True)
+
+    @classmethod
+    def act(cls):
+        cls.http_server.drain(5, cls.callback)
+
+    @classmethod
+    def make_connection(cls, busy, closed=False):
+        connection = mock.Mock(busy=busy, no_keep_alive=False)
+        connection.stream.closed.return_value = closed
+        connection.stream.writing.return_value = False
+        cls.http_server.connections.add(connection)
+        return connection
+
+
+class WhenDrainingHTTPServer(_DrainingTestCase, unittest.TestCase):
+
+    def should_stop_keeping_connections_alive(self):
+        self.assertTrue(self.http_server.no_keep_alive)
+        self.assertTrue(self.busy.no_keep_alive)
+
+    def should_close_idle_connections(self):
+        self.idle.close.assert_called_once_with()
+
+    def should_not_close_busy_connections(self):
+        self.assertFalse(self.busy.close.called)
+
+    def should_ignore_closed_connections(self):
+        self.assertFalse(self.closed.close.called)
+
+    def should_check_again_later(self):
+        self.http_server.io_loop.add_timeout.assert_called_once_with(
+            100.0 + self.http_server.poll_interval, mock.ANY)
+
+    def should_not_call_callback_yet(self):
+        self.assertFalse(self.callback.called)
+
+
+class WhenDrainingHTTPServerPastDeadline(_DrainingTestCase,
+                                         unittest.TestCase):
+
+    now = 106.0
+
+    def should_not_close_busy_connections(self):
+        self.assertFalse(self.busy.close.called)
+
+    def should_call_callback(self):
+        self.callback.assert_called_once_with()
+
+    def should_not_check_again(self):
+        self.assertFalse(self.http_server.io_loop.add_timeout.called)
+
+
+class WhenDrainingIdleHTTPServer(_DrainingTestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenDrainingIdleHTTPServer, cls).arrange()
+        cls.busy.busy = False
+
+    def should_close_every_connection(self):
+        self.idle.close.assert_called_once_with()
+        self.busy.close.assert_called_once_with()
+
+    def should_call_callback(self):
+        self.callback.assert_called_once_with()
+
+
+class WhenCreatingSupervisorWithoutWorkerCount(fluenttest.TestCase,
+                                               unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenCreatingSupervisorWithoutWorkerCount, cls).arrange()
+        cls.cpu_count = cls.patch('familytree.server.tornado.process'
+                                  '.cpu_count', return_value=12)
+
+    @classmethod
+    def act(cls):
+        cls.supervisor = server.Supervisor(0)
+
+    def should_start_worker_per_cpu(self):
+        self.assertEqual(self.supervisor.workers, 12)
+
+
+class WhenBindingSocketsWithReusePort(fluenttest.TestCase,
+                                      unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBindingSocketsWithReusePort, cls).arrange()
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise unittest.SkipTest('SO_REUSEPORT is not available')
+        cls.sockets = []
+
+    @classmethod
+    def act(cls):
+        cls.sockets = server.bind_sockets(0, '127.0.0.1', reuse_port=True)
+        port = cls.sockets[0].getsockname()[1]
+        cls.sockets.extend(
+            server.bind_sockets(port, '127.0.0.1', reuse_port=True))
+
+    @classmethod
+    def teardown_class(cls):
+        for sock in cls.sockets:
+            sock.close()
+        super(WhenBindingSocketsWithReusePort, cls).teardown_class()
+
+    def should_bind_same_port_twice(self):
+        self.assertEqual(self.sockets[0].getsockname(),
+                         self.sockets[1].getsockname())
+
+    def should_set_reuse_port(self):
+        self.assertTrue(self.sockets[0].getsockopt(socket.SOL_SOCKET,
+                                                   socket.SO_REUSEPORT))
@@ -0,0 +1,157 @@
+import json
+import logging
+import threading
+
+import fluenttest
+
+from familytree import timing
+from ..helpers.compat import mock
+from ..helpers.compat import unittest
+
+
+class WhenRecordingInRequestTimer(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenRecordingInRequestTimer, cls).arrange()
+        cls.timer = timing.RequestTimer()
+        cls.time = cls.patch('familytree.timing.time.time',
+                             side_effect=[10.0, 10.25])
+
+    @classmethod
+    def act(cls):
+        cls.timer.add('storage', 0.001)
+        cls.timer.add('storage', 0.0025)
+        with cls.timer.measure('encode'):
+            pass
+        with cls.timer.activate():
+            timing.record('links', 0.5)
+        timing.record('links', 0.5)
+
+    def should_add_durations_of_each_phase(self):
+        self.assertEqual(self.timer.summary(), (
+            {'storage': 3.5, 'encode': 250.0, 'links': 500.0},
+            {'storage': 2, 'encode': 1, 'links': 1}))
+
+    def should_restore_previous_timer(self):
+        self.assertIsNone(timing.get_current())
+
+
+class WhenBindingFunctionToTimer(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenBindingFunctionToTimer, cls).arrange()
+        cls.timer = timing.RequestTimer()
+        cls.seen = []
+
+    @classmethod
+    def act(cls):
+        def function(value):
+            cls.seen.append((timing.get_current(), value))
+            timing.record('storage', 0.125)
+
+        with cls.timer.activate():
+            bound = timing.bind(function)
+        thread = threading.Thread(target=bound, args=(1,))
+        thread.start()
+        thread.join()
+        cls.unbound_is_function = timing.bind(function) is function
+
+    def should_run_with_timer_in_other_thread(self):
+        self.assertEqual(self.seen, [(self.timer, 1)])
+
+    def should_record_in_timer(self):
+        self.assertEqual(self.timer.phases, {'storage': 0.125})
+
+    def should_not_wrap_function_without_timer(self):
+        self.assertTrue(self.unbound_is_function)
+
+
+class WhenSamplingLogRecords(fluenttest.TestCase, unittest.TestCase):
+
+    @classmethod
+    def arrange(cls):
+        super(WhenSamplingLogRecords, cls).arrange()
+        cls.random = cls.patch('familytree.timing.random.random',
+                               return_value=0.5)
+        cls.sample = timing.SampleFilter(rate='0.25', level='warning')
+
+    @classmethod
+    def act(cls):
+        cls.passed = [
+            cls.sample.filter(logging.makeLogRecord({'levelno': level}))
+            for level in (logging.INFO, logging.WARNING, logging.ERROR)]
+        cls.random.return_value = 0.1
+        cls.passed.append(
+            cls.sample.filter(logging.makeLogRecord(
+                {'levelno': logging.INFO})))
+
+    def should_pass_sample_of_records_below_level(self):
+        self.assertEqual(self.passed, [False, True, True, True])
+
+
+class _LogRequestTestCase(fluenttest.TestCase):
+
+    status = 200
+
+    @classmethod
+    def arrange(cls):
+        super(_LogRequestTestCase, cls).arrange()
+        cls.logger = cls.patch('familytree.timing.LOGGER')
+        cls.handler = mock.Mock()
+        cls.handler.__class__.__name__ = 'PersonHandler'
+        cls.handler.get_status.return_value = cls.status
+        cls.handler.request.method = 'GET'
+        cls.handler.request.path = '/person/1'
+        cls.handler.request.request_time.return_value = 0.0125
+        cls.handler.timer = timing.RequestTimer()
+        cls.handler.timer.add('storage', 0.01)
+
+    @classmethod
+    def act(cls):
+        timing.log_request(cls.handler)
+
+
+class WhenLoggingRequest(_LogRequestTestCase, unittest.TestCase):
+
+    def should_log_at_info(self):
+        self.assertEqual(self.logger.log.call_args[0][:2],
+                         (logging.INFO, '%s'))
+
+    def should_log_json_line(self):
+        entry = str(self.logger.log.call_args[0][2])
+        self.assertNotIn('\n', entry)
+        self.assertEqual(json.loads(entry), {
+            'handler': 'PersonHandler',
+            'method': 'GET',
+            'path': '/person/1',
+            'status': 200,
+            'duration': 12.5,
+            'phases': {'storage': 10.0},
+            'calls': {'storage': 1},
+        })
+
+
+class WhenLoggingFailedRequest(_LogRequestTestCase, unittest.TestCase):
+
+    status = 503
+
+    def should_log_at_error(self):
+        self.assertEqual(self.logger.log.call_args[0][0], logging.ERROR)
+
+
+class WhenLoggingRequestIsDisabled(_LogRequestTestCase, unittest.TestCase):
+
+    status = 404
+
+    @classmethod
+    def arrange(cls):
+        super(WhenLoggingRequestIsDisabled, cls).arrange()
+        cls.logger.isEnabledFor.return_value = False
+
+    def should_check_warning_level(self):
+        self.logger.isEnabledFor.assert_called_once_with(logging.WARNING)
+
+    def should_not_log(self):
+        self.assertFalse(self.logger.log.called)